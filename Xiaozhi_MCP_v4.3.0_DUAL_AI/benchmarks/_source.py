@@ -0,0 +1,40 @@
+"""
+Nạp một số định nghĩa top-level từ xiaozhi_final.py để benchmark
+(không import cả file - file chính phụ thuộc Windows, VLC, pyautogui...)
+"""
+
+import ast
+from pathlib import Path
+
+SOURCE_FILE = Path(__file__).resolve().parent.parent / "xiaozhi_final.py"
+
+
+def load_definitions(names, namespace=None) -> dict:
+    """
+    Exec các class/def/biến top-level có tên trong names (theo thứ tự trong file).
+
+    Args:
+        names: Tên cần nạp
+        namespace: Globals có sẵn (import, hằng số phụ thuộc...)
+
+    Returns:
+        dict namespace đã chứa các định nghĩa
+    """
+    wanted = set(names)
+    tree = ast.parse(SOURCE_FILE.read_text(encoding="utf-8"))
+    nodes = []
+    for node in tree.body:
+        if isinstance(node, (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+            found = {node.name}
+        elif isinstance(node, ast.Assign):
+            found = {t.id for t in node.targets if isinstance(t, ast.Name)}
+        else:
+            continue
+        if found & wanted:
+            nodes.append(node)
+            wanted -= found
+    if wanted:
+        raise LookupError(f"Not found in {SOURCE_FILE.name}: {sorted(wanted)}")
+    namespace = dict(namespace or {})
+    exec(compile(ast.Module(body=nodes, type_ignores=[]), str(SOURCE_FILE), "exec"), namespace)
+    return namespace
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Benchmark: tìm kiếm Knowledge Base trên 100 / 1k / 5k tài liệu (mỗi tài liệu tới 50k ký tự)
+
+  legacy - search_knowledge_base cũ: content.lower().count(keyword) trên mọi doc, mọi keyword
+  bm25   - KnowledgeSearchIndex: inverted index âm tiết + bigram (có dấu / bỏ dấu), BM25 + heap top-k
+
+In thời gian dựng index (lần đầu / commit 1 file với index cũ), thời gian/truy vấn,
+top-1 đúng tài liệu nguồn của truy vấn và tỉ lệ tìm thấy khi truy vấn gõ không dấu.
+Chạy: python benchmarks/bench_kb_search.py [--sizes 100 1000 5000] [--doc-words 2000] [--queries 40]
+"""
+
+import argparse
+import heapq
+import math
+import random
+import re
+import statistics
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+from _source import load_definitions
+
+ns = load_definitions(
+    ["_SONG_PUNCT_RE", "_SONG_SPACE_RE", "normalize_song_text", "fold_voice_token",
+     "KB_STOP_WORDS", "KB_FIELD_WEIGHTS", "KB_BM25_K1", "KB_BM25_B", "KB_FOLD_PREFIX", "KB_FOLD_CACHE_MAX",
+     "_KB_TOKEN_RE", "kb_tokens", "kb_terms", "KnowledgeSearchIndex"],
+    {"re": re, "math": math, "heapq": heapq, "time": time, "unicodedata": unicodedata, "array": array,
+     "bisect_left": bisect_left, "Counter": Counter, "defaultdict": defaultdict},
+)
+KnowledgeSearchIndex = ns["KnowledgeSearchIndex"]
+STOP_WORDS = ns["KB_STOP_WORDS"]
+
+SYLLABLES = (
+    "nghị định thông tư quy định hướng dẫn thực hiện quản lý nhà nước doanh nghiệp hợp đồng lao động "
+    "tiền lương bảo hiểm xã hội thuế thu nhập cá nhân kế toán báo cáo tài chính ngân sách đầu tư công "
+    "giáo dục đào tạo học sinh sinh viên giáo viên trường học y tế bệnh viện bác sĩ điều trị thuốc "
+    "giao thông vận tải đường bộ cầu cảng sân bay du lịch khách sạn nhà hàng văn hóa thể thao "
+    "nông nghiệp lúa gạo cà phê thủy sản môi trường rác thải khí hậu năng lượng điện mặt trời gió "
+    "công nghệ phần mềm dữ liệu mạng máy tính trí tuệ nhân tạo an ninh bảo mật chuyển đổi số"
+).split()
+
+
+FAMILY = ["Nguyễn", "Trần", "Lê", "Phạm", "Hoàng", "Võ", "Đặng", "Bùi", "Đỗ", "Hồ", "Ngô", "Dương"]
+MIDDLE = ["Văn", "Thị", "Minh", "Quốc", "Thanh", "Hữu", "Đức", "Ngọc", "Trung", "Xuân"]
+GIVEN = ["Khoa", "Hùng", "Lan", "Phương", "Tuấn", "Dũng", "Hạnh", "Thảo", "Nghĩa", "Trường", "Quyết", "Đông",
+         "Hải", "Yến", "Long", "Sơn"]
+
+
+def strip_accents(text: str) -> str:
+    text = "".join(c for c in unicodedata.normalize("NFD", text) if not unicodedata.combining(c))
+    return text.replace("đ", "d").replace("Đ", "D")
+
+
+def make_documents(size: int, words: int, rng: random.Random) -> list:
+    weights = [1.0 / (i + 1) for i in range(len(SYLLABLES))]  # Zipf: có từ rất phổ biến, có từ hiếm
+    documents = []
+    for i in range(size):
+        body = rng.choices(SYLLABLES, weights=weights, k=words)
+        marker = f"{rng.choice(FAMILY)} {rng.choice(MIDDLE)} {rng.choice(GIVEN)}"
+        for _ in range(3):  # Tên riêng xuất hiện vài lần trong tài liệu của người đó
+            body[rng.randrange(len(body))] = marker
+        for _ in range(5):  # Từng chữ của tên rải rác ở tài liệu khác (họ/tên đệm rất phổ biến)
+            body[rng.randrange(len(body))] = rng.choice(FAMILY + MIDDLE + GIVEN)
+        documents.append({
+            "file_path": f"C:/KB/tai_lieu_{i}.docx",
+            "file_name": f"tai_lieu_{i}.docx",
+            "content": " ".join(body)[:50000],
+            "summary": " ".join(rng.choices(SYLLABLES, k=25)),
+            "keywords": rng.sample(SYLLABLES, 5),
+            "marker": marker,
+        })
+    return documents
+
+
+def legacy_search(documents: list, query: str) -> list:
+    """Bản sao cách chấm điểm của search_knowledge_base trước khi có KnowledgeSearchIndex"""
+    keywords = [w.lower() for w in query.split() if w.lower() not in STOP_WORDS and len(w) > 3]
+    if len(keywords) > 4:
+        keywords = sorted(keywords, key=len, reverse=True)[:4]
+    if not keywords:
+        all_words = [w.lower() for w in query.split() if len(w) > 2]
+        keywords = sorted(all_words, key=len, reverse=True)[:3] if all_words else [query.lower()]
+    scored = []
+    min_keywords_match = max(1, len(keywords) - 1)
+    for doc in documents:
+        content_lower = doc["content"].lower()
+        score, matched = 0, 0
+        for keyword in keywords:
+            count = content_lower.count(keyword)
+            if count > 0:
+                score += math.log(1 + count) * 10
+                matched += 1
+        if matched < min_keywords_match:
+            continue
+        if matched > 1:
+            score *= (1 + matched * 0.5)
+        for keyword in keywords:
+            if keyword in doc["file_name"].lower():
+                score *= 2.0
+        if score > 0:
+            scored.append((score, doc))
+    scored.sort(key=lambda x: x[0], reverse=True)
+    return scored[:10]
+
+
+def timed(call, queries):
+    samples, results = [], []
+    for query in queries:
+        started = time.perf_counter()
+        results.append(call(query))
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples, results
+
+
+def fmt(samples):
+    samples = sorted(samples)
+    return (f"mean={statistics.mean(samples):9.2f}ms p50={samples[len(samples) // 2]:9.2f}ms "
+            f"max={samples[-1]:9.2f}ms")
+
+
+def top1_hits(results, targets):
+    """Top-1 có chứa đúng tên trong truy vấn (tên có thể trùng giữa vài tài liệu)"""
+    return sum(1 for hits, target in zip(results, targets)
+               if hits and target["marker"].lower() in hits[0][1]["content"].lower())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--doc-words", type=int, default=2000, help="Số âm tiết mỗi tài liệu")
+    parser.add_argument("--queries", type=int, default=40)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        rng = random.Random(size)
+        documents = make_documents(size, args.doc_words, rng)
+        targets = [rng.choice(documents) for _ in range(args.queries)]
+        queries = [f"{target['marker']} là ai" for target in targets]
+        plain_queries = [strip_accents(q) for q in queries]
+
+        started = time.perf_counter()
+        index = KnowledgeSearchIndex(tuple(documents))
+        build_ms = (time.perf_counter() - started) * 1000
+        changed = list(documents)
+        changed[0] = dict(changed[0], content=changed[0]["content"] + " cập nhật")
+        started = time.perf_counter()
+        updated = KnowledgeSearchIndex(tuple(changed), previous=index)
+        commit_ms = (time.perf_counter() - started) * 1000
+        rebuilt = KnowledgeSearchIndex(tuple(changed))
+        consistent = all([round(score, 3) for score, _, _ in updated.search(q, top_k=10)]  # Điểm bằng nhau có thể đổi thứ tự
+                         == [round(score, 3) for score, _, _ in rebuilt.search(q, top_k=10)]
+                         for q in queries[:10])
+
+        legacy_samples, legacy_results = timed(lambda q: legacy_search(documents, q), queries)
+        bm25_samples, bm25_results = timed(lambda q: index.search(q, top_k=10), queries)
+        _, legacy_plain = timed(lambda q: legacy_search(documents, q), plain_queries)
+        plain_samples, bm25_plain = timed(lambda q: index.search(q, top_k=10), plain_queries)
+
+        print(f"--- {size} docs × {args.doc_words} âm tiết (build {build_ms:.0f}ms, commit 1 file {commit_ms:.0f}ms, "
+              f"{index.stats['terms']} terms, commit tăng dần = dựng lại: {consistent})")
+        print(f"legacy        {fmt(legacy_samples)}  top-1 {top1_hits(legacy_results, targets)}/{len(queries)}")
+        print(f"bm25          {fmt(bm25_samples)}  top-1 {top1_hits(bm25_results, targets)}/{len(queries)}")
+        print(f"không dấu: legacy top-1 {top1_hits(legacy_plain, targets)}/{len(queries)}, "
+              f"bm25 top-1 {top1_hits(bm25_plain, targets)}/{len(queries)} ({fmt(plain_samples)})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark: phân loại từ khóa (realtime / nhạc / youtube / topic user)
+
+  linear    - any(kw in text_lower for kw in ...) cho từng bộ từ khóa (cách cũ)
+  automaton - KeywordClassifier: 1 automaton Aho-Corasick, 1 lần duyệt text
+
+Kiểm tra 2 cách cho cùng kết quả trên toàn bộ corpus trước khi đo.
+Chạy: python benchmarks/bench_keyword_classifier.py [--rounds 2000]
+"""
+
+import argparse
+import statistics
+import time
+import unicodedata
+from collections import deque
+
+from _source import load_definitions
+
+ns = load_definitions(
+    ["REALTIME_KEYWORDS", "MUSIC_KEYWORDS", "YOUTUBE_KEYWORDS", "USER_TOPIC_KEYWORDS",
+     "KEYWORD_CATEGORIES", "KeywordClassifier"],
+    {"unicodedata": unicodedata, "deque": deque},
+)
+KEYWORD_CATEGORIES = ns["KEYWORD_CATEGORIES"]
+
+CORPUS = [
+    "giá vàng hôm nay bao nhiêu",
+    "hôm nay ngày bao nhiêu âm lịch",
+    "phát nhạc sơn tùng",
+    "bài tiếp theo",
+    "tạm dừng",
+    "tăng âm lượng lên một chút",
+    "mở youtube xem video hài",
+    "thời tiết hà nội ngày mai thế nào",
+    "tổng thống mỹ hiện nay là ai",
+    "viết cho tôi một đoạn code python đọc file csv",
+    "kể một câu chuyện cổ tích ngắn cho bé ngủ",
+    "tại sao bầu trời có màu xanh",
+    "mở chrome giúp tôi",
+    "tắt máy tính lúc 11 giờ đêm",
+    "tin tức bóng đá mới nhất về đội tuyển việt nam",
+    "dịch câu này sang tiếng anh: chúc bạn một ngày tốt lành",
+    "Xin chào, bạn có khỏe không? Hôm qua mình đi chơi ở Đà Lạt, trời lạnh lắm nhưng cảnh rất đẹp, "
+    "mình muốn hỏi nên ăn gì ở chợ đêm và có quán cà phê nào view đẹp không",
+    "cho tôi biết cấu hình máy tính này",
+]
+
+
+def linear_classify(text: str) -> frozenset:
+    text_lower = text.lower()
+    return frozenset(name for name, keywords in KEYWORD_CATEGORIES.items()
+                     if any(kw in text_lower for kw in keywords))
+
+
+def linear_realtime(text: str) -> bool:
+    text_lower = text.lower()
+    return any(kw in text_lower for kw in KEYWORD_CATEGORIES["realtime"])
+
+
+def measure(label: str, call, rounds: int):
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for text in CORPUS:
+            call(text)
+        samples.append((time.perf_counter() - started) * 1e6 / len(CORPUS))
+    samples.sort()
+    print(f"{label:<22} mean={statistics.mean(samples):7.2f}us/text "
+          f"p50={samples[len(samples) // 2]:7.2f}us p99={samples[int(len(samples) * 0.99) - 1]:7.2f}us")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=2000)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    classifier = ns["KeywordClassifier"](KEYWORD_CATEGORIES)
+    build_ms = (time.perf_counter() - started) * 1000
+    print(f"build: {classifier.keyword_count} keywords, {len(classifier.categories)} categories, "
+          f"{classifier.state_count} states in {build_ms:.1f}ms")
+
+    for text in CORPUS:
+        expected, got = linear_classify(text), classifier.classify(text)
+        assert expected == got, f"{text!r}: linear={sorted(expected)} automaton={sorted(got)}"
+        assert linear_realtime(text) == classifier.has(text, "realtime"), text
+    print(f"verified: {len(CORPUS)} texts classify identically\n")
+
+    measure("linear (all)", linear_classify, args.rounds)
+    measure("automaton (all)", classifier.classify, args.rounds)
+    measure("linear (realtime)", linear_realtime, args.rounds)
+    measure("automaton (realtime)", lambda t: classifier.has(t, "realtime"), args.rounds)
+
+
+if __name__ == "__main__":
+    main()
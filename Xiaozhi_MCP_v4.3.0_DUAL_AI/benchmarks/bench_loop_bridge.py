@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark: chi phí mỗi lần gọi coroutine từ thread đồng bộ
+
+  legacy  - ThreadPoolExecutor mới + asyncio.run (loop mới) mỗi lần gọi (send_message_to_llm_sync cũ)
+  bridge  - LoopBridge.run → run_coroutine_threadsafe lên loop đang chạy
+
+Chạy: python benchmarks/bench_loop_bridge.py [--calls 2000]
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import statistics
+import threading
+import time
+
+from _source import load_definitions
+
+bridge_ns = load_definitions(["LoopBridge"], {
+    "asyncio": asyncio, "threading": threading, "concurrent": concurrent,
+})
+LoopBridge = bridge_ns["LoopBridge"]
+
+
+async def fake_send(message: str) -> dict:
+    """Giả lập send_message_to_llm: 1 lần nhường loop như ws.send"""
+    await asyncio.sleep(0)
+    return {"success": True, "message": message}
+
+
+def legacy_call(message: str) -> dict:
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        return executor.submit(asyncio.run, fake_send(message)).result(timeout=5)
+
+
+def measure(label: str, call, calls: int):
+    samples = []
+    for i in range(calls):
+        started = time.perf_counter()
+        call(f"msg {i}")
+        samples.append((time.perf_counter() - started) * 1e6)
+    samples.sort()
+    print(f"{label:<8} calls={calls:<6} mean={statistics.mean(samples):8.1f}us "
+          f"p50={samples[len(samples) // 2]:8.1f}us p99={samples[int(len(samples) * 0.99) - 1]:8.1f}us")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=2000)
+    args = parser.parse_args()
+
+    # Loop "server" chạy ở thread riêng, code đồng bộ gọi từ main thread
+    server_loop = asyncio.new_event_loop()
+    threading.Thread(target=server_loop.run_forever, daemon=True).start()
+    bridge = LoopBridge()
+    bridge.bind(server_loop)
+
+    measure("legacy", legacy_call, args.calls)
+    measure("bridge", lambda m: bridge.run(fake_send(m), timeout=5), args.calls)
+    server_loop.call_soon_threadsafe(server_loop.stop)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Benchmark: tìm bài hát gần đúng trên thư viện 1k / 10k / 100k bài
+
+  legacy - fuzzy_match_song cũ: chuẩn hóa lại mọi tên + difflib với toàn bộ thư viện
+  index  - SongSearchIndex: tên chuẩn hóa sẵn + trigram lấy ứng viên, chỉ chấm điểm top ứng viên
+
+In thời gian dựng index, thời gian/truy vấn và tỉ lệ top-1 trùng với cách cũ.
+Chạy: python benchmarks/bench_song_index.py [--sizes 1000 10000 100000] [--queries 30]
+"""
+
+import argparse
+import difflib
+import heapq
+import random
+import re
+import statistics
+import time
+import unicodedata
+from collections import Counter, defaultdict
+from pathlib import Path
+
+from _source import load_definitions
+
+ns = load_definitions(
+    ["SONG_QUERY_STOP_WORDS", "SONG_INDEX_CANDIDATES", "_SONG_PUNCT_RE", "_SONG_SPACE_RE",
+     "normalize_song_text", "song_trigrams", "SongSearchIndex"],
+    {"re": re, "difflib": difflib, "heapq": heapq, "unicodedata": unicodedata,
+     "Counter": Counter, "defaultdict": defaultdict, "Path": Path},
+)
+SongSearchIndex = ns["SongSearchIndex"]
+
+SYLLABLES = (
+    "anh em yêu thương nhớ người ta mình đã từng có nhau một lần nữa mưa nắng chiều tàn "
+    "đêm ngày xuân hạ thu đông phố cũ quê hương mẹ cha con đường về bên sông núi biển trời "
+    "xanh tím hồng vàng trắng đen giấc mơ ký ức hạnh phúc nước mắt nụ cười lời hứa chia tay "
+    "gặp lại hẹn hò tình đầu cuối cùng mãi mãi bao giờ đâu sao vì ai"
+).split()
+ARTISTS = ["Sơn Tùng M-TP", "Đen Vâu", "Mỹ Tâm", "Hà Anh Tuấn", "Bích Phương", "Noo Phước Thịnh",
+           "Hoàng Thùy Linh", "Vũ", "Min", "Erik", "Trúc Nhân", "Tóc Tiên", "Jack", "Amee", "Karik"]
+
+
+def make_library(size: int, rng: random.Random) -> dict:
+    songs = {}
+    while len(songs) < size:
+        title = " ".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 6)))
+        name = f"{rng.choice(ARTISTS)} - {title}".lower()
+        if rng.random() < 0.3:
+            name += f" ({rng.choice(['remix', 'live', 'acoustic', 'lofi'])})"
+        songs[name] = f"C:/Music/{name}.mp3"
+    return songs
+
+
+def make_queries(songs: dict, count: int, rng: random.Random) -> list:
+    """Giống người nói: bỏ dấu / bỏ bớt từ / thêm "phát bài" / sai chính tả nhẹ"""
+    names = list(songs)
+    queries = []
+    for _ in range(count):
+        title = rng.choice(names).split(" - ", 1)[1].split(" (")[0]
+        words = title.split()
+        if len(words) > 3 and rng.random() < 0.5:
+            words = words[:rng.randint(2, len(words) - 1)]
+        query = " ".join(words)
+        if rng.random() < 0.4:
+            query = "".join(c for c in unicodedata.normalize("NFD", query) if not unicodedata.combining(c))
+        if rng.random() < 0.3 and len(query) > 5:
+            i = rng.randrange(len(query))
+            query = query[:i] + query[i + 1:]
+        queries.append(rng.choice(["", "phát bài ", "mở bài "]) + query)
+    return queries
+
+
+def legacy_fuzzy_match(songs: dict, query: str):
+    """Bản sao thuật toán fuzzy_match_song trước khi có SongSearchIndex"""
+    def normalize_text(text):
+        text = unicodedata.normalize('NFD', text)
+        text = ''.join(c for c in text if not unicodedata.combining(c))
+        text = re.sub(r'[^\w\s]', '', text.lower()).strip()
+        text = re.sub(r'\s+', ' ', text)
+        return text
+
+    query_normalized = normalize_text(query)
+    stop_words = ['phat', 'bai', 'mo', 'chay', 'play', 'song', 'nhac', 'hat']
+    query_words = [w for w in query_normalized.split() if w not in stop_words]
+    query_processed = ' '.join(query_words) if query_words else query_normalized
+
+    best_match, best_score = None, 0.0
+    for song_name_original, song_path in songs.items():
+        song_name_normalized = normalize_text(song_name_original)
+        similarity = difflib.SequenceMatcher(None, query_processed, song_name_normalized).ratio()
+        if query_processed in song_name_normalized:
+            similarity += 0.25
+        if query_words and all(word in song_name_normalized for word in query_words):
+            similarity += 0.20
+        if song_name_normalized.startswith(query_processed[:4]):
+            similarity += 0.10
+        if similarity > best_score:
+            best_score, best_match = similarity, song_path
+    return best_match, best_score
+
+
+def timed(call, queries):
+    samples, results = [], []
+    for query in queries:
+        started = time.perf_counter()
+        results.append(call(query))
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples, results
+
+
+def fmt(samples):
+    samples = sorted(samples)
+    return (f"mean={statistics.mean(samples):9.2f}ms p50={samples[len(samples) // 2]:9.2f}ms "
+            f"max={samples[-1]:9.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--queries", type=int, default=30)
+    parser.add_argument("--legacy-queries", type=int, default=5,
+                        help="Số truy vấn chạy bằng cách cũ (chậm) để so sánh")
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        rng = random.Random(size)
+        songs = make_library(size, rng)
+        queries = make_queries(songs, args.queries, rng)
+
+        started = time.perf_counter()
+        index = SongSearchIndex(songs)
+        build_ms = (time.perf_counter() - started) * 1000
+
+        index_samples, index_results = timed(lambda q: index.search(q, limit=1), queries)
+        legacy_queries = queries[:args.legacy_queries]
+        legacy_samples, legacy_results = timed(lambda q: legacy_fuzzy_match(songs, q), legacy_queries)
+
+        agree = sum(1 for (path, score), found in zip(legacy_results, index_results)
+                    if found and (found[0]["path"] == path or abs(found[0]["score"] - score) < 1e-3))
+        print(f"--- {size} songs (index build {build_ms:.0f}ms, {len(index._postings)} trigrams)")
+        print(f"legacy  n={len(legacy_queries):<4} {fmt(legacy_samples)}")
+        print(f"index   n={len(queries):<4} {fmt(index_samples)}")
+        print(f"top-1 agrees with legacy: {agree}/{len(legacy_queries)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Benchmark: nhận dạng lệnh nhạc từ câu nói ESP32 (hay sai dấu / sai chính tả)
+
+  legacy  - normalize_voice_command + fuzzy_match_music_command cũ: str.replace từ thừa,
+            quét mọi pattern bằng "in", fuzzy = đếm ký tự có mặt trong câu
+  matcher - VoiceCommandMatcher: trie theo token bỏ dấu + deletion index (SymSpell, ≤ 1 edit)
+
+Trên corpus có nhãn (voice_command_corpus.tsv) in: đúng action, nhận nhầm câu không phải lệnh,
+phân bố confidence và thời gian/câu. Ngưỡng thực hiện ngay trong smart_music_control = 0.8.
+Chạy: python benchmarks/bench_voice_matcher.py [--corpus FILE] [--repeat 200] [--show-errors]
+"""
+
+import argparse
+import re
+import time
+import unicodedata
+from collections import Counter, defaultdict
+from pathlib import Path
+
+from _source import load_definitions
+
+ns = load_definitions(
+    ["_SONG_PUNCT_RE", "_SONG_SPACE_RE", "normalize_song_text",
+     "VOICE_CORRECTIONS", "MUSIC_COMMAND_PATTERNS", "VOICE_NOISE_WORDS",
+     "VOICE_FUZZY_MIN_LEN", "VOICE_TONE_COST", "VOICE_MAX_COST", "_VOICE_TOKEN_RE",
+     "fold_voice_token", "_within_one_edit", "VoiceCommandMatcher"],
+    {"re": re, "unicodedata": unicodedata, "defaultdict": defaultdict},
+)
+CORRECTIONS = ns["VOICE_CORRECTIONS"]
+PATTERNS = ns["MUSIC_COMMAND_PATTERNS"]
+NOISE = ns["VOICE_NOISE_WORDS"]
+EXECUTE_THRESHOLD = 0.8
+
+
+def legacy_match(text: str):
+    """Bản sao normalize_voice_command + fuzzy_match_music_command trước khi có VoiceCommandMatcher"""
+    text_lower = text.lower().strip()
+    for word in NOISE:
+        text_lower = text_lower.replace(word, ' ')
+    for correct_cmd, variations in CORRECTIONS.items():
+        hit = next((v for v in variations if v in text_lower), None)
+        if hit:
+            text_lower = text_lower.replace(hit, correct_cmd)
+            break
+
+    best_match, best_confidence = None, 0.0
+    for action, patterns in PATTERNS.items():
+        for pattern in patterns:
+            if pattern in text_lower:
+                confidence = 1.0
+            elif len(pattern) >= 3:
+                ratio = sum(1 for c in pattern if c in text_lower) / len(pattern)
+                confidence = ratio * 0.8 if ratio > 0.7 else 0.0
+            else:
+                continue
+            if confidence > best_confidence:
+                best_confidence, best_match = confidence, action
+    return best_match, best_confidence
+
+
+def load_corpus(path: Path) -> list:
+    rows = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        if not line.strip() or line.startswith("#"):
+            continue
+        text, label = line.rsplit("\t", 1)
+        rows.append((text, None if label == "-" else label))
+    return rows
+
+
+def evaluate(name, call, corpus, repeat, show_errors):
+    results = [call(text) for text, _ in corpus]
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for text, _ in corpus:
+            call(text)
+    per_call_us = (time.perf_counter() - started) / (repeat * len(corpus)) * 1e6
+
+    commands = [(r, label) for r, (_, label) in zip(results, corpus) if label]
+    others = [r for r, (_, label) in zip(results, corpus) if not label]
+    executed_ok = sum(1 for (action, conf), label in commands if action == label and conf >= EXECUTE_THRESHOLD)
+    top1_ok = sum(1 for (action, _), label in commands if action == label)
+    wrong_exec = sum(1 for (action, conf), label in commands if action != label and conf >= EXECUTE_THRESHOLD)
+    false_pos = sum(1 for action, conf in others if action and conf >= EXECUTE_THRESHOLD)
+    buckets = Counter("≥0.8" if conf >= 0.8 else "0.5-0.8" if conf > 0.5 else "≤0.5" for _, conf in results)
+
+    print(f"--- {name}: {per_call_us:8.1f}µs/câu")
+    print(f"  lệnh đúng action (bất kể conf): {top1_ok}/{len(commands)}")
+    print(f"  lệnh thực hiện ngay đúng (≥{EXECUTE_THRESHOLD}): {executed_ok}/{len(commands)}, "
+          f"thực hiện ngay SAI: {wrong_exec}")
+    print(f"  câu thường bị coi là lệnh (≥{EXECUTE_THRESHOLD}): {false_pos}/{len(others)}")
+    print("  confidence: " + ", ".join(f"{k}={buckets[k]}" for k in ("≥0.8", "0.5-0.8", "≤0.5")))
+    if show_errors:
+        for (action, conf), (text, label) in zip(results, corpus):
+            if (action if conf >= EXECUTE_THRESHOLD else None) != label:
+                print(f"    {text!r:40} want={label or '-':12} got={action}({conf:.2f})")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", type=Path, default=Path(__file__).with_name("voice_command_corpus.tsv"))
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--show-errors", action="store_true")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    started = time.perf_counter()
+    matcher = ns["VoiceCommandMatcher"](PATTERNS, CORRECTIONS, NOISE)
+    build_ms = (time.perf_counter() - started) * 1000
+    print(f"corpus {len(corpus)} câu, matcher {matcher.phrase_count} cụm, dựng {build_ms:.1f}ms")
+
+    def matcher_call(text):
+        result = matcher.match(text)
+        return result["action"], result["confidence"]
+
+    evaluate("legacy", legacy_match, corpus, args.repeat, args.show_errors)
+    evaluate("matcher", matcher_call, corpus, args.repeat, args.show_errors)
+
+
+if __name__ == "__main__":
+    main()
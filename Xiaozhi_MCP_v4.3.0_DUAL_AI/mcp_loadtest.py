@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+"""
+miniZ MCP Load Test - Server MCP giả lập + bộ tạo tải
+Đo throughput/latency của MCP client trong xiaozhi_final.py mà không cần wss://api.xiaozhi.me
+
+Cách dùng:
+  1. Chạy harness (server giả lập lắng nghe ws://127.0.0.1:8765/mcp/):
+       python mcp_loadtest.py --scenario mixed --devices 3
+  2. Chạy miniZ trỏ vào server giả lập (xiaozhi_endpoints.json cần >= N endpoint có token bất kỳ):
+       set XIAOZHI_MCP_URL=ws://127.0.0.1:8765/mcp/
+       set XIAOZHI_LOADTEST=1
+       python xiaozhi_final.py
+  3. Harness chờ đủ N thiết bị kết nối, chạy kịch bản rồi in báo cáo
+     (p50/p95/p99 theo tool, frames/s, event-loop lag của harness và của app qua /api/perf)
+
+Kịch bản:
+  burst     - Mỗi thiết bị bắn --calls tools/call cùng lúc
+  mixed     - Xen kẽ tool chậm (loadtest_sleep) và tool nhanh, đo head-of-line blocking
+  reconnect - Đóng toàn bộ kết nối --rounds lần, đo thời gian thiết bị kết nối lại + tools/list
+  all       - Chạy lần lượt burst, mixed, reconnect
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import time
+import urllib.request
+from collections import defaultdict
+from urllib.parse import parse_qs, urlparse
+
+from websockets.asyncio.server import serve
+from websockets.exceptions import ConnectionClosed
+
+
+# ============================================================
+# THỐNG KÊ
+# ============================================================
+
+def percentile(values: list, pct: float) -> float:
+    """Nearest-rank percentile (values đã sort)"""
+    if not values:
+        return 0.0
+    idx = min(len(values) - 1, max(0, int(round(pct / 100 * len(values) + 0.5)) - 1))
+    return values[idx]
+
+
+class LoadStats:
+    """Gom latency theo tool + đếm frame vào/ra. Timeout/mất kết nối chỉ đếm, không tính latency"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.failures = defaultdict(int)
+        self.frames_in = 0
+        self.frames_out = 0
+        self.progress_notifications = 0
+        self.started = time.perf_counter()
+
+    def record(self, label: str, seconds: float, ok: bool = True):
+        self.latencies[label].append(seconds * 1000)
+        if not ok:
+            self.errors[label] += 1
+
+    def fail(self, label: str):
+        """Không nhận được response (timeout / kết nối đóng) - không có latency thật để ghi"""
+        self.failures[label] += 1
+
+    def report(self) -> dict:
+        elapsed = max(1e-9, time.perf_counter() - self.started)
+        tools = {}
+        for label in sorted(set(self.latencies) | set(self.failures)):
+            ordered = sorted(self.latencies.get(label, ()))
+            tools[label] = {
+                "count": len(ordered),
+                "errors": self.errors.get(label, 0),
+                "failed": self.failures.get(label, 0),
+                "p50_ms": round(percentile(ordered, 50), 2),
+                "p95_ms": round(percentile(ordered, 95), 2),
+                "p99_ms": round(percentile(ordered, 99), 2),
+                "max_ms": round(ordered[-1], 2) if ordered else 0.0,
+            }
+        return {
+            "duration_s": round(elapsed, 2),
+            "tools": tools,
+            "frames_in": self.frames_in,
+            "frames_out": self.frames_out,
+            "frames_in_per_s": round(self.frames_in / elapsed, 1),
+            "frames_out_per_s": round(self.frames_out / elapsed, 1),
+            "progress_notifications": self.progress_notifications,
+        }
+
+
+class LoopLagSampler:
+    """Đo event-loop lag của chính harness (để phân biệt nghẽn ở harness hay ở app)"""
+
+    INTERVAL = 0.05
+
+    def __init__(self):
+        self.samples = []
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.INTERVAL
+            await asyncio.sleep(self.INTERVAL)
+            self.samples.append((loop.time() - expected) * 1000)
+
+    def stop(self) -> dict:
+        if self._task:
+            self._task.cancel()
+        ordered = sorted(max(0.0, s) for s in self.samples)
+        if not ordered:
+            return {"samples": 0}
+        return {
+            "samples": len(ordered),
+            "p50_ms": round(percentile(ordered, 50), 2),
+            "p95_ms": round(percentile(ordered, 95), 2),
+            "max_ms": round(ordered[-1], 2),
+        }
+
+
+# ============================================================
+# SERVER MCP GIẢ LẬP
+# ============================================================
+
+class DeviceSession:
+    """1 kết nối từ miniZ - đóng vai server xiaozhi.me: gửi initialize, tools/list, tools/call"""
+
+    def __init__(self, ws, token: str, stats: LoadStats, timeout: float):
+        self.ws = ws
+        self.token = token
+        self.stats = stats
+        self.timeout = timeout
+        self.tools = []
+        self._ids = itertools.count(1000)
+        self._pending = {}
+
+    async def send(self, message: dict):
+        self.stats.frames_out += 1
+        await self.ws.send(json.dumps(message, ensure_ascii=False))
+
+    async def read_loop(self):
+        async for raw in self.ws:
+            self.stats.frames_in += 1
+            try:
+                msg = json.loads(raw)
+            except json.JSONDecodeError:
+                continue
+            method = msg.get("method")
+            if method is None:
+                future = self._pending.pop(msg.get("id"), None)
+                if future and not future.done():
+                    future.set_result(msg)
+            elif method == "notifications/progress":
+                self.stats.progress_notifications += 1
+            elif "id" in msg:
+                # miniZ tự gửi initialize lên server → trả lời rỗng như server thật
+                await self.send({"jsonrpc": "2.0", "id": msg["id"], "result": {}})
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError("connection closed"))
+        self._pending.clear()
+
+    async def request(self, method: str, params: dict = None):
+        """Gửi JSON-RPC request, trả về (message, latency_seconds)"""
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        started = time.perf_counter()
+        await self.send({"jsonrpc": "2.0", "id": request_id, "method": method, "params": params or {}})
+        try:
+            msg = await asyncio.wait_for(future, self.timeout)
+        finally:
+            self._pending.pop(request_id, None)
+        return msg, time.perf_counter() - started
+
+    async def handshake(self):
+        msg, latency = await self.request("initialize", {
+            "protocolVersion": "2024-11-05",
+            "capabilities": {},
+            "clientInfo": {"name": "mcp-loadtest", "version": "1.0"}
+        })
+        self.stats.record("(initialize)", latency)
+        cursor, started, tools = None, time.perf_counter(), []
+        while True:
+            msg, _ = await self.request("tools/list", {"cursor": cursor} if cursor else {})
+            result = msg.get("result") or {}
+            tools.extend(t["name"] for t in result.get("tools", []))
+            cursor = result.get("nextCursor")
+            if not cursor:
+                break
+        self.stats.record("(tools/list all pages)", time.perf_counter() - started)
+        self.tools = tools
+
+    async def call_tool(self, name: str, arguments: dict = None, label: str = None):
+        label = label or name
+        try:
+            msg, latency = await self.request("tools/call", {
+                "name": name,
+                "arguments": arguments or {},
+                "_meta": {"progressToken": f"lt-{self.token}-{name}"}
+            })
+            result = msg.get("result") or {}
+            self.stats.record(label, latency, ok="error" not in msg and not result.get("isError"))
+        except (asyncio.TimeoutError, ConnectionError, ConnectionClosed):
+            self.stats.fail(label)
+
+    async def ping(self):
+        try:
+            _, latency = await self.request("ping")
+            self.stats.record("(ping)", latency)
+        except (asyncio.TimeoutError, ConnectionError, ConnectionClosed):
+            self.stats.fail("(ping)")
+
+
+class StandInServer:
+    """Server WebSocket giả lập wss://api.xiaozhi.me/mcp/"""
+
+    def __init__(self, stats: LoadStats, timeout: float):
+        self.stats = stats
+        self.timeout = timeout
+        self.devices = {}
+        self._changed = asyncio.Condition()
+
+    async def handler(self, ws):
+        query = parse_qs(urlparse(ws.request.path).query)
+        token = (query.get("token") or [f"anon-{id(ws)}"])[0]
+        session = DeviceSession(ws, token, self.stats, self.timeout)
+        reader = asyncio.create_task(session.read_loop())
+        try:
+            await session.handshake()
+            async with self._changed:
+                self.devices[token] = session
+                self._changed.notify_all()
+            print(f"📡 [LoadTest] Device '{token}' ready ({len(session.tools)} tools)")
+            await reader
+        except Exception as e:
+            print(f"⚠️ [LoadTest] Device '{token}' error: {e}")
+        finally:
+            reader.cancel()
+            async with self._changed:
+                if self.devices.get(token) is session:
+                    del self.devices[token]
+                self._changed.notify_all()
+
+    async def wait_for_devices(self, count: int, timeout: float = None, exclude: tuple = ()):
+        """Chờ đủ count thiết bị ready (bỏ qua các session cũ trong exclude)"""
+        def fresh():
+            return [s for s in self.devices.values() if s not in exclude]
+
+        async with self._changed:
+            await asyncio.wait_for(self._changed.wait_for(lambda: len(fresh()) >= count), timeout)
+        return fresh()[:count]
+
+
+# ============================================================
+# KỊCH BẢN
+# ============================================================
+
+async def _ping_loop(server: "StandInServer", interval: float = 0.5):
+    while True:
+        sessions = list(server.devices.values())
+        await asyncio.gather(*[s.ping() for s in sessions], return_exceptions=True)
+        await asyncio.sleep(interval)
+
+
+def _slow_tool(session: DeviceSession):
+    return "loadtest_sleep" if "loadtest_sleep" in session.tools else None
+
+
+async def scenario_burst(server: StandInServer, args):
+    sessions = await server.wait_for_devices(args.devices)
+    await asyncio.gather(*[
+        s.call_tool(args.fast_tool) for s in sessions for _ in range(args.calls)
+    ])
+
+
+async def scenario_mixed(server: StandInServer, args):
+    sessions = await server.wait_for_devices(args.devices)
+
+    async def drive(session: DeviceSession):
+        slow = _slow_tool(session)
+        if slow is None:
+            print("⚠️ [LoadTest] loadtest_sleep không có - chạy miniZ với XIAOZHI_LOADTEST=1")
+        calls = []
+        for i in range(args.calls):
+            if slow and i % args.slow_every == 0:
+                calls.append(asyncio.create_task(session.call_tool(
+                    slow, {"delay_ms": args.slow_ms, "block_ms": args.block_ms},
+                    label=f"loadtest_sleep({args.slow_ms}ms)"
+                )))
+            else:
+                calls.append(asyncio.create_task(session.call_tool(args.fast_tool)))
+            await asyncio.sleep(1 / args.rate)
+        await asyncio.gather(*calls)
+
+    await asyncio.gather(*[drive(s) for s in sessions])
+
+
+async def scenario_reconnect(server: StandInServer, args):
+    await server.wait_for_devices(args.devices)
+    for round_no in range(1, args.rounds + 1):
+        sessions = list(server.devices.values())
+        started = time.perf_counter()
+        await asyncio.gather(*[s.ws.close() for s in sessions], return_exceptions=True)
+        try:
+            sessions = await server.wait_for_devices(args.devices, timeout=args.timeout, exclude=tuple(sessions))
+        except asyncio.TimeoutError:
+            print(f"❌ [LoadTest] Round {round_no}: devices did not reconnect in {args.timeout}s")
+            server.stats.fail("(reconnect storm)")
+            continue
+        server.stats.record("(reconnect storm)", time.perf_counter() - started)
+        await asyncio.gather(*[s.call_tool(args.fast_tool) for s in sessions])
+        print(f"🔄 [LoadTest] Round {round_no}/{args.rounds}: {len(sessions)} devices back")
+
+
+SCENARIOS = {
+    "burst": [scenario_burst],
+    "mixed": [scenario_mixed],
+    "reconnect": [scenario_reconnect],
+    "all": [scenario_burst, scenario_mixed, scenario_reconnect],
+}
+
+
+# ============================================================
+# BÁO CÁO
+# ============================================================
+
+def fetch_app_perf(app_url: str):
+    """Lấy /api/perf từ miniZ (event-loop lag của app). None nếu không truy cập được"""
+    try:
+        with urllib.request.urlopen(f"{app_url.rstrip('/')}/api/perf", timeout=3) as resp:
+            return json.loads(resp.read().decode("utf-8"))
+    except Exception:
+        return None
+
+
+def print_report(title: str, report: dict):
+    print()
+    print(f"=== {title} | {report['duration_s']}s ===")
+    print(f"{'tool':<34}{'count':>7}{'err':>5}{'fail':>6}{'p50ms':>10}{'p95ms':>10}{'p99ms':>10}{'maxms':>10}")
+    for label, row in report["tools"].items():
+        print(f"{label:<34}{row['count']:>7}{row['errors']:>5}{row['failed']:>6}{row['p50_ms']:>10}"
+              f"{row['p95_ms']:>10}{row['p99_ms']:>10}{row['max_ms']:>10}")
+    print(f"frames in:  {report['frames_in']} ({report['frames_in_per_s']}/s)")
+    print(f"frames out: {report['frames_out']} ({report['frames_out_per_s']}/s)")
+    print(f"progress notifications: {report['progress_notifications']}")
+    lag = report["harness_loop_lag"]
+    if lag.get("samples"):
+        print(f"harness loop lag: p50 {lag['p50_ms']}ms, p95 {lag['p95_ms']}ms, max {lag['max_ms']}ms")
+    app_lag = (report.get("app_perf") or {}).get("loop_lag") or {}
+    if app_lag.get("samples"):
+        print(f"app loop lag:     p50 {app_lag['p50_ms']}ms, p95 {app_lag['p95_ms']}ms, "
+              f"p99 {app_lag['p99_ms']}ms, max {app_lag['max_ms']}ms")
+    else:
+        print("app loop lag:     (không lấy được /api/perf)")
+
+
+async def run(args) -> dict:
+    stats = LoadStats()
+    server = StandInServer(stats, args.timeout)
+    lag = LoopLagSampler()
+    async with serve(server.handler, args.host, args.port, max_size=16 * 1024 * 1024):
+        print(f"🚀 [LoadTest] Stand-in MCP server on ws://{args.host}:{args.port}/mcp/")
+        print(f"⏳ [LoadTest] Waiting for {args.devices} device(s)...")
+        await server.wait_for_devices(args.devices, timeout=args.connect_timeout)
+
+        stats.__init__()  # Bỏ số liệu handshake ban đầu, chỉ đo kịch bản
+        lag.start()
+        pinger = asyncio.create_task(_ping_loop(server))
+        for scenario in SCENARIOS[args.scenario]:
+            print(f"▶️ [LoadTest] {scenario.__name__}")
+            await scenario(server, args)
+        pinger.cancel()
+
+        report = stats.report()
+        report["harness_loop_lag"] = lag.stop()
+        report["app_perf"] = fetch_app_perf(args.app_url)
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="miniZ MCP stand-in server + load generator")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="mixed")
+    parser.add_argument("--devices", type=int, default=1, help="Số thiết bị đồng thời cần chờ kết nối")
+    parser.add_argument("--calls", type=int, default=50, help="Số tools/call mỗi thiết bị")
+    parser.add_argument("--rate", type=float, default=20, help="tools/call mỗi giây (mixed)")
+    parser.add_argument("--fast-tool", default="get_current_time")
+    parser.add_argument("--slow-ms", type=int, default=2000, help="Độ trễ async của tool chậm")
+    parser.add_argument("--block-ms", type=int, default=0, help="Thời gian tool chậm block event loop")
+    parser.add_argument("--slow-every", type=int, default=5, help="Cứ N call thì 1 call chậm")
+    parser.add_argument("--rounds", type=int, default=3, help="Số vòng reconnect storm")
+    parser.add_argument("--timeout", type=float, default=60, help="Timeout mỗi request (s)")
+    parser.add_argument("--connect-timeout", type=float, default=120, help="Thời gian chờ thiết bị kết nối (s)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--app-url", default="http://127.0.0.1:8000", help="miniZ Web UI (để đọc /api/perf)")
+    parser.add_argument("--json", dest="json_path", help="Ghi báo cáo ra file JSON")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print_report(f"miniZ MCP load test: {args.scenario} | devices={args.devices}", report)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 Report saved to {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
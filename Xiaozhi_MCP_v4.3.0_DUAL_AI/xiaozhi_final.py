@@ -12,6 +12,25 @@ import psutil
 import time
 import os
 import sys
+import concurrent.futures
+import contextvars
+import functools
+import hashlib
+import heapq
+import importlib.util
+import inspect
+import itertools
+import math
+import queue
+import random
+import sqlite3
+import threading
+import unicodedata
+from array import array
+from bisect import bisect_left
+from collections import Counter, OrderedDict, defaultdict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from datetime import datetime
 from pathlib import Path
 from fastapi import FastAPI, WebSocket, HTTPException
@@ -300,6 +319,7 @@ except ImportError:
 # Gemini AI
 try:
     import google.generativeai as genai
+    from google.generativeai.client import get_default_generative_client
     GEMINI_AVAILABLE = True
 except ImportError:
     GEMINI_AVAILABLE = False
@@ -507,6 +527,480 @@ def sanitize_tool_name(name: str) -> str:
     sanitized = sanitized.strip('_')
     return sanitized.lower()
 
+# ============================================================
+# 🤖 AI CLIENT MANAGER - Gemini/OpenAI: cache model, rate limit, quota thật
+# ============================================================
+# - Cache GenerativeModel / OpenAI client theo (key, model, config) thay vì tạo lại mỗi lần gọi
+# - Token bucket theo API key (RPM, TPM) và theo model (RPM)
+# - Hàng đợi ưu tiên: voice/MCP (interactive) > Web UI (default) > index tài liệu (background)
+# - Đếm request/token thực tế theo phút và theo ngày, backoff khi gặp 429
+
+AI_PROVIDER_LIMITS = {
+    # Free tier mặc định - chỉnh theo gói API đang dùng
+    "gemini": {"rpm": 60, "tpm": 1_000_000, "rpd": 1500},
+    "openai": {"rpm": 500, "tpm": 200_000, "rpd": 10_000},
+}
+AI_MODEL_RPM = {
+    # Giới hạn riêng từng model (mặc định = rpm của provider)
+    "models/gemini-3-flash-preview": 30,
+}
+AI_PRIORITY_INTERACTIVE = 0  # Robot đang chờ trả lời bằng giọng nói
+AI_PRIORITY_DEFAULT = 1      # Web UI, REST
+AI_PRIORITY_BACKGROUND = 2   # Index knowledge base, tóm tắt hàng loạt
+AI_BACKOFF_BASE = 2          # seconds - backoff 429 đầu tiên, nhân đôi mỗi lần liên tiếp
+AI_BACKOFF_MAX = 60
+
+_ai_priority = contextvars.ContextVar("ai_request_priority", default=AI_PRIORITY_DEFAULT)
+
+
+def set_ai_priority(priority: int):
+    """Đặt độ ưu tiên gọi AI cho task hiện tại (và các task con)"""
+    _ai_priority.set(priority)
+
+
+def is_rate_limit_error(e: Exception) -> bool:
+    """429 / ResourceExhausted / RateLimitError của Gemini, google-genai, OpenAI"""
+    name = type(e).__name__
+    text = str(e)
+    return name in ("ResourceExhausted", "RateLimitError", "TooManyRequests") or "429" in text or "RESOURCE_EXHAUSTED" in text
+
+
+class TokenBucket:
+    """Token bucket nạp theo phút. Cho phép âm (trừ token sau khi biết usage thật)"""
+
+    def __init__(self, per_minute: float, burst: float = None):
+        self.rate = per_minute / 60.0
+        self.capacity = burst if burst is not None else max(1.0, per_minute / 6)
+        self.tokens = self.capacity
+        self.blocked_until = 0.0
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        self._refill(now)
+        wait = max(0.0, self.blocked_until - now)
+        deficit = amount - self.tokens if amount else -self.tokens
+        if deficit > 0:
+            wait = max(wait, deficit / self.rate)
+        return wait
+
+    def take(self, amount: float, now: float):
+        self._refill(now)
+        self.tokens -= amount
+
+
+class AIUsageCounter:
+    """Request/token theo cửa sổ 60s trượt + tổng theo ngày"""
+
+    def __init__(self):
+        self._minute = deque()  # (monotonic, tokens) - 1 phần tử / request
+        self.day = datetime.now().strftime("%Y-%m-%d")
+        self.day_requests = 0
+        self.day_tokens = 0
+        self.day_errors = 0
+        self.day_rate_limited = 0
+
+    def _roll_day(self):
+        today = datetime.now().strftime("%Y-%m-%d")
+        if today != self.day:
+            self.day = today
+            self.day_requests = self.day_tokens = self.day_errors = self.day_rate_limited = 0
+
+    def add(self, tokens: int = 0, error: bool = False, rate_limited: bool = False):
+        self._roll_day()
+        self._minute.append((time.monotonic(), tokens))
+        self.day_requests += 1
+        self.day_tokens += tokens
+        self.day_errors += int(error)
+        self.day_rate_limited += int(rate_limited)
+
+    def snapshot(self) -> dict:
+        self._roll_day()
+        cutoff = time.monotonic() - 60
+        while self._minute and self._minute[0][0] < cutoff:
+            self._minute.popleft()
+        return {
+            "requests_last_min": len(self._minute),
+            "tokens_last_min": sum(tokens for _, tokens in self._minute),
+            "requests_today": self.day_requests,
+            "tokens_today": self.day_tokens,
+            "errors_today": self.day_errors,
+            "rate_limited_today": self.day_rate_limited,
+        }
+
+
+class AISlot:
+    """Quyền gọi 1 request AI (lấy qua ai_clients.slot) - ghi usage thật sau khi gọi xong"""
+
+    def __init__(self, manager, provider: str, model: str, api_key: str):
+        self.manager = manager
+        self.provider = provider
+        self.model = model
+        self.api_key = api_key
+        self.tokens = 0
+        self.recorded = False
+
+    def record(self, response=None, tokens: int = None):
+        """Đọc usage từ response Gemini (usage_metadata) / OpenAI (usage)"""
+        if tokens is None:
+            tokens = 0
+            usage = getattr(response, "usage_metadata", None)
+            if usage is not None:
+                tokens = getattr(usage, "total_token_count", 0) or (
+                    (getattr(usage, "prompt_token_count", 0) or 0) + (getattr(usage, "candidates_token_count", 0) or 0)
+                )
+            usage = getattr(response, "usage", None)
+            if usage is not None:
+                tokens = getattr(usage, "total_tokens", 0) or 0
+        self.tokens = int(tokens or 0)
+        self.recorded = True
+
+
+class AIClientManager:
+    """Quản lý client Gemini/OpenAI dùng chung cho toàn bộ app"""
+
+    def __init__(self):
+        self._models = {}           # (key, model, config) → GenerativeModel
+        self._clients = {}          # (provider, key) → client (OpenAI, google-genai)
+        self._configured_key = None
+        self._configure_lock = threading.Lock()  # genai.configure đổi key của client mặc định toàn cục
+        self._buckets = {}          # ("key"|"tpm"|"model", provider, key/model) → TokenBucket
+        self._backoff_level = {}    # (provider, key) → số lần 429 liên tiếp
+        self._usage = {}            # (provider, model) → AIUsageCounter
+        self._waiters = []          # [priority, seq, buckets, future]
+        self._seq = itertools.count()
+        self._wakeup = None
+        self.queue_peak = 0
+
+    # ---------- Client / model cache ----------
+
+    def _default_key(self, provider: str) -> str:
+        return GEMINI_API_KEY if provider == "gemini" else OPENAI_API_KEY
+
+    def gemini_model(self, model_name: str, generation_config=None, api_key: str = None, **kwargs):
+        """GenerativeModel dùng chung (google-generativeai). kwargs: tools, system_instruction..."""
+        api_key = api_key or GEMINI_API_KEY
+        cache_key = (api_key, model_name, repr(generation_config), repr(sorted(kwargs.items())))
+        model = self._models.get(cache_key)
+        if model is None:
+            if generation_config is not None:
+                kwargs["generation_config"] = generation_config
+            model = genai.GenerativeModel(model_name, **kwargs)
+            # GenerativeModel chỉ lấy client mặc định (key của lần configure gần nhất) ở lần generate đầu →
+            # gắn client của đúng key ngay lúc tạo, model key khác configure sau đó không đổi key của model này
+            with self._configure_lock:
+                if self._configured_key != api_key:
+                    genai.configure(api_key=api_key)
+                    self._configured_key = api_key
+                model._client = get_default_generative_client()
+            self._models[cache_key] = model
+        return model
+
+    def genai_client(self, api_key: str = None):
+        """Client google-genai (SDK mới - TTS, Google Search grounding)"""
+        api_key = api_key or GEMINI_API_KEY
+        client = self._clients.get(("google-genai", api_key))
+        if client is None:
+            from google import genai as google_genai
+            client = self._clients[("google-genai", api_key)] = google_genai.Client(api_key=api_key)
+        return client
+
+    def openai_client(self, api_key: str = None):
+        api_key = api_key or OPENAI_API_KEY
+        client = self._clients.get(("openai", api_key))
+        if client is None:
+            client = self._clients[("openai", api_key)] = OpenAI(api_key=api_key)
+        return client
+
+    # ---------- Rate limit + hàng đợi ưu tiên ----------
+
+    def _bucket(self, kind: str, provider: str, name: str) -> TokenBucket:
+        key = (kind, provider, name)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            limits = AI_PROVIDER_LIMITS.get(provider, {})
+            if kind == "model":
+                bucket = TokenBucket(AI_MODEL_RPM.get(name, limits.get("rpm", 60)))
+            elif kind == "tpm":
+                bucket = TokenBucket(limits.get("tpm", 1_000_000), burst=limits.get("tpm", 1_000_000) / 4)
+            else:
+                bucket = TokenBucket(limits.get("rpm", 60))
+            self._buckets[key] = bucket
+        return bucket
+
+    def _usage_counter(self, provider: str, model: str) -> AIUsageCounter:
+        counter = self._usage.get((provider, model))
+        if counter is None:
+            counter = self._usage[(provider, model)] = AIUsageCounter()
+        return counter
+
+    def _pump(self):
+        """Cấp quyền cho các request đang chờ theo (priority, thứ tự đến)"""
+        if self._wakeup is not None:
+            self._wakeup.cancel()
+            self._wakeup = None
+        now = time.monotonic()
+        blocked = set()
+        next_wait = None
+        remaining = []
+        for waiter in sorted(self._waiters, key=lambda w: (w[0], w[1])):
+            _, _, buckets, future = waiter
+            if future.done():
+                continue
+            ids = {id(b) for b, _ in buckets}
+            if ids & blocked:
+                # Request ưu tiên cao hơn đang chờ cùng bucket → không cho vượt
+                remaining.append(waiter)
+                continue
+            wait = max(b.wait_time(amount, now) for b, amount in buckets)
+            if wait <= 0:
+                for b, amount in buckets:
+                    b.take(amount, now)
+                future.set_result(None)
+            else:
+                blocked |= ids
+                remaining.append(waiter)
+                next_wait = wait if next_wait is None else min(next_wait, wait)
+        self._waiters = remaining
+        if next_wait is not None:
+            self._wakeup = asyncio.get_running_loop().call_later(next_wait, self._pump)
+
+    async def _acquire(self, provider: str, model: str, api_key: str, priority: int):
+        buckets = [
+            (self._bucket("key", provider, api_key), 1),
+            (self._bucket("model", provider, model), 1),
+            (self._bucket("tpm", provider, api_key), 0),  # chỉ chờ khi TPM đang âm
+        ]
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append([priority, next(self._seq), buckets, future])
+        self.queue_peak = max(self.queue_peak, len(self._waiters))
+        self._pump()
+        try:
+            await future
+        except asyncio.CancelledError:
+            self._waiters = [w for w in self._waiters if w[3] is not future]
+            raise
+
+    def _on_rate_limited(self, provider: str, api_key: str):
+        level = self._backoff_level.get((provider, api_key), 0)
+        self._backoff_level[(provider, api_key)] = level + 1
+        delay = min(AI_BACKOFF_MAX, AI_BACKOFF_BASE * (2 ** level))
+        self._bucket("key", provider, api_key).blocked_until = time.monotonic() + delay
+        print(f"⚠️ [AI] {provider} rate limited (429) - backoff {delay:.0f}s")
+
+    @asynccontextmanager
+    async def slot(self, provider: str, model: str, priority: int = None, api_key: str = None):
+        """
+        Chờ tới lượt gọi AI (rate limit + ưu tiên), rồi đếm usage:
+
+            async with ai_clients.slot("gemini", model_name) as slot:
+                response = await asyncio.to_thread(model.generate_content, prompt)
+                slot.record(response)
+        """
+        api_key = api_key or self._default_key(provider)
+        key_id = api_key[-6:] if api_key else "none"
+        priority = _ai_priority.get() if priority is None else priority
+        await self._acquire(provider, model, key_id, priority)
+        slot = AISlot(self, provider, model, key_id)
+        counter = self._usage_counter(provider, model)
+        try:
+            yield slot
+        except Exception as e:
+            rate_limited = is_rate_limit_error(e)
+            if rate_limited:
+                self._on_rate_limited(provider, key_id)
+            counter.add(error=True, rate_limited=rate_limited)
+            raise
+        else:
+            self._backoff_level.pop((provider, key_id), None)
+            counter.add(tokens=slot.tokens)
+            if slot.tokens:
+                self._bucket("tpm", provider, key_id).take(slot.tokens, time.monotonic())
+
+    async def generate(self, model_name: str, prompt, generation_config=None, timeout: float = None,
+                       priority: int = None, api_key: str = None, **model_kwargs):
+        """Gemini generate_content (google-generativeai) trong thread, qua rate limit + quota"""
+        model = self.gemini_model(model_name, generation_config, api_key=api_key, **model_kwargs)
+        async with self.slot("gemini", model_name, priority=priority, api_key=api_key) as slot:
+            call = asyncio.to_thread(model.generate_content, prompt)
+            response = await (asyncio.wait_for(call, timeout) if timeout else call)
+            slot.record(response)
+            return response
+
+    def snapshot(self) -> dict:
+        providers = {}
+        for (provider, model), counter in self._usage.items():
+            entry = providers.setdefault(provider, {"requests_last_min": 0, "tokens_last_min": 0,
+                                                    "requests_today": 0, "tokens_today": 0, "models": {}})
+            stats = counter.snapshot()
+            entry["models"][model] = stats
+            for field in ("requests_last_min", "tokens_last_min", "requests_today", "tokens_today"):
+                entry[field] += stats[field]
+        for provider, entry in providers.items():
+            limits = AI_PROVIDER_LIMITS.get(provider, {})
+            entry["limits"] = limits
+            if limits.get("rpd"):
+                entry["remaining_today_estimate"] = max(0, limits["rpd"] - entry["requests_today"])
+        now = time.monotonic()
+        return {
+            "providers": providers,
+            "queued": len(self._waiters),
+            "queue_peak": self.queue_peak,
+            "backoff": {
+                f"{provider}:{key}": round(bucket.blocked_until - now, 1)
+                for (kind, provider, key), bucket in self._buckets.items()
+                if kind == "key" and bucket.blocked_until > now
+            },
+        }
+
+
+ai_clients = AIClientManager()
+
+# ============================================================
+# 📶 MCP PROGRESS - notifications/progress cho tool chạy lâu
+# ============================================================
+
+
+class ProgressReporter:
+    """
+    Gửi notifications/progress về server MCP theo progressToken của request.
+    Tool gọi report_progress() ở từng bước hoặc với từng đoạn text trả về sớm
+    để robot có phản hồi đầu tiên trong ~1s thay vì chờ toàn bộ kết quả.
+    """
+
+    MIN_INTERVAL = 0.25  # seconds - gộp bớt cập nhật dồn dập (trừ khi force)
+
+    def __init__(self, send, progress_token):
+        self._send = send
+        self.progress_token = progress_token
+        self.progress = 0
+        self.total = None  # Total đã báo lần gần nhất - progress không được vượt
+        self.sent = 0
+        self._last_sent = 0.0
+        self._pending_text = ""
+
+    async def report(self, message: str = "", progress: float = None, total: float = None,
+                     partial: bool = False, force: bool = False) -> bool:
+        # Text partial được cộng dồn để không mất chunk khi bị throttle
+        if partial and message:
+            self._pending_text += message
+            message = self._pending_text
+        if total is not None:
+            self.total = total
+        now = time.monotonic()
+        if not force and now - self._last_sent < self.MIN_INTERVAL:
+            return False
+        self.progress = progress if progress is not None and progress > self.progress else self.progress + 1
+        if self.total is not None:
+            self.progress = min(self.progress, self.total)  # Chunk stream sau bước cuối không đẩy progress quá total
+        notification_params = {"progressToken": self.progress_token, "progress": self.progress}
+        if self.total is not None:
+            notification_params["total"] = self.total
+        if message:
+            notification_params["message"] = message
+        try:
+            await self._send(json.dumps({
+                "jsonrpc": "2.0",
+                "method": "notifications/progress",
+                "params": notification_params
+            }, ensure_ascii=False))
+        except Exception as e:
+            print(f"⚠️ [Progress] Send failed: {e}")
+            return False
+        self._last_sent = now
+        self._pending_text = ""
+        self.sent += 1
+        return True
+
+    async def flush(self) -> bool:
+        """Gửi nốt phần text partial còn bị giữ lại do throttle"""
+        if not self._pending_text:
+            return False
+        text, self._pending_text = self._pending_text, ""
+        return await self.report(text, partial=True, force=True)
+
+
+_current_progress = contextvars.ContextVar("mcp_progress_reporter", default=None)
+
+
+def has_progress_reporter() -> bool:
+    """True nếu tool đang chạy trong request MCP có progressToken"""
+    return _current_progress.get() is not None
+
+
+async def report_progress(message: str = "", progress: float = None, total: float = None,
+                          partial: bool = False, force: bool = False) -> bool:
+    """
+    Báo tiến độ / kết quả một phần từ bên trong tool.
+    Không có progressToken (gọi từ Web UI, REST...) thì bỏ qua.
+    """
+    reporter = _current_progress.get()
+    if reporter is None:
+        return False
+    return await reporter.report(message, progress, total, partial, force)
+
+
+async def gemini_generate_with_progress(gemini_model, prompt: str, generation_config=None) -> str:
+    """
+    Gọi Gemini trong thread riêng (không block event loop), qua rate limit/quota của ai_clients.
+    Nếu request có progressToken → dùng stream=True và đẩy từng chunk qua report_progress.
+    Returns: toàn bộ text đã ghép.
+    """
+    kwargs = {"generation_config": generation_config} if generation_config is not None else {}
+    model_name = getattr(gemini_model, "model_name", "gemini")
+    async with ai_clients.slot("gemini", model_name) as slot:
+        if not has_progress_reporter():
+            response = await asyncio.to_thread(gemini_model.generate_content, prompt, **kwargs)
+            slot.record(response)
+            return response.text if response and hasattr(response, 'text') else ""
+
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        done = object()
+        stream_holder = []
+        stop = threading.Event()  # Set khi caller bị hủy → thread ngừng đọc stream
+
+        def _stream():
+            try:
+                stream = gemini_model.generate_content(prompt, stream=True, **kwargs)
+                stream_holder.append(stream)
+                for chunk in stream:
+                    if stop.is_set():
+                        break
+                    try:
+                        text = chunk.text
+                    except Exception:
+                        text = ""  # Chunk không có text (safety/finish reason)
+                    if text:
+                        loop.call_soon_threadsafe(queue.put_nowait, text)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, done)
+
+        worker = loop.run_in_executor(None, _stream)
+        parts = []
+        try:
+            while True:
+                item = await queue.get()
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    await worker
+                    raise item
+                parts.append(item)
+                await report_progress(item, partial=True, force=len(parts) == 1)
+        finally:
+            stop.set()
+        await worker
+        if stream_holder:
+            slot.record(stream_holder[0])  # usage_metadata có sau khi stream xong
+        await _current_progress.get().flush()
+        return "".join(parts)
+
 async def get_system_info(category="all"):
     """
     Thu thập thông tin cấu hình máy tính chi tiết
@@ -873,13 +1367,237 @@ async def get_system_info(category="all"):
 
 # Tool retry configuration (từ repo chính thức)
 MAX_TOOL_RETRIES = 3
-TOOL_RETRY_INTERVAL = 2  # seconds
+TOOL_RETRY_BASE_DELAY = 0.5  # seconds - backoff gốc, nhân đôi mỗi lần retry (có jitter)
+TOOL_RETRY_MAX_DELAY = 4     # seconds - trần backoff
+
+# Tool deadline configuration - tool có thể khai báo "timeout" riêng trong TOOLS
+TOOL_DEFAULT_TIMEOUT = 30    # seconds - khi tool chưa khai báo và chưa đủ lịch sử latency
+TOOL_MIN_TIMEOUT = 10        # seconds - sàn cho timeout tự thích nghi (1 lần mạng chậm không bị cắt oan)
+TOOL_LATENCY_HISTORY = 50    # Số mẫu latency giữ lại cho mỗi tool
+
+# ============================================================
+# 🔤 KEYWORD CLASSIFIER - 1 automaton cho mọi bộ từ khóa (realtime/nhạc/topic)
+# ============================================================
+# Thay cho các vòng `any(kw in text_lower for kw in ...)` rải rác (mỗi lần O(từ khóa × độ dài text),
+# danh sách mỗi nơi mỗi khác). Aho-Corasick: dựng 1 lần lúc import, 1 lần duyệt text → mọi category khớp.
+# Ngữ nghĩa giữ nguyên: khớp chuỗi con trên text lowercase (thêm NFC + gộp khoảng trắng).
+
+# Câu hỏi cần thông tin thời gian thực (gộp từ ask_gemini, /api/smart_chat, /api/tool/ask_gemini
+# và IntentDetector.REALTIME_PATTERNS)
+REALTIME_KEYWORDS = [
+    # Giá cả, tài chính
+    'giá vàng', 'giá usd', 'giá đô', 'giá euro', 'tỷ giá', 'giá bitcoin', 'crypto', 'chứng khoán',
+    'stock', 'gold price', 'exchange rate', 'giá xăng', 'giá dầu',
+    'giá cao nhất', 'cao nhất', 'thấp nhất', 'giá hiện tại', 'giá mới nhất', 'bao nhiêu tiền',
+    'highest price', 'lowest price', 'current price', 'latest price',
+    'bitcoin', 'ethereum', 'btc', 'eth',
+
+    # Thời tiết
+    'thời tiết', 'weather', 'nhiệt độ', 'temperature', 'mưa', 'rain',
+    'trời nắng', 'trời nóng', 'trời lạnh',
+
+    # Tin tức, sự kiện
+    'tin tức', 'tin mới', 'news', 'mới nhất', 'latest', 'breaking', 'sự kiện',
+    # Khớp chuỗi con → không dùng 'lịch'/'event'/'schedule' trơn ("lịch sử", "du lịch", "prevent")
+    'lịch thi đấu', 'lịch chiếu', 'lịch phát sóng', 'lịch nghỉ', 'lịch thi',
+    'upcoming events', 'event schedule', 'match schedule',
+
+    # Thời gian thực
+    'hôm nay', 'bây giờ', 'hiện nay', 'hiện tại', 'hiện giờ', 'năm nay',
+    'today', 'now', 'current', 'currently',
+    'năm 2024', 'năm 2025', 'năm 2026', '2024', '2025', '2026',
+
+    # Thể thao, cuộc thi
+    'vô địch', 'champion', 'winner', 'kết quả', 'score', 'result',
+    'olympia', 'world cup', 'euro', 'sea games', 'olympic', 'bóng đá', 'football',
+
+    # Người nổi tiếng, chính trị
+    'tổng thống', 'president', 'thủ tướng', 'prime minister', 'chủ tịch', 'giám đốc',
+    'ceo', 'founder', 'leader', 'ai là', 'ai đang', 'who is', 'who are', 'who won',
+
+    # Sản phẩm, công nghệ mới
+    'iphone', 'samsung', 'tesla', 'apple', 'google', 'microsoft',
+    'ra mắt', 'launch', 'release', 'announced',
+
+    # Sự kiện xã hội
+    'covid', 'earthquake', 'động đất', 'bão', 'storm', 'lũ lụt', 'flood',
+    'tai nạn', 'accident', 'cháy', 'fire', 'chiến tranh', 'xung đột',
+
+    # Tra cứu chung
+    'là ai', 'là gì', 'ở đâu', 'what is', 'where is', 'how much', 'how many',
+    'bao nhiêu', 'khi nào', 'when',
+]
+
+# Các từ khóa để nhận diện lệnh nhạc - QUAN TRỌNG: thêm nhiều biến thể pause/stop
+MUSIC_KEYWORDS = [
+    # Phát nhạc
+    'phát nhạc', 'bật nhạc', 'mở nhạc', 'nghe nhạc', 'play music', 'chơi nhạc',
+    'phát bài', 'bật bài', 'mở bài', 'nghe bài', 'play song',
+    'phat nhac', 'bat nhac', 'mo nhac',
+    
+    # TẠM DỪNG - nhiều biến thể (QUAN TRỌNG!)
+    'tạm dừng', 'pause', 'dừng nhạc', 'dừng lại', 'ngưng nhạc', 'ngừng phát',
+    'tam dung', 'dung nhac', 'dung lai', 'ngung nhac',
+    'pao', 'pao nhac', 'poz', 'pốt',
+    'dừng', 'ngừng', 'nghỉ', 'im đi',
+    
+    # DỪNG HẲN/STOP
+    'stop music', 'tắt nhạc', 'dừng hẳn', 'stop', 'off nhạc',
+    'tat nhac', 'dung han', 'tắt đi', 'tắt bài',
+    
+    # Tiếp tục
+    'tiếp tục', 'resume', 'phát tiếp', 'tiep tuc', 'phat tiep',
+    
+    # Bài tiếp/trước
+    'bài tiếp', 'next', 'skip', 'chuyển bài', 'bài tiếp theo',
+    'bai tiep', 'tiep theo',
+    'bài trước', 'previous', 'quay lại bài', 'bai truoc', 'quay lai',
+    
+    # Âm lượng
+    'âm lượng', 'volume', 'tăng tiếng', 'giảm tiếng', 'to lên', 'nhỏ lại',
+    'tang am luong', 'giam am luong',
+    
+    # Trạng thái
+    'đang phát gì', 'bài gì', 'đang nghe gì',
+    
+    # Shuffle/Repeat
+    'trộn bài', 'shuffle', 'ngẫu nhiên', 'lặp lại', 'repeat', 'loop'
+]
+
+# Lệnh YouTube - loại trừ khỏi lệnh nhạc local
+YOUTUBE_KEYWORDS = ['youtube', 'video', 'clip', 'xem phim']
+
+# Topic quan tâm của user (update_user_profile_from_message)
+USER_TOPIC_KEYWORDS = {
+    "music": ["nhạc", "bài", "hát", "music", "song", "play", "pause", "volume"],
+    "weather": ["thời tiết", "weather", "mưa", "nắng", "nhiệt độ", "temperature"],
+    "news": ["tin", "news", "mới", "sự kiện", "event"],
+    "finance": ["giá", "vàng", "gold", "btc", "bitcoin", "chứng khoán", "stock", "usd", "tỷ giá"],
+    "system": ["âm lượng", "volume", "mở", "open", "tắt", "close", "kill"],
+    "web": ["tìm", "search", "google", "web", "tra cứu"],
+    "coding": ["code", "python", "javascript", "lập trình", "debug", "function"],
+    "general": ["là gì", "what is", "how to", "làm sao", "tại sao", "why"]
+}
+
+KEYWORD_CATEGORIES = {
+    "realtime": REALTIME_KEYWORDS,
+    "music": MUSIC_KEYWORDS,
+    "youtube": YOUTUBE_KEYWORDS,
+    **{f"topic:{topic}": keywords for topic, keywords in USER_TOPIC_KEYWORDS.items()},
+}
+
+
+class KeywordClassifier:
+    """
+    Aho-Corasick nhiều category. Mỗi state giữ bitmask category khớp (đã gộp theo fail link)
+    và bảng chuyển trạng thái thưa: chỉ lưu các cạnh khác với cạnh từ root,
+    nên bước duyệt không phải đi ngược fail link (tối đa 2 lần tra dict mỗi ký tự).
+    """
+
+    def __init__(self, categories: dict):
+        self.categories = list(categories)
+        self._bits = {name: 1 << i for i, name in enumerate(self.categories)}
+        self.all_mask = (1 << len(self.categories)) - 1
+        self.keyword_count = 0
+
+        # 1) Trie
+        goto = [{}]
+        out = [0]
+        for name, keywords in categories.items():
+            for keyword in keywords:
+                keyword = self.normalize(keyword)
+                if not keyword:
+                    continue
+                state = 0
+                for ch in keyword:
+                    nxt = goto[state].get(ch)
+                    if nxt is None:
+                        nxt = len(goto)
+                        goto[state][ch] = nxt
+                        goto.append({})
+                        out.append(0)
+                    state = nxt
+                out[state] |= self._bits[name]
+                self.keyword_count += 1
+
+        # 2) Fail link theo BFS + bảng chuyển thưa (so với root)
+        root = goto[0]
+        fail = [0] * len(goto)
+        sparse = [None] * len(goto)
+        sparse[0] = root
+        queue = deque()
+        for child in root.values():
+            sparse[child] = dict(goto[child])
+            queue.append(child)
+        while queue:
+            state = queue.popleft()
+            for ch, child in goto[state].items():
+                f = sparse[fail[state]].get(ch) if fail[state] else None
+                fail[child] = root.get(ch, 0) if f is None else f
+                out[child] |= out[fail[child]]
+                table = dict(sparse[fail[child]]) if fail[child] else {}
+                table.update(goto[child])
+                sparse[child] = table
+                queue.append(child)
+
+        self._root = root
+        self._sparse = sparse
+        self._out = out
+        self.state_count = len(goto)
+        self._labels = {}  # mask → frozenset tên category
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return " ".join(unicodedata.normalize("NFC", text).lower().split())
+
+    def mask(self, text: str) -> int:
+        """Bitmask các category khớp - 1 lần duyệt text"""
+        root_get = self._root.get
+        sparse = self._sparse
+        out = self._out
+        full = self.all_mask
+        state = 0
+        found = 0
+        for ch in self.normalize(text):
+            nxt = sparse[state].get(ch)
+            state = root_get(ch, 0) if nxt is None else nxt
+            if out[state]:
+                found |= out[state]
+                if found == full:
+                    break
+        return found
+
+    def classify(self, text: str) -> frozenset:
+        """Tập category khớp, VD: frozenset({"realtime", "topic:finance"})"""
+        found = self.mask(text)
+        labels = self._labels.get(found)
+        if labels is None:
+            labels = self._labels[found] = frozenset(
+                name for name, bit in self._bits.items() if found & bit)
+        return labels
+
+    def has(self, text: str, category: str) -> bool:
+        return bool(self.mask(text) & self._bits[category])
+
+
+keyword_classifier = KeywordClassifier(KEYWORD_CATEGORIES)
 
 # ============================================================
 # 🧠 INTENT DETECTION LLM - Phân tích ý định trước khi xử lý
 # (Từ xiaozhi-esp32-server chính thức)
 # ============================================================
 
+INTENT_LLM_MODEL = 'models/gemini-3-flash-preview'
+
+
+def compile_intent_patterns(intent: str, patterns: list):
+    """
+    Gộp cả họ pattern của 1 intent thành 1 regex alternation, mỗi pattern 1 named group
+    (intent_0, intent_1...) → 1 lần re.search thay cho N lần, m.lastgroup cho biết pattern nào khớp.
+    """
+    return re.compile("|".join(f"(?P<{intent}_{i}>{pattern})" for i, pattern in enumerate(patterns)))
+
+
 class IntentDetector:
     """
     Intent Detection LLM - Phân tích câu hỏi và xác định tool cần gọi
@@ -957,6 +1675,37 @@ class IntentDetector:
         r'gigabyte.*mainboard',
     ]
     
+    # Compile 1 lần lúc import - theo thứ tự ưu tiên khi kiểm tra
+    _INTENT_REGEXES = [
+        ("realtime", REALTIME_PATTERNS, compile_intent_patterns("realtime", REALTIME_PATTERNS)),
+        ("music", MUSIC_PATTERNS, compile_intent_patterns("music", MUSIC_PATTERNS)),
+        ("system_info", SYSTEM_INFO_PATTERNS, compile_intent_patterns("system_info", SYSTEM_INFO_PATTERNS)),
+        ("knowledge", KNOWLEDGE_BASE_PATTERNS, compile_intent_patterns("knowledge", KNOWLEDGE_BASE_PATTERNS)),
+    ]
+    
+    # Tool cụ thể cho câu hỏi realtime (theo thứ tự)
+    _REALTIME_TOOL_RULES = [
+        (re.compile(r'giá|tỷ giá|bao nhiêu'), "get_realtime_info"),
+        (re.compile(r'thời tiết|nhiệt độ|trời'), "get_realtime_info"),
+        (re.compile(r'tin tức|sự kiện|mới nhất'), "web_search"),
+        (re.compile(r'là ai|ai là|tổng thống|thủ tướng|ceo'), "web_search"),
+    ]
+    
+    _INTENT_RESULTS = {
+        "music": ("smart_music_control", 0.95),
+        "system_info": ("get_hardware_specs", 0.95),
+        "knowledge": ("get_knowledge_context", 0.85),
+    }
+    
+    @classmethod
+    def match_patterns(cls, text_lower: str):
+        """Trả về (intent, pattern) khớp đầu tiên theo thứ tự ưu tiên, hoặc (None, None)"""
+        for intent, patterns, regex in cls._INTENT_REGEXES:
+            match = regex.search(text_lower)
+            if match:
+                return intent, patterns[int(match.lastgroup.rsplit("_", 1)[1])]
+        return None, None
+    
     @classmethod
     def detect_intent(cls, text: str) -> dict:
         """
@@ -969,63 +1718,31 @@ class IntentDetector:
         }
         """
         text_lower = text.lower()
+        intent, pattern = cls.match_patterns(text_lower)
         
-        # Check realtime patterns
-        for pattern in cls.REALTIME_PATTERNS:
-            if re.search(pattern, text_lower):
-                # Xác định tool cụ thể
-                if any(word in text_lower for word in ['giá', 'tỷ giá', 'bao nhiêu']):
-                    tool = "get_realtime_info"
-                elif any(word in text_lower for word in ['thời tiết', 'nhiệt độ', 'trời']):
-                    tool = "get_realtime_info"
-                elif any(word in text_lower for word in ['tin tức', 'sự kiện', 'mới nhất']):
-                    tool = "web_search"
-                elif any(word in text_lower for word in ['là ai', 'ai là', 'tổng thống', 'thủ tướng', 'ceo']):
-                    tool = "web_search"
-                else:
-                    tool = "smart_answer"
-                    
-                return {
-                    "intent": "realtime",
-                    "suggested_tool": tool,
-                    "confidence": 0.9,
-                    "should_force_tool": True,
-                    "reason": f"Detected realtime pattern: {pattern}"
-                }
-        
-        # Check music patterns
-        for pattern in cls.MUSIC_PATTERNS:
-            if re.search(pattern, text_lower):
-                return {
-                    "intent": "music",
-                    "suggested_tool": "smart_music_control",
-                    "confidence": 0.95,
-                    "should_force_tool": True,
-                    "reason": f"Detected music pattern: {pattern}"
-                }
+        if intent == "realtime":
+            # Xác định tool cụ thể
+            tool = next((tool for regex, tool in cls._REALTIME_TOOL_RULES if regex.search(text_lower)),
+                        "smart_answer")
+            return {
+                "intent": "realtime",
+                "suggested_tool": tool,
+                "confidence": 0.9,
+                "should_force_tool": True,
+                "reason": f"Detected realtime pattern: {pattern}"
+            }
         
-        # Check system info patterns (mới thêm)
-        for pattern in cls.SYSTEM_INFO_PATTERNS:
-            if re.search(pattern, text_lower):
+        if intent is not None:
+            if intent == "system_info":
                 print(f"[DEBUG] System info pattern matched: {pattern} for text: {text_lower}")
-                return {
-                    "intent": "system_info",
-                    "suggested_tool": "get_hardware_specs",
-                    "confidence": 0.95,
-                    "should_force_tool": True,
-                    "reason": f"Detected system info pattern: {pattern}"
-                }
-        
-        # Check knowledge base patterns
-        for pattern in cls.KNOWLEDGE_BASE_PATTERNS:
-            if re.search(pattern, text_lower):
-                return {
-                    "intent": "knowledge",
-                    "suggested_tool": "get_knowledge_context",
-                    "confidence": 0.85,
-                    "should_force_tool": True,
-                    "reason": f"Detected knowledge pattern: {pattern}"
-                }
+            tool, confidence = cls._INTENT_RESULTS[intent]
+            return {
+                "intent": intent,
+                "suggested_tool": tool,
+                "confidence": confidence,
+                "should_force_tool": True,
+                "reason": f"Detected {intent} pattern: {pattern}"
+            }
         
         # General intent - không cần force tool
         return {
@@ -1042,6 +1759,7 @@ class IntentDetector:
         Sử dụng Gemini để phân tích intent phức tạp hơn
         Chỉ gọi khi pattern matching không chắc chắn
         Có thể kèm user context để hiểu người dùng tốt hơn
+        Kết quả LLM được cache theo câu đã chuẩn hóa (intent_llm_cache, lưu đĩa)
         """
         # Đầu tiên thử pattern matching
         result = cls.detect_intent(text)
@@ -1050,12 +1768,15 @@ class IntentDetector:
         if result["confidence"] >= 0.8:
             return result
         
+        # Câu mơ hồ đã hỏi LLM trước đó → dùng lại kết quả (micro giây thay vì 1 lượt Gemini)
+        cache_key, cache_class = intent_llm_cache.key("intent", text, INTENT_LLM_MODEL, query_class="evergreen")
+        cached = intent_llm_cache.get(cache_key, cache_class)
+        if cached is not None:
+            return cached
+        
         # Nếu có Gemini API, dùng LLM để phân tích
         if gemini_key and GEMINI_AVAILABLE:
             try:
-                genai.configure(api_key=gemini_key)
-                model = genai.GenerativeModel('models/gemini-3-flash-preview')
-                
                 # Lấy user context nếu được yêu cầu
                 user_context = ""
                 if include_user_context:
@@ -1084,7 +1805,7 @@ Quy tắc:
 
 CHỈ TRẢ LỜI JSON, KHÔNG GIẢI THÍCH.'''
 
-                response = model.generate_content(prompt)
+                response = await ai_clients.generate(INTENT_LLM_MODEL, prompt, api_key=gemini_key)
                 response_text = response.text.strip()
                 
                 # Parse JSON từ response
@@ -1093,7 +1814,7 @@ CHỈ TRẢ LỜI JSON, KHÔNG GIẢI THÍCH.'''
                 json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
                 if json_match:
                     llm_result = json.loads(json_match.group())
-                    return {
+                    result = {
                         "intent": llm_result.get("intent", "general"),
                         "suggested_tool": llm_result.get("tool") if llm_result.get("tool") != "none" else None,
                         "confidence": 0.85,
@@ -1101,6 +1822,8 @@ CHỈ TRẢ LỜI JSON, KHÔNG GIẢI THÍCH.'''
                         "reason": llm_result.get("reason", "LLM analysis"),
                         "source": "gemini_llm"
                     }
+                    intent_llm_cache.put(cache_key, result, cache_class)
+                    return result
             except Exception as e:
                 print(f"⚠️ [IntentDetector] LLM error: {e}")
         
@@ -1466,12 +2189,164 @@ def save_endpoints_to_file(endpoints, active_index, force_save=False):
 endpoints_config, loaded_active_index = load_endpoints_from_file()
 active_endpoint_index = loaded_active_index
 
-# Support 3 simultaneous MCP connections
-xiaozhi_connections = {0: None, 1: None, 2: None}  # Dict of {index: websocket}
-xiaozhi_connected = {0: False, 1: False, 2: False}  # Connection status for each device
-should_reconnect = {0: False, 1: False, 2: False}  # Reconnect flags
+# MCP server URL - đổi sang server giả lập (mcp_loadtest.py) để benchmark offline:
+#   set XIAOZHI_MCP_URL=ws://127.0.0.1:8765/mcp/
+# Mỗi endpoint cũng có thể khai báo "url" riêng trong xiaozhi_endpoints.json
+XIAOZHI_MCP_URL = os.environ.get("XIAOZHI_MCP_URL", "wss://api.xiaozhi.me/mcp/")
+
+
+def build_mcp_ws_url(ep: dict) -> str:
+    """Ghép URL WebSocket MCP cho endpoint (ưu tiên "url" riêng của endpoint)"""
+    base = ep.get("url") or XIAOZHI_MCP_URL
+    separator = "&" if "?" in base else "?"
+    return f"{base}{separator}token={ep['token']}"
+
+# Support N simultaneous MCP connections (1 slot / endpoint trong xiaozhi_endpoints.json)
+xiaozhi_connections = {i: None for i in range(len(endpoints_config))}  # Dict of {index: websocket}
+xiaozhi_connected = {i: False for i in range(len(endpoints_config))}  # Connection status for each device
+should_reconnect = {i: False for i in range(len(endpoints_config))}  # Reconnect flags
+
+# ============================================================
+# 📢 WEB UI HUB - Pub/sub cho các tab Web UI (/ws)
+# ============================================================
+# Mỗi client có hàng đợi giới hạn + writer task riêng → publish() không bao giờ await,
+# 1 tab chậm không làm chậm vòng lặp MCP. Topic "coalesce" chỉ giữ bản tin mới nhất.
+
+WEBUI_QUEUE_SIZE = 256  # Số message tối đa chờ gửi / client
+
+WEBUI_TOPIC_POLICIES = {
+    "status": "drop_oldest",       # xiaozhi_status, endpoint_connected
+    "activity": "drop_oldest",     # xiaozhi_activity
+    "knowledge": "coalesce",       # knowledge_index_progress - chỉ cần tiến độ mới nhất
+    "telemetry.vlc": "coalesce",        # Diff trạng thái VLC (event player + tick khi đang phát)
+    "telemetry.resources": "coalesce",  # CPU / RAM / disk
+    "telemetry.quotas": "coalesce",     # Quota Gemini / OpenAI / Serper
+    "telemetry.endpoints": "coalesce",  # Trạng thái kết nối thiết bị
+    "reply": "drop_oldest",        # phản hồi trực tiếp cho 1 client
+}
+
+
+class WebUIClient:
+    """1 tab Web UI: hàng đợi giới hạn + writer task"""
+
+    def __init__(self, websocket: WebSocket, maxsize: int = WEBUI_QUEUE_SIZE):
+        self.websocket = websocket
+        self.maxsize = maxsize
+        self.topics = None  # None = nhận tất cả topic
+        self._queue = deque()  # [coalesce_key, text]
+        self._coalesced = {}  # coalesce_key → entry đang chờ trong _queue
+        self._wakeup = asyncio.Event()
+        self._writer = None
+        self.chat_task = None  # Lượt chat stream đang chạy (xem run_chat_stream)
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+
+    def start(self):
+        self._writer = asyncio.create_task(self._write_loop())
+
+    def stop(self):
+        self.cancel_chat()
+        if self._writer:
+            self._writer.cancel()
+
+    def cancel_chat(self):
+        if self.chat_task is not None and not self.chat_task.done():
+            self.chat_task.cancel()
+        self.chat_task = None
+
+    def wants(self, topic: str) -> bool:
+        return self.topics is None or topic in self.topics
+
+    def offer(self, text: str, coalesce_key: str = None):
+        """Đưa message vào hàng đợi (không block)"""
+        if coalesce_key is not None:
+            entry = self._coalesced.get(coalesce_key)
+            if entry is not None:
+                entry[1] = text  # Thay bản tin cũ, giữ nguyên vị trí
+                self.coalesced += 1
+                return
+        if len(self._queue) >= self.maxsize:
+            oldest = self._queue.popleft()
+            if oldest[0] is not None:
+                self._coalesced.pop(oldest[0], None)
+            self.dropped += 1
+        entry = [coalesce_key, text]
+        self._queue.append(entry)
+        if coalesce_key is not None:
+            self._coalesced[coalesce_key] = entry
+        self._wakeup.set()
+
+    def send(self, message: dict):
+        """Phản hồi trực tiếp cho client này (đi qua writer để không ghi song song)"""
+        self.offer(json.dumps(message, ensure_ascii=False, separators=(",", ":")))
+
+    async def _write_loop(self):
+        try:
+            while True:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                while self._queue:
+                    key, text = self._queue.popleft()
+                    if key is not None:
+                        self._coalesced.pop(key, None)
+                    await self.websocket.send_text(text)
+                    self.sent += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Client đã đóng - receive loop sẽ gọi unregister
+            web_hub.unregister(self.websocket)
+
+    def snapshot(self) -> dict:
+        return {
+            "topics": sorted(self.topics) if self.topics is not None else "*",
+            "queued": len(self._queue),
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+        }
+
+
+class WebUIHub:
+    """Quản lý các client /ws và phát message theo topic"""
+
+    def __init__(self):
+        self.clients = {}  # websocket → WebUIClient
+        self.published = 0
+
+    def register(self, websocket: WebSocket) -> WebUIClient:
+        client = WebUIClient(websocket)
+        self.clients[websocket] = client
+        client.start()
+        return client
+
+    def unregister(self, websocket: WebSocket):
+        client = self.clients.pop(websocket, None)
+        if client:
+            client.stop()
+
+    def publish(self, topic: str, message: dict, coalesce_key: str = None):
+        """Phát message tới mọi client đăng ký topic - KHÔNG await, an toàn trong hot path MCP"""
+        if not self.clients:
+            return
+        if WEBUI_TOPIC_POLICIES.get(topic) == "coalesce" and coalesce_key is None:
+            coalesce_key = f"{topic}:{message.get('type', '')}"
+        text = json.dumps(message, ensure_ascii=False, separators=(",", ":"))
+        self.published += 1
+        for client in list(self.clients.values()):
+            if client.wants(topic):
+                client.offer(text, coalesce_key)
+
+    def snapshot(self) -> dict:
+        return {
+            "clients": len(self.clients),
+            "published": self.published,
+            "per_client": [c.snapshot() for c in self.clients.values()],
+        }
+
 
-active_connections = []
+web_hub = WebUIHub()
 
 # ============================================================
 # TASK MEMORY SYSTEM - Ghi nhớ tác vụ đã thực hiện
@@ -1644,24 +2519,11 @@ def update_user_profile_from_message(content: str, metadata: dict = None):
         profile["total_interactions"] = profile.get("total_interactions", 0) + 1
         profile["last_interaction"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         
-        # Phân tích topics
+        # Phân tích topics (USER_TOPIC_KEYWORDS - 1 lần duyệt cho mọi topic)
         topics = profile.get("topics", {})
-        content_lower = content.lower()
-        
-        # Detect topics từ nội dung
-        topic_keywords = {
-            "music": ["nhạc", "bài", "hát", "music", "song", "play", "pause", "volume"],
-            "weather": ["thời tiết", "weather", "mưa", "nắng", "nhiệt độ", "temperature"],
-            "news": ["tin", "news", "mới", "sự kiện", "event"],
-            "finance": ["giá", "vàng", "gold", "btc", "bitcoin", "chứng khoán", "stock", "usd", "tỷ giá"],
-            "system": ["âm lượng", "volume", "mở", "open", "tắt", "close", "kill"],
-            "web": ["tìm", "search", "google", "web", "tra cứu"],
-            "coding": ["code", "python", "javascript", "lập trình", "debug", "function"],
-            "general": ["là gì", "what is", "how to", "làm sao", "tại sao", "why"]
-        }
-        
-        for topic, keywords in topic_keywords.items():
-            if any(kw in content_lower for kw in keywords):
+        for category in keyword_classifier.classify(content):
+            if category.startswith("topic:"):
+                topic = category[len("topic:"):]
                 topics[topic] = topics.get(topic, 0) + 1
         
         profile["topics"] = topics
@@ -1688,12 +2550,18 @@ def update_user_profile_from_message(content: str, metadata: dict = None):
     except Exception as e:
         print(f"⚠️ [UserProfile] Error updating: {e}")
 
+_user_profile_cache = {"mtime": None, "profile": None}
+
 def load_user_profile() -> dict:
-    """Load user profile"""
+    """Load user profile (giữ trong RAM, chỉ đọc lại file khi file bị sửa)"""
     try:
-        if USER_PROFILE_FILE.exists():
-            with open(USER_PROFILE_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
+        mtime = USER_PROFILE_FILE.stat().st_mtime_ns
+        if _user_profile_cache["mtime"] == mtime:
+            return _user_profile_cache["profile"]
+        with open(USER_PROFILE_FILE, 'r', encoding='utf-8') as f:
+            profile = json.load(f)
+        _user_profile_cache.update(mtime=mtime, profile=profile)
+        return profile
     except:
         pass
     return {
@@ -1710,6 +2578,7 @@ def save_user_profile(profile: dict):
     try:
         with open(USER_PROFILE_FILE, 'w', encoding='utf-8') as f:
             json.dump(profile, f, ensure_ascii=False, indent=2)
+        _user_profile_cache.update(mtime=USER_PROFILE_FILE.stat().st_mtime_ns, profile=profile)
     except Exception as e:
         print(f"⚠️ [UserProfile] Error saving: {e}")
 
@@ -1945,6 +2814,19 @@ print(f"📡 MCP: Multi-device ready")
 # ============================================================
 # TOOL IMPLEMENTATIONS (20 TOOLS)
 # ============================================================
+# Tool chỉ gọi API blocking (subprocess, pyautogui, file, requests...) viết dạng def thường
+# + @blocking_handler: bên gọi vẫn `await` được (chạy qua asyncio.to_thread), còn
+# run_tool_handler lấy thẳng hàm sync (.blocking) đưa vào pool/lane của tool.
+
+
+def blocking_handler(fn):
+    """Bọc hàm sync thành coroutine function; hàm gốc giữ ở wrapper.blocking"""
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        return await asyncio.to_thread(fn, *args, **kwargs)
+
+    wrapper.blocking = fn
+    return wrapper
 
 async def set_volume(level: int) -> dict:
     """Điều chỉnh âm lượng hệ thống - Windows only"""
@@ -2137,7 +3019,8 @@ Write-Output ([int]($current * 100))
     except Exception as e:
         return {"success": False, "error": f"Lỗi: {str(e)}"}
 
-async def take_screenshot(filename: str = None) -> dict:
+@blocking_handler
+def take_screenshot(filename: str = None) -> dict:
     """Chụp màn hình toàn bộ và lưu file
     
     Args:
@@ -2223,7 +3106,7 @@ async def get_system_resources() -> dict:
             return _resource_cache
         
         # Lấy dữ liệu mới - giảm interval từ 1s xuống 0.1s
-        cpu = psutil.cpu_percent(interval=0.1)
+        cpu = await asyncio.to_thread(psutil.cpu_percent, 0.1)  # Đo 0.1s ở thread - không chặn event loop
         mem = psutil.virtual_memory()
         disk = psutil.disk_usage('/')
         
@@ -2249,21 +3132,44 @@ async def get_system_resources() -> dict:
         return {"success": False, "error": str(e)}
 
 async def get_api_quotas() -> dict:
-    """Lấy thông tin quota API (Gemini và Serper) - NOTE: Đây là giá trị ước tính"""
+    """
+    Lấy thông tin quota API (Gemini, OpenAI, Serper).
+    Số request/token là bộ đếm thật của ai_clients (từ lúc khởi động / trong ngày),
+    "remaining" là ước tính = giới hạn free tier - đã dùng.
+    """
     try:
+        ai_snapshot = ai_clients.snapshot()
+        usage = ai_snapshot["providers"]
+        empty = {"requests_last_min": 0, "tokens_last_min": 0, "requests_today": 0, "tokens_today": 0}
+
+        def provider_quota(provider: str, has_key: bool) -> dict:
+            limits = AI_PROVIDER_LIMITS[provider]
+            stats = usage.get(provider, empty)
+            return {
+                "has_key": has_key,
+                "free_tier": f"{stats['requests_last_min']}/{limits['rpm']} requests/min",
+                "daily_limit": f"{stats['requests_today']:,}/{limits['rpd']:,} requests/day",
+                "requests_last_min": stats["requests_last_min"],
+                "tokens_last_min": stats["tokens_last_min"],
+                "requests_today": stats["requests_today"],
+                "tokens_today": stats["tokens_today"],
+                "remaining_today_estimate": max(0, limits["rpd"] - stats["requests_today"]),
+                "limits": limits,
+                "models": stats.get("models", {})
+            }
+
+        serper_used = http_client.stats["hosts"].get("google.serper.dev", 0)
         result = {
             "success": True,
-            "gemini": {
-                "has_key": bool(GEMINI_API_KEY and GEMINI_API_KEY.strip()),
-                "free_tier": "60 requests/min",
-                "daily_limit": "1,500 requests/day",
-                "note": "Free tier - chưa có API để check exact quota"
-            },
+            "gemini": provider_quota("gemini", bool(GEMINI_API_KEY and GEMINI_API_KEY.strip())),
+            "openai": provider_quota("openai", bool(OPENAI_API_KEY and OPENAI_API_KEY.strip())),
             "serper": {
                 "has_key": bool(SERPER_API_KEY and SERPER_API_KEY.strip()),
-                "free_tier": "2,500 queries/month",
-                "note": "Free tier - chưa có API để check exact remaining"
-            }
+                "free_tier": f"{serper_used:,}/2,500 queries (từ lúc khởi động)",
+                "used_since_start": serper_used,
+                "note": "Serper không có API check quota - đếm theo request thật đã gửi"
+            },
+            "queued": ai_snapshot["queued"]
         }
         return result
     except Exception as e:
@@ -2286,7 +3192,8 @@ async def calculator(expression: str) -> dict:
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-async def get_network_info() -> dict:
+@blocking_handler
+def get_network_info() -> dict:
     """
     Lấy thông tin mạng chi tiết bao gồm:
     - Thông tin máy local (hostname, IP, MAC, gateway)
@@ -2391,7 +3298,8 @@ async def get_network_info() -> dict:
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-async def search_web(query: str) -> dict:
+@blocking_handler
+def search_web(query: str) -> dict:
     try:
         import webbrowser
         url = f"https://www.google.com/search?q={query.replace(' ', '+')}"
@@ -2400,7 +3308,8 @@ async def search_web(query: str) -> dict:
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-async def set_brightness(level: int) -> dict:
+@blocking_handler
+def set_brightness(level: int) -> dict:
     try:
         import screen_brightness_control as sbc
         sbc.set_brightness(level)
@@ -2408,7 +3317,8 @@ async def set_brightness(level: int) -> dict:
     except Exception as e:
         return {"success": False, "error": str(e), "note": "Có thể cần cài: pip install screen-brightness-control"}
 
-async def get_clipboard() -> dict:
+@blocking_handler
+def get_clipboard() -> dict:
     try:
         import pyperclip
         content = pyperclip.paste()
@@ -2416,7 +3326,8 @@ async def get_clipboard() -> dict:
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-async def set_clipboard(text: str) -> dict:
+@blocking_handler
+def set_clipboard(text: str) -> dict:
     try:
         import pyperclip
         pyperclip.copy(text)
@@ -2424,7 +3335,8 @@ async def set_clipboard(text: str) -> dict:
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-async def play_sound(frequency: int = 1000, duration: int = 500) -> dict:
+@blocking_handler
+def play_sound(frequency: int = 1000, duration: int = 500) -> dict:
     try:
         import winsound
         winsound.Beep(frequency, duration)
@@ -2432,7 +3344,8 @@ async def play_sound(frequency: int = 1000, duration: int = 500) -> dict:
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-async def open_application(app_name: str) -> dict:
+@blocking_handler
+def open_application(app_name: str) -> dict:
     """
     Mở ứng dụng Windows với khả năng tìm kiếm thông minh.
     
@@ -2724,6 +3637,42 @@ def _focus_and_send_hotkey(hwnd, *keys, delay=0.15):
     time.sleep(delay)
     pyautogui.hotkey(*keys)
 
+def _media_window_play_pause() -> dict:
+    """Play/Pause qua cửa sổ media player / media key (blocking - chạy ở thread)"""
+    windows = _find_all_media_windows()
+    
+    # 2. YouTube - nếu có
+    if windows['youtube']:
+        yt = windows['youtube'][0]
+        _focus_and_send_key(yt['hwnd'], 'k')
+        return {"success": True, "message": f"✅ Play/Pause YouTube: {yt['title'][:50]}..."}
+    
+    # 3. Windows Media Player
+    if windows['wmplayer']:
+        _focus_and_send_key(windows['wmplayer']['hwnd'], 'space')
+        return {"success": True, "message": "✅ Play/Pause (Windows Media Player)"}
+    
+    # 4. VLC Window (external)
+    if windows['vlc']:
+        _focus_and_send_key(windows['vlc']['hwnd'], 'space')
+        return {"success": True, "message": "✅ Play/Pause (VLC Window)"}
+    
+    # 5. Spotify Desktop App
+    if windows['spotify_app']:
+        _focus_and_send_key(windows['spotify_app']['hwnd'], 'space')
+        return {"success": True, "message": "✅ Play/Pause (Spotify Desktop)"}
+    
+    # 6. Spotify Web
+    if windows['spotify_web']:
+        sw = windows['spotify_web'][0]
+        _focus_and_send_key(sw['hwnd'], 'space')
+        return {"success": True, "message": f"✅ Play/Pause Spotify Web"}
+    
+    # 7. Fallback - dùng media key
+    pyautogui.press('playpause')
+    return {"success": True, "message": "✅ Đã gửi lệnh Play/Pause (Media Key)"}
+
+
 async def media_play_pause() -> dict:
     """
     Phát/Tạm dừng media (Play/Pause toggle).
@@ -2739,7 +3688,7 @@ async def media_play_pause() -> dict:
     try:
         # 🎵 ƯU TIÊN 1: Python-VLC nội bộ - NHANH NHẤT!
         if vlc_player and vlc_player._player:
-            vlc_player.pause()
+            await vlc_player.send("pause")
             is_playing = vlc_player.is_playing()
             status = vlc_player.get_full_status()
             current_song = status.get('current_song', 'Unknown')
@@ -2751,41 +3700,46 @@ async def media_play_pause() -> dict:
                 "llm_note": "🎵 Đang dùng Python-VLC Player tích hợp. Có thể dùng: pause_music(), resume_music(), stop_music(), music_next(), music_previous(), seek_music(), music_volume()"
             }
         
-        windows = _find_all_media_windows()
-        
-        # 2. YouTube - nếu có
-        if windows['youtube']:
-            yt = windows['youtube'][0]
-            _focus_and_send_key(yt['hwnd'], 'k')
-            return {"success": True, "message": f"✅ Play/Pause YouTube: {yt['title'][:50]}..."}
-        
-        # 3. Windows Media Player
-        if windows['wmplayer']:
-            _focus_and_send_key(windows['wmplayer']['hwnd'], 'space')
-            return {"success": True, "message": "✅ Play/Pause (Windows Media Player)"}
-        
-        # 4. VLC Window (external)
-        if windows['vlc']:
-            _focus_and_send_key(windows['vlc']['hwnd'], 'space')
-            return {"success": True, "message": "✅ Play/Pause (VLC Window)"}
-        
-        # 5. Spotify Desktop App
-        if windows['spotify_app']:
-            _focus_and_send_key(windows['spotify_app']['hwnd'], 'space')
-            return {"success": True, "message": "✅ Play/Pause (Spotify Desktop)"}
-        
-        # 6. Spotify Web
-        if windows['spotify_web']:
-            sw = windows['spotify_web'][0]
-            _focus_and_send_key(sw['hwnd'], 'space')
-            return {"success": True, "message": f"✅ Play/Pause Spotify Web"}
-        
-        # 7. Fallback - dùng media key
-        pyautogui.press('playpause')
-        return {"success": True, "message": "✅ Đã gửi lệnh Play/Pause (Media Key)"}
+        return await asyncio.to_thread(_media_window_play_pause)
     except Exception as e:
         return {"success": False, "error": str(e)}
 
+def _media_window_next_track() -> dict:
+    """Next track qua cửa sổ media player / media key (blocking - chạy ở thread)"""
+    windows = _find_all_media_windows()
+    
+    # 2. YouTube
+    if windows['youtube']:
+        yt = windows['youtube'][0]
+        _focus_and_send_hotkey(yt['hwnd'], 'shift', 'n')
+        return {"success": True, "message": f"✅ Chuyển video tiếp theo (YouTube): {yt['title'][:40]}..."}
+    
+    # 3. Windows Media Player
+    if windows['wmplayer']:
+        _focus_and_send_hotkey(windows['wmplayer']['hwnd'], 'ctrl', 'f')
+        return {"success": True, "message": "✅ Chuyển bài tiếp theo (Windows Media Player)"}
+    
+    # 4. VLC Window (external)
+    if windows['vlc']:
+        _focus_and_send_key(windows['vlc']['hwnd'], 'n')
+        return {"success": True, "message": "✅ Chuyển bài tiếp theo (VLC Window)"}
+    
+    # 5. Spotify Desktop App
+    if windows['spotify_app']:
+        _focus_and_send_hotkey(windows['spotify_app']['hwnd'], 'ctrl', 'right')
+        return {"success": True, "message": "✅ Chuyển bài tiếp theo (Spotify Desktop)"}
+    
+    # 6. Spotify Web
+    if windows['spotify_web']:
+        sw = windows['spotify_web'][0]
+        _focus_and_send_hotkey(sw['hwnd'], 'ctrl', 'right')
+        return {"success": True, "message": "✅ Chuyển bài tiếp theo (Spotify Web)"}
+    
+    # 7. Fallback - dùng media key
+    pyautogui.press('nexttrack')
+    return {"success": True, "message": "✅ Đã chuyển bài tiếp theo (Media Key)"}
+
+
 async def media_next_track() -> dict:
     """
     Chuyển bài tiếp theo (Next Track).
@@ -2794,10 +3748,8 @@ async def media_next_track() -> dict:
     try:
         # 🎵 ƯU TIÊN 1: Python-VLC nội bộ - NHANH NHẤT!
         if vlc_player and vlc_player._player:
-            success = vlc_player.next_track()
+            success = await vlc_player.send("skip", 1)  # Actor xác nhận bằng event Playing
             if success:
-                import time
-                time.sleep(0.3)  # Đợi VLC chuyển bài
                 status = vlc_player.get_full_status()
                 current_song = status.get('current_song', 'Unknown')
                 return {
@@ -2809,41 +3761,46 @@ async def media_next_track() -> dict:
                 }
             return {"success": False, "error": "Không có bài tiếp theo trong playlist VLC"}
         
-        windows = _find_all_media_windows()
-        
-        # 2. YouTube
-        if windows['youtube']:
-            yt = windows['youtube'][0]
-            _focus_and_send_hotkey(yt['hwnd'], 'shift', 'n')
-            return {"success": True, "message": f"✅ Chuyển video tiếp theo (YouTube): {yt['title'][:40]}..."}
-        
-        # 3. Windows Media Player
-        if windows['wmplayer']:
-            _focus_and_send_hotkey(windows['wmplayer']['hwnd'], 'ctrl', 'f')
-            return {"success": True, "message": "✅ Chuyển bài tiếp theo (Windows Media Player)"}
-        
-        # 4. VLC Window (external)
-        if windows['vlc']:
-            _focus_and_send_key(windows['vlc']['hwnd'], 'n')
-            return {"success": True, "message": "✅ Chuyển bài tiếp theo (VLC Window)"}
-        
-        # 5. Spotify Desktop App
-        if windows['spotify_app']:
-            _focus_and_send_hotkey(windows['spotify_app']['hwnd'], 'ctrl', 'right')
-            return {"success": True, "message": "✅ Chuyển bài tiếp theo (Spotify Desktop)"}
-        
-        # 6. Spotify Web
-        if windows['spotify_web']:
-            sw = windows['spotify_web'][0]
-            _focus_and_send_hotkey(sw['hwnd'], 'ctrl', 'right')
-            return {"success": True, "message": "✅ Chuyển bài tiếp theo (Spotify Web)"}
-        
-        # 7. Fallback - dùng media key
-        pyautogui.press('nexttrack')
-        return {"success": True, "message": "✅ Đã chuyển bài tiếp theo (Media Key)"}
+        return await asyncio.to_thread(_media_window_next_track)
     except Exception as e:
         return {"success": False, "error": str(e)}
 
+def _media_window_previous_track() -> dict:
+    """Previous track qua cửa sổ media player / media key (blocking - chạy ở thread)"""
+    windows = _find_all_media_windows()
+    
+    # 2. YouTube
+    if windows['youtube']:
+        yt = windows['youtube'][0]
+        _focus_and_send_hotkey(yt['hwnd'], 'shift', 'p')
+        return {"success": True, "message": f"✅ Chuyển video trước (YouTube): {yt['title'][:40]}..."}
+    
+    # 3. Windows Media Player
+    if windows['wmplayer']:
+        _focus_and_send_hotkey(windows['wmplayer']['hwnd'], 'ctrl', 'b')
+        return {"success": True, "message": "✅ Chuyển bài trước (Windows Media Player)"}
+    
+    # 4. VLC Window (external)
+    if windows['vlc']:
+        _focus_and_send_key(windows['vlc']['hwnd'], 'p')
+        return {"success": True, "message": "✅ Chuyển bài trước (VLC Window)"}
+    
+    # 5. Spotify Desktop App
+    if windows['spotify_app']:
+        _focus_and_send_hotkey(windows['spotify_app']['hwnd'], 'ctrl', 'left')
+        return {"success": True, "message": "✅ Chuyển bài trước (Spotify Desktop)"}
+    
+    # 6. Spotify Web
+    if windows['spotify_web']:
+        sw = windows['spotify_web'][0]
+        _focus_and_send_hotkey(sw['hwnd'], 'ctrl', 'left')
+        return {"success": True, "message": "✅ Chuyển bài trước (Spotify Web)"}
+    
+    # 7. Fallback - dùng media key
+    pyautogui.press('prevtrack')
+    return {"success": True, "message": "✅ Đã chuyển bài trước (Media Key)"}
+
+
 async def media_previous_track() -> dict:
     """
     Chuyển bài trước đó (Previous Track).
@@ -2852,10 +3809,8 @@ async def media_previous_track() -> dict:
     try:
         # 🎵 ƯU TIÊN 1: Python-VLC nội bộ - NHANH NHẤT!
         if vlc_player and vlc_player._player:
-            success = vlc_player.previous_track()
+            success = await vlc_player.send("skip", -1)  # Actor xác nhận bằng event Playing
             if success:
-                import time
-                time.sleep(0.3)  # Đợi VLC chuyển bài
                 status = vlc_player.get_full_status()
                 current_song = status.get('current_song', 'Unknown')
                 return {
@@ -2867,50 +3822,55 @@ async def media_previous_track() -> dict:
                 }
             return {"success": False, "error": "Không có bài trước trong playlist VLC"}
         
-        windows = _find_all_media_windows()
-        
-        # 2. YouTube
-        if windows['youtube']:
-            yt = windows['youtube'][0]
-            _focus_and_send_hotkey(yt['hwnd'], 'shift', 'p')
-            return {"success": True, "message": f"✅ Chuyển video trước (YouTube): {yt['title'][:40]}..."}
-        
-        # 3. Windows Media Player
-        if windows['wmplayer']:
-            _focus_and_send_hotkey(windows['wmplayer']['hwnd'], 'ctrl', 'b')
-            return {"success": True, "message": "✅ Chuyển bài trước (Windows Media Player)"}
-        
-        # 4. VLC Window (external)
-        if windows['vlc']:
-            _focus_and_send_key(windows['vlc']['hwnd'], 'p')
-            return {"success": True, "message": "✅ Chuyển bài trước (VLC Window)"}
-        
-        # 5. Spotify Desktop App
-        if windows['spotify_app']:
-            _focus_and_send_hotkey(windows['spotify_app']['hwnd'], 'ctrl', 'left')
-            return {"success": True, "message": "✅ Chuyển bài trước (Spotify Desktop)"}
-        
-        # 6. Spotify Web
-        if windows['spotify_web']:
-            sw = windows['spotify_web'][0]
-            _focus_and_send_hotkey(sw['hwnd'], 'ctrl', 'left')
-            return {"success": True, "message": "✅ Chuyển bài trước (Spotify Web)"}
-        
-        # 7. Fallback - dùng media key
-        pyautogui.press('prevtrack')
-        return {"success": True, "message": "✅ Đã chuyển bài trước (Media Key)"}
+        return await asyncio.to_thread(_media_window_previous_track)
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-async def media_stop() -> dict:
-    """
-    Dừng phát media (Stop).
-    ⭐ ƯU TIÊN PYTHON-VLC TRƯỚC - nhanh & không cần detect window!
-    """
-    try:
-        # 🎵 ƯU TIÊN 1: Python-VLC nội bộ - NHANH NHẤT!
+def _media_window_stop() -> dict:
+    """Stop qua cửa sổ media player / media key (blocking - chạy ở thread)"""
+    windows = _find_all_media_windows()
+    
+    # 2. YouTube
+    if windows['youtube']:
+        yt = windows['youtube'][0]
+        _focus_and_send_key(yt['hwnd'], 'k', delay=0.2)
+        return {"success": True, "message": f"✅ Đã dừng YouTube: {yt['title'][:50]}..."}
+    
+    # 3. Windows Media Player
+    if windows['wmplayer']:
+        _focus_and_send_key(windows['wmplayer']['hwnd'], 'stop')
+        return {"success": True, "message": "✅ Đã dừng phát (Windows Media Player)"}
+    
+    # 4. VLC Window (external)
+    if windows['vlc']:
+        _focus_and_send_key(windows['vlc']['hwnd'], 's')
+        return {"success": True, "message": "✅ Đã dừng phát (VLC Window)"}
+    
+    # 5. Spotify Desktop App - không có stop, dùng pause
+    if windows['spotify_app']:
+        _focus_and_send_key(windows['spotify_app']['hwnd'], 'space')
+        return {"success": True, "message": "✅ Đã tạm dừng (Spotify Desktop)"}
+    
+    # 6. Spotify Web
+    if windows['spotify_web']:
+        sw = windows['spotify_web'][0]
+        _focus_and_send_key(sw['hwnd'], 'space')
+        return {"success": True, "message": "✅ Đã tạm dừng (Spotify Web)"}
+    
+    # 7. Fallback - dùng media key
+    pyautogui.press('stop')
+    return {"success": True, "message": "✅ Đã dừng phát (Media Key)"}
+
+
+async def media_stop() -> dict:
+    """
+    Dừng phát media (Stop).
+    ⭐ ƯU TIÊN PYTHON-VLC TRƯỚC - nhanh & không cần detect window!
+    """
+    try:
+        # 🎵 ƯU TIÊN 1: Python-VLC nội bộ - NHANH NHẤT!
         if vlc_player and vlc_player._player:
-            vlc_player.stop()
+            await vlc_player.send("stop")
             return {
                 "success": True, 
                 "message": "⏹️ Đã dừng nhạc (Python-VLC)",
@@ -2918,38 +3878,7 @@ async def media_stop() -> dict:
                 "llm_note": "🎵 Đã dừng Python-VLC Player. Dùng play_music() hoặc resume_music() để phát lại."
             }
         
-        windows = _find_all_media_windows()
-        
-        # 2. YouTube
-        if windows['youtube']:
-            yt = windows['youtube'][0]
-            _focus_and_send_key(yt['hwnd'], 'k', delay=0.2)
-            return {"success": True, "message": f"✅ Đã dừng YouTube: {yt['title'][:50]}..."}
-        
-        # 3. Windows Media Player
-        if windows['wmplayer']:
-            _focus_and_send_key(windows['wmplayer']['hwnd'], 'stop')
-            return {"success": True, "message": "✅ Đã dừng phát (Windows Media Player)"}
-        
-        # 4. VLC Window (external)
-        if windows['vlc']:
-            _focus_and_send_key(windows['vlc']['hwnd'], 's')
-            return {"success": True, "message": "✅ Đã dừng phát (VLC Window)"}
-        
-        # 5. Spotify Desktop App - không có stop, dùng pause
-        if windows['spotify_app']:
-            _focus_and_send_key(windows['spotify_app']['hwnd'], 'space')
-            return {"success": True, "message": "✅ Đã tạm dừng (Spotify Desktop)"}
-        
-        # 6. Spotify Web
-        if windows['spotify_web']:
-            sw = windows['spotify_web'][0]
-            _focus_and_send_key(sw['hwnd'], 'space')
-            return {"success": True, "message": "✅ Đã tạm dừng (Spotify Web)"}
-        
-        # 7. Fallback - dùng media key
-        pyautogui.press('stop')
-        return {"success": True, "message": "✅ Đã dừng phát (Media Key)"}
+        return await asyncio.to_thread(_media_window_stop)
     except Exception as e:
         return {"success": False, "error": str(e)}
 
@@ -2977,7 +3906,8 @@ async def media_mute() -> dict:
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-async def media_control(action: str) -> dict:
+@blocking_handler
+def media_control(action: str) -> dict:
     """
     Điều khiển media player đa năng.
     
@@ -3150,7 +4080,8 @@ async def forget_all_tasks() -> dict:
 
 # ==================== END TASK MEMORY TOOLS ====================
 
-async def get_active_media_players() -> dict:
+@blocking_handler
+def get_active_media_players() -> dict:
     """
     Lấy danh sách các media players/applications đang chạy trên máy tính.
     
@@ -3279,7 +4210,8 @@ async def get_active_media_players() -> dict:
         traceback.print_exc()
         return {"success": False, "error": str(e)}
 
-async def list_running_processes(limit: int = 10) -> dict:
+@blocking_handler
+def list_running_processes(limit: int = 10) -> dict:
     try:
         procs = []
         for p in psutil.process_iter(['pid', 'name', 'cpu_percent', 'memory_percent']):
@@ -3293,7 +4225,8 @@ async def list_running_processes(limit: int = 10) -> dict:
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-async def kill_process(identifier: str, force: bool = True, exact_match: bool = False) -> dict:
+@blocking_handler
+def kill_process(identifier: str, force: bool = True, exact_match: bool = False) -> dict:
     """
     Kill process ngay lập tức.
     
@@ -3420,7 +4353,8 @@ async def kill_process(identifier: str, force: bool = True, exact_match: bool =
         return {"success": False, "error": str(e)}
 
 
-async def force_kill_app(app_name: str) -> dict:
+@blocking_handler
+def force_kill_app(app_name: str) -> dict:
     """
     Force kill app theo tên CHÍNH XÁC - kill ngay lập tức không hỏi han.
     Sử dụng cả psutil và taskkill để đảm bảo kill được.
@@ -3504,7 +4438,8 @@ async def force_kill_app(app_name: str) -> dict:
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-async def find_process(name_pattern: str = "", show_all: bool = False) -> dict:
+@blocking_handler
+def find_process(name_pattern: str = "", show_all: bool = False) -> dict:
     """
     Tìm kiếm process theo tên hoặc hiển thị tất cả.
     
@@ -3567,7 +4502,8 @@ async def find_process(name_pattern: str = "", show_all: bool = False) -> dict:
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-async def create_file(path: str, content: str) -> dict:
+@blocking_handler
+def create_file(path: str, content: str) -> dict:
     try:
         import os
         
@@ -3592,7 +4528,8 @@ async def create_file(path: str, content: str) -> dict:
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-async def read_file(path: str) -> dict:
+@blocking_handler
+def read_file(path: str) -> dict:
     try:
         import os
         
@@ -3616,7 +4553,8 @@ async def read_file(path: str) -> dict:
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-async def list_files(directory: str) -> dict:
+@blocking_handler
+def list_files(directory: str) -> dict:
     try:
         import os
         files = []
@@ -3627,7 +4565,8 @@ async def list_files(directory: str) -> dict:
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-async def get_battery_status() -> dict:
+@blocking_handler
+def get_battery_status() -> dict:
     try:
         bat = psutil.sensors_battery()
         if bat is None:
@@ -3641,7 +4580,8 @@ async def get_battery_status() -> dict:
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-async def get_disk_usage() -> dict:
+@blocking_handler
+def get_disk_usage() -> dict:
     try:
         disks = []
         for part in psutil.disk_partitions():
@@ -3760,7 +4700,8 @@ async def get_youtube_playlists() -> dict:
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-async def open_youtube_playlist(playlist_name: str) -> dict:
+@blocking_handler
+def open_youtube_playlist(playlist_name: str) -> dict:
     """Mở playlist YouTube đã lưu trong browser
     
     Args:
@@ -3825,13 +4766,794 @@ async def open_youtube_playlist(playlist_name: str) -> dict:
         traceback.print_exc()
         return {"success": False, "error": str(e)}
 
+# ============================================================
+# 🎯 SONG SEARCH INDEX - Tìm bài gần đúng trên thư viện lớn
+# ============================================================
+# Dựng 1 lần trong refresh_song_cache: tên bài đã chuẩn hóa + inverted index trigram ký tự.
+# Mỗi truy vấn: trigram → lấy ~64 ứng viên giống nhất (Dice), chỉ chấm điểm difflib + thưởng
+# (substring / đủ từ / prefix - giống luật cũ) trên ứng viên thay vì toàn bộ thư viện.
+
+SONG_QUERY_STOP_WORDS = {'phat', 'bai', 'mo', 'chay', 'play', 'song', 'nhac', 'hat'}
+SONG_INDEX_CANDIDATES = 64  # Số ứng viên chấm điểm chính xác mỗi truy vấn
+
+_SONG_PUNCT_RE = re.compile(r'[^\w\s]')
+_SONG_SPACE_RE = re.compile(r'\s+')
+
+
+def normalize_song_text(text: str) -> str:
+    """Bỏ dấu (NFD + bỏ combining mark), lowercase, bỏ ký tự đặc biệt, gộp khoảng trắng"""
+    text = unicodedata.normalize('NFD', text)
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    text = _SONG_PUNCT_RE.sub('', text.lower()).strip()
+    return _SONG_SPACE_RE.sub(' ', text)
+
+
+def song_trigrams(text: str) -> set:
+    padded = f" {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SongSearchIndex:
+    """Index tìm bài hát: tên đã chuẩn hóa + trigram → danh sách id bài"""
+
+    def __init__(self, songs: dict):
+        """songs: tên bài → đường dẫn (VLCMusicPlayer._song_cache)"""
+        self.names = []
+        self.paths = []
+        self._gram_sizes = []
+        postings = defaultdict(list)
+        for name, path in songs.items():
+            normalized = normalize_song_text(name)
+            grams = song_trigrams(normalized)
+            doc_id = len(self.names)
+            self.names.append(normalized)
+            self.paths.append(path)
+            self._gram_sizes.append(len(grams))
+            for gram in grams:
+                postings[gram].append(doc_id)
+        self._postings = dict(postings)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @staticmethod
+    def prepare_query(query: str) -> tuple:
+        """(query đã xử lý, các từ còn lại sau khi bỏ từ điều khiển như "phát", "bài"...)"""
+        normalized = normalize_song_text(query)
+        words = [w for w in normalized.split() if w not in SONG_QUERY_STOP_WORDS]
+        return (' '.join(words) if words else normalized), words
+
+    def candidates(self, processed: str, limit: int = SONG_INDEX_CANDIDATES):
+        """Các id bài chung nhiều trigram nhất với query (thư viện nhỏ → tất cả)"""
+        if len(self.names) <= limit:
+            return range(len(self.names))
+        grams = song_trigrams(processed)
+        shared = Counter()
+        for gram in grams:
+            posting = self._postings.get(gram)
+            if posting:
+                shared.update(posting)
+        query_size = len(grams)
+        sizes = self._gram_sizes
+        return sorted(heapq.nlargest(limit, shared, key=lambda d: shared[d] / (query_size + sizes[d])))
+
+    def search(self, query: str, limit: int = 5, threshold: float = 0.0,
+               candidates: int = SONG_INDEX_CANDIDATES) -> list:
+        """
+        Top-k bài khớp nhất.
+        Returns: [{"name", "path", "score"}] giảm dần theo score (score >= threshold)
+        """
+        processed, words = self.prepare_query(query)
+        if not processed or not self.names:
+            return []
+        matcher = difflib.SequenceMatcher(None, processed, "")
+        prefix = processed[:4]
+        scored = []
+        for doc_id in self.candidates(processed, candidates):
+            name = self.names[doc_id]
+            matcher.set_seq2(name)
+            score = matcher.ratio()
+            # Thưởng điểm nếu query có trong tên bài (substring match)
+            if processed in name:
+                score += 0.25
+            # Thưởng điểm nếu từng từ đều có trong tên bài
+            if words and all(word in name for word in words):
+                score += 0.20
+            # Thưởng điểm nếu bắt đầu giống nhau (prefix match - 4 ký tự đầu)
+            if name.startswith(prefix):
+                score += 0.10
+            if score >= threshold:
+                scored.append((-score, doc_id))
+        return [
+            {"name": Path(self.paths[doc_id]).name, "path": self.paths[doc_id], "score": round(-neg, 4)}
+            for neg, doc_id in heapq.nsmallest(limit, scored)
+        ]
+
+
+# ============================================================
+# 📚 MUSIC CATALOG - Danh mục nhạc lưu bền (SQLite), quét lại tăng dần
+# ============================================================
+# Mỗi thư mục gốc (music_library / thư mục người dùng / folder tùy chỉnh) được quét 1 lần
+# bằng os.scandir rồi lưu path, size, mtime, tên chuẩn hóa, thư mục con vào SQLite.
+# Các tool nhạc chỉ truy vấn catalog (có phân trang) thay vì rglob + stat mỗi lần gọi.
+# Watcher nền quét lại định kỳ, so (size, mtime) để chỉ ghi phần thay đổi.
+
+MUSIC_CATALOG_FILE = CONVERSATION_BASE_DIR.parent / "music_catalog.db"
+MUSIC_CATALOG_POLL_INTERVAL = 60  # Giây giữa 2 lần watcher quét lại
+MUSIC_CATALOG_STALE_SECONDS = 300  # Catalog cũ hơn mức này → tool kích hoạt quét lại nền
+MUSIC_PAGE_SIZE = 50
+MUSIC_PAGE_SIZE_MAX = 500
+
+_MUSIC_CATALOG_SCHEMA = """
+CREATE TABLE IF NOT EXISTS roots (
+    root TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    scanned_at REAL NOT NULL,
+    track_count INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tracks (
+    root TEXT NOT NULL,
+    rel_path TEXT NOT NULL,
+    full_path TEXT NOT NULL,
+    folder TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    name_lower TEXT NOT NULL,
+    norm_name TEXT NOT NULL,
+    ext TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    PRIMARY KEY (root, rel_path)
+);
+CREATE INDEX IF NOT EXISTS tracks_by_name ON tracks (root, filename, rel_path);
+CREATE INDEX IF NOT EXISTS tracks_by_path ON tracks (root, full_path);
+CREATE TABLE IF NOT EXISTS track_terms (
+    root TEXT NOT NULL,
+    term TEXT NOT NULL,
+    field TEXT NOT NULL,
+    rel_path TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS track_terms_by_term ON track_terms (root, term, field);
+CREATE INDEX IF NOT EXISTS track_terms_by_track ON track_terms (root, rel_path);
+"""
+
+# Cột tag thêm sau (ALTER TABLE cho catalog tạo từ bản trước); tags_mtime_ns != mtime_ns → chưa đọc tag
+_MUSIC_TAG_COLUMNS = {
+    "title": "TEXT NOT NULL DEFAULT ''",
+    "artist": "TEXT NOT NULL DEFAULT ''",
+    "album": "TEXT NOT NULL DEFAULT ''",
+    "duration": "REAL NOT NULL DEFAULT 0",
+    "tags_mtime_ns": "INTEGER NOT NULL DEFAULT 0",
+}
+_MUSIC_TAG_SEARCH_FIELDS = ("title", "artist", "album")
+
+_TRACK_COLUMNS = "rel_path, full_path, filename, ext, size, title, artist, album, duration"
+
+
+def _track_row_to_dict(row) -> dict:
+    rel_path, full_path, filename, ext, size, title, artist, album, duration = row
+    return {
+        "filename": filename,
+        "path": rel_path,
+        "full_path": full_path,
+        "size_mb": round(size / (1024**2), 2),
+        "extension": ext,
+        "title": title,
+        "artist": artist,
+        "album": album,
+        "duration_s": round(duration)
+    }
+
+
+def _like_escape(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+# --- Đọc tag (title/artist/album/duration) chỉ từ phần header, không đọc cả file ---
+# ID3v2 / FLAC / MP4: seek qua từng frame/block/atom, chỉ đọc frame text nhỏ (bỏ qua ảnh bìa).
+# Ogg: đọc tối đa MUSIC_TAG_READ_LIMIT byte đầu + 64KB cuối (granule của page cuối → duration).
+
+MUSIC_TAG_READ_LIMIT = 256 * 1024  # Trần số byte đọc ở đầu file (Ogg comment header)
+MUSIC_TAG_FRAME_MAX = 16 * 1024  # Frame/atom text lớn hơn mức này → bỏ qua
+MUSIC_TAG_WORKERS = 4
+MUSIC_TAG_FILES_PER_MINUTE = 6000  # Trần throughput để không chiếm hết IO ổ đĩa
+MUSIC_TAG_BATCH = 256
+
+_ID3_FIELDS = {"TIT2": "title", "TPE1": "artist", "TALB": "album", "TLEN": "length",
+               "TT2": "title", "TP1": "artist", "TAL": "album", "TLE": "length"}
+_VORBIS_FIELDS = {"TITLE": "title", "ARTIST": "artist", "ALBUM": "album"}
+_MP4_FIELDS = {b"\xa9nam": "title", b"\xa9ART": "artist", b"\xa9alb": "album"}
+_MPEG1_L3_BITRATES = (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320)
+_MPEG2_L3_BITRATES = (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160)
+_MPEG_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+
+def _u32be(data: bytes) -> int:
+    return int.from_bytes(data[:4], "big")
+
+
+def _u32le(data: bytes) -> int:
+    return int.from_bytes(data[:4], "little")
+
+
+def _syncsafe(data: bytes) -> int:
+    return (data[0] << 21) | (data[1] << 14) | (data[2] << 7) | data[3]
+
+
+def _decode_id3_text(data: bytes) -> str:
+    if not data:
+        return ""
+    codec = {0: "latin-1", 1: "utf-16", 2: "utf-16-be", 3: "utf-8"}.get(data[0], "latin-1")
+    text = data[1:].decode(codec, errors="replace")
+    return "/".join(part.strip() for part in text.split("\x00") if part.strip())  # v2.4: nhiều giá trị cách nhau bằng NUL
+
+
+def _read_id3(f, tags: dict) -> int:
+    """Frame text của ID3v2 ở đầu file. Trả về vị trí kết thúc tag (0 nếu không có)"""
+    header = f.read(10)
+    if len(header) < 10 or header[:3] != b"ID3":
+        return 0
+    version, flags = header[3], header[5]
+    tag_end = _syncsafe(header[6:10]) + 10
+    pos = 10
+    if flags & 0x40 and version >= 3:  # Extended header
+        ext = f.read(4)
+        pos += _syncsafe(ext) if version == 4 else _u32be(ext) + 4
+    id_len, head_len = (3, 6) if version == 2 else (4, 10)
+    while pos + head_len <= tag_end:
+        f.seek(pos)
+        frame = f.read(head_len)
+        if len(frame) < head_len or frame[0] == 0:
+            break  # Padding
+        if version == 2:
+            size = int.from_bytes(frame[3:6], "big")
+        else:
+            size = _syncsafe(frame[4:8]) if version == 4 else _u32be(frame[4:8])
+        field = _ID3_FIELDS.get(frame[:id_len].decode("latin-1"))
+        if field and field not in tags and size <= MUSIC_TAG_FRAME_MAX:
+            value = _decode_id3_text(f.read(size))
+            if value:
+                tags[field] = value
+        pos += head_len + size
+    return tag_end + (10 if flags & 0x10 else 0)  # Footer
+
+
+def _mpeg_duration(f, audio_start: int, file_size: int):
+    """Duration MP3 từ frame đầu: Xing/Info/VBRI (VBR) hoặc bitrate (CBR)"""
+    f.seek(audio_start)
+    data = f.read(4096)
+    for i in range(len(data) - 4):
+        if data[i] != 0xFF or data[i + 1] & 0xE0 != 0xE0:
+            continue
+        version, layer = (data[i + 1] >> 3) & 3, (data[i + 1] >> 1) & 3
+        bitrate_idx, rate_idx = data[i + 2] >> 4, (data[i + 2] >> 2) & 3
+        if version == 1 or layer != 1 or bitrate_idx in (0, 15) or rate_idx == 3:
+            continue  # Không phải header MPEG Layer III hợp lệ
+        sample_rate = _MPEG_SAMPLE_RATES[version][rate_idx]
+        samples_per_frame = 1152 if version == 3 else 576
+        mono = (data[i + 3] >> 6) == 3
+        side_info = (17 if mono else 32) if version == 3 else (9 if mono else 17)
+        xing = i + 4 + side_info
+        if data[xing:xing + 4] in (b"Xing", b"Info") and _u32be(data[xing + 4:xing + 8]) & 1:
+            return _u32be(data[xing + 8:xing + 12]) * samples_per_frame / sample_rate
+        if data[i + 36:i + 40] == b"VBRI":
+            return _u32be(data[i + 50:i + 54]) * samples_per_frame / sample_rate
+        bitrates = _MPEG1_L3_BITRATES if version == 3 else _MPEG2_L3_BITRATES
+        return (file_size - audio_start - i) * 8 / (bitrates[bitrate_idx] * 1000)
+    return None
+
+
+def _parse_vorbis_comments(data: bytes, tags: dict):
+    pos = 4 + _u32le(data)  # Bỏ vendor string
+    count = _u32le(data[pos:pos + 4])
+    pos += 4
+    for _ in range(count):
+        if pos + 4 > len(data):
+            break
+        length = _u32le(data[pos:pos + 4])
+        key, _, value = data[pos + 4:pos + 4 + length].decode("utf-8", errors="replace").partition("=")
+        pos += 4 + length
+        field = _VORBIS_FIELDS.get(key.upper())
+        if field and field not in tags and value.strip():
+            tags[field] = value.strip()
+
+
+def _read_flac(f, tags: dict):
+    """Metadata block FLAC: STREAMINFO (duration) + VORBIS_COMMENT, seek qua PICTURE/PADDING"""
+    while True:
+        header = f.read(4)
+        if len(header) < 4:
+            return
+        block_type, size = header[0] & 0x7F, int.from_bytes(header[1:4], "big")
+        if block_type == 0 and size >= 18:
+            info = f.read(size)
+            sample_rate = int.from_bytes(info[10:13], "big") >> 4
+            total_samples = ((info[13] & 0x0F) << 32) | _u32be(info[14:18])
+            if sample_rate and total_samples:
+                tags["duration"] = total_samples / sample_rate
+        elif block_type == 4 and size <= MUSIC_TAG_READ_LIMIT:
+            _parse_vorbis_comments(f.read(size), tags)
+        else:
+            f.seek(size, 1)
+        if header[0] & 0x80:  # Block cuối
+            return
+
+
+def _read_ogg(f, tags: dict, file_size: int):
+    """Ogg Vorbis/Opus: ghép 2 packet đầu (ident + comment) trong MUSIC_TAG_READ_LIMIT byte đầu"""
+    data = f.read(MUSIC_TAG_READ_LIMIT)
+    packets, current, pos = [], b"", 0
+    while len(packets) < 2 and data[pos:pos + 4] == b"OggS":
+        segments = data[pos + 26]
+        table = data[pos + 27:pos + 27 + segments]
+        pos += 27 + segments
+        for lacing in table:
+            current += data[pos:pos + lacing]
+            pos += lacing
+            if lacing < 255:
+                packets.append(current)
+                current = b""
+    if len(packets) < 2:
+        return
+    ident, comments = packets
+    if ident.startswith(b"\x01vorbis"):
+        sample_rate, pre_skip = _u32le(ident[12:16]), 0
+        _parse_vorbis_comments(comments[7:], tags)
+    elif ident.startswith(b"OpusHead"):
+        sample_rate, pre_skip = 48000, int.from_bytes(ident[10:12], "little")
+        _parse_vorbis_comments(comments[8:], tags)
+    else:
+        return
+    f.seek(max(0, file_size - 65536))
+    tail = f.read(65536)
+    last = tail.rfind(b"OggS")
+    if sample_rate and last >= 0:
+        granule = int.from_bytes(tail[last + 6:last + 14], "little")
+        if 0 < granule < (1 << 62):
+            tags["duration"] = (granule - pre_skip) / sample_rate
+
+
+def _mp4_atoms(f, start: int, end: int):
+    """Duyệt atom con trong [start, end) chỉ bằng header 8/16 byte (seek qua nội dung)"""
+    pos = start
+    while pos + 8 <= end:
+        f.seek(pos)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        size, head = _u32be(header), 8
+        if size == 1:
+            size, head = int.from_bytes(f.read(8), "big"), 16
+        elif size == 0:
+            size = end - pos
+        if size < head:
+            return
+        yield header[4:8], pos + head, pos + size
+        pos += size
+
+
+def _mp4_child(f, start: int, end: int, kind: bytes):
+    for child, child_start, child_end in _mp4_atoms(f, start, end):
+        if child == kind:
+            return child_start, child_end
+    return None
+
+
+def _read_mp4(f, tags: dict, file_size: int):
+    """M4A/MP4: moov/mvhd (duration) + moov/udta/meta/ilst (©nam, ©ART, ©alb)"""
+    moov = _mp4_child(f, 0, file_size, b"moov")
+    if not moov:
+        return
+    mvhd = _mp4_child(f, *moov, b"mvhd")
+    if mvhd:
+        f.seek(mvhd[0])
+        data = f.read(32)
+        if data[:1] == b"\x01":
+            timescale, duration = _u32be(data[20:24]), int.from_bytes(data[24:32], "big")
+        else:
+            timescale, duration = _u32be(data[12:16]), _u32be(data[16:20])
+        if timescale:
+            tags["duration"] = duration / timescale
+    udta = _mp4_child(f, *moov, b"udta")
+    meta = udta and _mp4_child(f, *udta, b"meta")
+    ilst = meta and _mp4_child(f, meta[0] + 4, meta[1], b"ilst")  # meta là full box (+4 version/flags)
+    if not ilst:
+        return
+    for kind, item_start, item_end in list(_mp4_atoms(f, *ilst)):
+        field = _MP4_FIELDS.get(kind)
+        if not field or field in tags or item_end - item_start > MUSIC_TAG_FRAME_MAX:
+            continue
+        data_atom = _mp4_child(f, item_start, item_end, b"data")
+        if data_atom:
+            f.seek(data_atom[0] + 8)  # Bỏ type + locale
+            value = f.read(data_atom[1] - data_atom[0] - 8).decode("utf-8", errors="replace").strip()
+            if value:
+                tags[field] = value
+
+
+def read_audio_tags(path: str) -> dict:
+    """title/artist/album/duration (giây) từ header ID3v2, FLAC/Ogg Vorbis comment, MP4 ilst"""
+    tags = {}
+    try:
+        file_size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            audio_start = _read_id3(f, tags)
+            f.seek(audio_start)
+            magic = f.read(12)
+            f.seek(audio_start + 4)
+            if magic[:4] == b"fLaC":
+                _read_flac(f, tags)
+            elif magic[:4] == b"OggS":
+                f.seek(audio_start)
+                _read_ogg(f, tags, file_size)
+            elif magic[4:8] == b"ftyp":
+                _read_mp4(f, tags, file_size)
+            elif path.lower().endswith(".mp3"):
+                length = tags.get("length", "")
+                tags["duration"] = int(length) / 1000 if length.isdigit() else _mpeg_duration(f, audio_start, file_size)
+    except Exception as e:
+        print(f"⚠️ [Catalog] Tag read error {path}: {e}")
+    tags.pop("length", None)
+    return tags
+
+
+class MusicCatalog:
+    """Danh mục nhạc SQLite dùng chung cho mọi tool nhạc (thread-safe)"""
+
+    def __init__(self, db_path: Path):
+        self.db_path = db_path
+        self._conn = None
+        self._lock = threading.Lock()  # Bảo vệ connection SQLite
+        self._scan_lock = threading.Lock()  # 1 lần quét tại 1 thời điểm
+        self._generations = {}  # root → số lần catalog thay đổi (để VLC biết khi nào dựng lại index)
+        self._listeners = []  # fn(root_key) gọi ở thread quét sau khi catalog của root đổi
+        self._pending = set()  # Root đang chờ quét nền
+        self._watcher = None
+        self._stop = threading.Event()
+        self._tag_thread = None
+        self._tag_wakeup = threading.Event()
+        self._tag_pool = None
+        self._tag_bucket = TokenBucket(MUSIC_TAG_FILES_PER_MINUTE, burst=MUSIC_TAG_BATCH)
+        self._tag_bucket_lock = threading.Lock()
+        self.stats = {"scans": 0, "last_scan_ms": 0.0, "added": 0, "updated": 0, "removed": 0,
+                      "tags_read": 0, "tags_found": 0, "tag_files_per_s": 0.0}
+
+    @staticmethod
+    def root_key(root) -> str:
+        return os.path.normcase(os.path.abspath(str(root)))
+
+    def _db(self):
+        if self._conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_MUSIC_CATALOG_SCHEMA)
+            existing = {row[1] for row in self._conn.execute("PRAGMA table_info(tracks)")}
+            for column, decl in _MUSIC_TAG_COLUMNS.items():
+                if column not in existing:
+                    self._conn.execute(f"ALTER TABLE tracks ADD COLUMN {column} {decl}")
+            self._conn.commit()
+        return self._conn
+
+    def _query(self, sql: str, params=()) -> list:
+        with self._lock:
+            return self._db().execute(sql, params).fetchall()
+
+    def generation(self, root) -> int:
+        return self._generations.get(self.root_key(root), 0)
+
+    def add_listener(self, callback) -> None:
+        """callback(root_key) chạy ở thread quét (ngoài lock) mỗi khi danh sách bài của root đổi"""
+        self._listeners.append(callback)
+
+    def _notify(self, key: str) -> None:
+        for callback in list(self._listeners):
+            try:
+                callback(key)
+            except Exception as e:
+                print(f"⚠️ [Catalog] Listener error: {e}")
+
+    def _root_info(self, key: str):
+        rows = self._query("SELECT scanned_at, track_count FROM roots WHERE root = ?", (key,))
+        return rows[0] if rows else None
+
+    @staticmethod
+    def _walk(root_path: str):
+        """os.scandir đệ quy: (rel_path '/', entry, stat) của file nhạc - stat lấy từ DirEntry"""
+        stack = [""]
+        while stack:
+            rel_dir = stack.pop()
+            try:
+                with os.scandir(os.path.join(root_path, rel_dir) if rel_dir else root_path) as entries:
+                    for entry in entries:
+                        rel = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                        try:
+                            if entry.is_dir():
+                                stack.append(rel)
+                            elif os.path.splitext(entry.name)[1].lower() in MUSIC_EXTENSIONS and entry.is_file():
+                                yield rel, entry, entry.stat()
+                        except OSError:
+                            continue
+            except OSError:
+                continue  # PermissionError / thư mục bị xóa giữa chừng
+
+    def rescan(self, root) -> dict:
+        """Quét lại 1 thư mục gốc, chỉ ghi bài mới / đã đổi (size, mtime) / đã xóa"""
+        root_path = os.path.abspath(str(root))
+        key = self.root_key(root_path)
+        with self._scan_lock:
+            started = time.perf_counter()
+            known = {rel: (size, mtime) for rel, size, mtime in self._query(
+                "SELECT rel_path, size, mtime_ns FROM tracks WHERE root = ?", (key,))}
+            upserts = []
+            seen = 0
+            for rel, entry, st in self._walk(root_path):
+                seen += 1
+                previous = known.pop(rel, None)
+                if previous == (st.st_size, st.st_mtime_ns):
+                    continue
+                stem, ext = os.path.splitext(entry.name)
+                folder = rel.rpartition('/')[0]
+                upserts.append((key, rel, entry.path, folder, entry.name, entry.name.lower(),
+                                normalize_song_text(stem), ext.lower(), st.st_size, st.st_mtime_ns,
+                                previous is None))
+            removed = list(known)
+
+            with self._lock:
+                conn = self._db()
+                with conn:
+                    # REPLACE xóa luôn tag cũ (tags_mtime_ns = 0) → indexer đọc lại tag của file đã đổi
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO tracks (root, rel_path, full_path, folder, filename, name_lower, "
+                        "norm_name, ext, size, mtime_ns) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        [row[:-1] for row in upserts])
+                    stale = [(key, rel) for rel in removed] + [(key, row[1]) for row in upserts if not row[-1]]
+                    conn.executemany("DELETE FROM tracks WHERE root = ? AND rel_path = ?",
+                                     [(key, rel) for rel in removed])
+                    conn.executemany("DELETE FROM track_terms WHERE root = ? AND rel_path = ?", stale)
+                    conn.execute("INSERT OR REPLACE INTO roots VALUES (?, ?, ?, ?)",
+                                 (key, root_path, time.time(), seen))
+
+            added = sum(1 for row in upserts if row[-1])
+            result = {"root": root_path, "total": seen, "added": added,
+                      "updated": len(upserts) - added, "removed": len(removed),
+                      "ms": round((time.perf_counter() - started) * 1000, 1)}
+            if upserts or removed:
+                self._generations[key] = self._generations.get(key, 0) + 1
+                print(f"📚 [Catalog] {root_path}: {seen} bài (+{added} ~{result['updated']} -{len(removed)}) trong {result['ms']}ms")
+            self.stats["scans"] += 1
+            self.stats["last_scan_ms"] = result["ms"]
+            for name in ("added", "updated", "removed"):
+                self.stats[name] += result[name]
+        if upserts:
+            self._kick_tags()
+        if upserts or removed:
+            self._notify(key)
+        return result
+
+    def ensure(self, root) -> None:
+        """Root chưa có trong catalog → quét ngay; catalog đã cũ → quét lại ở thread nền"""
+        key = self.root_key(root)
+        info = self._root_info(key)
+        if info is None:
+            self.rescan(root)
+        elif time.time() - info[0] > MUSIC_CATALOG_STALE_SECONDS and key not in self._pending:
+            self._pending.add(key)
+
+            def _background():
+                try:
+                    self.rescan(root)
+                except Exception as e:
+                    print(f"⚠️ [Catalog] Background rescan error: {e}")
+                finally:
+                    self._pending.discard(key)
+
+            threading.Thread(target=_background, daemon=True, name="music-catalog-rescan").start()
+
+    async def ensure_async(self, root) -> None:
+        await asyncio.to_thread(self.ensure, root)
+
+    # --- Tag indexer nền: đọc tag song song trên pool, giới hạn số file/phút ---
+
+    def _kick_tags(self) -> None:
+        self._tag_wakeup.set()
+        if self._tag_thread is None or not self._tag_thread.is_alive():
+            self._tag_thread = threading.Thread(target=self._tag_loop, daemon=True, name="music-tag-indexer")
+            self._tag_thread.start()
+
+    def _read_tags_throttled(self, path: str) -> dict:
+        while True:
+            with self._tag_bucket_lock:
+                now = time.monotonic()
+                wait = self._tag_bucket.wait_time(1, now)
+                if wait <= 0:
+                    self._tag_bucket.take(1, now)
+                    break
+            time.sleep(wait)
+        return read_audio_tags(path)
+
+    def _tag_loop(self) -> None:
+        from concurrent.futures import ThreadPoolExecutor
+        self._tag_pool = self._tag_pool or ThreadPoolExecutor(MUSIC_TAG_WORKERS, thread_name_prefix="music-tag")
+        while not self._stop.is_set():
+            self._tag_wakeup.wait()
+            self._tag_wakeup.clear()
+            while not self._stop.is_set():
+                rows = self._query(
+                    "SELECT root, rel_path, full_path, mtime_ns FROM tracks WHERE tags_mtime_ns != mtime_ns LIMIT ?",
+                    (MUSIC_TAG_BATCH,))
+                if not rows:
+                    break
+                started = time.perf_counter()
+                results = list(self._tag_pool.map(self._read_tags_throttled, [row[2] for row in rows]))
+                updates, terms = [], []
+                for (key, rel, _, mtime_ns), tags in zip(rows, results):
+                    values = [tags.get(field, "")[:200] for field in _MUSIC_TAG_SEARCH_FIELDS]
+                    updates.append((*values, tags.get("duration") or 0, mtime_ns, key, rel, mtime_ns))
+                    for field, value in zip(_MUSIC_TAG_SEARCH_FIELDS, values):
+                        for term in set(normalize_song_text(value).split()):
+                            terms.append((key, term, field, rel))
+                with self._lock:
+                    conn = self._db()
+                    with conn:
+                        # Chỉ ghi nếu file chưa đổi kể từ lúc đọc (mtime_ns khớp)
+                        written = conn.executemany(
+                            "UPDATE tracks SET title = ?, artist = ?, album = ?, duration = ?, tags_mtime_ns = ? "
+                            "WHERE root = ? AND rel_path = ? AND mtime_ns = ?", updates).rowcount
+                        conn.executemany("DELETE FROM track_terms WHERE root = ? AND rel_path = ?",
+                                         [(row[0], row[1]) for row in rows])
+                        conn.executemany("INSERT INTO track_terms VALUES (?, ?, ?, ?)", terms)
+                elapsed = time.perf_counter() - started
+                self.stats["tags_read"] += len(rows)
+                self.stats["tags_found"] += sum(1 for tags in results if tags.get("artist") or tags.get("title"))
+                self.stats["tag_files_per_s"] = round(len(rows) / elapsed, 1) if elapsed else 0.0
+                if not written:
+                    break  # Cả lô đều đã đổi trên đĩa - chờ lần rescan tới cập nhật mtime
+
+    def _filters(self, key: str, folder: str = "", keyword: str = "", search_by: str = "name"):
+        """search_by: name (tên file chứa keyword) | artist | album | title | all (tên file hoặc mọi tag)"""
+        clauses, params = ["root = ?"], [key]
+        folder = folder.strip().strip('/\\').replace('\\', '/')
+        if folder:
+            clauses.append("(folder = ? OR folder LIKE ? ESCAPE '\\')")
+            params += [folder, _like_escape(folder) + "/%"]
+        if keyword:
+            matches, match_params = [], []
+            if search_by in ("name", "all"):
+                matches.append("instr(name_lower, ?) > 0")
+                match_params.append(keyword.lower())
+            fields = _MUSIC_TAG_SEARCH_FIELDS if search_by == "all" else (search_by,) if search_by in _MUSIC_TAG_SEARCH_FIELDS else ()
+            terms = sorted(set(normalize_song_text(keyword).split()))
+            if fields and terms:
+                # Index term của tag: bài phải chứa đủ mọi từ của keyword (đã bỏ dấu)
+                matches.append(
+                    f"rel_path IN (SELECT rel_path FROM track_terms WHERE root = ? "
+                    f"AND term IN ({', '.join('?' * len(terms))}) AND field IN ({', '.join('?' * len(fields))}) "
+                    f"GROUP BY rel_path HAVING COUNT(DISTINCT term) = ?)")
+                match_params += [key, *terms, *fields, len(terms)]
+            clauses.append(f"({' OR '.join(matches)})" if matches else "0")
+            params += match_params
+        return " AND ".join(clauses), params
+
+    def count(self, root, folder: str = "", keyword: str = "", search_by: str = "name") -> int:
+        key = self.root_key(root)
+        if not folder and not keyword:
+            info = self._root_info(key)
+            return info[1] if info else 0
+        where, params = self._filters(key, folder, keyword, search_by)
+        return self._query(f"SELECT COUNT(*) FROM tracks WHERE {where}", params)[0][0]
+
+    def page(self, root, offset: int = 0, limit: int = MUSIC_PAGE_SIZE, folder: str = "", keyword: str = "",
+             search_by: str = "name") -> list:
+        """1 trang bài hát sắp theo tên file - chi phí O(trang) nhờ index (root, filename)"""
+        where, params = self._filters(self.root_key(root), folder, keyword, search_by)
+        rows = self._query(
+            f"SELECT {_TRACK_COLUMNS} FROM tracks WHERE {where} ORDER BY filename, rel_path LIMIT ? OFFSET ?",
+            params + [limit, offset])
+        return [_track_row_to_dict(row) for row in rows]
+
+    def find(self, root, filename: str):
+        """Khớp chính xác tên / đường dẫn tương đối trước, sau đó tên chứa filename"""
+        filename_lower = filename.lower()
+        rows = self._query(
+            f"SELECT {_TRACK_COLUMNS} FROM tracks WHERE root = ? AND "
+            "(name_lower = ? OR rel_path = ? OR instr(name_lower, ?) > 0) "
+            "ORDER BY (name_lower = ? OR rel_path = ?) DESC, filename, rel_path LIMIT 1",
+            (self.root_key(root), filename_lower, filename, filename_lower, filename_lower, filename))
+        return _track_row_to_dict(rows[0]) if rows else None
+
+    def paths(self, root) -> list:
+        """Toàn bộ đường dẫn đầy đủ (đã sort) - dùng tạo playlist"""
+        rows = self._query("SELECT full_path FROM tracks WHERE root = ? ORDER BY full_path",
+                           (self.root_key(root),))
+        return [row[0] for row in rows]
+
+    def songs(self, root) -> dict:
+        """Tên bài (stem lowercase) → đường dẫn đầy đủ, cho VLCMusicPlayer._song_cache"""
+        rows = self._query("SELECT filename, ext, full_path FROM tracks WHERE root = ? ORDER BY rel_path",
+                           (self.root_key(root),))
+        return {filename[:len(filename) - len(ext)].lower(): full_path for filename, ext, full_path in rows}
+
+    def roots(self) -> list:
+        return [row[0] for row in self._query("SELECT path FROM roots")]
+
+    def start_watcher(self, interval: float = MUSIC_CATALOG_POLL_INTERVAL) -> None:
+        """Thread nền quét lại mọi root đã biết mỗi `interval` giây"""
+        if self._watcher and self._watcher.is_alive():
+            return
+        self._stop.clear()
+
+        def _poll():
+            while not self._stop.wait(interval):
+                for root in self.roots():
+                    if self._stop.is_set():
+                        break
+                    try:
+                        if os.path.isdir(root):
+                            self.rescan(root)
+                    except Exception as e:
+                        print(f"⚠️ [Catalog] Watcher error ({root}): {e}")
+
+        self._watcher = threading.Thread(target=_poll, daemon=True, name="music-catalog-watcher")
+        self._watcher.start()
+        self._kick_tags()  # Đọc tag còn thiếu (catalog cũ / lần chạy trước bị dừng giữa chừng)
+
+    def stop_watcher(self) -> None:
+        self._stop.set()
+        self._tag_wakeup.set()
+
+    def snapshot(self) -> dict:
+        roots = self._query("SELECT path, track_count, scanned_at FROM roots")
+        return {
+            **self.stats,
+            "roots": {path: {"tracks": count, "age_s": round(time.time() - scanned_at, 1)}
+                      for path, count, scanned_at in roots},
+            "watcher": bool(self._watcher and self._watcher.is_alive()),
+            "tags_pending": self._query("SELECT COUNT(*) FROM tracks WHERE tags_mtime_ns != mtime_ns")[0][0]
+        }
+
+
+music_catalog = MusicCatalog(MUSIC_CATALOG_FILE)
+
+
+def music_page_args(page, page_size) -> tuple:
+    """Chuẩn hóa tham số phân trang từ LLM (có thể là string) → (page, page_size, offset)"""
+    try:
+        page = max(1, int(page))
+    except (TypeError, ValueError):
+        page = 1
+    try:
+        page_size = min(MUSIC_PAGE_SIZE_MAX, max(1, int(page_size)))
+    except (TypeError, ValueError):
+        page_size = MUSIC_PAGE_SIZE
+    return page, page_size, (page - 1) * page_size
+
+
+# Playlist dạng cửa sổ: media list VLC chỉ chứa bài hiện tại + N bài trước/sau (theo thứ tự phát).
+# Thứ tự phát (shuffle) là mảng index; repeat all/off tính trên index, không trên Media của VLC.
+MUSIC_PLAYLIST_WINDOW = 5
+
+# Actor VLC: 1 thread sở hữu player, nhận lệnh qua queue, xác nhận chuyển trạng thái bằng event libvlc.
+# Lệnh dồn dập được gộp: 5 lần volume +10 → 1 set_volume, next x3 → skip 3.
+VLC_COALESCE_WINDOW = 0.03  # Giây chờ gom thêm lệnh khi lệnh đầu gộp được
+VLC_CONFIRM_TIMEOUT = 1.5  # Giây chờ event Playing/Paused/Stopped
+_VLC_COALESCABLE = {"skip", "volume_delta", "volume", "seek", "pause"}
+
+# Preload: bài kế / bài trước được pre-parse (local, metadata) + đọc trước phần đầu file vào page cache
+# → "bài tiếp" chỉ còn chờ VLC mở decoder. Đo skip → event Playing (xem /api/perf)
+VLC_PRELOAD_BYTES = 512 * 1024
+VLC_PRELOAD_KEEP = 4  # Media đã preload nằm ngoài cửa sổ (LRU)
+VLC_FILE_CACHING_MS = 100  # File local: VLC mặc định đệm 300ms trước khi phát
+VLC_SKIP_SAMPLES = 200
+
+
 # VLC Player Manager (Singleton)
 class VLCMusicPlayer:
     """
     VLC Music Player với hỗ trợ đầy đủ:
     - Play/Pause/Stop
     - Next/Previous track
-    - Playlist management
+    - Playlist management (cửa sổ MUSIC_PLAYLIST_WINDOW - playlist lớn không tạo hết Media)
     - Fuzzy song matching (tìm bài gần đúng)
     - Media keys support (VLC tự động hỗ trợ)
     """
@@ -3840,9 +5562,18 @@ class VLCMusicPlayer:
     _media_list = None
     _list_player = None
     _current_playlist = []
+    _order = array('L')  # Thứ tự phát: vị trí → index trong _current_playlist
+    _position = 0  # Vị trí hiện tại trong _order
+    _window = []  # Vị trí trong _order (đã % len) của từng item trong _media_list
+    _actor_thread = None
+    on_change = None  # Callback (không tham số) khi trạng thái đổi - gọi từ thread VLC/actor
     _shuffle = False
     _repeat_mode = 0  # 0: off, 1: all, 2: one
     _song_cache = {}  # Cache danh sách bài hát
+    _song_index = None  # SongSearchIndex dựng từ _song_cache
+    _song_root = None  # Thư mục gốc của _song_cache trong music_catalog
+    _song_generation = 0
+    _song_lock = threading.RLock()  # 1 lần dựng index tại 1 thời điểm (rescan thread / tool thread)
     
     def __new__(cls):
         if cls._instance is None:
@@ -3862,26 +5593,335 @@ class VLCMusicPlayer:
                 self._media_list = self._instance_vlc.media_list_new()
                 self._list_player = self._instance_vlc.media_list_player_new()
                 self._list_player.set_media_player(self._player)
+                
+                # 🎭 Actor: mọi lệnh điều khiển chạy trên 1 thread; callback VLC chỉ ghi nhận / xếp hàng
+                # (không gọi libvlc trong callback)
+                self._commands = queue.Queue()
+                self._state_cond = threading.Condition()
+                self._state_seq = 0
+                self._last_state_event = None
+                self._last_state_at = 0.0
+                self._command_submitted = 0.0
+                self.actor_stats = {"commands": 0, "executed": 0, "coalesced": 0, "skips": 0, "preload_hits": 0}
+                self._skip_latency = deque(maxlen=VLC_SKIP_SAMPLES)
+                self._preloaded = OrderedDict()  # path → Media đã pre-parse (ngoài cửa sổ)
+                self._preload_pool = ThreadPoolExecutor(1, thread_name_prefix="vlc-preload")
+                player_events = self._player.event_manager()
+                for event_type in (vlc.EventType.MediaPlayerPlaying, vlc.EventType.MediaPlayerPaused,
+                                   vlc.EventType.MediaPlayerStopped, vlc.EventType.MediaPlayerEncounteredError):
+                    player_events.event_attach(event_type, self._on_state_event)
+                list_events = self._list_player.event_manager()
+                for event_type in (vlc.EventType.MediaListPlayerNextItemSet, vlc.EventType.MediaListPlayerPlayed):
+                    list_events.event_attach(event_type, lambda event: self._commands.put(("window", (event.type,), [], time.perf_counter())))
+                self._actor_thread = threading.Thread(target=self._actor_loop, daemon=True, name="vlc-actor")
+                self._actor_thread.start()
                 print("✅ [VLC] VLC Music Player initialized (full UI + fuzzy matching)")
             except Exception as e:
                 print(f"❌ [VLC] Failed to initialize: {e}")
                 self._player = None
     
+    # --- Actor: queue lệnh + future, gộp lệnh, xác nhận bằng event ---
+    
+    def submit(self, name: str, *args) -> Future:
+        """Xếp lệnh cho actor, trả về concurrent.futures.Future (không block)"""
+        future = Future()
+        if self._actor_thread is None:
+            future.set_result(False)
+            return future
+        self.actor_stats["commands"] += 1
+        self._commands.put((name, args, [future], time.perf_counter()))
+        return future
+    
+    def call(self, name: str, *args, timeout: float = 10):
+        """Gửi lệnh và chờ kết quả (cho code đồng bộ). Trên chính thread actor → chạy trực tiếp"""
+        if threading.current_thread() is self._actor_thread:
+            return getattr(self, f"_cmd_{name}")(*args)
+        return self.submit(name, *args).result(timeout)
+    
+    async def send(self, name: str, *args):
+        """Gửi lệnh từ async code - không block event loop"""
+        return await asyncio.wrap_future(self.submit(name, *args))
+    
+    def _on_state_event(self, event):
+        with self._state_cond:
+            self._state_seq += 1
+            self._last_state_event = event.type
+            self._last_state_at = time.perf_counter()
+            self._state_cond.notify_all()
+        self._notify_change()
+    
+    def _notify_change(self):
+        if self.on_change is not None:
+            try:
+                self.on_change()
+            except Exception as e:
+                print(f"⚠️ [VLC] on_change error: {e}")
+    
+    def _await_state(self, since: int, wanted: set, timeout: float = VLC_CONFIRM_TIMEOUT):
+        """Chờ event trạng thái (sau mốc since) thuộc wanted. Trả về loại event hoặc None nếu timeout"""
+        deadline = time.monotonic() + timeout
+        with self._state_cond:
+            while not (self._state_seq > since and self._last_state_event in wanted):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._state_cond.wait(remaining)
+            return self._last_state_event
+    
+    def _play_confirmed(self, action) -> bool:
+        """Chạy action rồi chờ MediaPlayerPlaying (thay cho sleep cố định); chưa phát → chạy lại 1 lần"""
+        Event = self._vlc.EventType
+        for attempt in range(2):
+            if attempt:
+                print(f"⚠️ [VLC] Not playing after {VLC_CONFIRM_TIMEOUT}s, retry...")
+            since = self._state_seq
+            action()
+            if self._await_state(since, {Event.MediaPlayerPlaying, Event.MediaPlayerEncounteredError}) == Event.MediaPlayerPlaying:
+                return True
+        return self._player.is_playing()
+    
+    def _coalesce(self, batch: list) -> list:
+        """Gộp lệnh liên tiếp cùng loại: skip/volume_delta cộng dồn, volume/seek lấy giá trị cuối,
+        pause (toggle) đếm số lần - chẵn thì không làm gì"""
+        merged = []
+        for name, args, futures, submitted in batch:
+            if name == "pause":
+                args = (1,)
+            last = merged[-1] if merged else None
+            if last and last[0] == name and name in _VLC_COALESCABLE:
+                if name in ("skip", "volume_delta", "pause"):
+                    last[1] = (last[1][0] + args[0],)
+                else:
+                    last[1] = args
+                last[2].extend(futures)
+                self.actor_stats["coalesced"] += 1
+            else:
+                merged.append([name, args, list(futures), submitted])
+        return merged
+    
+    def _actor_loop(self):
+        while True:
+            batch = [self._commands.get()]
+            if batch[0][0] in _VLC_COALESCABLE:
+                time.sleep(VLC_COALESCE_WINDOW)  # Gom các lệnh đến dồn dập (voice / click liên tục)
+            while True:
+                try:
+                    batch.append(self._commands.get_nowait())
+                except queue.Empty:
+                    break
+            for name, args, futures, submitted in self._coalesce(batch):
+                self._command_submitted = submitted  # Lệnh gộp → tính từ lệnh đầu tiên
+                try:
+                    result = getattr(self, f"_cmd_{name}")(*args)
+                    self.actor_stats["executed"] += 1
+                    for future in futures:
+                        future.set_result(result)
+                except Exception as e:
+                    print(f"❌ [VLC] Command {name}{args} error: {e}")
+                    for future in futures:
+                        future.set_exception(e)
+            self._notify_change()  # Volume / shuffle / repeat không có event VLC riêng
+    
+    # --- Lệnh public (giữ API cũ) → chuyển qua actor ---
+    
     def play_file(self, file_path: str):
         """Phát 1 file nhạc"""
+        return self.call("play_file", file_path)
+    
+    def play_playlist(self, file_paths: list):
+        """Phát playlist - chỉ tạo Media cho cửa sổ quanh bài đầu, không phải cả playlist"""
+        return self.call("play_playlist", list(file_paths))
+    
+    def pause(self):
+        """Tạm dừng / phát tiếp (toggle)"""
+        return self.call("pause")
+    
+    def resume(self):
+        """Tiếp tục phát - Đảm bảo đang play"""
+        return self.call("resume")
+    
+    def stop(self):
+        """Dừng phát hoàn toàn và reset trạng thái"""
+        return self.call("stop")
+    
+    def skip(self, delta: int) -> bool:
+        """Chuyển delta bài theo thứ tự phát (vòng đầu/cuối)"""
+        return self.call("skip", delta)
+    
+    def next_track(self):
+        """Bài tiếp theo - Tự động phát luôn, xác nhận bằng event Playing"""
+        return self.call("skip", 1)
+    
+    def previous_track(self):
+        """Bài trước - Tự động phát luôn, xác nhận bằng event Playing"""
+        return self.call("skip", -1)
+    
+    # --- Handler chạy trên thread actor ---
+    
+    def _cmd_play_file(self, file_path: str):
         if not self._player:
             return False
         try:
             media = self._instance_vlc.media_new(file_path)
-            self._player.set_media(media)
-            self._player.play()
-            return True
+            return self._play_confirmed(lambda: (self._player.set_media(media), self._player.play()))
         except Exception as e:
             print(f"❌ [VLC] Play error: {e}")
             return False
     
-    def play_playlist(self, file_paths: list):
-        """Phát playlist với nhiều bài"""
+    def _window_positions(self, center: int) -> list:
+        """Vị trí (trong _order) của cửa sổ quanh center; repeat all → vòng qua đầu/cuối.
+        Luôn trả vị trí đã % len(_order), không trùng nhau (playlist ngắn hơn cửa sổ → lấy cả playlist)"""
+        count = len(self._order)
+        lo, hi = center - MUSIC_PLAYLIST_WINDOW, center + MUSIC_PLAYLIST_WINDOW
+        if self._repeat_mode != 1:
+            return list(range(max(0, lo), min(count - 1, hi) + 1))
+        if hi - lo + 1 > count:
+            lo = center - (count - 1) // 2
+            hi = lo + count - 1
+        return [position % count for position in range(lo, hi + 1)]
+    
+    def _path_at(self, position: int) -> str:
+        return self._current_playlist[self._order[position % len(self._order)]]
+    
+    def _new_media(self, path: str):
+        media = self._instance_vlc.media_new(path)
+        media.add_option(f":file-caching={VLC_FILE_CACHING_MS}")
+        return media
+    
+    def _media_at(self, position: int):
+        """Media cho 1 vị trí - lấy bản đã preload nếu có (mỗi Media chỉ nằm trong 1 media list)"""
+        path = self._path_at(position)
+        return self._preloaded.pop(path, None) or self._new_media(path)
+    
+    def _neighbor_media(self, position: int):
+        """Media sẽ phát khi skip tới position: item trong cửa sổ hoặc bản preload (None nếu chưa có)"""
+        if position in self._window:
+            return self._media_list.item_at_index(self._window.index(position))
+        return self._preloaded.get(self._path_at(position))
+    
+    def _is_parsed(self, media) -> bool:
+        try:
+            return media is not None and media.get_parsed_status() == self._vlc.MediaParsedStatus.done
+        except Exception:
+            return False
+    
+    def _preload_neighbors(self):
+        """Pre-parse bài kế tiếp + bài trước (parse local của libvlc chạy nền) và đọc trước
+        VLC_PRELOAD_BYTES đầu file → lần skip sau không phải chờ mở/demux file nguội"""
+        if not self._current_playlist:
+            return
+        count = len(self._order)
+        for position in (self._position + 1, self._position - 1):
+            if self._repeat_mode != 1 and not 0 <= position < count:
+                continue
+            position %= count
+            path = self._path_at(position)
+            media = self._neighbor_media(position)
+            if media is None:
+                media = self._preloaded[path] = self._new_media(path)
+                while len(self._preloaded) > VLC_PRELOAD_KEEP:
+                    self._preloaded.popitem(last=False)
+            elif path in self._preloaded:
+                self._preloaded.move_to_end(path)
+            try:
+                if not self._is_parsed(media):
+                    media.parse_with_options(self._vlc.MediaParseFlag.local, 0)  # Async, không block actor
+            except Exception as e:
+                print(f"⚠️ [VLC] Preparse error: {e}")
+            self._preload_pool.submit(self._warm_file, path)
+    
+    @staticmethod
+    def _warm_file(path: str):
+        """Đọc phần đầu file → nằm sẵn trong page cache của OS khi VLC mở"""
+        try:
+            with open(path, 'rb') as f:
+                f.read(VLC_PRELOAD_BYTES)
+        except OSError:
+            pass
+    
+    def snapshot(self) -> dict:
+        def pct(samples, p):
+            if not samples:
+                return None
+            ordered = sorted(samples)
+            return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1000, 1)
+
+        return {
+            **self.actor_stats,
+            "preloaded": len(self._preloaded),
+            "skip_to_audio_p50_ms": pct(self._skip_latency, 50),
+            "skip_to_audio_p95_ms": pct(self._skip_latency, 95),
+        }
+    
+    def _load_window(self, center: int) -> int:
+        """Dựng media list mới chỉ gồm cửa sổ quanh center. Trả về index của center trong list"""
+        positions = self._window_positions(center)
+        media_list = self._instance_vlc.media_list_new()
+        media_list.lock()
+        for position in positions:
+            media_list.add_media(self._media_at(position))
+        media_list.unlock()
+        self._media_list = media_list
+        self._window = positions
+        self._list_player.set_media_list(media_list)
+        return positions.index(center % len(self._order))
+    
+    def _set_position(self, position: int):
+        self._position = position % len(self._order)
+        self._current_index = self._order[self._position]
+    
+    def _jump(self, position: int):
+        """Phát bài ở vị trí position của _order - dựng lại cửa sổ nếu bài nằm ngoài cửa sổ"""
+        position %= len(self._order)
+        if position in self._window:
+            index = self._window.index(position)
+        else:
+            index = self._load_window(position)
+        self._set_position(position)
+        self._list_player.play_item_at_index(index)
+    
+    def _refresh_forward(self):
+        """Thay các bài SAU bài đang phát bằng thứ tự mới (sau khi đổi shuffle).
+        Chỉ xóa/thêm phía sau item hiện tại nên VLC không mất vị trí đang phát."""
+        media = self._player.get_media()
+        index = self._media_list.index_of_item(media) if media else -1
+        if index < 0:
+            self._window = []  # Không đang phát → lần phát sau dựng lại cửa sổ
+            return
+        positions = self._window_positions(self._position)
+        forward = positions[positions.index(self._position) + 1:]
+        self._media_list.lock()
+        for i in range(self._media_list.count() - 1, index, -1):
+            self._media_list.remove_index(i)
+        for position in forward:
+            self._media_list.add_media(self._media_at(position))
+        self._media_list.unlock()
+        # Các item trước bài hiện tại thuộc thứ tự cũ → không dùng để map vị trí nữa
+        self._window = [None] * index + [self._position] + forward
+    
+    def _cmd_window(self, event_type):
+        """Event VLC: NextItemSet → cập nhật vị trí; Played (hết cửa sổ) → trượt cửa sổ"""
+        if not self._current_playlist:
+            return
+        if event_type == self._vlc.EventType.MediaListPlayerNextItemSet:
+            media = self._player.get_media()
+            index = self._media_list.index_of_item(media) if media else -1
+            if 0 <= index < len(self._window) and self._window[index] is not None:
+                moved = self._window[index] != self._position
+                self._set_position(self._window[index])
+                if moved:  # VLC tự sang bài (hết bài) → preload cặp bài kế mới
+                    self._preload_neighbors()
+        elif event_type == self._vlc.EventType.MediaListPlayerPlayed:
+            following = self._position + 1
+            if following >= len(self._order) and self._repeat_mode != 1:
+                print("⏹️ [VLC] Playlist ended")
+                return
+            following %= len(self._order)
+            print(f"🪟 [VLC] Window end → slide to position {following}/{len(self._order)}")
+            self._jump(following)
+            self._preload_neighbors()
+    
+    def _cmd_play_playlist(self, file_paths: list):
         if not self._list_player:
             print("❌ [VLC] list_player chưa khởi tạo")
             return False
@@ -3889,58 +5929,33 @@ class VLCMusicPlayer:
             print(f"🎵 [VLC DEBUG] play_playlist called with {len(file_paths)} files")
             for i, p in enumerate(file_paths[:3]):  # Log 3 file đầu
                 print(f"   [{i+1}] {p}")
+            if not file_paths:
+                return False
             
             # QUAN TRỌNG: STOP bài đang phát trước!
             self._list_player.stop()
-            import time
-            time.sleep(0.3)
             print("🛑 [VLC] Stopped current playback")
             
-            # Clear playlist cũ và tạo mới
-            self._media_list = self._instance_vlc.media_list_new()
             self._current_playlist = file_paths
-            
-            # Thêm tất cả bài vào playlist
-            for path in file_paths:
-                media = self._instance_vlc.media_new(path)
-                self._media_list.add_media(media)
-            
-            print(f"🎵 [VLC DEBUG] Media list count: {self._media_list.count()}")
-            
-            # Set playlist mới
-            self._list_player.set_media_list(self._media_list)
-            
-            # Set current index to 0 (first song)
-            self._current_index = 0
-            
-            # QUAN TRỌNG: Gọi play() để phát bài đầu tiên
-            self._list_player.play()
-            print(f"🎵 [VLC DEBUG] list_player.play() called")
-            
-            # FIX DOUBLE-CLICK: Tăng thời gian chờ để VLC khởi tạo đầy đủ
-            time.sleep(0.7)
-            
-            # Kiểm tra và đảm bảo đang phát với retry mechanism
-            if self._player:
-                state = self._player.get_state()
-                is_playing = self._player.is_playing()
-                current_vol = self._player.audio_get_volume()
-                print(f"🎵 [VLC DEBUG] State: {state}, is_playing: {is_playing}, volume: {current_vol}")
-                
-                # FIX: Retry nếu chưa phát (quan trọng cho double-click)
-                retry_count = 0
-                max_retries = 3
-                while not is_playing and retry_count < max_retries:
-                    print(f"⚠️ [VLC DEBUG] Not playing, retry {retry_count+1}/{max_retries}...")
-                    self._list_player.play()
-                    time.sleep(0.4)
-                    is_playing = self._player.is_playing()
-                    retry_count += 1
-                
-                # Đảm bảo volume đủ nghe
-                if current_vol < 50:
-                    self._player.audio_set_volume(80)
-                    print(f"🔊 [VLC] Volume was {current_vol}, set to 80")
+            # Bài đầu (bài được chọn) luôn phát trước; shuffle trộn phần còn lại
+            self._order = array('L', range(len(file_paths)))
+            if self._shuffle:
+                rest = self._order[1:]
+                random.shuffle(rest)
+                self._order[1:] = rest
+            self._window = []
+            
+            # Xác nhận bằng event Playing thay vì sleep cố định
+            is_playing = self._play_confirmed(lambda: self._jump(0))
+            self._preload_neighbors()
+            current_vol = self._player.audio_get_volume()
+            print(f"🎵 [VLC DEBUG] Media list count: {self._media_list.count()} (window of {len(file_paths)}), "
+                  f"is_playing: {is_playing}, volume: {current_vol}")
+            
+            # Đảm bảo volume đủ nghe
+            if current_vol < 50:
+                self._player.audio_set_volume(80)
+                print(f"🔊 [VLC] Volume was {current_vol}, set to 80")
             
             print(f"▶️ [VLC] Playing playlist with {len(file_paths)} songs")
             return True
@@ -3950,142 +5965,93 @@ class VLCMusicPlayer:
             traceback.print_exc()
             return False
     
-    def pause(self):
-        """Tạm dừng"""
-        if self._player:
-            self._player.pause()
-            return True
-        return False
+    def _cmd_pause(self, toggles: int = 1):
+        if not self._player:
+            return False
+        if toggles % 2 == 0:
+            return True  # Pause + play liên tiếp → triệt tiêu
+        Event = self._vlc.EventType
+        since = self._state_seq
+        self._player.pause()
+        self._await_state(since, {Event.MediaPlayerPaused, Event.MediaPlayerPlaying}, timeout=1.0)
+        return True
     
-    def resume(self):
-        """Tiếp tục phát - Đảm bảo đang play"""
+    def _cmd_resume(self):
         if self._list_player:
             # Nếu đang paused, gọi play để tiếp tục
             if not self.is_playing():
-                self._list_player.play()
-            return True
-        elif self._player:
-            if not self.is_playing():
-                self._player.play()
+                self._play_confirmed(self._list_player.play)
             return True
         return False
     
-    def stop(self):
-        """Dừng phát hoàn toàn và reset trạng thái"""
+    def _cmd_stop(self):
+        if not self._player:
+            return False
         try:
-            import time
-            
+            Event = self._vlc.EventType
+            was_active = self._player.get_state() not in (self._vlc.State.Stopped, self._vlc.State.NothingSpecial)
+            since = self._state_seq
             # Stop cả list_player và player
-            if self._list_player:
-                self._list_player.stop()
-                time.sleep(0.1)
-            
-            if self._player:
-                self._player.stop()
-                time.sleep(0.1)
-            
-            # Verify đã dừng thực sự
-            stopped = False
-            for _ in range(3):  # Retry 3 lần
-                if not self.is_playing():
-                    stopped = True
-                    break
-                time.sleep(0.1)
-                if self._player:
-                    self._player.stop()
+            self._list_player.stop()
+            self._player.stop()
             
-            if stopped:
+            # Verify đã dừng thực sự (event Stopped)
+            if not was_active or not self.is_playing() or self._await_state(since, {Event.MediaPlayerStopped}, timeout=1.0):
                 print("✅ [VLC] Stopped successfully")
             else:
                 print("⚠️ [VLC] Stop command sent but player may still be active")
-            
             return True
         except Exception as e:
             print(f"❌ [VLC] Stop error: {e}")
             return False
     
-    def next_track(self):
-        """Bài tiếp theo - Tự động phát luôn với retry logic!"""
-        if self._list_player and self._current_playlist:
-            current_idx = getattr(self, '_current_index', 0)
-            last_idx = len(self._current_playlist) - 1
-            
-            # Stop hiện tại để tránh conflict
-            self._list_player.stop()
-            
-            if current_idx >= last_idx:
-                # Đã ở bài cuối, quay lại bài đầu
-                self._current_index = 0
-                print(f"🔄 [VLC] Next: Wrap to first track (index 0)")
-            else:
-                # Còn bài tiếp, chuyển bình thường
-                self._current_index = current_idx + 1
-                print(f"⏭️ [VLC] Next: Now at index {self._current_index}")
-            
-            # Play bài mới bằng index
-            self._list_player.play_item_at_index(self._current_index)
-            
-            import time
-            time.sleep(0.4)
-            
-            # Retry nếu chưa phát (tối đa 2 lần)
-            retry_count = 0
-            while not self.is_playing() and retry_count < 2:
-                print(f"⚠️ [VLC] Not playing yet, retry {retry_count + 1}/2...")
-                self._list_player.play()
-                time.sleep(0.3)
-                retry_count += 1
-            
-            # Verify
-            if self.is_playing():
-                print(f"✅ [VLC] Next track playing successfully")
-                return True
-            else:
-                print(f"❌ [VLC] Failed to play next track after retries")
-                return False
-        return False
+    def _cmd_skip(self, delta: int) -> bool:
+        if not self._list_player or not self._current_playlist:
+            return False
+        if delta == 0:
+            return True  # next + previous liên tiếp → đứng yên
+        target = (self._position + delta) % len(self._order)
+        if delta > 0 and target < self._position:
+            print(f"🔄 [VLC] Next: Wrap to first track (index 0)")
+        elif delta < 0 and target > self._position:
+            print(f"🔄 [VLC] Previous: Wrap to last track (index {target})")
+        
+        warm = self._is_parsed(self._neighbor_media(target))
+        ok = self._play_confirmed(lambda: self._jump(target))
+        if ok:
+            # Skip → audio: từ lúc lệnh vào queue (kể cả thời gian gom lệnh) tới event Playing
+            latency = max(0.0, self._last_state_at - self._command_submitted)
+            self._skip_latency.append(latency)
+            self.actor_stats["skips"] += 1
+            self.actor_stats["preload_hits"] += warm
+        print(f"{'⏭️' if delta > 0 else '⏮️'} [VLC] Skip {delta:+d} → index {self._current_index} "
+              f"(position {self._position}) {'✅' if ok else '❌'}{' (preloaded)' if warm else ''}")
+        self._preload_neighbors()
+        return ok
+    
+    def _cmd_volume(self, level: int):
+        if not self._player:
+            return False
+        level = max(0, min(100, int(level)))
+        self._player.audio_set_volume(level)
+        return level
     
-    def previous_track(self):
-        """Bài trước - Tự động phát luôn với retry logic!"""
-        if self._list_player and self._current_playlist:
-            # Kiểm tra nếu đang ở bài đầu tiên
-            current_idx = getattr(self, '_current_index', 0)
-            
-            # Stop hiện tại để tránh conflict
-            self._list_player.stop()
-            
-            if current_idx <= 0:
-                # Đã ở bài đầu, quay lại bài cuối cùng của playlist
-                last_idx = len(self._current_playlist) - 1
-                self._current_index = last_idx
-                print(f"🔄 [VLC] Previous: Wrap to last track (index {last_idx})")
-            else:
-                # Còn bài trước, chuyển bình thường
-                self._current_index = current_idx - 1
-                print(f"⏮️ [VLC] Previous: Now at index {self._current_index}")
-            
-            # Play bài mới bằng index
-            self._list_player.play_item_at_index(self._current_index)
-            
-            import time
-            time.sleep(0.4)
-            
-            # Retry nếu chưa phát (tối đa 2 lần)
-            retry_count = 0
-            while not self.is_playing() and retry_count < 2:
-                print(f"⚠️ [VLC] Not playing yet, retry {retry_count + 1}/2...")
-                self._list_player.play()
-                time.sleep(0.3)
-                retry_count += 1
-            
-            # Verify
-            if self.is_playing():
-                print(f"✅ [VLC] Previous track playing successfully")
-                return True
-            else:
-                print(f"❌ [VLC] Failed to play previous track after retries")
-                return False
-        return False
+    def _cmd_volume_delta(self, delta: int):
+        if not self._player:
+            return False
+        return self._cmd_volume((self._player.audio_get_volume() or 50) + delta)
+    
+    def _cmd_mute(self):
+        if not self._player:
+            return False
+        self._player.audio_toggle_mute()
+        return True
+    
+    def _cmd_seek(self, position: float):
+        if not self._player:
+            return False
+        self._player.set_position(max(0.0, min(1.0, position)))
+        return True
     
     def is_playing(self):
         """Kiểm tra đang phát không"""
@@ -4137,19 +6103,11 @@ class VLCMusicPlayer:
     
     def set_volume(self, level: int):
         """Đặt âm lượng (0-100)"""
-        if self._player:
-            level = max(0, min(100, level))
-            self._player.audio_set_volume(level)
-            return True
-        return False
+        return self.call("volume", level) is not False
     
     def set_position(self, position: float):
         """Đặt vị trí (0.0 - 1.0)"""
-        if self._player:
-            position = max(0.0, min(1.0, position))
-            self._player.set_position(position)
-            return True
-        return False
+        return self.call("seek", position)
     
     def get_current_media_title(self):
         """Lấy tiêu đề media đang phát - TỐI ƯU với cache"""
@@ -4208,23 +6166,44 @@ class VLCMusicPlayer:
         }
     
     def set_shuffle(self, enabled: bool):
-        """Bật/tắt chế độ phát ngẫu nhiên"""
-        self._shuffle = enabled
-        if self._list_player:
-            # VLC MediaListPlayer không có native shuffle, ta xử lý thủ công khi next/previous
-            pass
-        return self._shuffle
+        """Bật/tắt chế độ phát ngẫu nhiên - trộn mảng index _order, giữ bài đang phát"""
+        if self._actor_thread is None:
+            self._shuffle = enabled
+            return self._shuffle
+        return self.call("shuffle", enabled)
     
     def set_repeat_mode(self, mode: int):
         """Đặt chế độ lặp lại: 0=off, 1=all, 2=one"""
+        if self._actor_thread is None:
+            self._repeat_mode = mode
+            return self._repeat_mode
+        return self.call("repeat", mode)
+    
+    def _cmd_shuffle(self, enabled: bool):
+        self._shuffle = enabled
+        if self._list_player and self._current_playlist:
+            # VLC MediaListPlayer không có native shuffle → tự sắp lại thứ tự phát
+            current = self._current_index
+            if enabled:
+                rest = array('L', (i for i in range(len(self._current_playlist)) if i != current))
+                random.shuffle(rest)
+                self._order = array('L', [current]) + rest
+                self._position = 0
+            else:
+                self._order = array('L', range(len(self._current_playlist)))
+                self._position = current
+            self._refresh_forward()
+            self._preload_neighbors()
+        return self._shuffle
+    
+    def _cmd_repeat(self, mode: int):
         self._repeat_mode = mode
         if self._list_player:
-            if mode == 0:
-                self._list_player.set_playback_mode(self._vlc.PlaybackMode.default)
-            elif mode == 1:
-                self._list_player.set_playback_mode(self._vlc.PlaybackMode.loop)
-            elif mode == 2:
+            # Lặp 1 bài dùng repeat của VLC; lặp tất cả do cửa sổ tự vòng về đầu (loop của VLC chỉ lặp cửa sổ)
+            if mode == 2:
                 self._list_player.set_playback_mode(self._vlc.PlaybackMode.repeat)
+            else:
+                self._list_player.set_playback_mode(self._vlc.PlaybackMode.default)
         return self._repeat_mode
     
     def get_shuffle(self):
@@ -4245,26 +6224,36 @@ class VLCMusicPlayer:
         return f"{minutes}:{seconds:02d}"
     
     def refresh_song_cache(self, music_folder: Path):
-        """Refresh cache danh sách bài hát từ music_library"""
+        """Dựng lại cache + SongSearchIndex từ music_catalog (không quét lại ổ đĩa).
+        Blocking (vài giây với thư viện lớn) → gọi ở thread; dựng xong mới thay tham chiếu,
+        query đang chạy vẫn đọc bản cũ."""
         try:
-            print(f"🔄 [VLC] Refreshing song cache from {music_folder}...")
-            self._song_cache = {}
-            
             if not music_folder.exists():
                 print(f"⚠️ [VLC] Music folder not found: {music_folder}")
+                self._song_cache, self._song_index = {}, None
                 return
             
-            extensions = ['.mp3', '.flac', '.wav', '.m4a', '.ogg', '.wma']
-            for file_path in music_folder.rglob("*"):
-                if file_path.is_file() and file_path.suffix.lower() in extensions:
-                    # Lưu: tên file (lowercase) -> đường dẫn đầy đủ
-                    song_name = file_path.stem.lower()  # Tên file không có extension
-                    self._song_cache[song_name] = str(file_path)
-            
-            print(f"✅ [VLC] Song cache refreshed: {len(self._song_cache)} songs")
+            with self._song_lock:
+                print(f"🔄 [VLC] Refreshing song cache from {music_folder}...")
+                music_catalog.ensure(music_folder)
+                generation = music_catalog.generation(music_folder)
+                # Lưu: tên file (lowercase, không extension) -> đường dẫn đầy đủ
+                song_cache = music_catalog.songs(music_folder)
+                song_index = SongSearchIndex(song_cache)
+                self._song_index = song_index
+                self._song_cache = song_cache
+                self._song_root = music_folder
+                self._song_generation = generation
+            print(f"✅ [VLC] Song cache refreshed: {len(song_cache)} songs")
         except Exception as e:
             print(f"❌ [VLC] Error refreshing song cache: {e}")
     
+    def on_catalog_change(self, root_key: str):
+        """Listener của music_catalog (thread quét): catalog thư mục đang dùng đổi → dựng index mới ngay"""
+        root = self._song_root
+        if root is not None and music_catalog.root_key(root) == root_key:
+            self.refresh_song_cache(root)
+    
     def fuzzy_match_song(self, query: str, threshold: float = 0.3):
         """
         Tìm bài hát gần đúng bằng fuzzy matching với Unicode normalization
@@ -4276,67 +6265,33 @@ class VLCMusicPlayer:
         Returns:
             tuple: (best_match_path, similarity_score) hoặc (None, 0.0)
         """
-        if not self._song_cache:
-            print("⚠️ [VLC] Song cache empty, call refresh_song_cache() first")
+        results = self.search_songs(query, limit=1)
+        if not results:
             return None, 0.0
+        best = results[0]
         
-        import unicodedata
-        
-        # Normalize Unicode (NFD = decompose dấu) để so sánh tốt hơn
-        def normalize_text(text):
-            # NFD: tách dấu khỏi ký tự (e.g., "á" -> "a" + dấu)
-            text = unicodedata.normalize('NFD', text)
-            # Loại bỏ dấu thanh (chỉ giữ chữ cái cơ bản)
-            text = ''.join(c for c in text if not unicodedata.combining(c))
-            # Lowercase và loại bỏ ký tự đặc biệt
-            text = re.sub(r'[^\w\s]', '', text.lower()).strip()
-            text = re.sub(r'\s+', ' ', text)  # Collapse spaces
-            return text
-        
-        query_normalized = normalize_text(query)
-        
-        # Loại bỏ các từ điều khiển thường gặp
-        stop_words = ['phat', 'bai', 'mo', 'chay', 'play', 'song', 'nhac', 'hat']
-        query_words = [w for w in query_normalized.split() if w not in stop_words]
-        query_processed = ' '.join(query_words) if query_words else query_normalized
-        
-        print(f"🔍 [VLC Fuzzy] Query: '{query}' -> Normalized: '{query_processed}'")
-        
-        best_match = None
-        best_score = 0.0
-        
-        for song_name_original, song_path in self._song_cache.items():
-            # Normalize song name để so sánh
-            song_name_normalized = normalize_text(song_name_original)
-            
-            # Tính similarity với difflib
-            similarity = difflib.SequenceMatcher(None, query_processed, song_name_normalized).ratio()
-            
-            # Thưởng điểm nếu query có trong tên bài (substring match)
-            if query_processed in song_name_normalized:
-                similarity += 0.25
-            
-            # Thưởng điểm nếu từng từ đều có trong tên bài
-            if query_words:
-                words_match = all(word in song_name_normalized for word in query_words)
-                if words_match:
-                    similarity += 0.20
-            
-            # Thưởng điểm nếu bắt đầu giống nhau (prefix match)
-            if song_name_normalized.startswith(query_processed[:4]):  # 4 ký tự đầu
-                similarity += 0.10
-            
-            if similarity > best_score:
-                best_score = similarity
-                best_match = song_path
-        
-        if best_score >= threshold:
-            print(f"✅ [VLC Fuzzy] Found match: {Path(best_match).name} (score: {best_score:.2f})")
-            return best_match, best_score
+        if best["score"] >= threshold:
+            print(f"✅ [VLC Fuzzy] Found match: {best['name']} (score: {best['score']:.2f})")
+            return best["path"], best["score"]
         else:
-            print(f"❌ [VLC Fuzzy] No match found above threshold {threshold} (best: {best_score:.2f})")
+            print(f"❌ [VLC Fuzzy] No match found above threshold {threshold} (best: {best['score']:.2f})")
             return None, 0.0
     
+    def search_songs(self, query: str, limit: int = 5, threshold: float = 0.0) -> list:
+        """
+        Top-k bài gần đúng nhất qua SongSearchIndex
+        
+        Returns:
+            list: [{"name", "path", "score"}] giảm dần theo score
+        """
+        song_index = self._song_index  # Chỉ đọc - index được dựng lại khi catalog đổi (on_catalog_change)
+        if song_index is None or not len(song_index):
+            print("⚠️ [VLC] Song cache empty, call refresh_song_cache() first")
+            return []
+        
+        print(f"🔍 [VLC Fuzzy] Query: '{query}' -> Normalized: '{SongSearchIndex.prepare_query(query)[0]}'")
+        return song_index.search(query, limit=limit, threshold=threshold)
+    
     def play_by_fuzzy_match(self, query: str, threshold: float = 0.4):
         """
         Phát bài hát bằng fuzzy matching
@@ -4380,16 +6335,17 @@ class VLCMusicPlayer:
     
     async def play_file_async(self, file_path: str):
         """Async wrapper cho play_file để không blocking"""
-        return await asyncio.to_thread(self.play_file, file_path)
+        return await self.send("play_file", file_path)
     
     async def play_playlist_async(self, file_paths: list):
         """Async wrapper cho play_playlist để không blocking"""
-        return await asyncio.to_thread(self.play_playlist, file_paths)
+        return await self.send("play_playlist", list(file_paths))
 
 # Global VLC player instance - với error handling
 try:
     vlc_player = VLCMusicPlayer()
     VLC_AVAILABLE = vlc_player._player is not None
+    music_catalog.add_listener(vlc_player.on_catalog_change)  # Dựng lại fuzzy index ở thread quét
 except Exception as e:
     print(f"⚠️ [VLC] VLC không khả dụng: {e}")
     vlc_player = None
@@ -4672,7 +6628,8 @@ class BrowserController:
 # Global browser controller instance
 browser_controller = BrowserController()
 
-async def list_music(subfolder: str = "", auto_play: bool = True, folder: str = "") -> dict:
+async def list_music(subfolder: str = "", auto_play: bool = True, folder: str = "",
+                     page: int = 1, page_size: int = MUSIC_PAGE_SIZE) -> dict:
     """
     Liệt kê file nhạc trong music_library hoặc thư mục tùy chỉnh.
     Theo mặc định TỰ ĐỘNG PHÁT bài đầu tiên (giống xinnan-tech/xiaozhi-esp32-server).
@@ -4682,6 +6639,8 @@ async def list_music(subfolder: str = "", auto_play: bool = True, folder: str =
         subfolder: Subfolder trong music_library
         auto_play: Tự động phát bài đầu tiên (default True)
         folder: Thư mục tùy chỉnh (nếu có, sẽ override music_library)
+        page: Trang cần lấy (bắt đầu từ 1)
+        page_size: Số bài mỗi trang (tối đa MUSIC_PAGE_SIZE_MAX)
     """
     try:
         # Xác định thư mục gốc
@@ -4703,65 +6662,65 @@ async def list_music(subfolder: str = "", auto_play: bool = True, folder: str =
         if not search_path.exists():
             return {"success": False, "error": f"Thư mục '{subfolder or folder}' không tồn tại"}
         
-        music_files = []
-        for file_path in search_path.rglob("*"):
-            if file_path.is_file() and file_path.suffix.lower() in MUSIC_EXTENSIONS:
-                try:
-                    relative_path = file_path.relative_to(base_path)
-                except ValueError:
-                    relative_path = file_path.name
-                    
-                music_files.append({
-                    "filename": file_path.name,
-                    "path": str(relative_path).replace('\\', '/'),
-                    "full_path": str(file_path),
-                    "size_mb": round(file_path.stat().st_size / (1024**2), 2),
-                    "extension": file_path.suffix.lower()
-                })
-        
-        music_files.sort(key=lambda x: x['filename'])
-        
-        if len(music_files) == 0:
+        # Catalog: chỉ đọc đúng 1 trang, không rglob/stat cả thư viện
+        await music_catalog.ensure_async(base_path)
+        page, page_size, offset = music_page_args(page, page_size)
+        subfolder = "" if is_user_folder else subfolder
+        total = await asyncio.to_thread(music_catalog.count, base_path, folder=subfolder)
+        music_files = await asyncio.to_thread(music_catalog.page, base_path, offset=offset, limit=page_size,
+                                              folder=subfolder)
+        paging = {
+            "page": page,
+            "page_size": page_size,
+            "total_pages": (total + page_size - 1) // page_size,
+            "has_more": offset + len(music_files) < total
+        }
+        
+        if total == 0:
             return {
                 "success": True, 
                 "files": [], 
                 "count": 0,
                 "message": "No music files found. Please add music files to the folder.",
                 "is_user_folder": is_user_folder,
-                "source_path": str(base_path)
+                "source_path": str(base_path),
+                **paging
             }
         
-        # 🎵 AUTO-PLAY: Tự động phát bài đầu tiên (như code reference)
-        first_file = music_files[0]['filename'] if not is_user_folder else music_files[0]['full_path']
         play_result = None
         
         if auto_play:
+            # 🎵 AUTO-PLAY: Tự động phát bài đầu tiên (như code reference)
+            first = music_files[0] if offset == 0 else (
+                await asyncio.to_thread(music_catalog.page, base_path, limit=1, folder=subfolder))[0]
+            first_file = first['filename'] if not is_user_folder else first['full_path']
             print(f"🎵 [Auto-Play] list_music tự động phát: {first_file}")
             if is_user_folder:
                 # Phát từ user folder bằng default player
-                play_result = await play_music_from_path(music_files[0]['full_path'])
+                play_result = await play_music_from_path(first['full_path'])
             else:
                 play_result = await play_music(first_file)
             
             if play_result.get("success"):
-                message = f"✅ Auto-played: {music_files[0]['filename']}\nTotal {len(music_files)} song(s)"
+                message = f"✅ Auto-played: {first['filename']}\nTotal {total} song(s)"
             else:
-                message = f"❌ Found {len(music_files)} songs but failed to play: {play_result.get('error', 'Unknown error')}"
+                message = f"❌ Found {total} songs but failed to play: {play_result.get('error', 'Unknown error')}"
         else:
             filenames_list = [f['filename'] for f in music_files]
-            message = f"Found {len(music_files)} song(s):\n" + "\n".join([f"  - {fname}" for fname in filenames_list[:10]])
-            if len(music_files) > 10:
-                message += f"\n  ... and {len(music_files) - 10} more"
+            message = f"Found {total} song(s):\n" + "\n".join([f"  - {fname}" for fname in filenames_list[:10]])
+            if total > offset + 10:
+                message += f"\n  ... and {total - offset - min(10, len(music_files))} more"
         
         return {
             "success": True,
             "files": music_files,
-            "count": len(music_files),
+            "count": total,
             "library_path": str(base_path),
             "is_user_folder": is_user_folder,
             "message": message,
             "auto_played": auto_play,
-            "play_result": play_result if auto_play else None
+            "play_result": play_result if auto_play else None,
+            **paging
         }
     except Exception as e:
         return {"success": False, "error": str(e)}
@@ -4777,7 +6736,7 @@ async def play_music_from_path(file_path: str) -> dict:
             return {"success": False, "error": f"File không tồn tại: {file_path}"}
         
         # 🎵 SỬ DỤNG VLC thay vì os.startfile - NHANH!
-        success = vlc_player.play_playlist([str(path)])
+        success = await vlc_player.play_playlist_async([str(path)])
         
         if success:
             print(f"🎵 [VLC] Đang phát từ path: {path.name}")
@@ -4794,6 +6753,30 @@ async def play_music_from_path(file_path: str) -> dict:
     except Exception as e:
         return {"success": False, "error": str(e)}
 
+def _find_library_song(filename: str, use_fuzzy: bool = True):
+    """Tìm bài trong music_library: khớp chính xác qua catalog, sau đó fuzzy.
+    Blocking (SQLite + song index, giữ lock catalog) → gọi qua asyncio.to_thread. Trả về Path hoặc None"""
+    if not vlc_player._song_cache:
+        vlc_player.refresh_song_cache(MUSIC_LIBRARY)
+    
+    # Step 2: Tìm file chính xác trước (tra catalog, không quét thư mục)
+    exact = music_catalog.find(MUSIC_LIBRARY, filename)
+    if exact:
+        music_path = Path(exact['full_path'])
+        print(f"✅ [VLC Play] Found exact match: {music_path}")
+        return music_path
+    
+    # Step 3: Nếu không tìm thấy chính xác, dùng fuzzy matching
+    if use_fuzzy:
+        print(f"🔍 [VLC Play] Exact match not found, trying fuzzy matching...")
+        matched_path, score = vlc_player.fuzzy_match_song(filename, threshold=0.4)
+        if matched_path:
+            music_path = Path(matched_path)
+            print(f"✅ [VLC Play] Fuzzy match found: {music_path.name} (score: {score:.2f})")
+            return music_path
+    return None
+
+
 async def play_music(filename: str, create_playlist: bool = True, use_fuzzy: bool = True) -> dict:
     """
     Phát nhạc từ music_library bằng VLC player với fuzzy matching.
@@ -4812,40 +6795,16 @@ async def play_music(filename: str, create_playlist: bool = True, use_fuzzy: boo
         
         print(f"🎵 [VLC Play] Tìm file: '{filename}'")
         
-        # TỐI ƯU: Chỉ refresh cache nếu chưa có (lazy loading)
-        if not hasattr(vlc_player, '_song_cache') or not vlc_player._song_cache:
-            vlc_player.refresh_song_cache(MUSIC_LIBRARY)
-        
-        # Step 2: Tìm file chính xác trước
-        music_path = None
-        filename_lower = filename.lower()
-        
-        for file_path in MUSIC_LIBRARY.rglob("*"):
-            if file_path.is_file():
-                if (file_path.name == filename or 
-                    file_path.name.lower() == filename_lower or
-                    str(file_path.relative_to(MUSIC_LIBRARY)).replace('\\', '/') == filename or
-                    filename_lower in file_path.name.lower()):
-                    if file_path.suffix.lower() in MUSIC_EXTENSIONS:
-                        music_path = file_path
-                        print(f"✅ [VLC Play] Found exact match: {music_path}")
-                        break
-        
-        # Step 3: Nếu không tìm thấy chính xác, dùng fuzzy matching
-        if not music_path and use_fuzzy:
-            print(f"🔍 [VLC Play] Exact match not found, trying fuzzy matching...")
-            matched_path, score = vlc_player.fuzzy_match_song(filename, threshold=0.4)
-            
-            if matched_path:
-                music_path = Path(matched_path)
-                print(f"✅ [VLC Play] Fuzzy match found: {music_path.name} (score: {score:.2f})")
+        # Tra catalog / fuzzy index (SQLite, lock catalog) ở thread - không chặn event loop
+        await music_catalog.ensure_async(MUSIC_LIBRARY)
+        music_path = await asyncio.to_thread(_find_library_song, filename, use_fuzzy)
         
         if not music_path:
-            available = [f.name for f in MUSIC_LIBRARY.rglob("*") if f.is_file() and f.suffix.lower() in MUSIC_EXTENSIONS]
+            available = [f['filename'] for f in await asyncio.to_thread(music_catalog.page, MUSIC_LIBRARY, limit=5)]
             return {
                 "success": False, 
                 "error": f"Không tìm thấy '{filename}' (đã thử fuzzy matching)",
-                "available_files": available[:5],
+                "available_files": available,
                 "hint": "Thử tìm bằng từ khóa trong tên bài hoặc dùng list_music() để xem danh sách"
             }
         
@@ -4853,10 +6812,7 @@ async def play_music(filename: str, create_playlist: bool = True, use_fuzzy: boo
         
         if create_playlist:
             # Tạo playlist với tất cả bài trong thư mục
-            all_songs = sorted([
-                str(f) for f in MUSIC_LIBRARY.rglob("*") 
-                if f.is_file() and f.suffix.lower() in MUSIC_EXTENSIONS
-            ])
+            all_songs = await asyncio.to_thread(music_catalog.paths, MUSIC_LIBRARY)
             
             # Đảm bảo bài hiện tại ở đầu playlist
             if str(music_path) in all_songs:
@@ -4872,7 +6828,7 @@ async def play_music(filename: str, create_playlist: bool = True, use_fuzzy: boo
             return {
                 "success": True,
                 "filename": music_path.name,
-                "path": str(music_path.relative_to(MUSIC_LIBRARY)),
+                "path": os.path.relpath(music_path, MUSIC_LIBRARY),
                 "full_path": str(music_path),
                 "size_mb": round(music_path.stat().st_size / (1024**2), 2),
                 "message": f"🎵 Đang phát: {music_path.name} (Python-VLC + Fuzzy Matching)",
@@ -4902,7 +6858,7 @@ async def pause_music() -> dict:
     """
     try:
         if vlc_player and vlc_player._player:
-            vlc_player.pause()
+            await vlc_player.send("pause")
             status = vlc_player.get_full_status()
             current_song = status.get('current_song', 'Unknown')
             return {
@@ -4930,9 +6886,7 @@ async def resume_music() -> dict:
     """
     try:
         if vlc_player and vlc_player._player:
-            vlc_player.resume()  # Dùng method resume() mới - đảm bảo play
-            import time
-            time.sleep(0.2)
+            await vlc_player.send("resume")  # Actor chờ event Playing - không sleep
             status = vlc_player.get_full_status()
             current_song = status.get('current_song', 'Unknown')
             return {
@@ -4961,7 +6915,7 @@ async def stop_music() -> dict:
     """
     try:
         if vlc_player and vlc_player._player:
-            vlc_player.stop()
+            await vlc_player.send("stop")
             return {
                 "success": True, 
                 "message": "⏹️ Đã dừng nhạc hoàn toàn (Python-VLC)",
@@ -4982,7 +6936,7 @@ async def stop_music() -> dict:
 # FUZZY MATCHING - Xử lý nhận dạng giọng nói không chính xác từ ESP32
 # ============================================================
 
-# Các biến thể phát âm sai thường gặp (từ ESP32 voice recognition)
+# Các biến thể phát âm sai thường gặp (từ ESP32 voice recognition) → cụm chuẩn khi normalize
 VOICE_CORRECTIONS = {
     # Bài tiếp/next variations
     'bài tiếp': ['bài tiếp', 'bai tiep', 'bài diệp', 'bài thiếp', 'bài típ', 'bay tiep', 'bai tip', 'bai diep'],
@@ -5017,6 +6971,248 @@ VOICE_CORRECTIONS = {
     'repeat': ['repeat', 'ri pít', 'rì pít', 'lặp lại', 'lap lai', 'loop', 'lúp'],
 }
 
+# Các pattern chính theo action - thứ tự = ưu tiên khi trùng (pause/stop TRƯỚC)
+MUSIC_COMMAND_PATTERNS = {
+    'pause': [
+        # Tiếng Việt chuẩn
+        'tạm dừng', 'dừng nhạc', 'dừng lại', 'ngưng nhạc', 'ngừng phát', 'nghỉ', 'pause',
+        # Voice variants (ESP32 recognition)
+        'tam dung', 'dung nhac', 'dung lai', 'ngung nhac', 'ngung phat', 
+        'pao', 'pao nhac', 'poz', 'pốt', 'pos', 'pát', 'pát nhạc',
+        # Biến thể
+        'dừng đi', 'dừng bài', 'stop nhạc', 'tắt nhạc đi', 'tắt bài đi',
+        'im đi', 'im lặng', 'yên đi', 'đừng phát', 'không phát nữa',
+        # Ngắn gọn
+        'dừng', 'ngừng', 'nghỉ'
+    ],
+    'stop': [
+        # Tiếng Việt chuẩn  
+        'tắt nhạc', 'dừng hẳn', 'tắt hẳn', 'dừng hoàn toàn', 'stop', 'off nhạc',
+        # Voice variants
+        'tat nhac', 'dung han', 'tat han', 'stóp', 'sop', 'sốp',
+        # Biến thể
+        'tắt đi', 'tắt bài', 'đóng nhạc', 'hủy nhạc', 'không nghe nữa',
+        'tắt', 'off'
+    ],
+    'next': ['bài tiếp', 'tiếp theo', 'next', 'skip', 'chuyển bài', 'kế tiếp', 'bài khác', 'sang bài',
+             'bai tiep', 'tiep theo', 'bai diep', 'thiep theo', 'nex', 'nếch', 'bài sau'],
+    'previous': ['bài trước', 'quay lại', 'previous', 'pre', 'lùi bài', 'bài cũ', 'trước đó',
+                 'bai truoc', 'quay lai', 'bai chuoc', 'pri', 'prê'],
+    'play': ['phát nhạc', 'bật nhạc', 'mở nhạc', 'play', 'chơi nhạc', 'nghe nhạc',
+             'phat nhac', 'bat nhac', 'mo nhac', 'plây', 'tiếp tục', 'phát tiếp'],
+    'volume_up': ['tăng âm lượng', 'to lên', 'tăng tiếng', 'volume up', 'tang am luong', 'to len'],
+    'volume_down': ['giảm âm lượng', 'nhỏ lại', 'giảm tiếng', 'volume down', 'giam am luong', 'nho lai'],
+    'shuffle': ['shuffle', 'trộn bài', 'ngẫu nhiên', 'random', 'sáp phồ', 'tron bai'],
+    'repeat': ['repeat', 'lặp lại', 'loop', 'ri pít', 'lap lai', 'lúp'],
+}
+
+# Từ thừa thường xuất hiện trong câu nói - bỏ theo token (không cắt giữa từ như str.replace)
+VOICE_NOISE_WORDS = ['ơi', 'này', 'đi', 'nha', 'nhé', 'giùm', 'cho tôi', 'hộ tôi', 'dùm', 'cái']
+
+VOICE_FUZZY_MIN_LEN = 4  # Token (bỏ dấu) ngắn hơn không sửa theo edit distance - "pa", "net" khớp quá nhiều từ
+VOICE_TONE_COST = 0.5  # Đúng chữ, sai dấu ("dùng" ↔ "dừng")
+VOICE_MAX_COST = 1.0  # Tổng lỗi tối đa của 1 cụm nhiều token (cụm 1 token phải khớp đúng)
+
+_VOICE_TOKEN_RE = re.compile(r'\w+')
+
+
+def fold_voice_token(token: str) -> str:
+    """Bỏ dấu 1 token (kể cả đ → d) để so khớp lỗi nhận dạng mất dấu"""
+    return normalize_song_text(token).replace('đ', 'd')
+
+
+def _within_one_edit(a: str, b: str) -> bool:
+    """Khoảng cách Damerau-Levenshtein (OSA) ≤ 1"""
+    if a == b:
+        return True
+    la, lb = len(a), len(b)
+    if abs(la - lb) > 1:
+        return False
+    if la == lb:
+        diff = [i for i in range(la) if a[i] != b[i]]
+        if len(diff) == 1:
+            return True
+        return len(diff) == 2 and diff[1] == diff[0] + 1 and a[diff[0]] == b[diff[1]] and a[diff[1]] == b[diff[0]]
+    if la > lb:
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    return a[i:] == b[i + 1:]
+
+
+class VoiceCommandMatcher:
+    """
+    Nhận dạng lệnh nhạc từ câu nói (ESP32 hay nhận sai) - dựng 1 lần, mỗi câu duyệt 1 lượt:
+    - Trie theo token đã bỏ dấu cho mọi cụm trong MUSIC_COMMAND_PATTERNS + VOICE_CORRECTIONS
+      (khớp cụm dài nhất tại mỗi vị trí, không quét từng pattern)
+    - Deletion index kiểu SymSpell (xóa 1 ký tự) → token sai ≤ 1 edit tìm được cụm gần đúng
+    Confidence = 1 - 0.5 × lỗi / số token của cụm (đúng hết = 1.0; sai dấu tính nửa lỗi).
+    """
+
+    def __init__(self, commands: dict, corrections: dict, noise_words: list):
+        self.actions = list(commands)
+        self._root = [{}, None]  # [con theo token bỏ dấu, entry nếu hết cụm tại đây]
+        self._surfaces = {}  # token bỏ dấu → các dạng có dấu xuất hiện trong pattern
+        self.phrase_count = 0
+        self._noise = {tuple(w.split()) for w in noise_words}
+        self._noise_first = {w[0] for w in self._noise}
+
+        canonical_of = {}
+        for canonical, variants in corrections.items():
+            for variant in variants:
+                canonical_of.setdefault(self._key(variant), canonical)
+        # Cụm chứa từ thừa ("tắt nhạc đi") bị bỏ từ thừa giống câu nói → đăng ký sau cụm sạch,
+        # không tranh chỗ của cụm gốc ("tắt nhạc" = stop)
+        phrases = [(p, a) for a, patterns in commands.items() for p in patterns]
+        phrases += [(v, None) for variants in corrections.values() for v in variants]
+        phrases += [(c, None) for c in corrections]
+        phrases.sort(key=lambda item: len(self._tokens(item[0])) != len(self._key(item[0])))
+        for phrase, action in phrases:
+            key = self._key(phrase)
+            if not key:
+                continue
+            canonical = canonical_of.get(key, phrase)
+            priority = self.actions.index(action) if action else len(self.actions)
+            self._add(key, phrase, (action, canonical, priority))
+
+        # Cụm sửa lỗi không có action riêng ("bai tip") → action của cụm chuẩn ("bài tiếp" = next)
+        def resolve(node):
+            entry = node[1]
+            if entry is not None and entry[0] is None:
+                target = self._exact(self._key(entry[1]))
+                if target is not None and target[0] is not None:
+                    node[1] = (target[0], entry[1], target[2])
+            for child in node[0].values():
+                resolve(child)
+        resolve(self._root)
+
+        # SymSpell: token trong trie + mọi dạng xóa 1 ký tự → token gốc
+        self._deletes = defaultdict(set)
+        for token in self._surfaces:
+            if len(token) < VOICE_FUZZY_MIN_LEN:
+                continue
+            self._deletes[token].add(token)
+            for i in range(len(token)):
+                self._deletes[token[:i] + token[i + 1:]].add(token)
+
+    def _tokens(self, text: str) -> list:
+        return _VOICE_TOKEN_RE.findall(unicodedata.normalize("NFC", text).lower())
+
+    def _strip_noise(self, tokens: list) -> list:
+        if not self._noise_first.intersection(tokens):
+            return tokens
+        kept = []
+        i = 0
+        while i < len(tokens):
+            if tokens[i] in self._noise_first:
+                skip = next((len(w) for w in self._noise if tuple(tokens[i:i + len(w)]) == w), 0)
+                if skip:
+                    i += skip
+                    continue
+            kept.append(tokens[i])
+            i += 1
+        return kept
+
+    def _key(self, phrase: str) -> tuple:
+        return tuple(self._strip_noise(self._tokens(phrase)))
+
+    def _add(self, key: tuple, phrase: str, entry: tuple):
+        node = self._root
+        for token in key:
+            folded = fold_voice_token(token)
+            self._surfaces.setdefault(folded, set()).add(token)
+            node = node[0].setdefault(folded, [{}, None])
+        if node[1] is None:
+            node[1] = entry
+            self.phrase_count += 1
+
+    def _exact(self, key: tuple):
+        node = self._root
+        for token in key:
+            node = node[0].get(fold_voice_token(token))
+            if node is None:
+                return None
+        return node[1]
+
+    def _fuzzy(self, folded: str) -> set:
+        """Token trong trie cách folded đúng 1 edit"""
+        if len(folded) < VOICE_FUZZY_MIN_LEN:
+            return set()
+        candidates = set(self._deletes.get(folded, ()))
+        for i in range(len(folded)):
+            candidates |= self._deletes.get(folded[:i] + folded[i + 1:], set())
+        candidates.discard(folded)
+        return {c for c in candidates if _within_one_edit(folded, c)}
+
+    def _longest(self, words: list, start: int):
+        """Cụm khớp tốt nhất bắt đầu tại start: dài nhất → ít lỗi nhất → action ưu tiên"""
+        best = None
+        stack = [(self._root, start, 0.0)]
+        while stack:
+            node, i, cost = stack.pop()
+            entry = node[1]
+            length = i - start
+            if entry is not None and length and (cost == 0 or (length > 1 and cost <= VOICE_MAX_COST and cost < length)):
+                rank = (length, -cost, -entry[2])
+                if best is None or rank > best[0]:
+                    best = (rank, i, cost, entry)
+            if i == len(words):
+                continue
+            surface, folded, fuzzy = words[i]
+            child = node[0].get(folded)
+            if child is not None:
+                exact = surface in self._surfaces[folded] or surface == folded  # ESP32 trả chữ không dấu
+                stack.append((child, i + 1, cost + (0 if exact else VOICE_TONE_COST)))
+            if cost + 1 <= VOICE_MAX_COST:
+                for candidate in fuzzy:
+                    child = node[0].get(candidate)
+                    if child is not None:
+                        stack.append((child, i + 1, cost + 1))
+        return best
+
+    def match(self, text: str) -> dict:
+        """
+        1 lượt duyệt câu: chuẩn hóa (bỏ từ thừa, thay cụm nhận sai bằng cụm chuẩn) + action tốt nhất.
+        Returns: {"normalized": str, "action": str|None, "confidence": float, "matches": [...]}
+        """
+        tokens = self._strip_noise(self._tokens(text or ""))
+        words = []
+        for token in tokens:
+            folded = fold_voice_token(token)
+            words.append((token, folded, self._fuzzy(folded)))
+        output = []
+        matches = []
+        i = 0
+        while i < len(words):
+            found = self._longest(words, i)
+            if found is None:
+                output.append(words[i][0])
+                i += 1
+                continue
+            _, end, cost, (action, canonical, priority) = found
+            span = " ".join(w[0] for w in words[i:end])
+            output.append(canonical)  # Cụm nhận sai/gần đúng → cụm chuẩn
+            matches.append({
+                "text": span,
+                "canonical": canonical,
+                "action": action,
+                "confidence": round(1.0 - 0.5 * cost / (end - i), 3),
+                "priority": priority,
+            })
+            i = end
+        best = max((m for m in matches if m["action"]), key=lambda m: (m["confidence"], -m["priority"]), default=None)
+        return {
+            "normalized": " ".join(output),
+            "action": best["action"] if best else None,
+            "confidence": best["confidence"] if best else 0.0,
+            "matches": matches,
+        }
+
+
+voice_command_matcher = VoiceCommandMatcher(MUSIC_COMMAND_PATTERNS, VOICE_CORRECTIONS, VOICE_NOISE_WORDS)
+
+
 def normalize_voice_command(text: str) -> str:
     """
     Chuẩn hóa lệnh voice từ ESP32 - sửa lỗi nhận dạng phổ biến.
@@ -5024,23 +7220,10 @@ def normalize_voice_command(text: str) -> str:
     """
     if not text:
         return ""
-    
-    text_lower = text.lower().strip()
-    
-    # Loại bỏ các từ thừa thường xuất hiện
-    noise_words = ['ơi', 'này', 'đi', 'nha', 'nhé', 'giùm', 'cho tôi', 'hộ tôi', 'dùm', 'cái']
-    for word in noise_words:
-        text_lower = text_lower.replace(word, ' ')
-    
-    # Tìm match gần nhất
-    for correct_cmd, variations in VOICE_CORRECTIONS.items():
-        for variant in variations:
-            if variant in text_lower:
-                # Tìm thấy match → trả về lệnh chuẩn
-                print(f"🔊 [Voice Normalize] '{text}' → detected '{correct_cmd}' (matched '{variant}')")
-                return text_lower.replace(variant, correct_cmd)
-    
-    return text_lower
+    result = voice_command_matcher.match(text)
+    if result["matches"]:
+        print(f"🔊 [Voice Normalize] '{text}' → '{result['normalized']}'")
+    return result["normalized"]
 
 def fuzzy_match_music_command(text: str) -> tuple:
     """
@@ -5049,94 +7232,8 @@ def fuzzy_match_music_command(text: str) -> tuple:
     """
     if not text:
         return (False, "", 0.0)
-    
-    text_lower = text.lower().strip()
-    
-    # Các pattern chính và độ tin cậy - ƯU TIÊN pause/stop TRƯỚC
-    COMMAND_PATTERNS = {
-        'pause': {
-            'patterns': [
-                # Tiếng Việt chuẩn
-                'tạm dừng', 'dừng nhạc', 'dừng lại', 'ngưng nhạc', 'ngừng phát', 'nghỉ', 'pause',
-                # Voice variants (ESP32 recognition)
-                'tam dung', 'dung nhac', 'dung lai', 'ngung nhac', 'ngung phat', 
-                'pao', 'pao nhac', 'poz', 'pốt', 'pos', 'pát', 'pát nhạc',
-                # Biến thể
-                'dừng đi', 'dừng bài', 'stop nhạc', 'tắt nhạc đi', 'tắt bài đi',
-                'im đi', 'im lặng', 'yên đi', 'đừng phát', 'không phát nữa',
-                # Ngắn gọn
-                'dừng', 'ngừng', 'nghỉ'
-            ],
-            'action': 'pause'
-        },
-        'stop': {
-            'patterns': [
-                # Tiếng Việt chuẩn  
-                'tắt nhạc', 'dừng hẳn', 'tắt hẳn', 'dừng hoàn toàn', 'stop', 'off nhạc',
-                # Voice variants
-                'tat nhac', 'dung han', 'tat han', 'stóp', 'sop', 'sốp',
-                # Biến thể
-                'tắt đi', 'tắt bài', 'đóng nhạc', 'hủy nhạc', 'không nghe nữa',
-                'tắt', 'off'
-            ],
-            'action': 'stop'
-        },
-        'next': {
-            'patterns': ['bài tiếp', 'tiếp theo', 'next', 'skip', 'chuyển bài', 'kế tiếp', 'bài khác', 'sang bài',
-                        'bai tiep', 'tiep theo', 'bai diep', 'thiep theo', 'nex', 'nếch', 'bài sau'],
-            'action': 'next'
-        },
-        'previous': {
-            'patterns': ['bài trước', 'quay lại', 'previous', 'pre', 'lùi bài', 'bài cũ', 'trước đó',
-                        'bai truoc', 'quay lai', 'bai chuoc', 'pri', 'prê'],
-            'action': 'previous'
-        },
-        'play': {
-            'patterns': ['phát nhạc', 'bật nhạc', 'mở nhạc', 'play', 'chơi nhạc', 'nghe nhạc',
-                        'phat nhac', 'bat nhac', 'mo nhac', 'plây', 'tiếp tục', 'phát tiếp'],
-            'action': 'play'
-        },
-        'volume_up': {
-            'patterns': ['tăng âm lượng', 'to lên', 'tăng tiếng', 'volume up', 'tang am luong', 'to len'],
-            'action': 'volume_up'
-        },
-        'volume_down': {
-            'patterns': ['giảm âm lượng', 'nhỏ lại', 'giảm tiếng', 'volume down', 'giam am luong', 'nho lai'],
-            'action': 'volume_down'
-        },
-        'shuffle': {
-            'patterns': ['shuffle', 'trộn bài', 'ngẫu nhiên', 'random', 'sáp phồ', 'tron bai'],
-            'action': 'shuffle'
-        },
-        'repeat': {
-            'patterns': ['repeat', 'lặp lại', 'loop', 'ri pít', 'lap lai', 'lúp'],
-            'action': 'repeat'
-        }
-    }
-    
-    best_match = None
-    best_confidence = 0.0
-    
-    for cmd_type, cmd_info in COMMAND_PATTERNS.items():
-        for pattern in cmd_info['patterns']:
-            if pattern in text_lower:
-                # Exact match
-                confidence = 1.0
-                if confidence > best_confidence:
-                    best_confidence = confidence
-                    best_match = cmd_info['action']
-                    
-            # Fuzzy: check if most characters match
-            elif len(pattern) >= 3:
-                # Simple fuzzy: count matching chars
-                matching = sum(1 for c in pattern if c in text_lower)
-                ratio = matching / len(pattern)
-                if ratio > 0.7:  # 70%+ match
-                    confidence = ratio * 0.8  # Scale down fuzzy matches
-                    if confidence > best_confidence:
-                        best_confidence = confidence
-                        best_match = cmd_info['action']
-    
+    result = voice_command_matcher.match(text)
+    best_match, best_confidence = result["action"], result["confidence"]
     is_music = best_match is not None and best_confidence > 0.5
     
     if is_music:
@@ -5144,41 +7241,7 @@ def fuzzy_match_music_command(text: str) -> tuple:
     
     return (is_music, best_match or "", best_confidence)
 
-# Các từ khóa để nhận diện lệnh nhạc - QUAN TRỌNG: thêm nhiều biến thể pause/stop
-MUSIC_KEYWORDS = [
-    # Phát nhạc
-    'phát nhạc', 'bật nhạc', 'mở nhạc', 'nghe nhạc', 'play music', 'chơi nhạc',
-    'phát bài', 'bật bài', 'mở bài', 'nghe bài', 'play song',
-    'phat nhac', 'bat nhac', 'mo nhac',
-    
-    # TẠM DỪNG - nhiều biến thể (QUAN TRỌNG!)
-    'tạm dừng', 'pause', 'dừng nhạc', 'dừng lại', 'ngưng nhạc', 'ngừng phát',
-    'tam dung', 'dung nhac', 'dung lai', 'ngung nhac',
-    'pao', 'pao nhac', 'poz', 'pốt',
-    'dừng', 'ngừng', 'nghỉ', 'im đi',
-    
-    # DỪNG HẲN/STOP
-    'stop music', 'tắt nhạc', 'dừng hẳn', 'stop', 'off nhạc',
-    'tat nhac', 'dung han', 'tắt đi', 'tắt bài',
-    
-    # Tiếp tục
-    'tiếp tục', 'resume', 'phát tiếp', 'tiep tuc', 'phat tiep',
-    
-    # Bài tiếp/trước
-    'bài tiếp', 'next', 'skip', 'chuyển bài', 'bài tiếp theo',
-    'bai tiep', 'tiep theo',
-    'bài trước', 'previous', 'quay lại bài', 'bai truoc', 'quay lai',
-    
-    # Âm lượng
-    'âm lượng', 'volume', 'tăng tiếng', 'giảm tiếng', 'to lên', 'nhỏ lại',
-    'tang am luong', 'giam am luong',
-    
-    # Trạng thái
-    'đang phát gì', 'bài gì', 'đang nghe gì',
-    
-    # Shuffle/Repeat
-    'trộn bài', 'shuffle', 'ngẫu nhiên', 'lặp lại', 'repeat', 'loop'
-]
+# MUSIC_KEYWORDS / YOUTUBE_KEYWORDS: xem phần KEYWORD CLASSIFIER
 
 def is_music_command(text: str) -> bool:
     """
@@ -5187,15 +7250,10 @@ def is_music_command(text: str) -> bool:
     
     Returns: True nếu là lệnh nhạc, False nếu không
     """
-    text_lower = text.lower()
-    
-    # Loại trừ YouTube
-    youtube_keywords = ['youtube', 'video', 'clip', 'xem phim']
-    if any(yt in text_lower for yt in youtube_keywords):
-        return False
+    categories = keyword_classifier.classify(text)
     
-    # Kiểm tra có keyword nhạc không
-    return any(kw in text_lower for kw in MUSIC_KEYWORDS)
+    # Loại trừ YouTube, còn lại: có keyword nhạc không
+    return "music" in categories and "youtube" not in categories
 
 async def detect_and_execute_music(text: str) -> dict:
     """
@@ -5223,6 +7281,37 @@ async def detect_and_execute_music(text: str) -> dict:
             "hint": "Nếu bạn muốn điều khiển nhạc, hãy dùng các từ khóa như: phát nhạc, bài tiếp, dừng, âm lượng, v.v."
         }
 
+# "của Sơn Tùng", "ca sĩ Mỹ Tâm", "album Sky Tour" → tìm theo tag trong catalog
+MUSIC_TAG_QUERY_RE = re.compile(r'^(?:(?P<artist>của|cua|ca sĩ|ca si|nghệ sĩ|nghe si|by)|(?P<album>album))\s+(?P<query>.+)$')
+
+
+async def play_music_by_tag(query: str, search_by: str = "artist"):
+    """Phát mọi bài có tag artist/album khớp query (index tag của music_catalog). None nếu không có bài nào"""
+    if not MUSIC_LIBRARY.exists():
+        return None
+    await music_catalog.ensure_async(MUSIC_LIBRARY)
+    tracks = await asyncio.to_thread(music_catalog.page, MUSIC_LIBRARY, limit=MUSIC_PAGE_SIZE_MAX,
+                                     keyword=query, search_by=search_by)
+    if not tracks:
+        return None
+    
+    success = await vlc_player.play_playlist_async([t['full_path'] for t in tracks])
+    if not success:
+        return {"success": False, "error": "VLC player không thể phát. Kiểm tra VLC đã cài đặt chưa!"}
+    first = tracks[0]
+    label = "ca sĩ" if search_by == "artist" else "album"
+    print(f"🎵 [VLC] Playing {len(tracks)} songs by {search_by} '{query}'")
+    return {
+        "success": True,
+        "filename": first['filename'],
+        "full_path": first['full_path'],
+        "matched_by": search_by,
+        "playlist_count": len(tracks),
+        "message": f"🎵 Đang phát {len(tracks)} bài của {label} '{first[search_by] or query}': {first['title'] or first['filename']}",
+        "player": "Python-VLC Enhanced"
+    }
+
+
 async def smart_music_control(command: str) -> dict:
     """
     🎵 ĐIỀU KHIỂN NHẠC THÔNG MINH QUA PYTHON-VLC
@@ -5232,6 +7321,7 @@ async def smart_music_control(command: str) -> dict:
     Nhận lệnh tiếng Việt/Anh tự nhiên, tự động thực hiện:
     - Phát nhạc: "phát nhạc", "bật nhạc", "play music"
     - Phát bài cụ thể: "phát bài [tên]", "nghe [tên]"
+    - Phát theo ca sĩ / album: "phát nhạc của Sơn Tùng", "mở album [tên]"
     - Tạm dừng: "pause", "tạm dừng", "dừng nhạc"
     - Tiếp tục: "tiếp tục", "resume", "phát tiếp"
     - Bài tiếp: "bài tiếp", "next", "skip"
@@ -5246,15 +7336,14 @@ async def smart_music_control(command: str) -> dict:
     📌 HỖ TRỢ FUZZY MATCHING: Nhận dạng cả khi voice recognition sai!
     """
     try:
-        # BƯỚC 1: Normalize voice command (sửa lỗi nhận dạng phổ biến)
-        cmd = normalize_voice_command(command)
+        # BƯỚC 1+2: Normalize (sửa lỗi nhận dạng phổ biến) + fuzzy match action - 1 lượt duyệt
+        voice = voice_command_matcher.match(command)
+        cmd = voice["normalized"]
+        fuzzy_action, confidence = voice["action"] or "", voice["confidence"]
         original_cmd = command.lower().strip()
         
         print(f"🎵 [Smart Music] Original: '{original_cmd}' → Normalized: '{cmd}'")
         
-        # BƯỚC 2: Fuzzy match để tìm action nhanh
-        is_music, fuzzy_action, confidence = fuzzy_match_music_command(cmd)
-        
         # Kiểm tra nếu là lệnh YouTube → từ chối và gợi ý tool khác
         youtube_keywords = ['youtube', 'video', 'clip']
         if any(yt in cmd for yt in youtube_keywords):
@@ -5299,19 +7388,17 @@ async def smart_music_control(command: str) -> dict:
                     return await list_music(auto_play=True)
                 return {"success": True, "message": f"🎵 Đang phát: {current_track}"}
             elif fuzzy_action == 'volume_up':
-                current_vol = vlc_player.get_volume() or 50
-                return await music_volume(min(100, current_vol + 10))
+                return await music_volume_step(10)
             elif fuzzy_action == 'volume_down':
-                current_vol = vlc_player.get_volume() or 50
-                return await music_volume(max(0, current_vol - 10))
+                return await music_volume_step(-10)
             elif fuzzy_action == 'shuffle':
                 new_state = not vlc_player.get_shuffle()
-                vlc_player.set_shuffle(new_state)
+                await vlc_player.send("shuffle", new_state)
                 return {"success": True, "message": f"🔀 Shuffle: {'Bật' if new_state else 'Tắt'}"}
             elif fuzzy_action == 'repeat':
                 current_mode = vlc_player.get_repeat_mode()
                 new_mode = (current_mode + 1) % 3
-                vlc_player.set_repeat_mode(new_mode)
+                await vlc_player.send("repeat", new_mode)
                 mode_names = ['Tắt', 'Lặp tất cả', 'Lặp 1 bài']
                 return {"success": True, "message": f"🔁 Repeat: {mode_names[new_mode]}"}
         
@@ -5387,6 +7474,17 @@ async def smart_music_control(command: str) -> dict:
                 song_name = song_name.strip()
                 
                 if song_name and len(song_name) > 1:
+                    # Ca sĩ / album: "của X", "album Y" - hoặc không có file nào tên chứa song_name
+                    tag_query = MUSIC_TAG_QUERY_RE.match(song_name)
+                    if tag_query:
+                        by_tag = await play_music_by_tag(tag_query.group('query'), 'album' if tag_query.group('album') else 'artist')
+                        if by_tag:
+                            return by_tag
+                        song_name = tag_query.group('query')
+                    elif MUSIC_LIBRARY.exists() and not await asyncio.to_thread(music_catalog.find, MUSIC_LIBRARY, song_name):
+                        by_tag = await play_music_by_tag(song_name, 'artist') or await play_music_by_tag(song_name, 'album')
+                        if by_tag:
+                            return by_tag
                     print(f"🎵 [Smart Music] Tìm và phát: '{song_name}'")
                     return await play_music(filename=song_name, create_playlist=True)
                 else:
@@ -5394,7 +7492,7 @@ async def smart_music_control(command: str) -> dict:
                     if is_playing:
                         return {"success": True, "message": f"🎵 Đang phát: {current_track}"}
                     elif has_playlist:
-                        vlc_player.resume()
+                        await vlc_player.send("resume")
                         return {"success": True, "message": "▶️ Tiếp tục phát nhạc"}
                     else:
                         print(f"🎵 [Smart Music] Phát playlist mặc định")
@@ -5409,11 +7507,9 @@ async def smart_music_control(command: str) -> dict:
                 level = int(numbers[0])
                 return await music_volume(level)
             elif any(x in cmd for x in ['tăng', 'to', 'lớn', 'up', 'cao']):
-                current_vol = vlc_player.get_volume() or 50
-                return await music_volume(min(100, current_vol + 10))
+                return await music_volume_step(10)
             elif any(x in cmd for x in ['giảm', 'nhỏ', 'bé', 'down', 'thấp']):
-                current_vol = vlc_player.get_volume() or 50
-                return await music_volume(max(0, current_vol - 10))
+                return await music_volume_step(-10)
         
         # === 8. TRẠNG THÁI ===
         status_patterns = ['đang phát', 'bài gì', 'status', 'trạng thái', 'đang nghe']
@@ -5424,7 +7520,7 @@ async def smart_music_control(command: str) -> dict:
         shuffle_patterns = ['ngẫu nhiên', 'shuffle', 'random', 'trộn']
         if any(x in cmd for x in shuffle_patterns):
             new_state = not vlc_player.get_shuffle()
-            vlc_player.set_shuffle(new_state)
+            await vlc_player.send("shuffle", new_state)
             return {"success": True, "message": f"🔀 Shuffle: {'Bật' if new_state else 'Tắt'}"}
         
         # === 10. LẶP LẠI ===
@@ -5432,7 +7528,7 @@ async def smart_music_control(command: str) -> dict:
         if any(x in cmd for x in repeat_patterns):
             current_mode = vlc_player.get_repeat_mode()
             new_mode = (current_mode + 1) % 3
-            vlc_player.set_repeat_mode(new_mode)
+            await vlc_player.send("repeat", new_mode)
             modes = ['Tắt', 'Lặp tất cả', 'Lặp 1 bài']
             return {"success": True, "message": f"🔁 Repeat: {modes[new_mode]}"}
         
@@ -5476,12 +7572,9 @@ async def music_next() -> dict:
         if not vlc_player._current_playlist:
             return {"success": False, "error": "Không có playlist. Phát nhạc trước với play_music()!"}
         
-        success = vlc_player.next_track()
+        success = await vlc_player.send("skip", 1)  # Actor xác nhận bằng event Playing, gộp next/prev dồn dập
         
         if success:
-            import time
-            time.sleep(0.3)  # Đợi VLC load media mới
-            
             # Lấy thông tin bài hiện tại
             idx = vlc_player.get_playlist_index()
             if vlc_player._current_playlist and 0 <= idx < len(vlc_player._current_playlist):
@@ -5542,12 +7635,9 @@ async def music_previous() -> dict:
         if not vlc_player._current_playlist:
             return {"success": False, "error": "Không có playlist. Phát nhạc trước với play_music()!", "tool_called": True}
         
-        success = vlc_player.previous_track()
+        success = await vlc_player.send("skip", -1)  # Actor xác nhận bằng event Playing, gộp next/prev dồn dập
         
         if success:
-            import time
-            time.sleep(0.3)  # Đợi VLC load media mới
-            
             # Lấy thông tin bài hiện tại
             idx = vlc_player.get_playlist_index()
             if vlc_player._current_playlist and 0 <= idx < len(vlc_player._current_playlist):
@@ -5585,7 +7675,8 @@ async def music_previous() -> dict:
         traceback.print_exc()
         return {"success": False, "error": str(e), "tool_called": True}
 
-async def get_music_status() -> dict:
+@blocking_handler
+def get_music_status() -> dict:
     """Lấy trạng thái đầy đủ VLC player cho Web UI real-time sync"""
     try:
         status = vlc_player.get_full_status()
@@ -5611,7 +7702,7 @@ async def seek_music(percentage: float) -> dict:
         position = max(0.0, min(1.0, percentage / 100.0))
         
         # Dùng method set_position của VLCMusicPlayer
-        result = vlc_player.set_position(position)
+        result = await vlc_player.send("seek", position)
         
         if result:
             return {
@@ -5627,23 +7718,33 @@ async def seek_music(percentage: float) -> dict:
 async def music_volume(level: int) -> dict:
     """Điều chỉnh âm lượng VLC Player (0-100)"""
     try:
-        if not vlc_player.player:
+        if not vlc_player or not vlc_player._player:
             return {"success": False, "error": "VLC Player chưa khởi tạo"}
         
         # VLC volume range: 0-100 (có thể lên tới 200 nhưng sẽ méo tiếng)
-        volume = max(0, min(100, level))
-        vlc_player.player.audio_set_volume(volume)
-        
-        icon = "🔇" if volume == 0 else ("🔈" if volume < 30 else ("🔉" if volume < 70 else "🔊"))
-        
-        return {
-            "success": True,
-            "volume": volume,
-            "message": f"{icon} Âm lượng: {volume}%"
-        }
+        volume = await vlc_player.send("volume", level)
+        return _music_volume_result(volume)
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+async def music_volume_step(delta: int) -> dict:
+    """Tăng/giảm âm lượng tương đối - nhiều lệnh liên tiếp được actor VLC gộp thành 1 lần set"""
+    try:
+        if not vlc_player or not vlc_player._player:
+            return {"success": False, "error": "VLC Player chưa khởi tạo"}
+        volume = await vlc_player.send("volume_delta", delta)
+        return _music_volume_result(volume)
     except Exception as e:
         return {"success": False, "error": str(e)}
 
+def _music_volume_result(volume: int) -> dict:
+    icon = "🔇" if volume == 0 else ("🔈" if volume < 30 else ("🔉" if volume < 70 else "🔊"))
+    return {
+        "success": True,
+        "volume": volume,
+        "message": f"{icon} Âm lượng: {volume}%"
+    }
+
 def check_music_folder_config() -> dict:
     """Kiểm tra xem đã có config thư mục nhạc chưa"""
     try:
@@ -5665,7 +7766,8 @@ def check_music_folder_config() -> dict:
     except:
         return {"has_config": False}
 
-async def save_music_folder_config(folder_path: str) -> dict:
+@blocking_handler
+def save_music_folder_config(folder_path: str) -> dict:
     """Lưu cấu hình đường dẫn thư mục nhạc người dùng"""
     try:
         import json
@@ -5705,8 +7807,7 @@ async def play_music_from_user_folder(filename: str = "", auto_play: bool = True
                 "error": "Chưa cấu hình thư mục nhạc. Vui lòng vào Music Settings để thiết lập."
             }
         
-        with open(config_file, 'r', encoding='utf-8') as f:
-            config = json.load(f)
+        config = await asyncio.to_thread(lambda: json.loads(config_file.read_text(encoding='utf-8')))
         
         folder_path = Path(config['folder_path'])
         if not folder_path.exists():
@@ -5715,14 +7816,11 @@ async def play_music_from_user_folder(filename: str = "", auto_play: bool = True
                 "error": f"Thư mục không tồn tại: {folder_path}"
             }
         
-        # Tìm file nhạc
-        music_extensions = ['.mp3', '.wav', '.flac', '.m4a', '.wma', '.aac', '.ogg']
-        music_files = []
-        
-        for ext in music_extensions:
-            music_files.extend(list(folder_path.glob(f"**/*{ext}")))
+        # Tìm file nhạc (qua catalog, không glob lại thư mục mỗi lần)
+        await music_catalog.ensure_async(folder_path)
+        total_files = await asyncio.to_thread(music_catalog.count, folder_path)
         
-        if not music_files:
+        if not total_files:
             return {
                 "success": False,
                 "error": f"Không tìm thấy file nhạc trong: {folder_path}"
@@ -5730,10 +7828,9 @@ async def play_music_from_user_folder(filename: str = "", auto_play: bool = True
         
         # Nếu có filename cụ thể, tìm file đó
         if filename:
-            filename_lower = filename.lower()
-            matching_files = [f for f in music_files if filename_lower in f.name.lower()]
+            matching_files = await asyncio.to_thread(music_catalog.page, folder_path, limit=1, keyword=filename)
             if matching_files:
-                target_file = matching_files[0]
+                target_file = Path(matching_files[0]['full_path'])
             else:
                 return {
                     "success": False,
@@ -5741,18 +7838,18 @@ async def play_music_from_user_folder(filename: str = "", auto_play: bool = True
                 }
         else:
             # Phát file đầu tiên
-            target_file = music_files[0]
+            target_file = Path((await asyncio.to_thread(music_catalog.page, folder_path, limit=1))[0]['full_path'])
         
         # 🎵 PHÁT BẰNG PYTHON-VLC (thay vì trình phát mặc định)
         # Tạo playlist với tất cả bài trong thư mục
-        all_songs = sorted([str(f) for f in music_files])
+        all_songs = await asyncio.to_thread(music_catalog.paths, folder_path)
         
         # Đảm bảo bài hiện tại ở đầu playlist
         if str(target_file) in all_songs:
             all_songs.remove(str(target_file))
         all_songs.insert(0, str(target_file))
         
-        success = vlc_player.play_playlist(all_songs)
+        success = await vlc_player.play_playlist_async(all_songs)
         
         if success:
             message = f"🎵 Đang phát '{target_file.name}' (VLC Player)"
@@ -5761,7 +7858,7 @@ async def play_music_from_user_folder(filename: str = "", auto_play: bool = True
                 "success": True,
                 "message": message,
                 "file_path": str(target_file),
-                "total_files": len(music_files),
+                "total_files": total_files,
                 "playlist_count": len(all_songs),
                 "player": "VLC (Python-VLC)"
             }
@@ -5771,60 +7868,61 @@ async def play_music_from_user_folder(filename: str = "", auto_play: bool = True
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-async def search_music(keyword: str, auto_play: bool = True) -> dict:
+async def search_music(keyword: str, auto_play: bool = True,
+                       page: int = 1, page_size: int = MUSIC_PAGE_SIZE, search_by: str = "all") -> dict:
     """
     Tìm kiếm nhạc theo từ khóa và TỰ ĐỘNG PHÁT bài đầu tiên.
     Set auto_play=False để chỉ tìm kiếm không phát.
+    search_by: all (tên file + tag) | name | artist | album | title
     """
     try:
         if not MUSIC_LIBRARY.exists():
             return {"success": False, "error": "Thư mục music_library không tồn tại"}
         
-        keyword_lower = keyword.lower()
-        music_files = []
-        
-        for file_path in MUSIC_LIBRARY.rglob("*"):
-            if file_path.is_file() and file_path.suffix.lower() in MUSIC_EXTENSIONS:
-                if keyword_lower in file_path.name.lower():
-                    relative_path = file_path.relative_to(MUSIC_LIBRARY)
-                    music_files.append({
-                        "filename": file_path.name,
-                        "path": str(relative_path).replace('\\', '/'),
-                        "size_mb": round(file_path.stat().st_size / (1024**2), 2),
-                        "extension": file_path.suffix.lower()
-                    })
-        
-        music_files.sort(key=lambda x: x['filename'])
+        if search_by not in ("all", "name") + _MUSIC_TAG_SEARCH_FIELDS:
+            search_by = "all"
+        await music_catalog.ensure_async(MUSIC_LIBRARY)
+        page, page_size, offset = music_page_args(page, page_size)
+        total = await asyncio.to_thread(music_catalog.count, MUSIC_LIBRARY, keyword=keyword, search_by=search_by)
+        music_files = await asyncio.to_thread(music_catalog.page, MUSIC_LIBRARY, offset=offset, limit=page_size,
+                                              keyword=keyword, search_by=search_by)
         
-        if len(music_files) == 0:
+        if total == 0:
             return {
                 "success": False,
                 "error": f"Không tìm thấy bài hát nào với từ khóa '{keyword}'"
             }
         
-        # 🎵 AUTO-PLAY: Tự động phát bài đầu tiên
-        first_file = music_files[0]['filename']
         play_result = None
         
         if auto_play:
+            # 🎵 AUTO-PLAY: Tự động phát bài đầu tiên
+            first = (music_files or await asyncio.to_thread(
+                music_catalog.page, MUSIC_LIBRARY, limit=1, keyword=keyword, search_by=search_by))[0]
+            first_file = first['filename']
             print(f"🔍 [Search Music] Tìm thấy '{keyword}', tự động phát: {first_file}")
-            play_result = await play_music(first_file)
+            play_result = await play_music(first['path'])
             
             if play_result.get("success"):
-                message = f"✅ Found & playing: {first_file}\nTotal {len(music_files)} match(es) for '{keyword}'"
+                message = f"✅ Found & playing: {first_file}\nTotal {total} match(es) for '{keyword}'"
             else:
-                message = f"❌ Found {len(music_files)} songs but failed to play: {play_result.get('error', 'Unknown error')}"
+                message = f"❌ Found {total} songs but failed to play: {play_result.get('error', 'Unknown error')}"
         else:
-            message = f"Tìm thấy {len(music_files)} kết quả cho '{keyword}'"
+            message = f"Tìm thấy {total} kết quả cho '{keyword}'"
         
         return {
             "success": True,
             "files": music_files,
-            "count": len(music_files),
+            "count": total,
             "keyword": keyword,
+            "search_by": search_by,
             "message": message,
             "auto_played": auto_play,
-            "play_result": play_result if auto_play else None
+            "play_result": play_result if auto_play else None,
+            "page": page,
+            "page_size": page_size,
+            "total_pages": (total + page_size - 1) // page_size,
+            "has_more": offset + len(music_files) < total
         }
     except Exception as e:
         return {"success": False, "error": str(e)}
@@ -5882,7 +7980,7 @@ async def open_youtube(search_query: str = "") -> dict:
             message = "Đã mở YouTube"
             mode = "homepage"
         
-        webbrowser.open(url)
+        await asyncio.to_thread(webbrowser.open, url)
         return {
             "success": True, 
             "mode": mode,
@@ -5893,7 +7991,7 @@ async def open_youtube(search_query: str = "") -> dict:
         return {"success": False, "error": str(e)}
 
 async def search_youtube_video(video_title: str, auto_open: bool = True) -> dict:
-    """Tìm kiếm video YouTube chính xác theo tên và mở video đó (dùng requests + regex)
+    """Tìm kiếm video YouTube chính xác theo tên và mở video đó (dùng http_client + regex)
     
     Args:
         video_title: Tên video cần tìm (có thể là tên chính xác hoặc từ khóa)
@@ -5903,7 +8001,6 @@ async def search_youtube_video(video_title: str, auto_open: bool = True) -> dict
         dict với thông tin video: title, link
     """
     try:
-        import requests
         import re
         import webbrowser
         from urllib.parse import quote_plus
@@ -5916,16 +8013,16 @@ async def search_youtube_video(video_title: str, auto_open: bool = True) -> dict
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
         
-        response = requests.get(search_url, headers=headers, timeout=10)
+        response = await http_client.get(search_url, headers=headers, timeout=10)
         
-        if response.status_code != 200:
+        if response.status != 200:
             return {
                 "success": False,
-                "error": f"YouTube search failed: HTTP {response.status_code}"
+                "error": f"YouTube search failed: HTTP {response.status}"
             }
         
         # Tìm video ID từ HTML
-        video_ids = re.findall(r'"videoId":"([^"]{11})"', response.text)
+        video_ids = re.findall(r'"videoId":"([^"]{11})"', response.text())
         
         if not video_ids:
             return {
@@ -5938,7 +8035,7 @@ async def search_youtube_video(video_title: str, auto_open: bool = True) -> dict
         video_url = f"https://www.youtube.com/watch?v={video_id}"
         
         # Tìm title từ HTML
-        title_match = re.search(r'"title":{"runs":\[{"text":"([^"]+)"}', response.text)
+        title_match = re.search(r'"title":{"runs":\[{"text":"([^"]+)"}', response.text())
         video_title_found = title_match.group(1) if title_match else video_title
         
         result = {
@@ -5948,7 +8045,7 @@ async def search_youtube_video(video_title: str, auto_open: bool = True) -> dict
         }
         
         if auto_open:
-            webbrowser.open(video_url)
+            await asyncio.to_thread(webbrowser.open, video_url)
             result['message'] = f"✅ Đã mở video: {video_title_found}"
             print(f"✅ [YouTube] Đã mở: {video_title_found}")
         else:
@@ -5967,15 +8064,18 @@ async def search_youtube_video(video_title: str, auto_open: bool = True) -> dict
 # BROWSER AUTOMATION TOOLS
 # ============================================================
 
-async def browser_open_url(url: str) -> dict:
+@blocking_handler
+def browser_open_url(url: str) -> dict:
     """Mở URL trong browser được điều khiển (Selenium)"""
     return browser_controller.open_url(url)
 
-async def browser_get_info() -> dict:
+@blocking_handler
+def browser_get_info() -> dict:
     """Lấy thông tin trang hiện tại"""
     return browser_controller.get_current_info()
 
-async def browser_click(selector: str, by: str = "css") -> dict:
+@blocking_handler
+def browser_click(selector: str, by: str = "css") -> dict:
     """Click vào element trên trang web
     
     Args:
@@ -5984,7 +8084,8 @@ async def browser_click(selector: str, by: str = "css") -> dict:
     """
     return browser_controller.click_element(selector, by)
 
-async def browser_fill_input(selector: str, text: str, by: str = "css") -> dict:
+@blocking_handler
+def browser_fill_input(selector: str, text: str, by: str = "css") -> dict:
     """Điền text vào input field
     
     Args:
@@ -5994,7 +8095,8 @@ async def browser_fill_input(selector: str, text: str, by: str = "css") -> dict:
     """
     return browser_controller.fill_input(selector, text, by)
 
-async def browser_scroll(direction: str = "down", amount: int = 500) -> dict:
+@blocking_handler
+def browser_scroll(direction: str = "down", amount: int = 500) -> dict:
     """Cuộn trang
     
     Args:
@@ -6003,19 +8105,23 @@ async def browser_scroll(direction: str = "down", amount: int = 500) -> dict:
     """
     return browser_controller.scroll(direction, amount)
 
-async def browser_back() -> dict:
+@blocking_handler
+def browser_back() -> dict:
     """Quay lại trang trước"""
     return browser_controller.go_back()
 
-async def browser_forward() -> dict:
+@blocking_handler
+def browser_forward() -> dict:
     """Tiến tới trang sau"""
     return browser_controller.go_forward()
 
-async def browser_refresh() -> dict:
+@blocking_handler
+def browser_refresh() -> dict:
     """Làm mới trang"""
     return browser_controller.refresh()
 
-async def browser_screenshot(filepath: str = None) -> dict:
+@blocking_handler
+def browser_screenshot(filepath: str = None) -> dict:
     """Chụp screenshot trang hiện tại
     
     Args:
@@ -6023,7 +8129,8 @@ async def browser_screenshot(filepath: str = None) -> dict:
     """
     return browser_controller.screenshot(filepath)
 
-async def browser_new_tab(url: str = None) -> dict:
+@blocking_handler
+def browser_new_tab(url: str = None) -> dict:
     """Mở tab mới
     
     Args:
@@ -6031,11 +8138,13 @@ async def browser_new_tab(url: str = None) -> dict:
     """
     return browser_controller.new_tab(url)
 
-async def browser_close_tab() -> dict:
+@blocking_handler
+def browser_close_tab() -> dict:
     """Đóng tab hiện tại"""
     return browser_controller.close_tab()
 
-async def browser_execute_js(script: str) -> dict:
+@blocking_handler
+def browser_execute_js(script: str) -> dict:
     """Thực thi JavaScript code trên trang
     
     Args:
@@ -6043,11 +8152,13 @@ async def browser_execute_js(script: str) -> dict:
     """
     return browser_controller.execute_script(script)
 
-async def browser_close() -> dict:
+@blocking_handler
+def browser_close() -> dict:
     """Đóng browser hoàn toàn"""
     return browser_controller.close_browser()
 
-async def open_facebook() -> dict:
+@blocking_handler
+def open_facebook() -> dict:
     """Mở Facebook"""
     try:
         import webbrowser
@@ -6057,7 +8168,8 @@ async def open_facebook() -> dict:
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-async def open_google(search_query: str = "") -> dict:
+@blocking_handler
+def open_google(search_query: str = "") -> dict:
     """Mở Google với từ khóa tìm kiếm (nếu có)"""
     try:
         import webbrowser
@@ -6072,7 +8184,8 @@ async def open_google(search_query: str = "") -> dict:
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-async def open_tiktok() -> dict:
+@blocking_handler
+def open_tiktok() -> dict:
     """Mở TikTok"""
     try:
         import webbrowser
@@ -6082,7 +8195,8 @@ async def open_tiktok() -> dict:
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-async def open_website(url: str) -> dict:
+@blocking_handler
+def open_website(url: str) -> dict:
     """Mở trang web tùy chỉnh"""
     try:
         import webbrowser
@@ -6098,7 +8212,8 @@ async def open_website(url: str) -> dict:
 # YOUTUBE PLAYER CONTROL TOOLS
 # ============================================================
 
-async def control_youtube(action: str) -> dict:
+@blocking_handler
+def control_youtube(action: str) -> dict:
     """
     Điều khiển YouTube player bằng keyboard shortcuts.
     Phải có cửa sổ YouTube đang active/focused.
@@ -6208,7 +8323,8 @@ async def youtube_mute() -> dict:
     """Bật/Tắt tiếng YouTube."""
     return await control_youtube("mute_toggle")
 
-async def youtube_fullscreen() -> dict:
+@blocking_handler
+def youtube_fullscreen() -> dict:
     """Bật/Tắt chế độ toàn màn hình YouTube (phím F)."""
     try:
         import pyautogui
@@ -6219,7 +8335,8 @@ async def youtube_fullscreen() -> dict:
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-async def youtube_captions() -> dict:
+@blocking_handler
+def youtube_captions() -> dict:
     """Bật/Tắt phụ đề YouTube (phím C)."""
     try:
         import pyautogui
@@ -6230,7 +8347,8 @@ async def youtube_captions() -> dict:
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-async def youtube_speed(speed: str = "normal") -> dict:
+@blocking_handler
+def youtube_speed(speed: str = "normal") -> dict:
     """
     Thay đổi tốc độ phát YouTube.
     speed: 'slower' (chậm hơn) hoặc 'faster' (nhanh hơn) hoặc 'normal' (bình thường)
@@ -6256,7 +8374,8 @@ async def youtube_speed(speed: str = "normal") -> dict:
 # VLC PLAYER CONTROL TOOLS
 # ============================================================
 
-async def control_vlc(action: str) -> dict:
+@blocking_handler
+def control_vlc(action: str) -> dict:
     """
     Điều khiển VLC Player bằng keyboard shortcuts.
     Cần VLC đang chạy và có focus.
@@ -6385,7 +8504,8 @@ async def vlc_backward(seconds: int = 10) -> dict:
 # WINDOWS MEDIA PLAYER CONTROL TOOLS
 # ============================================================
 
-async def control_wmp(action: str) -> dict:
+@blocking_handler
+def control_wmp(action: str) -> dict:
     """
     Điều khiển Windows Media Player bằng keyboard shortcuts.
     Cần WMP đang chạy và có focus.
@@ -6478,6 +8598,63 @@ async def wmp_mute() -> dict:
 # SMART MEDIA CONTROL - Tự động nhận diện player đang chạy
 # ============================================================
 
+def _media_key_fallback(action: str) -> dict:
+    """Gửi media key tới player bên ngoài (blocking - chạy ở thread)"""
+    import psutil
+    import pyautogui
+    
+    running_players = []
+    for proc in psutil.process_iter(['name']):
+        name = proc.info['name'].lower()
+        if 'spotify' in name:
+            running_players.append('spotify')
+        elif 'vlc' in name:
+            running_players.append('vlc_external')
+        elif 'wmplayer' in name:
+            running_players.append('wmp')
+        elif 'chrome' in name or 'firefox' in name or 'msedge' in name:
+            running_players.append('browser')
+    
+    player = None
+    if 'spotify' in running_players:
+        player = 'spotify'
+    elif 'vlc_external' in running_players:
+        player = 'vlc_external'
+    elif 'wmp' in running_players:
+        player = 'wmp'
+    elif 'browser' in running_players:
+        player = 'browser'
+    
+    if not player:
+        return {
+            "success": False,
+            "error": "Không có Python-VLC đang phát và không phát hiện media player nào",
+            "hint": "Dùng play_music() để phát nhạc bằng Python-VLC trước!"
+        }
+    
+    media_keys = {
+        "play_pause": "playpause",
+        "stop": "stop",
+        "next": "nexttrack",
+        "previous": "prevtrack",
+        "volume_up": "volumeup",
+        "volume_down": "volumedown",
+        "mute": "volumemute"
+    }
+    
+    if action in media_keys:
+        time.sleep(0.2)
+        pyautogui.press(media_keys[action])
+        return {
+            "success": True,
+            "message": f"✅ Đã gửi lệnh {action} tới {player}",
+            "player": player,
+            "action": action
+        }
+    
+    return {"success": False, "error": f"Action '{action}' không hợp lệ"}
+
+
 async def smart_media_control(action: str) -> dict:
     """
     Điều khiển media thông minh.
@@ -6487,22 +8664,20 @@ async def smart_media_control(action: str) -> dict:
     Actions: play_pause, stop, next, previous, volume_up, volume_down, mute
     """
     try:
-        import time
-        
         # 🎵 ƯU TIÊN 1: PYTHON-VLC NỘI BỘ - NHANH NHẤT!
         if vlc_player and vlc_player._player:
             action_map = {
-                "play_pause": lambda: vlc_player.pause(),
-                "stop": lambda: vlc_player.stop(),
-                "next": lambda: (vlc_player._list_player.next(), time.sleep(0.3), vlc_player._list_player.play() if not vlc_player.is_playing() else None),
-                "previous": lambda: (vlc_player._list_player.previous(), time.sleep(0.3), vlc_player._list_player.play() if not vlc_player.is_playing() else None),
-                "volume_up": lambda: vlc_player._player.audio_set_volume(min(100, vlc_player._player.audio_get_volume() + 10)),
-                "volume_down": lambda: vlc_player._player.audio_set_volume(max(0, vlc_player._player.audio_get_volume() - 10)),
-                "mute": lambda: vlc_player._player.audio_toggle_mute()
+                "play_pause": ("pause",),
+                "stop": ("stop",),
+                "next": ("skip", 1),
+                "previous": ("skip", -1),
+                "volume_up": ("volume_delta", 10),
+                "volume_down": ("volume_delta", -10),
+                "mute": ("mute",)
             }
             
             if action in action_map:
-                action_map[action]()
+                await vlc_player.send(*action_map[action])
                 status = vlc_player.get_full_status()
                 return {
                     "success": True,
@@ -6514,59 +8689,7 @@ async def smart_media_control(action: str) -> dict:
                 }
         
         # 2. Fallback: Dùng media keys cho external players
-        import psutil
-        import pyautogui
-        
-        running_players = []
-        for proc in psutil.process_iter(['name']):
-            name = proc.info['name'].lower()
-            if 'spotify' in name:
-                running_players.append('spotify')
-            elif 'vlc' in name:
-                running_players.append('vlc_external')
-            elif 'wmplayer' in name:
-                running_players.append('wmp')
-            elif 'chrome' in name or 'firefox' in name or 'msedge' in name:
-                running_players.append('browser')
-        
-        player = None
-        if 'spotify' in running_players:
-            player = 'spotify'
-        elif 'vlc_external' in running_players:
-            player = 'vlc_external'
-        elif 'wmp' in running_players:
-            player = 'wmp'
-        elif 'browser' in running_players:
-            player = 'browser'
-        
-        if not player:
-            return {
-                "success": False,
-                "error": "Không có Python-VLC đang phát và không phát hiện media player nào",
-                "hint": "Dùng play_music() để phát nhạc bằng Python-VLC trước!"
-            }
-        
-        media_keys = {
-            "play_pause": "playpause",
-            "stop": "stop",
-            "next": "nexttrack",
-            "previous": "prevtrack",
-            "volume_up": "volumeup",
-            "volume_down": "volumedown",
-            "mute": "volumemute"
-        }
-        
-        if action in media_keys:
-            time.sleep(0.2)
-            pyautogui.press(media_keys[action])
-            return {
-                "success": True,
-                "message": f"✅ Đã gửi lệnh {action} tới {player}",
-                "player": player,
-                "action": action
-            }
-        
-        return {"success": False, "error": f"Action '{action}' không hợp lệ"}
+        return await asyncio.to_thread(_media_key_fallback, action)
         
     except Exception as e:
         return {"success": False, "error": str(e)}
@@ -6576,7 +8699,8 @@ async def smart_media_control(action: str) -> dict:
 # NEW TOOLS FROM XIAOZHI-MCPTOOLS REFERENCE
 # ============================================================
 
-async def lock_computer() -> dict:
+@blocking_handler
+def lock_computer() -> dict:
     """Khóa máy tính ngay lập tức"""
     try:
         subprocess.run("rundll32.exe user32.dll,LockWorkStation", shell=True, check=True)
@@ -6584,7 +8708,8 @@ async def lock_computer() -> dict:
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-async def shutdown_schedule(action: str, delay: int = 0) -> dict:
+@blocking_handler
+def shutdown_schedule(action: str, delay: int = 0) -> dict:
     """
     Lên lịch tắt máy/khởi động lại
     action: 'shutdown', 'restart', 'cancel'
@@ -6604,7 +8729,8 @@ async def shutdown_schedule(action: str, delay: int = 0) -> dict:
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-async def show_desktop() -> dict:
+@blocking_handler
+def show_desktop() -> dict:
     """Hiển thị desktop (Win+D)"""
     try:
         import pyautogui
@@ -6613,7 +8739,8 @@ async def show_desktop() -> dict:
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-async def undo_operation() -> dict:
+@blocking_handler
+def undo_operation() -> dict:
     """Hoàn tác thao tác cuối (Ctrl+Z)"""
     try:
         import pyautogui
@@ -6622,7 +8749,8 @@ async def undo_operation() -> dict:
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-async def set_theme(dark_mode: bool = True) -> dict:
+@blocking_handler
+def set_theme(dark_mode: bool = True) -> dict:
     """Đổi theme Windows sáng/tối. Nếu dark_mode=None thì toggle"""
     try:
         import winreg
@@ -6645,7 +8773,8 @@ async def set_theme(dark_mode: bool = True) -> dict:
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-async def change_wallpaper(keyword: str = "", custom_path: str = "") -> dict:
+@blocking_handler
+def change_wallpaper(keyword: str = "", custom_path: str = "") -> dict:
     """
     Đổi hình nền desktop
     - Nếu có custom_path: dùng file được chỉ định
@@ -6685,7 +8814,8 @@ async def change_wallpaper(keyword: str = "", custom_path: str = "") -> dict:
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-async def get_desktop_path() -> dict:
+@blocking_handler
+def get_desktop_path() -> dict:
     """Lấy đường dẫn thư mục Desktop"""
     try:
         user_profile = subprocess.check_output("echo %USERPROFILE%", shell=True, text=True).strip()
@@ -6694,7 +8824,8 @@ async def get_desktop_path() -> dict:
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-async def paste_content(content: str = "") -> dict:
+@blocking_handler
+def paste_content(content: str = "") -> dict:
     """
     Dán nội dung vào vị trí con trỏ
     Nếu content rỗng, chỉ thực hiện Ctrl+V với clipboard hiện tại
@@ -6717,7 +8848,8 @@ async def paste_content(content: str = "") -> dict:
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-async def press_enter() -> dict:
+@blocking_handler
+def press_enter() -> dict:
     """Nhấn phím Enter"""
     try:
         import pyautogui
@@ -6727,7 +8859,8 @@ async def press_enter() -> dict:
         return {"success": False, "error": str(e)}
 
 
-async def save_text_to_file(content: str, filename: str = "") -> dict:
+@blocking_handler
+def save_text_to_file(content: str, filename: str = "") -> dict:
     """
     Lưu văn bản do LLM soạn thành file text
     LLM có thể soạn bài viết, báo cáo, code, v.v. và lưu trực tiếp vào file
@@ -6786,7 +8919,6 @@ async def gemini_text_to_speech(text: str, voice: str = "Aoede", save_audio: boo
         filename: Tên file (nếu save_audio=True)
     """
     try:
-        from google import genai
         from google.genai import types
         import os
         import tempfile
@@ -6806,8 +8938,8 @@ async def gemini_text_to_speech(text: str, voice: str = "Aoede", save_audio: boo
         
         print(f"🎙️ [Gemini TTS] Text: {text[:50]}... Voice: {voice}")
         
-        # Create client
-        client = genai.Client(api_key=gemini_api_key)
+        # Client dùng chung (cache theo API key)
+        client = ai_clients.genai_client(gemini_api_key)
         
         # Generate speech in thread pool to avoid blocking event loop
         def generate_speech():
@@ -6830,10 +8962,12 @@ async def gemini_text_to_speech(text: str, voice: str = "Aoede", save_audio: boo
         loop = asyncio.get_event_loop()
         print(f"🎙️ [Gemini TTS] Calling API...")
         try:
-            response = await asyncio.wait_for(
-                loop.run_in_executor(None, generate_speech),
-                timeout=30.0  # 30s timeout - đủ cho 500 chars
-            )
+            async with ai_clients.slot("gemini", "gemini-2.5-flash-preview-tts", api_key=gemini_api_key) as slot:
+                response = await asyncio.wait_for(
+                    loop.run_in_executor(None, generate_speech),
+                    timeout=30.0  # 30s timeout - đủ cho 500 chars
+                )
+                slot.record(response)
             print(f"🎙️ [Gemini TTS] API responded!")
         except asyncio.TimeoutError:
             print(f"❌ [Gemini TTS] API timeout after 30s")
@@ -6950,6 +9084,73 @@ async def gemini_text_to_speech(text: str, voice: str = "Aoede", save_audio: boo
         return {"success": False, "error": f"Gemini TTS lỗi: {str(e)}"}
 
 
+def _sapi_speak(text: str, save_audio: bool, filename: str) -> dict:
+    """Đọc (và lưu) văn bản bằng Windows SAPI - blocking tới khi đọc xong, chạy ở thread"""
+    import pythoncom
+    
+    pythoncom.CoInitialize()  # Thread worker chưa khởi tạo COM
+    try:
+        import win32com.client
+    
+        # Khởi tạo SAPI voice
+        speaker = win32com.client.Dispatch("SAPI.SpVoice")
+    
+        # Lấy danh sách voices (tiếng Anh, tiếng Việt nếu có cài)
+        voices = speaker.GetVoices()
+    
+        # Nếu muốn lưu thành file audio
+        if save_audio:
+            from comtypes.client import CreateObject
+            from comtypes.gen import SpeechLib
+        
+            engine = CreateObject("SAPI.SpVoice")
+            stream = CreateObject("SAPI.SpFileStream")
+        
+            # Tạo tên file nếu không có
+            if not filename:
+                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                filename = f"tts_audio_{timestamp}.wav"
+        
+            if not filename.endswith('.wav'):
+                filename += '.wav'
+        
+            # Lưu vào Documents
+            documents_path = os.path.expanduser("~\\Documents")
+            save_folder = os.path.join(documents_path, "miniZ_TTS_Audio")
+            os.makedirs(save_folder, exist_ok=True)
+        
+            file_path = os.path.join(save_folder, filename)
+        
+            # Mở stream và ghi audio
+            stream.Open(file_path, SpeechLib.SSFMCreateForWrite)
+            engine.AudioOutputStream = stream
+            engine.Speak(text)
+            stream.Close()
+        
+            file_size = os.path.getsize(file_path)
+        
+            return {
+                "success": True,
+                "message": f"🔊 Đã đọc văn bản và lưu audio: {filename}",
+                "path": file_path,
+                "size_bytes": file_size,
+                "text_length": len(text),
+                "engine": "Windows SAPI"
+            }
+        else:
+            # Chỉ đọc không lưu
+            speaker.Speak(text)
+        
+            return {
+                "success": True,
+                "message": f"🔊 Đã đọc văn bản ({len(text)} ký tự)",
+                "text_length": len(text),
+                "engine": "Windows SAPI"
+            }
+    finally:
+        pythoncom.CoUninitialize()
+
+
 async def text_to_speech(text: str, save_audio: bool = False, filename: str = "") -> dict:
     """
     Text-to-Speech (TTS): Đọc văn bản thành giọng nói
@@ -6989,7 +9190,7 @@ async def text_to_speech(text: str, save_audio: bool = False, filename: str = ""
                 
                 # Tạo audio bằng gTTS (giọng Vietnamese native)
                 tts = gTTS(text=text, lang='vi', slow=False)
-                tts.save(file_path)
+                await asyncio.to_thread(tts.save, file_path)  # Gọi Google TTS qua mạng
                 
                 file_size = os.path.getsize(file_path)
                 
@@ -7037,63 +9238,7 @@ async def text_to_speech(text: str, save_audio: bool = False, filename: str = ""
         
         # === NGÔN NGỮ KHÁC: Dùng Windows SAPI ===
         if not is_vietnamese:
-            import win32com.client
-            
-            # Khởi tạo SAPI voice
-            speaker = win32com.client.Dispatch("SAPI.SpVoice")
-            
-            # Lấy danh sách voices (tiếng Anh, tiếng Việt nếu có cài)
-            voices = speaker.GetVoices()
-            
-            # Nếu muốn lưu thành file audio
-            if save_audio:
-                from comtypes.client import CreateObject
-                from comtypes.gen import SpeechLib
-                
-                engine = CreateObject("SAPI.SpVoice")
-                stream = CreateObject("SAPI.SpFileStream")
-                
-                # Tạo tên file nếu không có
-                if not filename:
-                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                    filename = f"tts_audio_{timestamp}.wav"
-                
-                if not filename.endswith('.wav'):
-                    filename += '.wav'
-                
-                # Lưu vào Documents
-                documents_path = os.path.expanduser("~\\Documents")
-                save_folder = os.path.join(documents_path, "miniZ_TTS_Audio")
-                os.makedirs(save_folder, exist_ok=True)
-                
-                file_path = os.path.join(save_folder, filename)
-                
-                # Mở stream và ghi audio
-                stream.Open(file_path, SpeechLib.SSFMCreateForWrite)
-                engine.AudioOutputStream = stream
-                engine.Speak(text)
-                stream.Close()
-                
-                file_size = os.path.getsize(file_path)
-                
-                return {
-                    "success": True,
-                    "message": f"🔊 Đã đọc văn bản và lưu audio: {filename}",
-                    "path": file_path,
-                    "size_bytes": file_size,
-                    "text_length": len(text),
-                    "engine": "Windows SAPI"
-                }
-            else:
-                # Chỉ đọc không lưu
-                speaker.Speak(text)
-                
-                return {
-                    "success": True,
-                    "message": f"🔊 Đã đọc văn bản ({len(text)} ký tự)",
-                    "text_length": len(text),
-                    "engine": "Windows SAPI"
-                }
+            return await asyncio.to_thread(_sapi_speak, text, save_audio, filename)
         
     except ImportError as e:
         return {
@@ -7104,7 +9249,8 @@ async def text_to_speech(text: str, save_audio: bool = False, filename: str = ""
         return {"success": False, "error": f"TTS lỗi: {str(e)}"}
 
 
-async def speech_to_text(duration: int = 5, save_transcript: bool = True, filename: str = "") -> dict:
+@blocking_handler
+def speech_to_text(duration: int = 5, save_transcript: bool = True, filename: str = "") -> dict:
     """
     Speech-to-Text (STT): Chuyển giọng nói thành văn bản
     Sử dụng Google Speech Recognition (cần Internet)
@@ -7209,7 +9355,8 @@ async def speech_to_text(duration: int = 5, save_transcript: bool = True, filena
 # shutdown_computer -> sử dụng shutdown_schedule
 
 
-async def find_in_document(search_text: str) -> dict:
+@blocking_handler
+def find_in_document(search_text: str) -> dict:
     """Tìm kiếm trong tài liệu (Ctrl+F)"""
     try:
         import pyperclip
@@ -7244,7 +9391,6 @@ async def get_vnexpress_news(category: str = "home", max_articles: int = 5) -> d
     category: home, thoi-su, goc-nhin, the-gioi, kinh-doanh, giai-tri, the-thao, phap-luat, giao-duc, suc-khoe, gia-dinh, du-lich, khoa-hoc, so-hoa, xe, cong-dong, tam-su, cuoi
     """
     try:
-        import aiohttp
         import xml.etree.ElementTree as ET
         
         # RSS URL mapping
@@ -7268,43 +9414,42 @@ async def get_vnexpress_news(category: str = "home", max_articles: int = 5) -> d
         
         print(f"📰 [News] Fetching news from: {rss_url}")
         
-        # ⚡ Dùng aiohttp thay vì feedparser
-        async with aiohttp.ClientSession() as session:
-            async with session.get(rss_url, timeout=8) as resp:
-                if resp.status != 200:
-                    return {"success": False, "error": f"HTTP {resp.status}"}
+        # ⚡ Dùng http_client (pool chung) thay vì feedparser
+        resp = await http_client.get(rss_url, timeout=8)
+        if resp.status != 200:
+            return {"success": False, "error": f"HTTP {resp.status}"}
                 
-                content = await resp.text()
-                root = ET.fromstring(content)
+        content = resp.text()
+        root = ET.fromstring(content)
                 
-                articles = []
-                items = root.findall('.//item')[:max_articles]
+        articles = []
+        items = root.findall('.//item')[:max_articles]
                 
-                for i, item in enumerate(items):
-                    try:
-                        title_elem = item.find('title')
-                        link_elem = item.find('link')
-                        pubdate_elem = item.find('pubDate')
-                        desc_elem = item.find('description')
+        for i, item in enumerate(items):
+            try:
+                title_elem = item.find('title')
+                link_elem = item.find('link')
+                pubdate_elem = item.find('pubDate')
+                desc_elem = item.find('description')
                         
-                        article = {
-                            "title": title_elem.text if title_elem is not None else "No title",
-                            "link": link_elem.text if link_elem is not None else "",
-                            "published": pubdate_elem.text if pubdate_elem is not None else "",
-                            "description": ""
-                        }
+                article = {
+                    "title": title_elem.text if title_elem is not None else "No title",
+                    "link": link_elem.text if link_elem is not None else "",
+                    "published": pubdate_elem.text if pubdate_elem is not None else "",
+                    "description": ""
+                }
                         
-                        # Get description (strip HTML tags)
-                        if desc_elem is not None and desc_elem.text:
-                            import re
-                            desc_text = re.sub(r'<[^>]+>', '', desc_elem.text)
-                            article["description"] = desc_text.strip()[:200] + "..."
+                # Get description (strip HTML tags)
+                if desc_elem is not None and desc_elem.text:
+                    import re
+                    desc_text = re.sub(r'<[^>]+>', '', desc_elem.text)
+                    article["description"] = desc_text.strip()[:200] + "..."
                         
-                        articles.append(article)
-                        print(f"✅ [News] Article {i+1}: {article['title'][:50]}...")
+                articles.append(article)
+                print(f"✅ [News] Article {i+1}: {article['title'][:50]}...")
                         
-                    except Exception as e:
-                        print(f"⚠️ [News] Error parsing article {i+1}: {e}")
+            except Exception as e:
+                print(f"⚠️ [News] Error parsing article {i+1}: {e}")
         
         result = {
             "success": True,
@@ -7485,7 +9630,6 @@ async def get_gold_price() -> dict:
     Lấy giá vàng từ các nguồn uy tín
     """
     try:
-        import requests
         from bs4 import BeautifulSoup
         import re
 
@@ -7507,13 +9651,13 @@ async def get_gold_price() -> dict:
 
         # Try SJC XML first
         try:
-            response = requests.get(sources[0]["url"], timeout=10, headers={
+            response = await http_client.get(sources[0]["url"], timeout=10, headers={
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
             })
             response.encoding = 'utf-8'
 
-            if response.status_code == 200:
-                soup = BeautifulSoup(response.content, 'xml')
+            if response.status == 200:
+                soup = BeautifulSoup(response.body, 'xml')
                 items = soup.find_all('item')
 
                 if items:
@@ -7592,12 +9736,12 @@ async def get_gold_price() -> dict:
         # Fallback: Try giavang.org scraping
         try:
             print(f"💰 [Gold] Trying giavang.org...")
-            response = requests.get('https://giavang.org/', timeout=15, headers={
+            response = await http_client.get('https://giavang.org/', timeout=15, headers={
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
             })
 
-            if response.status_code == 200:
-                soup = BeautifulSoup(response.content, 'html.parser')
+            if response.status == 200:
+                soup = BeautifulSoup(response.body, 'html.parser')
 
                 # Look for gold price tables
                 tables = soup.find_all('table')
@@ -7768,8 +9912,6 @@ async def analyze_gold_price_with_ai(analysis_type: str = "compare_month") -> di
         
         if SERPER_API_KEY and SERPER_API_KEY.strip():
             try:
-                import requests
-                
                 # Tính tháng trước
                 last_month_vn = (datetime.now() - timedelta(days=30)).strftime("tháng %m năm %Y")
                 
@@ -7788,9 +9930,9 @@ async def analyze_gold_price_with_ai(analysis_type: str = "compare_month") -> di
                     "num": 5
                 }
                 
-                response = requests.post(url, headers=headers, json=payload, timeout=10)
+                response = await http_client.post(url, headers=headers, json_body=payload, timeout=10, coalesce=True)
                 
-                if response.status_code == 200:
+                if response.status == 200:
                     data = response.json()
                     
                     # Lấy Answer Box
@@ -7810,7 +9952,7 @@ async def analyze_gold_price_with_ai(analysis_type: str = "compare_month") -> di
                     
                     print(f"✅ [Gold AI] Got historical data from Google")
                 else:
-                    print(f"⚠️ [Gold AI] Serper API returned {response.status_code}")
+                    print(f"⚠️ [Gold AI] Serper API returned {response.status}")
                     
             except Exception as e:
                 print(f"⚠️ [Gold AI] Error fetching historical data: {e}")
@@ -7887,13 +10029,9 @@ Trả lời ngắn:
                 "error": "Gemini API không khả dụng. Vui lòng cấu hình GEMINI_API_KEY."
             }
         
-        import google.generativeai as genai
-        genai.configure(api_key=GEMINI_API_KEY)
-        
-        model = genai.GenerativeModel('models/gemini-3-flash-preview')
-        
         print(f"🤖 [Gold AI] Asking Gemini to analyze...")
-        response = model.generate_content(
+        response = await ai_clients.generate(
+            'models/gemini-3-flash-preview',
             analysis_prompt,
             generation_config=genai.types.GenerationConfig(
                 temperature=0.7,
@@ -7919,6 +10057,278 @@ Trả lời ngắn:
         }
 
 
+# ============================================================================
+# 💾 AI RESPONSE CACHE - Cache câu trả lời AI (lưu đĩa, TTL theo loại câu hỏi)
+# ============================================================================
+# Robot hỏi lại cùng một câu nhiều lần/ngày ("giá vàng hôm nay", "hôm nay ngày bao nhiêu âm lịch")
+# → trả lời từ cache (< 1ms, không tốn quota API) thay vì gọi Gemini/GPT mất vài giây.
+#   - Key = namespace + model + prompt đã chuẩn hóa + hash context (tham số ảnh hưởng kết quả)
+#   - "live": giá cả, thời tiết, tin tức → hết hạn theo khung 10 phút
+#   - "daily": câu hỏi về ngày hôm nay/âm lịch → hết hạn lúc 0h
+#   - "evergreen": kiến thức chung → giữ 7 ngày
+#   - LRU theo số entry + tổng dung lượng, ghi file nền (debounce) bằng thread riêng
+
+RESPONSE_CACHE_FILE = CONVERSATION_BASE_DIR.parent / "response_cache.json"
+RESPONSE_CACHE_MAX_ENTRIES = 1000
+RESPONSE_CACHE_MAX_BYTES = 4 * 1024 * 1024   # 4MB (tính theo JSON của kết quả)
+RESPONSE_CACHE_SAVE_DELAY = 5.0               # Gộp nhiều lần ghi trong 5s thành 1 lần
+
+# bucket: câu trả lời chỉ dùng trong cùng khung thời gian (giây, "day" = ngày theo giờ máy)
+# ttl: giữ bao lâu kể từ lúc lưu
+RESPONSE_CACHE_POLICIES = {
+    "live": {"bucket": 600},
+    "daily": {"bucket": "day"},
+    "evergreen": {"ttl": 7 * 86400},
+}
+
+RESPONSE_CACHE_CLASS_KEYWORDS = {
+    "live": [
+        'giá vàng', 'giá usd', 'giá đô', 'tỷ giá', 'giá bitcoin', 'bitcoin', 'crypto',
+        'chứng khoán', 'cổ phiếu', 'giá xăng', 'giá dầu', 'giá hiện tại', 'giá mới nhất',
+        'stock', 'gold price', 'exchange rate', 'price',
+        'thời tiết', 'weather', 'nhiệt độ', 'temperature', 'mưa', 'bão',
+        'tin tức', 'news', 'mới nhất', 'latest', 'breaking', 'tỷ số', 'score', 'kết quả trận',
+        'bây giờ', 'hiện tại', 'hiện nay', 'right now', 'current', 'giao thông',
+    ],
+    "daily": [
+        'hôm nay', 'today', 'ngày mai', 'tomorrow', 'hôm qua', 'yesterday',
+        'âm lịch', 'dương lịch', 'lunar', 'thứ mấy', 'ngày bao nhiêu', 'ngày mấy',
+        'tuần này', 'tháng này', 'năm nay', 'this week',
+    ],
+}
+
+_RESPONSE_CACHE_CLASS_PATTERNS = {
+    cls: re.compile(r'(?<!\w)(?:' + '|'.join(re.escape(kw) for kw in keywords) + r')(?!\w)')
+    for cls, keywords in RESPONSE_CACHE_CLASS_KEYWORDS.items()
+}
+
+
+def normalize_cache_prompt(prompt: str) -> str:
+    """Chuẩn hóa prompt để câu hỏi giống nhau ra cùng key (giữ dấu tiếng Việt - dấu đổi nghĩa)"""
+    text = unicodedata.normalize("NFC", str(prompt)).lower()
+    text = re.sub(r'\s+', ' ', text).strip()
+    return text.rstrip(' ?!.…,;:')
+
+
+def classify_cache_query(normalized_prompt: str) -> str:
+    """live / daily / evergreen - "live" thắng nếu câu hỏi vừa có giá vừa có "hôm nay\""""
+    for cls in ("live", "daily"):
+        if _RESPONSE_CACHE_CLASS_PATTERNS[cls].search(normalized_prompt):
+            return cls
+    return "evergreen"
+
+
+class ResponseCache:
+    """LRU cache câu trả lời AI, lưu ra đĩa. Dùng được từ mọi thread/event loop."""
+
+    def __init__(self, path: Path, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+                 max_bytes: int = RESPONSE_CACHE_MAX_BYTES):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()   # key → {"value", "class", "created", "expires_at", "size"}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._dirty = False
+        self._save_timer = None
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expired": 0,
+                      "saves": 0, "save_errors": 0}
+        self._class_stats = {cls: {"hits": 0, "misses": 0} for cls in RESPONSE_CACHE_POLICIES}
+        self._hit_us_total = 0.0
+
+    # ---------- Key / policy ----------
+
+    def key(self, namespace: str, prompt: str, model: str = "", context=None, query_class: str = None) -> tuple:
+        """
+        Trả về (key, query_class). context: dict/str các tham số ảnh hưởng kết quả.
+        Câu hỏi theo khung thời gian mang bucket trong key → sang khung mới là tự miss.
+        query_class: ép loại TTL (VD intent của câu nói không đổi theo thời gian → "evergreen")
+        """
+        normalized = normalize_cache_prompt(prompt)
+        query_class = query_class or classify_cache_query(normalized)
+        bucket = self._bucket_id(RESPONSE_CACHE_POLICIES[query_class], time.time())
+        context_hash = ""
+        if context:
+            raw = json.dumps(context, sort_keys=True, ensure_ascii=False, default=str)
+            context_hash = hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+        digest = hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+        return f"{namespace}|{model}|{context_hash}|{bucket}|{digest}", query_class
+
+    @staticmethod
+    def _bucket_id(policy: dict, now: float) -> str:
+        bucket = policy.get("bucket")
+        if bucket == "day":
+            return time.strftime("%Y%m%d", time.localtime(now))
+        if bucket:
+            return str(int(now // bucket))
+        return "-"
+
+    @staticmethod
+    def _expires_at(policy: dict, now: float) -> float:
+        bucket = policy.get("bucket")
+        if bucket == "day":
+            tomorrow = time.localtime(now + 86400)
+            return time.mktime((tomorrow.tm_year, tomorrow.tm_mon, tomorrow.tm_mday, 0, 0, 0, 0, 0, -1))
+        if bucket:
+            return (now // bucket + 1) * bucket
+        return now + policy.get("ttl", 86400)
+
+    # ---------- Get / put ----------
+
+    def get(self, key: str, query_class: str = None):
+        """Trả về bản sao kết quả đã cache (kèm "cached": True) hoặc None"""
+        start = time.perf_counter()
+        if not self._loaded:
+            self.load()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry["expires_at"] <= time.time():
+                self._remove(key)
+                self.stats["expired"] += 1
+                entry = None
+            class_stats = self._class_stats.get(query_class or (entry or {}).get("class"))
+            if entry is None:
+                self.stats["misses"] += 1
+                if class_stats:
+                    class_stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            if class_stats:
+                class_stats["hits"] += 1
+            result = dict(entry["value"])
+            result["cached"] = True
+            result["cache_age_s"] = round(time.time() - entry["created"], 1)
+            self._hit_us_total += (time.perf_counter() - start) * 1e6
+            return result
+
+    def put(self, key: str, value: dict, query_class: str = "evergreen"):
+        """Lưu kết quả thành công. Kết quả lớn hơn 1/4 budget không cache."""
+        try:
+            size = len(json.dumps(value, ensure_ascii=False, default=str).encode("utf-8"))
+        except (TypeError, ValueError):
+            return
+        if size > self.max_bytes // 4:
+            return
+        if not self._loaded:
+            self.load()
+        now = time.time()
+        policy = RESPONSE_CACHE_POLICIES.get(query_class, RESPONSE_CACHE_POLICIES["evergreen"])
+        value = {k: v for k, v in value.items() if k not in ("cached", "cache_age_s")}
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = {"value": value, "class": query_class, "created": now,
+                                  "expires_at": self._expires_at(policy, now), "size": size}
+            self._bytes += size
+            self.stats["stores"] += 1
+            self._evict()
+            self._dirty = True
+        self._schedule_save()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._dirty = True
+        self._schedule_save()
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry["size"]
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= entry["size"]
+            self.stats["evictions"] += 1
+
+    # ---------- Persist ----------
+
+    def load(self):
+        """Đọc cache từ đĩa (bỏ entry đã hết hạn). Gọi 1 lần - lúc startup hoặc lần dùng đầu."""
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            try:
+                if not self.path.exists():
+                    return
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                now = time.time()
+                for key, entry in data.get("entries", []):
+                    if entry.get("expires_at", 0) > now:
+                        self._entries[key] = entry
+                        self._bytes += entry.get("size", 0)
+                self._evict()
+                print(f"💾 [ResponseCache] Loaded {len(self._entries)} entries ({self._bytes // 1024} KB)")
+            except Exception as e:
+                print(f"⚠️ [ResponseCache] Error loading cache: {e}")
+
+    def _schedule_save(self):
+        with self._lock:
+            if self._save_timer is not None:
+                return
+            self._save_timer = threading.Timer(RESPONSE_CACHE_SAVE_DELAY, self.save)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def save(self):
+        """Ghi file tạm rồi os.replace → không bao giờ để lại file cache hỏng"""
+        with self._lock:
+            self._save_timer = None
+            if not self._dirty:
+                return
+            snapshot = {"version": 1, "entries": list(self._entries.items())}
+            self._dirty = False
+        tmp_path = self.path.with_suffix(".tmp")
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f, ensure_ascii=False, default=str)
+            os.replace(tmp_path, self.path)
+            self.stats["saves"] += 1
+        except Exception as e:
+            self.stats["save_errors"] += 1
+            with self._lock:
+                self._dirty = True
+            print(f"⚠️ [ResponseCache] Error saving cache: {e}")
+
+    def flush(self):
+        """Ghi ngay (dùng khi shutdown)"""
+        with self._lock:
+            timer, self._save_timer = self._save_timer, None
+        if timer is not None:
+            timer.cancel()
+        self.save()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            by_class = {cls: 0 for cls in RESPONSE_CACHE_POLICIES}
+            for entry in self._entries.values():
+                by_class[entry["class"]] = by_class.get(entry["class"], 0) + 1
+            return {
+                **self.stats,
+                "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else 0.0,
+                "avg_hit_us": round(self._hit_us_total / self.stats["hits"], 1) if self.stats["hits"] else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "entries_by_class": by_class,
+                "by_class": {cls: dict(s) for cls, s in self._class_stats.items()},
+            }
+
+
+response_cache = ResponseCache(RESPONSE_CACHE_FILE)
+
+# Kết quả intent từ LLM (IntentDetector.detect_with_llm) - nhỏ, giữ lâu
+INTENT_CACHE_FILE = CONVERSATION_BASE_DIR.parent / "intent_cache.json"
+intent_llm_cache = ResponseCache(INTENT_CACHE_FILE, max_entries=2000, max_bytes=512 * 1024)
+
+
 # ============================================================================
 # 🔍 GEMINI WITH GOOGLE SEARCH GROUNDING
 # ============================================================================
@@ -7958,15 +10368,14 @@ async def ask_gemini_with_google_search(
         
         # Import các module cần thiết từ google.genai
         try:
-            from google import genai
             from google.genai import types
         except ImportError:
             # Fallback: Dùng google-generativeai cũ
             print("⚠️ [Gemini+GoogleSearch] google-genai not found, using legacy method")
             return await _ask_gemini_google_search_legacy(prompt, model)
         
-        # Khởi tạo client với API key
-        client = genai.Client(api_key=GEMINI_API_KEY)
+        # Client dùng chung (cache theo API key)
+        client = ai_clients.genai_client()
         
         # Cấu hình Google Search tool với dynamic retrieval
         google_search_tool = types.Tool(
@@ -7994,21 +10403,23 @@ async def ask_gemini_with_google_search(
         # Gọi Gemini với Google Search grounding
         loop = asyncio.get_event_loop()
         
-        response = await asyncio.wait_for(
-            loop.run_in_executor(
-                None,
-                lambda: client.models.generate_content(
-                    model=model,
-                    contents=prompt,
-                    config=types.GenerateContentConfig(
-                        tools=[google_search_tool],
-                        system_instruction=system_instruction,
-                        temperature=0.7,
+        async with ai_clients.slot("gemini", model) as slot:
+            response = await asyncio.wait_for(
+                loop.run_in_executor(
+                    None,
+                    lambda: client.models.generate_content(
+                        model=model,
+                        contents=prompt,
+                        config=types.GenerateContentConfig(
+                            tools=[google_search_tool],
+                            system_instruction=system_instruction,
+                            temperature=0.7,
+                        )
                     )
-                )
-            ),
-            timeout=30.0  # Timeout 30s vì cần thời gian search
-        )
+                ),
+                timeout=30.0  # Timeout 30s vì cần thời gian search
+            )
+            slot.record(response)
         
         # Lấy text response
         response_text = ""
@@ -8108,8 +10519,6 @@ async def _ask_gemini_google_search_legacy(prompt: str, model: str = "gemini-2.0
     Fallback: Dùng google-generativeai cũ với grounding
     """
     try:
-        genai.configure(api_key=GEMINI_API_KEY)
-        
         from datetime import datetime
         today_str = datetime.now().strftime('%d/%m/%Y')
         
@@ -8124,14 +10533,10 @@ async def _ask_gemini_google_search_legacy(prompt: str, model: str = "gemini-2.0
         try:
             # Thử dùng google_search_retrieval (phiên bản mới)
             tools = [{"google_search_retrieval": {"dynamic_retrieval_config": {"mode": "MODE_DYNAMIC", "dynamic_threshold": 0.7}}}]
-            gemini_model = genai.GenerativeModel(
-                model,
-                generation_config=generation_config,
-                tools=tools
-            )
+            gemini_model = ai_clients.gemini_model(model, generation_config, tools=tools)
         except Exception:
             # Fallback: không dùng tools
-            gemini_model = genai.GenerativeModel(model, generation_config=generation_config)
+            gemini_model = ai_clients.gemini_model(model, generation_config)
         
         system_prompt = f"""Hôm nay là {today_str}. Bạn là trợ lý AI thông minh.
 Hãy trả lời câu hỏi dựa trên kiến thức của bạn. Trả lời ngắn gọn, chuyên nghiệp."""
@@ -8139,10 +10544,12 @@ Hãy trả lời câu hỏi dựa trên kiến thức của bạn. Trả lời n
         full_prompt = f"{system_prompt}\n\nCâu hỏi: {prompt}"
         
         loop = asyncio.get_event_loop()
-        response = await asyncio.wait_for(
-            loop.run_in_executor(None, lambda: gemini_model.generate_content(full_prompt)),
-            timeout=25.0
-        )
+        async with ai_clients.slot("gemini", model) as slot:
+            response = await asyncio.wait_for(
+                loop.run_in_executor(None, lambda: gemini_model.generate_content(full_prompt)),
+                timeout=25.0
+            )
+            slot.record(response)
         
         response_text = response.text if hasattr(response, 'text') else str(response)
         
@@ -8181,19 +10588,8 @@ async def ask_gemini_direct(prompt: str, model: str = "models/gemini-3-flash-pre
         if not GEMINI_API_KEY or GEMINI_API_KEY.strip() == "":
             return {"success": False, "error": "Gemini API key chưa được cấu hình"}
         
-        # Cấu hình Gemini
-        genai.configure(api_key=GEMINI_API_KEY)
-        gemini_model = genai.GenerativeModel(model)
-        
-        # Gọi API với timeout 15 giây
-        loop = asyncio.get_event_loop()
-        response = await asyncio.wait_for(
-            loop.run_in_executor(
-                None, 
-                lambda: gemini_model.generate_content(prompt)
-            ),
-            timeout=15.0
-        )
+        # Model dùng chung + rate limit (timeout 15 giây)
+        response = await ai_clients.generate(model, prompt, timeout=15.0)
         
         response_text = response.text
         
@@ -8225,55 +10621,25 @@ async def ask_gemini(prompt: str, model: str = "models/gemini-3-flash-preview")
         dict với success, response_text, và message
     """
     try:
-        # ===== AUTO RAG: Kiểm tra có cần tra cứu web không =====
-        # Mở rộng keywords để bao quát nhiều câu hỏi thời sự hơn
-        realtime_keywords = [
-            # Giá cả, tài chính
-            'giá vàng', 'giá usd', 'tỷ giá', 'giá bitcoin', 'crypto', 'chứng khoán', 
-            'stock', 'gold price', 'exchange rate', 'giá xăng', 'giá dầu',
-            'giá cao nhất', 'cao nhất', 'thấp nhất', 'giá hiện tại', 'giá mới nhất',
-            'highest price', 'lowest price', 'current price', 'latest price',
-            
-            # Thời tiết
-            'thời tiết', 'weather', 'nhiệt độ', 'temperature', 'mưa', 'rain',
-            
-            # Tin tức, sự kiện
-            'tin tức', 'news', 'mới nhất', 'latest', 'breaking',
-            
-            # Thời gian thực
-            'hôm nay', 'bây giờ', 'hiện nay', 'hiện tại', 'today', 'now', 'current',
-            'currently', 'năm 2024', 'năm 2025', '2024', '2025',
-            
-            # Thể thao, cuộc thi
-            'vô địch', 'champion', 'winner', 'kết quả', 'score', 'result',
-            'olympia', 'world cup', 'euro', 'sea games', 'olympic', 'bóng đá', 'football',
-            
-            # Người nổi tiếng, chính trị
-            'tổng thống', 'president', 'thủ tướng', 'prime minister', 'chủ tịch',
-            'ceo', 'founder', 'leader', 'ai là', 'who is', 'who are',
-            
-            # Sản phẩm, công nghệ mới
-            'iphone', 'samsung', 'tesla', 'apple', 'google', 'microsoft',
-            'ra mắt', 'launch', 'release', 'announced',
-            
-            # Sự kiện xã hội
-            'covid', 'earthquake', 'động đất', 'bão', 'storm', 'lũ lụt', 'flood',
-            'tai nạn', 'accident', 'cháy', 'fire',
-            
-            # Tra cứu chung
-            'là ai', 'là gì', 'ở đâu', 'what is', 'where is', 'how much',
-            'bao nhiêu', 'khi nào', 'when'
-        ]
-        prompt_lower = prompt.lower()
-        needs_realtime = any(kw in prompt_lower for kw in realtime_keywords)
+        # ===== AUTO RAG: Kiểm tra có cần tra cứu web không (REALTIME_KEYWORDS) =====
+        needs_realtime = keyword_classifier.has(prompt, "realtime")
+        
+        # ===== 💾 CACHE: câu hỏi lặp lại → trả lời ngay, không gọi Serper/Gemini =====
+        # Câu trả lời dựa trên kết quả tra cứu web → luôn "live", cùng bộ từ khóa quyết định tra cứu
+        cache_key, cache_class = response_cache.key(
+            "ask_gemini", prompt, model, query_class="live" if needs_realtime else None)
+        cached = response_cache.get(cache_key, cache_class)
+        if cached is not None:
+            print(f"💾 [Gemini] Cache hit ({cache_class}, {cached['cache_age_s']}s): {prompt[:50]}...")
+            return cached
         
         rag_context = ""
         if needs_realtime:
             # ✅ Ưu tiên Serper API (Google Search trực tiếp) - chính xác và nhanh hơn
             if SERPER_API_KEY and SERPER_API_KEY.strip():
                 print(f"[Gemini+Serper] Phát hiện câu hỏi thời gian thực, đang tra cứu Google...")
+                await report_progress("🔍 Đang tra cứu Google...", force=True)
                 try:
-                    import requests
                     from datetime import datetime
                     
                     # Thêm ngày tháng năm hiện tại vào query để lấy thông tin mới nhất
@@ -8293,10 +10659,10 @@ async def ask_gemini(prompt: str, model: str = "models/gemini-3-flash-preview")
                         "num": 5
                     }
                     
-                    # ⚡ TIMEOUT 8s cho Serper API
-                    response = requests.post(url, headers=headers, json=payload, timeout=8)
+                    # ⚡ TIMEOUT 8s cho Serper API (pool HTTP chung, gộp câu hỏi trùng)
+                    response = await http_client.post(url, headers=headers, json_body=payload, timeout=8, coalesce=True)
                     
-                    if response.status_code == 200:
+                    if response.status == 200:
                         data = response.json()
                         results = []
                         
@@ -8342,7 +10708,7 @@ async def ask_gemini(prompt: str, model: str = "models/gemini-3-flash-preview")
                             
                             print(f"[Gemini+Serper] ✅ Đã lấy được {len(results)} kết quả từ Google")
                     else:
-                        print(f"[Gemini+Serper] ⚠️ API error: {response.status_code}")
+                        print(f"[Gemini+Serper] ⚠️ API error: {response.status}")
                         
                 except Exception as e:
                     print(f"[Gemini+Serper] ⚠️ Lỗi tra cứu: {e}")
@@ -8350,6 +10716,7 @@ async def ask_gemini(prompt: str, model: str = "models/gemini-3-flash-preview")
             # Fallback: Dùng RAG system nếu không có Serper API
             elif RAG_AVAILABLE:
                 print(f"[Gemini+RAG] Serper API không có, dùng RAG fallback...")
+                await report_progress("🔍 Đang tra cứu Internet...", force=True)
                 try:
                     from rag_system import web_search
                     from datetime import datetime
@@ -8386,14 +10753,8 @@ async def ask_gemini(prompt: str, model: str = "models/gemini-3-flash-preview")
                 "help": "Lấy API key tại: https://aistudio.google.com/apikey"
             }
         
-        # Cấu hình Gemini với API key
-        genai.configure(api_key=GEMINI_API_KEY)
-        print(f"[Gemini] Configured with API key: ...{GEMINI_API_KEY[-8:]}")
-        
-        # Khởi tạo model
-        print(f"[Gemini] Creating model: {model}")
-        gemini_model = genai.GenerativeModel(model)
-        print(f"[Gemini] Model created successfully")
+        # Model dùng chung (cache theo API key + tên model)
+        gemini_model = ai_clients.gemini_model(model)
         
         # Gọi API trong executor để không block event loop
         # Thêm RAG context vào prompt nếu có
@@ -8448,21 +10809,14 @@ TRẢ LỜI (nhớ: hôm nay là {today_str}, phân tích thời gian chính xá
 {response_instruction}"""
         
         print(f"[Gemini] Sending prompt: {enhanced_prompt[:50]}...")
-        loop = asyncio.get_event_loop()
         
-        # ⚡ TIMEOUT 20s cho ask_gemini chính (có RAG)
-        response = await asyncio.wait_for(
-            loop.run_in_executor(
-                None,
-                lambda: gemini_model.generate_content(enhanced_prompt)
-            ),
+        # ⚡ TIMEOUT 20s cho ask_gemini chính (có RAG) - stream từng đoạn nếu robot hỗ trợ progress
+        response_text = await asyncio.wait_for(
+            gemini_generate_with_progress(gemini_model, enhanced_prompt),
             timeout=20.0
         )
         print(f"[Gemini] Response received")
         
-        # Lấy text từ response
-        response_text = response.text if hasattr(response, 'text') else str(response)
-        
         # 🔄 TRUNCATE: Giới hạn response dưới 4000 ký tự cho LLM
         if len(response_text) > MAX_LLM_RESPONSE_CHARS:
             original_len = len(response_text)
@@ -8484,6 +10838,12 @@ TRẢ LỜI (nhớ: hôm nay là {today_str}, phân tích thời gian chính xá
             result["rag_used"] = True
             result["message"] = f"✅ Gemini đã trả lời với thông tin từ Internet (model: {model})"
         
+        # Không cache câu trả lời thời gian thực khi tra cứu web thất bại (trả lời thiếu dữ liệu)
+        search_failed = needs_realtime and not rag_context and (
+            (SERPER_API_KEY and SERPER_API_KEY.strip()) or RAG_AVAILABLE)
+        if not search_failed:
+            response_cache.put(cache_key, result, cache_class)
+        
         return result
         
     except asyncio.TimeoutError:
@@ -8658,6 +11018,13 @@ async def ask_gpt4(prompt: str, model: str = "gpt-4o") -> dict:
         dict với success, response_text, và message
     """
     try:
+        # 💾 Câu hỏi lặp lại → trả lời từ cache
+        cache_key, cache_class = response_cache.key("ask_gpt4", prompt, model)
+        cached = response_cache.get(cache_key, cache_class)
+        if cached is not None:
+            print(f"💾 [GPT-4] Cache hit ({cache_class}, {cached['cache_age_s']}s): {prompt[:50]}...")
+            return cached
+        
         # Kiểm tra OpenAI có khả dụng không
         if not OPENAI_AVAILABLE:
             return {
@@ -8675,20 +11042,22 @@ async def ask_gpt4(prompt: str, model: str = "gpt-4o") -> dict:
         
         # Khởi tạo OpenAI client
         print(f"[GPT-4] Configured with API key: ...{OPENAI_API_KEY[-8:]}")
-        client = OpenAI(api_key=OPENAI_API_KEY)
+        client = ai_clients.openai_client(OPENAI_API_KEY)
         
         print(f"[GPT-4] Sending prompt with model: {model}")
         
-        # Gọi API trong executor để không block event loop
+        # Gọi API trong executor để không block event loop (qua rate limit + quota)
         loop = asyncio.get_event_loop()
-        response = await loop.run_in_executor(
-            None,
-            lambda: client.chat.completions.create(
-                model=model,
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=1000
+        async with ai_clients.slot("openai", model) as slot:
+            response = await loop.run_in_executor(
+                None,
+                lambda: client.chat.completions.create(
+                    model=model,
+                    messages=[{"role": "user", "content": prompt}],
+                    max_tokens=1000
+                )
             )
-        )
+            slot.record(response)
         
         print(f"[GPT-4] Response received")
         
@@ -8703,7 +11072,7 @@ async def ask_gpt4(prompt: str, model: str = "gpt-4o") -> dict:
         
         print(f"[GPT-4] Response text: {response_text[:100]}...")
         
-        return {
+        result = {
             "success": True,
             "prompt": prompt,
             "response_text": response_text,
@@ -8715,6 +11084,8 @@ async def ask_gpt4(prompt: str, model: str = "gpt-4o") -> dict:
             },
             "message": f"✅ GPT-4 đã trả lời (model: {model})"
         }
+        response_cache.put(cache_key, result, cache_class)
+        return result
         
     except Exception as e:
         error_msg = str(e)
@@ -8764,6 +11135,190 @@ async def ask_gpt4(prompt: str, model: str = "gpt-4o") -> dict:
 import aiohttp
 import urllib.parse
 
+# ============================================================
+# 🌐 SHARED HTTP CLIENT - 1 connection pool cho mọi tool scraper/API
+# ============================================================
+# - Keep-alive: tái sử dụng kết nối TCP/TLS theo host (không tạo ClientSession mỗi lần gọi)
+# - Giới hạn số request đồng thời theo host
+# - Singleflight: các GET giống hệt nhau đang chạy cùng lúc dùng chung 1 request upstream
+#   (VD: 3 thiết bị cùng hỏi giá vàng → 1 lần fetch)
+# - HTTP/2 tùy chọn qua httpx (pip install httpx[http2]); mặc định aiohttp HTTP/1.1
+try:
+    import httpx
+    # httpx cần h2 để bật http2 - chỉ kiểm tra có cài, không import
+    HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None and os.environ.get("XIAOZHI_HTTP2", "1") != "0"
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+HTTP_DEFAULT_TIMEOUT = 10  # seconds
+HTTP_TOTAL_LIMIT = 64      # Tổng số kết nối trong pool
+HTTP_PER_HOST_LIMIT = 6    # Request đồng thời tối đa / host (mặc định)
+HTTP_HOST_LIMITS = {
+    "google.serper.dev": 4,
+    "www.youtube.com": 4,
+}
+HTTP_DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36"
+}
+
+
+class HttpResponse:
+    """Response đã đọc xong body → chia sẻ an toàn giữa các request được gộp"""
+
+    def __init__(self, url: str, status: int, headers: dict, body: bytes, encoding: str = None):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.encoding = encoding
+
+    def text(self, encoding: str = None) -> str:
+        return self.body.decode(encoding or self.encoding or "utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.body)
+
+
+class SharedHttpClient:
+    """Lớp HTTP dùng chung: pool keep-alive + giới hạn theo host + gộp request trùng"""
+
+    def __init__(self):
+        self._session = None
+        self._loop = None
+        self._host_limits = {}  # host → Semaphore
+        self._inflight = {}     # key → Task đang fetch
+        self.stats = {"requests": 0, "upstream": 0, "coalesced": 0, "errors": 0, "hosts": {}}
+
+    def _new_session(self):
+        if HTTP2_AVAILABLE:
+            return httpx.AsyncClient(
+                http2=True,
+                headers=HTTP_DEFAULT_HEADERS,
+                follow_redirects=True,
+                limits=httpx.Limits(max_connections=HTTP_TOTAL_LIMIT, keepalive_expiry=30),
+            )
+        return aiohttp.ClientSession(
+            headers=HTTP_DEFAULT_HEADERS,
+            connector=aiohttp.TCPConnector(
+                limit=HTTP_TOTAL_LIMIT,
+                limit_per_host=max([HTTP_PER_HOST_LIMIT, *HTTP_HOST_LIMITS.values()]),
+                ttl_dns_cache=300,
+                keepalive_timeout=30,
+            ),
+        )
+
+    @staticmethod
+    async def _close_session(session):
+        if HTTP2_AVAILABLE:
+            await session.aclose()
+        else:
+            await session.close()
+
+    def bind(self, loop: asyncio.AbstractEventLoop = None):
+        """Gắn pool vào loop của server (gọi trong startup, cạnh loop_bridge.bind())"""
+        self._loop = loop or asyncio.get_running_loop()
+
+    def _on_home_loop(self) -> bool:
+        """Chỉ loop đã bind mới dùng pool chung; chưa bind (script/CLI) → session tạm"""
+        if self._loop is not asyncio.get_running_loop():
+            return False
+        if self._session is None:
+            self._session = self._new_session()
+        return True
+
+    def _host_semaphore(self, host: str) -> asyncio.Semaphore:
+        semaphore = self._host_limits.get(host)
+        if semaphore is None:
+            semaphore = self._host_limits[host] = asyncio.Semaphore(HTTP_HOST_LIMITS.get(host, HTTP_PER_HOST_LIMIT))
+        return semaphore
+
+    async def _send(self, session, method: str, url: str, params, headers, json_body, data, timeout) -> HttpResponse:
+        if HTTP2_AVAILABLE:
+            resp = await session.request(method, url, params=params, headers=headers,
+                                         json=json_body, data=data, timeout=timeout)
+            return HttpResponse(str(resp.url), resp.status_code, dict(resp.headers), resp.content, resp.encoding)
+        async with session.request(method, url, params=params, headers=headers, json=json_body, data=data,
+                                   timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+            body = await resp.read()
+            return HttpResponse(str(resp.url), resp.status, dict(resp.headers), body, resp.get_encoding() if body else None)
+
+    async def _fetch(self, method: str, url: str, params, headers, json_body, data, timeout) -> HttpResponse:
+        host = urllib.parse.urlsplit(url).hostname or ""
+        self.stats["hosts"][host] = self.stats["hosts"].get(host, 0) + 1
+        self.stats["upstream"] += 1
+        if not self._on_home_loop():
+            # Gọi từ event loop khác / trước khi bind → session tạm riêng
+            session = self._new_session()
+            try:
+                return await self._send(session, method, url, params, headers, json_body, data, timeout)
+            finally:
+                await self._close_session(session)
+        async with self._host_semaphore(host):
+            return await self._send(self._session, method, url, params, headers, json_body, data, timeout)
+
+    async def request(self, method: str, url: str, *, params: dict = None, headers: dict = None,
+                      json_body=None, data=None, timeout: float = HTTP_DEFAULT_TIMEOUT,
+                      coalesce: bool = None) -> HttpResponse:
+        """
+        Gửi HTTP request qua pool chung.
+
+        Args:
+            coalesce: Gộp request trùng đang chạy. Mặc định: chỉ GET.
+                      POST idempotent (VD: Serper search) có thể bật tay.
+        """
+        self.stats["requests"] += 1
+        if coalesce is None:
+            coalesce = method.upper() == "GET" and data is None and json_body is None
+        if not coalesce or not self._on_home_loop():
+            try:
+                return await self._fetch(method, url, params, headers, json_body, data, timeout)
+            except Exception:
+                self.stats["errors"] += 1
+                raise
+
+        key = (
+            method.upper(), url,
+            json.dumps(params, sort_keys=True, default=str) if params else "",
+            json.dumps(headers, sort_keys=True) if headers else "",
+            json.dumps(json_body, sort_keys=True, default=str) if json_body is not None else "",
+        )
+        task = self._inflight.get(key)
+        if task is None:
+            # Task độc lập với caller: caller đầu bị hủy thì các caller còn lại vẫn nhận kết quả
+            task = asyncio.ensure_future(self._fetch(method, url, params, headers, json_body, data, timeout))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _t, k=key: self._inflight.pop(k, None))
+        else:
+            self.stats["coalesced"] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.stats["errors"] += 1
+            raise
+
+    async def get(self, url: str, **kwargs) -> HttpResponse:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> HttpResponse:
+        return await self.request("POST", url, **kwargs)
+
+    async def close(self):
+        if self._session is not None:
+            await self._close_session(self._session)
+            self._session = None
+
+    def snapshot(self) -> dict:
+        return {
+            "backend": "httpx/http2" if HTTP2_AVAILABLE else "aiohttp",
+            "inflight": len(self._inflight),
+            **self.stats,
+        }
+
+
+http_client = SharedHttpClient()
+
 async def get_daily_news() -> dict:
     """
     Lấy tin tức 60 giây mỗi ngày (每日早报/60s morning news).
@@ -8771,19 +11326,18 @@ async def get_daily_news() -> dict:
     """
     try:
         url = "https://60s.viki.moe/?v2=1"
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, timeout=10) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    news_list = data.get('data', [])[:10]  # Top 10 tin
-                    formatted = "\n".join([f"{i+1}. {item}" for i, item in enumerate(news_list)])
-                    return {
-                        "success": True,
-                        "message": "📰 Tin tức 60 giây hôm nay:",
-                        "news": formatted,
-                        "source": "60s.viki.moe"
-                    }
-                return {"success": False, "error": f"API trả về status {response.status}"}
+        response = await http_client.get(url, timeout=10)
+        if response.status == 200:
+            data = response.json()
+            news_list = data.get('data', [])[:10]  # Top 10 tin
+            formatted = "\n".join([f"{i+1}. {item}" for i, item in enumerate(news_list)])
+            return {
+                "success": True,
+                "message": "📰 Tin tức 60 giây hôm nay:",
+                "news": formatted,
+                "source": "60s.viki.moe"
+            }
+        return {"success": False, "error": f"API trả về status {response.status}"}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
@@ -8793,18 +11347,17 @@ async def get_random_quote() -> dict:
     """
     try:
         url = "https://v1.hitokoto.cn/"
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, timeout=10) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    return {
-                        "success": True,
-                        "quote": data.get('hitokoto', ''),
-                        "from": data.get('from', 'Unknown'),
-                        "author": data.get('from_who', ''),
-                        "type": data.get('type', '')
-                    }
-                return {"success": False, "error": f"API error: {response.status}"}
+        response = await http_client.get(url, timeout=10)
+        if response.status == 200:
+            data = response.json()
+            return {
+                "success": True,
+                "quote": data.get('hitokoto', ''),
+                "from": data.get('from', 'Unknown'),
+                "author": data.get('from_who', ''),
+                "type": data.get('type', '')
+            }
+        return {"success": False, "error": f"API error: {response.status}"}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
@@ -8826,19 +11379,18 @@ async def get_hotlist(platform: str = "weibo") -> dict:
         if not url:
             return {"success": False, "error": f"Platform không hỗ trợ. Chọn: weibo, zhihu, baidu, douyin"}
         
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, timeout=10) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    hot_list = data.get('data', [])[:15]  # Top 15
-                    formatted = "\n".join([f"{i+1}. {item.get('name', item.get('title', ''))}" for i, item in enumerate(hot_list)])
-                    return {
-                        "success": True,
-                        "platform": platform,
-                        "hotlist": formatted,
-                        "count": len(hot_list)
-                    }
-                return {"success": False, "error": f"API error: {response.status}"}
+        response = await http_client.get(url, timeout=10)
+        if response.status == 200:
+            data = response.json()
+            hot_list = data.get('data', [])[:15]  # Top 15
+            formatted = "\n".join([f"{i+1}. {item.get('name', item.get('title', ''))}" for i, item in enumerate(hot_list)])
+            return {
+                "success": True,
+                "platform": platform,
+                "hotlist": formatted,
+                "count": len(hot_list)
+            }
+        return {"success": False, "error": f"API error: {response.status}"}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
@@ -8850,20 +11402,19 @@ async def search_baike(query: str) -> dict:
         encoded_query = urllib.parse.quote(query)
         url = f"https://baike.baidu.com/api/openapi/BaikeLemmaCardApi?scope=103&format=json&appid=379020&bk_key={encoded_query}"
         
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, timeout=10) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    if data.get('id'):
-                        return {
-                            "success": True,
-                            "title": data.get('title', ''),
-                            "abstract": data.get('abstract', ''),
-                            "url": data.get('url', ''),
-                            "image": data.get('image', '')
-                        }
-                    return {"success": False, "error": f"Không tìm thấy '{query}' trên Baike"}
-                return {"success": False, "error": f"API error: {response.status}"}
+        response = await http_client.get(url, timeout=10)
+        if response.status == 200:
+            data = response.json()
+            if data.get('id'):
+                return {
+                    "success": True,
+                    "title": data.get('title', ''),
+                    "abstract": data.get('abstract', ''),
+                    "url": data.get('url', ''),
+                    "image": data.get('image', '')
+                }
+            return {"success": False, "error": f"Không tìm thấy '{query}' trên Baike"}
+        return {"success": False, "error": f"API error: {response.status}"}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
@@ -8879,19 +11430,18 @@ async def get_history_today() -> dict:
         
         url = f"https://api.oioweb.cn/api/common/history?month={month}&day={day}"
         
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, timeout=10) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    events = data.get('result', [])[:10]
-                    formatted = "\n".join([f"• {e.get('year', '')}: {e.get('title', '')}" for e in events])
-                    return {
-                        "success": True,
-                        "date": f"{month}/{day}",
-                        "events": formatted,
-                        "count": len(events)
-                    }
-                return {"success": False, "error": f"API error: {response.status}"}
+        response = await http_client.get(url, timeout=10)
+        if response.status == 200:
+            data = response.json()
+            events = data.get('result', [])[:10]
+            formatted = "\n".join([f"• {e.get('year', '')}: {e.get('title', '')}" for e in events])
+            return {
+                "success": True,
+                "date": f"{month}/{day}",
+                "events": formatted,
+                "count": len(events)
+            }
+        return {"success": False, "error": f"API error: {response.status}"}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
@@ -8901,16 +11451,15 @@ async def get_joke() -> dict:
     """
     try:
         url = "https://api.oioweb.cn/api/common/joke"
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, timeout=10) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    return {
-                        "success": True,
-                        "joke": data.get('result', {}).get('content', 'Không có joke'),
-                        "source": "oioweb.cn"
-                    }
-                return {"success": False, "error": f"API error: {response.status}"}
+        response = await http_client.get(url, timeout=10)
+        if response.status == 200:
+            data = response.json()
+            return {
+                "success": True,
+                "joke": data.get('result', {}).get('content', 'Không có joke'),
+                "source": "oioweb.cn"
+            }
+        return {"success": False, "error": f"API error: {response.status}"}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
@@ -8923,26 +11472,25 @@ async def get_weather_simple(city: str = "Hanoi") -> dict:
         encoded_city = urllib.parse.quote(city)
         url = f"https://wttr.in/{encoded_city}?format=j1"
         
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, timeout=15) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    current = data.get('current_condition', [{}])[0]
-                    weather_desc = current.get('weatherDesc', [{}])[0].get('value', '')
-                    temp_c = current.get('temp_C', '')
-                    humidity = current.get('humidity', '')
-                    wind_kmph = current.get('windspeedKmph', '')
+        response = await http_client.get(url, timeout=15)
+        if response.status == 200:
+            data = response.json()
+            current = data.get('current_condition', [{}])[0]
+            weather_desc = current.get('weatherDesc', [{}])[0].get('value', '')
+            temp_c = current.get('temp_C', '')
+            humidity = current.get('humidity', '')
+            wind_kmph = current.get('windspeedKmph', '')
                     
-                    return {
-                        "success": True,
-                        "city": city,
-                        "weather": weather_desc,
-                        "temperature": f"{temp_c}°C",
-                        "humidity": f"{humidity}%",
-                        "wind": f"{wind_kmph} km/h",
-                        "summary": f"🌤️ {city}: {weather_desc}, {temp_c}°C, Độ ẩm {humidity}%"
-                    }
-                return {"success": False, "error": f"Không tìm thấy thời tiết cho '{city}'"}
+            return {
+                "success": True,
+                "city": city,
+                "weather": weather_desc,
+                "temperature": f"{temp_c}°C",
+                "humidity": f"{humidity}%",
+                "wind": f"{wind_kmph} km/h",
+                "summary": f"🌤️ {city}: {weather_desc}, {temp_c}°C, Độ ẩm {humidity}%"
+            }
+        return {"success": False, "error": f"Không tìm thấy thời tiết cho '{city}'"}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
@@ -9095,7 +11643,8 @@ async def set_dark_light_theme(mode: str) -> dict:
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-async def lock_computer() -> dict:
+@blocking_handler
+def lock_computer() -> dict:
     """
     Khóa máy tính ngay lập tức.
     """
@@ -9207,7 +11756,8 @@ async def undo_action() -> dict:
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-async def show_desktop() -> dict:
+@blocking_handler
+def show_desktop() -> dict:
     """
     Hiển thị Desktop (Win+D).
     """
@@ -9228,7 +11778,6 @@ async def get_weather_vietnam(city: str = "Hà Nội") -> dict:
     Lấy thông tin thời tiết Việt Nam từ wttr.in (miễn phí, không cần API key).
     """
     try:
-        import aiohttp
         import urllib.parse
         
         # Normalize tên thành phố
@@ -9249,34 +11798,33 @@ async def get_weather_vietnam(city: str = "Hà Nội") -> dict:
         city_query = city_mapping.get(city.lower().strip(), city)
         url = f"https://wttr.in/{urllib.parse.quote(city_query)}?format=j1"
         
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, timeout=10) as resp:
-                if resp.status == 200:
-                    data = await resp.json()
-                    current = data.get("current_condition", [{}])[0]
+        resp = await http_client.get(url, timeout=10)
+        if resp.status == 200:
+            data = resp.json()
+            current = data.get("current_condition", [{}])[0]
                     
-                    temp_c = current.get("temp_C", "N/A")
-                    feels_like = current.get("FeelsLikeC", "N/A")
-                    humidity = current.get("humidity", "N/A")
-                    weather_desc = current.get("lang_vi", [{}])
-                    if weather_desc:
-                        weather_desc = weather_desc[0].get("value", current.get("weatherDesc", [{}])[0].get("value", ""))
-                    else:
-                        weather_desc = current.get("weatherDesc", [{}])[0].get("value", "")
-                    wind_kmph = current.get("windspeedKmph", "N/A")
+            temp_c = current.get("temp_C", "N/A")
+            feels_like = current.get("FeelsLikeC", "N/A")
+            humidity = current.get("humidity", "N/A")
+            weather_desc = current.get("lang_vi", [{}])
+            if weather_desc:
+                weather_desc = weather_desc[0].get("value", current.get("weatherDesc", [{}])[0].get("value", ""))
+            else:
+                weather_desc = current.get("weatherDesc", [{}])[0].get("value", "")
+            wind_kmph = current.get("windspeedKmph", "N/A")
                     
-                    return {
-                        "success": True,
-                        "city": city,
-                        "temperature": f"{temp_c}°C",
-                        "feels_like": f"{feels_like}°C",
-                        "humidity": f"{humidity}%",
-                        "weather": weather_desc,
-                        "wind": f"{wind_kmph} km/h",
-                        "message": f"🌤️ Thời tiết {city}: {temp_c}°C, {weather_desc}, Độ ẩm {humidity}%, Gió {wind_kmph}km/h"
-                    }
-                else:
-                    return {"success": False, "error": f"Không lấy được thời tiết: HTTP {resp.status}"}
+            return {
+                "success": True,
+                "city": city,
+                "temperature": f"{temp_c}°C",
+                "feels_like": f"{feels_like}°C",
+                "humidity": f"{humidity}%",
+                "weather": weather_desc,
+                "wind": f"{wind_kmph} km/h",
+                "message": f"🌤️ Thời tiết {city}: {temp_c}°C, {weather_desc}, Độ ẩm {humidity}%, Gió {wind_kmph}km/h"
+            }
+        else:
+            return {"success": False, "error": f"Không lấy được thời tiết: HTTP {resp.status}"}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
@@ -9285,41 +11833,38 @@ async def get_gold_price_vietnam() -> dict:
     Lấy giá vàng Việt Nam từ API miễn phí.
     """
     try:
-        import aiohttp
-        
         # Sử dụng API giá vàng SJC
         url = "https://api.btmc.vn/api/BTMCAPI/getpricesheet"
         
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, timeout=10) as resp:
-                if resp.status == 200:
-                    data = await resp.json()
+        resp = await http_client.get(url, timeout=10)
+        if resp.status == 200:
+            data = resp.json()
                     
-                    # Tìm giá vàng SJC
-                    gold_prices = []
-                    for item in data.get("data", []):
-                        name = item.get("name", "")
-                        buy = item.get("buy", 0)
-                        sell = item.get("sell", 0)
-                        if "SJC" in name or "vàng" in name.lower():
-                            gold_prices.append({
-                                "name": name,
-                                "buy": f"{buy:,.0f}".replace(",", "."),
-                                "sell": f"{sell:,.0f}".replace(",", ".")
-                            })
+            # Tìm giá vàng SJC
+            gold_prices = []
+            for item in data.get("data", []):
+                name = item.get("name", "")
+                buy = item.get("buy", 0)
+                sell = item.get("sell", 0)
+                if "SJC" in name or "vàng" in name.lower():
+                    gold_prices.append({
+                        "name": name,
+                        "buy": f"{buy:,.0f}".replace(",", "."),
+                        "sell": f"{sell:,.0f}".replace(",", ".")
+                    })
                     
-                    if gold_prices:
-                        msg = "💰 Giá vàng hôm nay:\n"
-                        for g in gold_prices[:3]:  # Top 3
-                            msg += f"• {g['name']}: Mua {g['buy']} - Bán {g['sell']} VNĐ/lượng\n"
+            if gold_prices:
+                msg = "💰 Giá vàng hôm nay:\n"
+                for g in gold_prices[:3]:  # Top 3
+                    msg += f"• {g['name']}: Mua {g['buy']} - Bán {g['sell']} VNĐ/lượng\n"
                         
-                        return {
-                            "success": True,
-                            "prices": gold_prices[:3],
-                            "message": msg.strip()
-                        }
+                return {
+                    "success": True,
+                    "prices": gold_prices[:3],
+                    "message": msg.strip()
+                }
                     
-                return {"success": False, "error": "Không lấy được giá vàng"}
+        return {"success": False, "error": "Không lấy được giá vàng"}
     except Exception as e:
         # Fallback: trả về thông tin hướng dẫn
         return {
@@ -9333,29 +11878,26 @@ async def get_exchange_rate_vietnam(currency: str = "USD") -> dict:
     Lấy tỷ giá ngoại tệ so với VND.
     """
     try:
-        import aiohttp
-        
         currency = currency.upper().strip()
         
         # Dùng API miễn phí exchangerate-api
         url = f"https://api.exchangerate-api.com/v4/latest/{currency}"
         
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, timeout=10) as resp:
-                if resp.status == 200:
-                    data = await resp.json()
-                    rates = data.get("rates", {})
-                    vnd_rate = rates.get("VND", 0)
+        resp = await http_client.get(url, timeout=10)
+        if resp.status == 200:
+            data = resp.json()
+            rates = data.get("rates", {})
+            vnd_rate = rates.get("VND", 0)
                     
-                    if vnd_rate:
-                        return {
-                            "success": True,
-                            "currency": currency,
-                            "vnd_rate": f"{vnd_rate:,.0f}".replace(",", "."),
-                            "message": f"💱 Tỷ giá: 1 {currency} = {vnd_rate:,.0f} VNĐ".replace(",", ".")
-                        }
+            if vnd_rate:
+                return {
+                    "success": True,
+                    "currency": currency,
+                    "vnd_rate": f"{vnd_rate:,.0f}".replace(",", "."),
+                    "message": f"💱 Tỷ giá: 1 {currency} = {vnd_rate:,.0f} VNĐ".replace(",", ".")
+                }
                         
-                return {"success": False, "error": f"Không tìm thấy tỷ giá {currency}"}
+        return {"success": False, "error": f"Không tìm thấy tỷ giá {currency}"}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
@@ -9364,7 +11906,6 @@ async def get_daily_quote() -> dict:
     Lấy câu nói hay/trích dẫn ngẫu nhiên.
     """
     try:
-        import aiohttp
         import random
         
         # Các quotes tiếng Việt đẹp
@@ -9384,16 +11925,15 @@ async def get_daily_quote() -> dict:
         # Thử lấy quote từ API
         try:
             url = "https://api.quotable.io/random"
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, timeout=5) as resp:
-                    if resp.status == 200:
-                        data = await resp.json()
-                        return {
-                            "success": True,
-                            "quote": data.get("content", ""),
-                            "author": data.get("author", "Unknown"),
-                            "message": f"💬 \"{data.get('content', '')}\" - {data.get('author', 'Unknown')}"
-                        }
+            resp = await http_client.get(url, timeout=5)
+            if resp.status == 200:
+                data = resp.json()
+                return {
+                    "success": True,
+                    "quote": data.get("content", ""),
+                    "author": data.get("author", "Unknown"),
+                    "message": f"💬 \"{data.get('content', '')}\" - {data.get('author', 'Unknown')}"
+                }
         except:
             pass
         
@@ -9413,7 +11953,6 @@ async def get_today_in_history() -> dict:
     Lấy sự kiện lịch sử ngày hôm nay.
     """
     try:
-        import aiohttp
         from datetime import datetime
         
         today = datetime.now()
@@ -9422,25 +11961,24 @@ async def get_today_in_history() -> dict:
         
         url = f"https://history.muffinlabs.com/date/{month}/{day}"
         
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, timeout=10) as resp:
-                if resp.status == 200:
-                    data = await resp.json()
-                    events = data.get("data", {}).get("Events", [])[:3]
+        resp = await http_client.get(url, timeout=10)
+        if resp.status == 200:
+            data = resp.json()
+            events = data.get("data", {}).get("Events", [])[:3]
                     
-                    if events:
-                        msg = f"📜 Ngày này ({day}/{month}) trong lịch sử:\n"
-                        for event in events:
-                            year = event.get("year", "")
-                            text = event.get("text", "")
-                            msg += f"• {year}: {text[:100]}...\n" if len(text) > 100 else f"• {year}: {text}\n"
+            if events:
+                msg = f"📜 Ngày này ({day}/{month}) trong lịch sử:\n"
+                for event in events:
+                    year = event.get("year", "")
+                    text = event.get("text", "")
+                    msg += f"• {year}: {text[:100]}...\n" if len(text) > 100 else f"• {year}: {text}\n"
                         
-                        return {
-                            "success": True,
-                            "date": f"{day}/{month}",
-                            "events": events,
-                            "message": msg.strip()
-                        }
+                return {
+                    "success": True,
+                    "date": f"{day}/{month}",
+                    "events": events,
+                    "message": msg.strip()
+                }
                         
         return {"success": False, "error": "Không lấy được sự kiện lịch sử"}
     except Exception as e:
@@ -9540,72 +12078,69 @@ async def get_news_vietnam() -> dict:
     Lấy tin tức nóng Việt Nam.
     """
     try:
-        import aiohttp
-        
         # Dùng RSS feed từ các báo Việt Nam
         rss_urls = [
             "https://vnexpress.net/rss/tin-moi-nhat.rss",
             "https://tuoitre.vn/rss/tin-moi-nhat.rss",
         ]
         
-        async with aiohttp.ClientSession() as session:
-            for rss_url in rss_urls:
-                try:
-                    async with session.get(rss_url, timeout=10) as resp:
-                        if resp.status == 200:
-                            import xml.etree.ElementTree as ET
-                            content = await resp.text()
-                            root = ET.fromstring(content)
+        for rss_url in rss_urls:
+            try:
+                resp = await http_client.get(rss_url, timeout=10)
+                if resp.status == 200:
+                    import xml.etree.ElementTree as ET
+                    content = resp.text()
+                    root = ET.fromstring(content)
                             
-                            items = root.findall('.//item')[:5]
-                            news = []
+                    items = root.findall('.//item')[:5]
+                    news = []
                             
-                            for item in items:
-                                title = item.find('title')
-                                title_text = title.text if title is not None else "No title"
-                                news.append(title_text)
+                    for item in items:
+                        title = item.find('title')
+                        title_text = title.text if title is not None else "No title"
+                        news.append(title_text)
                             
-                            if news:
-                                msg = "📰 Tin tức mới nhất:\n"
-                                for i, n in enumerate(news, 1):
-                                    msg += f"{i}. {n}\n"
+                    if news:
+                        msg = "📰 Tin tức mới nhất:\n"
+                        for i, n in enumerate(news, 1):
+                            msg += f"{i}. {n}\n"
                                 
-                                result = {
-                                    "success": True,
-                                    "news": news,
-                                    "message": msg.strip()
-                                }
+                        result = {
+                            "success": True,
+                            "news": news,
+                            "message": msg.strip()
+                        }
                                 
-                                # 🤖 GEMINI SUMMARIZATION: Tóm tắt nhanh bằng Gemini (non-blocking)
-                                try:
-                                    context = "\n".join([f"{i+1}. {n}" for i, n in enumerate(news)])
-                                    # ⚡ PROMPT NGẮN GỌN - phản hồi nhanh hơn
-                                    summary_prompt = f"""Tóm tắt 5 tin VN sau thành 3 ý chính:
+                        # 🤖 GEMINI SUMMARIZATION: Tóm tắt nhanh bằng Gemini (non-blocking)
+                        try:
+                            context = "\n".join([f"{i+1}. {n}" for i, n in enumerate(news)])
+                            # ⚡ PROMPT NGẮN GỌN - phản hồi nhanh hơn
+                            summary_prompt = f"""Tóm tắt 5 tin VN sau thành 3 ý chính:
 {context}
 
 Format: 📌 [3 điểm] + 🔹 [xu hướng chung 1 câu]"""
                                     
-                                    print(f"⚡ [NewsVN+Gemini] Tóm tắt nhanh {len(news)} tin...")
-                                    # ⏱️ Timeout 15 giây - đủ thời gian cho Gemini
-                                    gemini_summary = await asyncio.wait_for(
-                                        ask_gemini_direct(summary_prompt, model="models/gemini-3-flash-preview"),
-                                        timeout=15.0
-                                    )
-                                    if gemini_summary.get("success"):
-                                        summary_text = gemini_summary["response_text"]
-                                        result["gemini_summary"] = summary_text
-                                        result["message"] = f"✨ {summary_text}\n\n" + result["message"]
-                                        print(f"✅ [NewsVN+Gemini] Done ({len(summary_text)} chars)")
-                                    else:
-                                        print(f"⚠️ [NewsVN+Gemini] Failed: {gemini_summary.get('error')}")
-                                except asyncio.TimeoutError:
-                                    print(f"⏱️ [NewsVN+Gemini] Timeout - trả tin thô")
-                                except Exception as e:
-                                    print(f"⚠️ [NewsVN+Gemini] Error: {e}")
+                            print(f"⚡ [NewsVN+Gemini] Tóm tắt nhanh {len(news)} tin...")
+                            # ⏱️ Timeout 15 giây - đủ thời gian cho Gemini
+                            gemini_summary = await asyncio.wait_for(
+                                ask_gemini_direct(summary_prompt, model="models/gemini-3-flash-preview"),
+                                timeout=15.0
+                            )
+                            if gemini_summary.get("success"):
+                                summary_text = gemini_summary["response_text"]
+                                result["gemini_summary"] = summary_text
+                                result["message"] = f"✨ {summary_text}\n\n" + result["message"]
+                                print(f"✅ [NewsVN+Gemini] Done ({len(summary_text)} chars)")
+                            else:
+                                print(f"⚠️ [NewsVN+Gemini] Failed: {gemini_summary.get('error')}")
+                        except asyncio.TimeoutError:
+                            print(f"⏱️ [NewsVN+Gemini] Timeout - trả tin thô")
+                        except Exception as e:
+                            print(f"⚠️ [NewsVN+Gemini] Error: {e}")
                                 
-                                return result
-                except:
-                    continue
+                        return result
+            except:
+                continue
                     
         return {"success": False, "error": "Không lấy được tin tức"}
     except Exception as e:
@@ -9916,16 +12451,9 @@ async def gemini_smart_kb_filter(
         # ============================================================
         # BƯỚC 1: Load tất cả documents từ Knowledge Base
         # ============================================================
-        all_documents = []
-        
-        # Thử load từ index trước
-        if KNOWLEDGE_INDEX_FILE.exists():
-            try:
-                with open(KNOWLEDGE_INDEX_FILE, 'r', encoding='utf-8') as f:
-                    index_data = json.load(f)
-                all_documents = index_data.get("documents", [])
-            except:
-                pass
+        # Thử load từ index trước (snapshot trong RAM - không đọc đĩa)
+        kb = await knowledge_store.current_async()
+        all_documents = list(kb.documents)
         
         # 🆕 FALLBACK: Nếu index trống, đọc trực tiếp từ files
         if not all_documents:
@@ -9937,7 +12465,7 @@ async def gemini_smart_kb_filter(
                 files = scan_folder_for_files(folder_path)
                 for f in files[:15]:  # Giới hạn 15 files
                     try:
-                        text = extract_text_from_file(f["path"])
+                        text = await tool_pools["io_thread"].run(extract_text_from_file, f["path"])
                         if text and len(text.strip()) > 50 and not text.startswith("["):
                             all_documents.append({
                                 "file_path": f["path"],
@@ -9959,36 +12487,24 @@ async def gemini_smart_kb_filter(
         # ============================================================
         # BƯỚC 2: Pre-filter bằng keywords (giảm số docs cần gửi Gemini)
         # ============================================================
-        query_lower = user_query.lower()
-        stop_words = {'là', 'của', 'và', 'có', 'các', 'được', 'trong', 'để', 'này', 'đó', 
-                     'cho', 'với', 'từ', 'về', 'như', 'theo', 'không', 'khi', 'đã', 'sẽ',
-                     'ai', 'gì', 'nào', 'đâu', 'sao', 'thế', 'a', 'an', 'the', 'is', 'are'}
-        
-        keywords = [w.lower() for w in user_query.split() if w.lower() not in stop_words and len(w) > 1]
+        search_index = kb.search_index if kb.documents else KnowledgeSearchIndex(tuple(all_documents))
+        keywords = [surface for _, surface in search_index.query_terms(user_query) if surface]
         print(f"🔑 [GEMINI KB] Keywords: {keywords}")
         
-        # Pre-filter: Chỉ giữ documents có ít nhất 1 keyword
-        candidate_docs = []
-        for doc in all_documents:
-            content = doc.get("content", "").lower()
-            file_name = doc.get("file_name", "")
-            
+        # Pre-filter: BM25 top documents có ít nhất 1 keyword (nếu không có keywords, lấy tất cả)
+        def usable(content: str) -> bool:
             # Skip invalid content
-            if content.strip().startswith("%pdf-") or len(content.strip()) < 50:
-                continue
-            
-            # Check keyword match
-            match_count = sum(1 for kw in keywords if kw in content or kw in file_name.lower())
-            if match_count > 0 or not keywords:  # Nếu không có keywords, lấy tất cả
-                candidate_docs.append({
-                    "file_name": file_name,
-                    "content": doc.get("content", ""),
-                    "match_count": match_count
-                })
+            stripped = content.strip()
+            return len(stripped) >= 50 and not stripped.lower().startswith("%pdf-")
         
-        # Sort by match count và giới hạn
-        candidate_docs.sort(key=lambda x: x["match_count"], reverse=True)
-        candidate_docs = candidate_docs[:max_documents]
+        if keywords:
+            ranked = [(doc, len(matched)) for _, doc, matched in search_index.search(user_query, top_k=max_documents * 2)]
+        else:
+            ranked = [(doc, 0) for doc in all_documents]
+        candidate_docs = [
+            {"file_name": doc.get("file_name", ""), "content": doc.get("content", ""), "match_count": match_count}
+            for doc, match_count in ranked if usable(doc.get("content", ""))
+        ][:max_documents]
         
         if not candidate_docs:
             return {
@@ -10088,20 +12604,17 @@ Format: JSON array"""
         if not gemini_api_key:
             return {"success": False, "error": "Thiếu Gemini API key"}
         
-        genai.configure(api_key=gemini_api_key)
-        
-        # Sử dụng Gemini 3 Flash Preview (model mới nhất, nhanh nhất)
-        model = genai.GenerativeModel('models/gemini-2.0-flash')
-        
         print(f"🤖 [GEMINI KB] Calling Gemini Flash to filter...")
         
-        response = model.generate_content(
+        response = await ai_clients.generate(
+            'models/gemini-2.0-flash',
             gemini_prompt,
             generation_config=genai.types.GenerationConfig(
                 temperature=0.2,  # Low temp cho accuracy
                 max_output_tokens=2000,
                 top_p=0.95
-            )
+            ),
+            api_key=gemini_api_key
         )
         
         if not response or not response.text:
@@ -10227,6 +12740,16 @@ async def gemini_smart_analyze(
         dict với analysis, sources, summary
     """
     try:
+        # 💾 Cùng câu hỏi + cùng tham số phân tích → trả lời từ cache
+        cache_key, cache_class = response_cache.key(
+            "gemini_smart_analyze", user_query, "models/gemini-2.0-flash",
+            context={"type": analysis_type, "web": include_web_search, "kb": include_kb,
+                     "max_results": max_search_results})
+        cached = response_cache.get(cache_key, cache_class)
+        if cached is not None:
+            print(f"💾 [GEMINI ANALYZE] Cache hit ({cache_class}, {cached['cache_age_s']}s)")
+            return cached
+        
         print(f"🔥 [GEMINI ANALYZE] Analyzing: {user_query[:60]}...")
         
         # ============================================================
@@ -10244,8 +12767,7 @@ async def gemini_smart_analyze(
         if not gemini_api_key:
             return {"success": False, "error": "Thiếu Gemini API key"}
         
-        genai.configure(api_key=gemini_api_key)
-        model = genai.GenerativeModel('models/gemini-2.0-flash')
+        model = ai_clients.gemini_model('models/gemini-2.0-flash', api_key=gemini_api_key)
         
         # ============================================================
         # BƯỚC 2: Gemini tạo search queries tối ưu
@@ -10263,13 +12785,16 @@ Trả về JSON array, VD: ["query 1", "query 2", "query 3"]
 Chỉ trả về JSON, không giải thích."""
 
         print("🔍 [GEMINI ANALYZE] Generating search queries...")
+        await report_progress("🧠 Đang phân tích yêu cầu...", progress=1, total=4, force=True)
         
-        query_response = model.generate_content(
+        query_response = await ai_clients.generate(
+            'models/gemini-2.0-flash',
             query_prompt,
             generation_config=genai.types.GenerationConfig(
                 temperature=0.3,
                 max_output_tokens=300
-            )
+            ),
+            api_key=gemini_api_key
         )
         
         # Parse search queries
@@ -10292,6 +12817,7 @@ Chỉ trả về JSON, không giải thích."""
         
         if include_web_search and RAG_AVAILABLE:
             print(f"🌐 [GEMINI ANALYZE] Searching web with {len(search_queries)} queries...")
+            await report_progress(f"🌐 Đang tìm kiếm: {', '.join(search_queries[:3])}", progress=2, total=4, force=True)
             
             from rag_system import web_search as rag_web_search
             
@@ -10333,6 +12859,7 @@ Chỉ trả về JSON, không giải thích."""
         
         if include_kb:
             print("📚 [GEMINI ANALYZE] Searching Knowledge Base...")
+            await report_progress("📚 Đang tìm trong tài liệu nội bộ...", progress=3, total=4, force=True)
             try:
                 kb_result = await gemini_smart_kb_filter(
                     user_query=user_query,
@@ -10396,8 +12923,10 @@ Chỉ trả về JSON, không giải thích."""
 📝 TRẢ LỜI NGẮN GỌN:"""
 
         print("🤖 [GEMINI ANALYZE] Gemini analyzing and synthesizing...")
+        await report_progress("🤖 Đang tổng hợp kết quả...", progress=4, total=4, force=True)
         
-        analysis_response = model.generate_content(
+        analysis_content = await gemini_generate_with_progress(
+            model,
             analysis_prompt,
             generation_config=genai.types.GenerationConfig(
                 temperature=0.3,
@@ -10406,10 +12935,10 @@ Chỉ trả về JSON, không giải thích."""
             )
         )
         
-        if not analysis_response or not analysis_response.text:
+        if not analysis_content:
             return {"success": False, "error": "Gemini không trả về phân tích"}
         
-        analysis_content = analysis_response.text.strip()
+        analysis_content = analysis_content.strip()
         
         # ⚡ GIỚI HẠN ĐỘ DÀI - Quá dài sẽ khiến LLM cloud bị timeout
         MAX_RESPONSE_LENGTH = 1500
@@ -10430,10 +12959,12 @@ Chỉ trả về JSON, không giải thích."""
         
         # Trả về response_text để format_result_for_llm xử lý đúng
         # Giống cách ask_gemini, ask_gpt4 hoạt động
-        return {
+        result = {
             "success": True,
             "response_text": analysis_content
         }
+        response_cache.put(cache_key, result, cache_class)
+        return result
         
     except Exception as e:
         import traceback
@@ -10452,15 +12983,9 @@ async def search_knowledge_base(query: str) -> dict:
         if not query:
             return {"success": False, "error": "Vui lòng nhập từ khóa tìm kiếm"}
         
-        # Load index
-        documents = []
-        if KNOWLEDGE_INDEX_FILE.exists():
-            try:
-                with open(KNOWLEDGE_INDEX_FILE, 'r', encoding='utf-8') as f:
-                    index_data = json.load(f)
-                documents = index_data.get("documents", [])
-            except:
-                pass
+        # Load index (snapshot trong RAM - không đọc đĩa)
+        kb = await knowledge_store.current_async()
+        documents = list(kb.documents)
         
         # 🆕 FALLBACK: Nếu index trống, tự động đọc trực tiếp từ files
         if not documents:
@@ -10472,7 +12997,7 @@ async def search_knowledge_base(query: str) -> dict:
                 files = scan_folder_for_files(folder_path)
                 for f in files[:10]:  # Giới hạn 10 files để tránh quá tải
                     try:
-                        text = extract_text_from_file(f["path"])
+                        text = await tool_pools["io_thread"].run(extract_text_from_file, f["path"])
                         if text and len(text.strip()) > 50 and not text.startswith("["):
                             documents.append({
                                 "file_path": f["path"],
@@ -10492,80 +13017,24 @@ async def search_knowledge_base(query: str) -> dict:
                     "error": "Knowledge base chưa có dữ liệu. Vui lòng vào Web UI > Knowledge Base để cấu hình thư mục và index files."
                 }
         
-        # Tách query thành keywords (bỏ stop words phổ biến)
-        stop_words = {
-            # Vietnamese
-            'là', 'của', 'và', 'có', 'các', 'được', 'trong', 'để', 'này', 'đó', 'cho', 'với', 
-            'từ', 'về', 'như', 'theo', 'không', 'khi', 'đã', 'sẽ', 'những', 'một', 'hay', 'hoặc',
-            'thì', 'mà', 'nếu', 'vì', 'bởi', 'nên', 'cũng', 'lại', 'còn', 'đây', 'kia', 'ấy',
-            'ra', 'vào', 'lên', 'xuống', 'đi', 'đến', 'bằng', 'qua', 'sau', 'trước', 'trên', 'dưới',
-            'nào', 'gì', 'sao', 'thế', 'rằng', 'tại', 'vậy', 'nhưng', 'tuy', 'mặc', 'dù',
-            # English
-            'a', 'an', 'the', 'is', 'are', 'was', 'were', 'be', 'been', 'being', 
-            'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would', 'should', 'could', 
-            'may', 'might', 'can', 'what', 'which', 'who', 'how', 'when', 'where', 'why',
-            'this', 'that', 'these', 'those', 'it', 'its', 'they', 'them', 'their',
-            'he', 'she', 'him', 'her', 'his', 'we', 'us', 'our', 'you', 'your',
-            'of', 'to', 'in', 'on', 'at', 'by', 'for', 'with', 'about', 'as', 'from'
-        }
-        
-        # Lọc keywords - CHỈ GIỮ TỪ QUAN TRỌNG (dài > 3 ký tự)
-        keywords = [w.lower() for w in query.split() if w.lower() not in stop_words and len(w) > 3]
-        
-        # Nếu query quá dài (>4 từ), chỉ lấy 4 từ quan trọng nhất
-        if len(keywords) > 4:
-            keywords = sorted(keywords, key=len, reverse=True)[:4]
-        
+        # BM25 trên inverted index (dựng lúc index) - chỉ duyệt posting list của từ trong query
+        search_index = kb.search_index if kb.documents else KnowledgeSearchIndex(tuple(documents))
+        keywords = [surface for _, surface in search_index.query_terms(query) if surface]
         if not keywords:
-            all_words = [w.lower() for w in query.split() if len(w) > 2]
-            keywords = sorted(all_words, key=len, reverse=True)[:3] if all_words else [query.lower()]
-        
+            keywords = [query.lower()]
         print(f"🔍 [KB] Searching with keywords: {keywords}")
         
-        # Tính điểm relevance cho từng document
         scored_docs = []
-        min_keywords_match = max(1, len(keywords) - 1)
-        
-        for doc in documents:
+        min_keywords_match = max(1, min(len(keywords), 4) - 1)  # Câu hỏi dài: chỉ cần khớp 3 từ
+        for score, doc, matched_keywords in search_index.search(query, top_k=10, min_match=min_keywords_match):
             content = doc.get("content", "")
-            content_lower = content.lower()
-            file_name = doc.get("file_name", "")
-            
-            score = 0
-            matched_keywords = []
-            best_pos = 0
-            
-            for keyword in keywords:
-                count = content_lower.count(keyword)
-                if count > 0:
-                    import math
-                    score += math.log(1 + count) * 10
-                    matched_keywords.append(keyword)
-                    if not best_pos:
-                        idx = content_lower.find(keyword)
-                        if idx >= 0:
-                            best_pos = idx
-            
-            if len(matched_keywords) < min_keywords_match:
-                continue
-            
-            if len(matched_keywords) > 1:
-                score *= (1 + len(matched_keywords) * 0.5)
-            
-            for keyword in keywords:
-                if keyword in file_name.lower():
-                    score *= 2.0
-            
-            if score > 0:
-                scored_docs.append({
-                    "file_name": file_name,
-                    "score": score,
-                    "matched_keywords": matched_keywords,
-                    "content": content,
-                    "best_pos": best_pos
-                })
-        
-        scored_docs.sort(key=lambda x: x["score"], reverse=True)
+            scored_docs.append({
+                "file_name": doc.get("file_name", ""),
+                "score": score,
+                "matched_keywords": matched_keywords,
+                "content": content,
+                "best_pos": max(0, search_index.locate(content, matched_keywords)) if len(scored_docs) < 2 else 0
+            })
         
         if not scored_docs:
             return {
@@ -10629,9 +13098,6 @@ async def search_knowledge_base(query: str) -> dict:
                     "context": context_for_gemini[:4000]
                 }
             
-            genai.configure(api_key=gemini_api_key)
-            model = genai.GenerativeModel('models/gemini-2.0-flash')
-            
             prompt = f"""Bạn là trợ lý AI chuyên trả lời câu hỏi dựa trên tài liệu.
 
 ⚡ QUY TẮC BẮT BUỘC:
@@ -10655,12 +13121,14 @@ async def search_knowledge_base(query: str) -> dict:
 
 🎯 TRẢ LỜI NGAY:"""
 
-            response = model.generate_content(
+            response = await ai_clients.generate(
+                'models/gemini-2.0-flash',
                 prompt,
                 generation_config=genai.types.GenerationConfig(
                     max_output_tokens=500,
                     temperature=0.3  # Low temp cho accurate answers
-                )
+                ),
+                api_key=gemini_api_key
             )
             
             gemini_answer = response.text.strip() if response.text else ""
@@ -10706,22 +13174,17 @@ async def get_knowledge_context(query: str = "", max_chars: int = 10000, use_gem
         use_gemini_filter: Nếu True, sẽ dùng gemini_smart_kb_filter để lọc thông minh (mặc định: False)
     """
     try:
-        # Load index
-        if not KNOWLEDGE_INDEX_FILE.exists():
+        # Load index (snapshot trong RAM - không đọc đĩa)
+        kb = await knowledge_store.current_async()
+        if not kb.documents:
             return {
                 "success": False, 
                 "context": "",
                 "error": "Knowledge base chưa có dữ liệu. Vui lòng index files trước."
             }
         
-        with open(KNOWLEDGE_INDEX_FILE, 'r', encoding='utf-8') as f:
-            index_data = json.load(f)
-        
-        all_documents = index_data.get("documents", [])
-        if not all_documents:
-            return {"success": False, "context": "", "error": "Knowledge base trống."}
-        
-        print(f"📚 [KB] Loaded {len(all_documents)} documents from index")
+        all_documents = list(kb.documents)
+        print(f"📚 [KB] Using {len(all_documents)} documents (index v{kb.version})")
         
         # ============================================================
         # 🔥 OPTION: Sử dụng Gemini Smart Filter nếu được bật
@@ -10756,12 +13219,10 @@ async def get_knowledge_context(query: str = "", max_chars: int = 10000, use_gem
         # BƯỚC 1: Chuẩn bị keywords và query
         # ============================================================
         query_lower = query.lower().strip() if query else ""
+        search_index = kb.search_index
         
-        # Tạo keywords từ query
-        stop_words = {'là', 'của', 'và', 'có', 'các', 'được', 'trong', 'để', 'này', 'đó', 'cho', 'với', 
-                     'từ', 'về', 'như', 'theo', 'không', 'khi', 'đã', 'sẽ', 'ai', 'gì', 'nào', 'đâu',
-                     'a', 'an', 'the', 'is', 'are', 'was', 'were', 'be', 'been', 'what', 'who', 'where'}
-        keywords = [w.lower() for w in query.split() if w.lower() not in stop_words and len(w) > 1] if query else []
+        # Tạo keywords từ query (âm tiết đã bỏ stop word - cùng cách tách với BM25 index)
+        keywords = [surface for _, surface in search_index.query_terms(query) if surface] if query else []
         
         # Nếu không có keywords, dùng toàn bộ query
         if not keywords and query:
@@ -10770,151 +13231,39 @@ async def get_knowledge_context(query: str = "", max_chars: int = 10000, use_gem
         print(f"🔑 [KB] Query: '{query}' → Keywords: {keywords}")
         
         # ============================================================
-        # BƯỚC 2: Lọc và score documents
+        # BƯỚC 2: Lọc và score documents - BM25 (file name > summary/keywords > content)
         # ============================================================
-        scored_documents = []
-        
-        for doc in all_documents:
-            content = doc.get("content", "")
-            file_name = doc.get("file_name", "unknown")
-            content_lower = content.lower()
-            file_name_lower = file_name.lower()
-            
+        def usable(content: str) -> bool:
             # ⚠️ SKIP: PDF structure hoặc content quá ngắn
-            if content.strip().startswith("%PDF-") or content.strip().startswith("<</"):
-                continue
-            if len(content.strip()) < 50:
-                continue
-            
-            # Tính điểm relevance với scoring mới
-            score = 0
-            match_reasons = []
-            has_exact_match = False
-            has_filename_match = False
-            
-            if query_lower:
-                # 0️⃣ FILENAME MATCH (ƯU TIÊN CAO) - Check trước!
-                # Normalize filename để so sánh (bỏ dấu, bỏ ký tự đặc biệt)
-                import unicodedata
-                def normalize_text(text):
-                    # Bỏ dấu tiếng Việt và chuyển thành ASCII
-                    nfkd = unicodedata.normalize('NFKD', text.lower())
-                    return ''.join(c for c in nfkd if not unicodedata.combining(c))
-                
-                query_normalized = normalize_text(query_lower)
-                filename_normalized = normalize_text(file_name_lower)
-                
-                # Full query match trong filename
-                if query_lower in file_name_lower or query_normalized in filename_normalized:
-                    score += 5000
-                    match_reasons.append("filename_exact")
-                    has_filename_match = True
-                else:
-                    # Partial keyword match trong filename
-                    filename_kw_matches = 0
-                    for kw in keywords:
-                        kw_norm = normalize_text(kw)
-                        if kw in file_name_lower or kw_norm in filename_normalized:
-                            filename_kw_matches += 1
-                    
-                    if filename_kw_matches >= 2:
-                        score += 2000 * filename_kw_matches
-                        match_reasons.append(f"filename_partial:{filename_kw_matches}")
-                        has_filename_match = True
-                    elif filename_kw_matches == 1 and len(keywords) <= 2:
-                        score += 500
-                        match_reasons.append(f"filename_partial:{filename_kw_matches}")
-                        has_filename_match = True
-                
-                # 1️⃣ EXACT PHRASE MATCH (ưu tiên CAO NHẤT - ví dụ: "Lê Trung Khoa" as a phrase)
-                exact_count = content_lower.count(query_lower)
-                if exact_count > 0:
-                    score += 5000 * exact_count  # RẤT CAO - ưu tiên tuyệt đối
-                    match_reasons.append(f"exact_phrase:{exact_count}")
-                    has_exact_match = True
-                
-                # 2️⃣ PROXIMITY CHECK - Kiểm tra keywords có gần nhau không (cho tên riêng)
-                # Nếu query có vẻ là tên người (>= 2 từ), kiểm tra xem các từ có liền nhau không
-                has_proximity = False
-                if len(keywords) >= 2 and not has_exact_match:
-                    # Tìm vị trí của mỗi keyword
-                    keyword_positions = []
-                    for kw in keywords:
-                        pos = content_lower.find(kw)
-                        if pos >= 0:
-                            keyword_positions.append((kw, pos))
-                    
-                    # Kiểm tra proximity (trong vòng 50 ký tự)
-                    if len(keyword_positions) == len(keywords):
-                        # Tất cả keywords đều có trong content
-                        positions = [p[1] for p in keyword_positions]
-                        min_pos, max_pos = min(positions), max(positions)
-                        # Nếu tất cả keywords nằm trong 50 ký tự → có thể là tên riêng
-                        if max_pos - min_pos < 50:
-                            has_proximity = True
-                            score += 3000  # Bonus cao cho proximity
-                            match_reasons.append(f"proximity:{max_pos - min_pos}chars")
-                
-                # 3️⃣ KEYWORD MATCH - Đếm số keywords xuất hiện
-                keyword_matches = 0
-                total_kw_score = 0
-                for kw in keywords:
-                    kw_count = content_lower.count(kw)
-                    if kw_count > 0:
-                        total_kw_score += min(kw_count, 5)  # Cap tại 5 lần mỗi keyword
-                        keyword_matches += 1
-                
-                # ⚠️ NẾU LÀ TÊN RIÊNG (>= 2 keywords): Cần có exact match hoặc proximity
-                if len(keywords) >= 2:
-                    if has_exact_match or has_proximity:
-                        # Có exact hoặc proximity → bonus cao
-                        score += 200 * keyword_matches
-                        match_reasons.append(f"name_match:{keyword_matches}/{len(keywords)}")
-                    elif has_filename_match:
-                        # Có filename match → bonus trung bình
-                        score += 100 * keyword_matches
-                        match_reasons.append(f"content_support:{keyword_matches}/{len(keywords)}")
-                    elif keyword_matches == len(keywords):
-                        # Tất cả keywords match nhưng KHÔNG gần nhau → score thấp
-                        score += 20 * keyword_matches  # Thấp hơn nhiều
-                        match_reasons.append(f"scattered_kw:{keyword_matches}/{len(keywords)}")
-                        
-                        # ⚠️ PENALTY MẠNH cho documents dài với scattered keywords
-                        # NHƯNG không penalty nếu có filename match
-                        if len(content) > 5000 and not has_filename_match:
-                            score = int(score * 0.1)  # Giảm 90%!
-                            match_reasons.append("penalty:scattered_in_long_doc")
-                    elif keyword_matches >= len(keywords) * 0.7:
-                        # >= 70% keywords match → score rất thấp
-                        score += 10 * keyword_matches
-                        match_reasons.append(f"partial_kw:{keyword_matches}/{len(keywords)}")
-                    else:
-                        # < 70% keywords → REJECT (trừ khi có filename match)
-                        if not has_exact_match and not has_filename_match:
-                            continue
-                else:
-                    # Single keyword → score thấp hơn
-                    if keyword_matches > 0:
-                        score += 30 * total_kw_score
-                        match_reasons.append(f"single_kw:{total_kw_score}")
-                
-                # ⚠️ REJECT: Không có match nào ý nghĩa
-                if score == 0:
-                    continue
-            else:
-                # Không có query → lấy tất cả (với score dựa trên độ dài content)
-                score = min(len(content), 5000)  # Cap score
-                match_reasons.append("no_query")
-            
-            scored_documents.append({
-                "doc": doc,
-                "score": score,
-                "reasons": match_reasons,
-                "content_len": len(content)
-            })
+            stripped = content.strip()
+            return len(stripped) >= 50 and not stripped.startswith("%PDF-") and not stripped.startswith("<</")
         
-        # Sort by score
-        scored_documents.sort(key=lambda x: x["score"], reverse=True)
+        scored_documents = []
+        if query_lower:
+            # Nhiều từ (vd. tên riêng "Lê Trung Khoa"): phải khớp ≥ 70% số từ;
+            # bigram trong index thưởng các từ đứng liền nhau thay cho exact phrase/proximity cũ
+            min_match = max(1, math.ceil(len(keywords) * 0.7))
+            for score, doc, matched in search_index.search(query, top_k=20, min_match=min_match):
+                content = doc.get("content", "")
+                if usable(content):
+                    scored_documents.append({
+                        "doc": doc,
+                        "score": score,
+                        "reasons": [f"bm25:{len(matched)}/{len(keywords)}"],
+                        "content_len": len(content)
+                    })
+        else:
+            # Không có query → lấy tất cả (với score dựa trên độ dài content)
+            for doc in all_documents:
+                content = doc.get("content", "")
+                if usable(content):
+                    scored_documents.append({
+                        "doc": doc,
+                        "score": min(len(content), 5000),  # Cap score
+                        "reasons": ["no_query"],
+                        "content_len": len(content)
+                    })
+            scored_documents.sort(key=lambda x: x["score"], reverse=True)
         
         print(f"📊 [KB] Scored {len(scored_documents)} relevant documents")
         
@@ -10923,16 +13272,16 @@ async def get_knowledge_context(query: str = "", max_chars: int = 10000, use_gem
         # ============================================================
         if scored_documents and query:
             top_score = scored_documents[0]["score"]
-            # Chỉ lấy documents có score >= 30% top score (hoặc tối thiểu 50 điểm)
-            min_threshold = max(50, top_score * 0.3)
+            # Chỉ lấy documents có score >= 30% top score
+            min_threshold = top_score * 0.3
             filtered_docs = [d for d in scored_documents if d["score"] >= min_threshold]
             
             # Giới hạn tối đa 5 documents để tránh quá tải
             filtered_docs = filtered_docs[:5]
             
-            print(f"🎯 [KB] Filtered to {len(filtered_docs)} docs (threshold: {min_threshold:.0f})")
+            print(f"🎯 [KB] Filtered to {len(filtered_docs)} docs (threshold: {min_threshold:.2f})")
             for i, d in enumerate(filtered_docs[:3]):
-                print(f"   {i+1}. {d['doc']['file_name']}: score={d['score']:.0f} ({', '.join(d['reasons'])})")
+                print(f"   {i+1}. {d['doc']['file_name']}: score={d['score']:.2f} ({', '.join(d['reasons'])})")
         else:
             filtered_docs = scored_documents[:3]  # Lấy tối đa 3 docs nếu không có query
         
@@ -10985,7 +13334,7 @@ async def get_knowledge_context(query: str = "", max_chars: int = 10000, use_gem
                 content = content[:2500] + "\n[... Nội dung tiếp bị cắt ...]"
             
             # Build context entry
-            header = f"\n\n{'='*50}\n📄 {file_name} (score: {item['score']:.0f})\n{'='*50}\n"
+            header = f"\n\n{'='*50}\n📄 {file_name} (score: {item['score']:.1f})\n{'='*50}\n"
             entry = header + content
             
             # Kiểm tra giới hạn tổng chars
@@ -11132,9 +13481,9 @@ async def doc_reader_gemini_rag(
                 "error": "Knowledge base path không hợp lệ. Vui lòng cấu hình thư mục KB."
             }
         
-        # Load index
-        index_data = load_knowledge_index()
-        documents = index_data.get("documents", [])
+        # Load index (snapshot trong RAM - không đọc đĩa)
+        kb = await knowledge_store.current_async()
+        documents = list(kb.documents)
         
         if not documents:
             return {
@@ -11145,6 +13494,9 @@ async def doc_reader_gemini_rag(
         print(f"📚 [RAG] Loaded {len(documents)} documents")
         
         # BƯỚC 2: Chunk documents (chia nhỏ tài liệu)
+        # Semantic: BM25 chọn doc ứng viên trước → chỉ chia chunk các doc đó (không quét cả KB)
+        if use_vector_search:
+            documents = [doc for _, doc, _ in kb.search_index.search(user_query, top_k=max(top_k * 2, 10))]
         all_chunks = []
         for doc in documents:
             content = doc.get("content", "")
@@ -11173,7 +13525,7 @@ async def doc_reader_gemini_rag(
         # BƯỚC 3: Tìm kiếm chunks liên quan
         if use_vector_search:
             # Vector/Semantic Search (simple TF-IDF based)
-            relevant_chunks = _semantic_search_chunks(user_query, all_chunks, top_k)
+            relevant_chunks = _semantic_search_chunks(user_query, all_chunks, top_k, kb.search_index)
         else:
             # Keyword search (fallback)
             relevant_chunks = _keyword_search_chunks(user_query, all_chunks, top_k)
@@ -11185,6 +13537,7 @@ async def doc_reader_gemini_rag(
             }
         
         print(f"🔍 [RAG] Found {len(relevant_chunks)} relevant chunks")
+        await report_progress(f"📚 Tìm thấy {len(relevant_chunks)} đoạn liên quan, đang soạn câu trả lời...", force=True)
         
         # BƯỚC 4: Format context từ relevant chunks
         prompt_context = ""
@@ -11228,11 +13581,10 @@ async def doc_reader_gemini_rag(
                 "error": "Gemini API không khả dụng. Vui lòng kiểm tra API key."
             }
         
-        import google.generativeai as genai
-        genai.configure(api_key=GEMINI_API_KEY)
-        model = genai.GenerativeModel('models/gemini-3-flash-preview')
+        model = ai_clients.gemini_model('models/gemini-3-flash-preview')
         
-        response = model.generate_content(
+        response_text = await gemini_generate_with_progress(
+            model,
             final_prompt,
             generation_config=genai.types.GenerationConfig(
                 temperature=0.3,  # Focused and factual
@@ -11240,18 +13592,18 @@ async def doc_reader_gemini_rag(
             )
         )
         
-        if not response or not response.text:
+        if not response_text:
             return {
                 "success": False,
                 "error": "Gemini không trả về response."
             }
         
-        print(f"✅ [RAG] Generated response ({len(response.text)} chars)")
+        print(f"✅ [RAG] Generated response ({len(response_text)} chars)")
         
         # Return full result
         return {
             "success": True,
-            "response_text": response.text.strip(),
+            "response_text": response_text.strip(),
             "query": user_query,
             "sources": sources,
             "chunks_used": len(relevant_chunks),
@@ -11266,46 +13618,15 @@ async def doc_reader_gemini_rag(
         return {"success": False, "error": str(e)}
 
 
-def _semantic_search_chunks(query: str, chunks: list, top_k: int = 5) -> list:
+def _semantic_search_chunks(query: str, chunks: list, top_k: int = 5, search_index: "KnowledgeSearchIndex" = None) -> list:
     """
-    Tìm kiếm semantic dựa trên TF-IDF scoring
+    Tìm kiếm semantic dựa trên BM25 (IDF của cả Knowledge Base, chunk chỉ lấy từ doc ứng viên)
     """
-    import math
-    
-    # Extract keywords from query
-    stop_words = {'là', 'của', 'và', 'có', 'các', 'được', 'trong', 'để', 'này', 'đó', 
-                  'cho', 'với', 'từ', 'về', 'như', 'theo', 'không', 'khi', 'đã', 'sẽ',
-                  'a', 'an', 'the', 'is', 'are', 'was', 'were', 'be', 'been', 'being'}
-    
-    keywords = [w.lower() for w in query.split() if w.lower() not in stop_words and len(w) > 2]
-    
-    if not keywords:
-        keywords = [query.lower()]
-    
-    # Score each chunk
-    scored_chunks = []
-    for chunk in chunks:
-        text_lower = chunk['text'].lower()
-        score = 0
-        
-        for keyword in keywords:
-            count = text_lower.count(keyword)
-            if count > 0:
-                # TF-IDF inspired scoring
-                score += math.log(1 + count) * 10
-        
-        # Multi-keyword bonus
-        matched = sum(1 for kw in keywords if kw in text_lower)
-        if matched > 1:
-            score *= (1 + matched * 0.3)
-        
-        if score > 0:
-            chunk['score'] = score
-            scored_chunks.append(chunk)
+    if search_index is None:
+        search_index = knowledge_store.current().search_index
     
-    # Sort by score and return top K
-    scored_chunks.sort(key=lambda x: x['score'], reverse=True)
-    return scored_chunks[:top_k]
+    ranked = search_index.rank_passages(query, [chunk['text'] for chunk in chunks], top_k)
+    return [dict(chunks[i], score=score) for score, i in ranked]
 
 
 def _keyword_search_chunks(query: str, chunks: list, top_k: int = 5) -> list:
@@ -11393,7 +13714,8 @@ async def get_fuel_price_vietnam() -> dict:
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-async def lock_computer() -> dict:
+@blocking_handler
+def lock_computer() -> dict:
     """
     Khóa màn hình máy tính (Win+L).
     """
@@ -11474,7 +13796,8 @@ async def set_dark_mode(enable: bool = True) -> dict:
 # � NETWORK/FIREWALL CHECK TOOLS - Kiểm tra quyền kết nối mạng
 # ============================================================
 
-async def check_network_permission() -> dict:
+@blocking_handler
+def check_network_permission() -> dict:
     """
     Kiểm tra quyền kết nối mạng (Windows Firewall) và trạng thái Internet.
     Hướng dẫn người dùng cấp quyền nếu chưa có.
@@ -11527,7 +13850,8 @@ async def check_network_permission() -> dict:
         return {"success": False, "error": str(e)}
 
 
-async def request_firewall_permission() -> dict:
+@blocking_handler
+def request_firewall_permission() -> dict:
     """
     Yêu cầu cấp quyền Firewall cho ứng dụng (cần quyền Admin).
     """
@@ -11552,7 +13876,8 @@ async def request_firewall_permission() -> dict:
         return {"success": False, "error": str(e)}
 
 
-async def check_internet_connection() -> dict:
+@blocking_handler
+def check_internet_connection() -> dict:
     """
     Kiểm tra kết nối Internet và độ trễ mạng.
     """
@@ -11590,7 +13915,7 @@ async def send_message_to_llm(message: str, device_index: int = None, wait_respo
     
     Args:
         message: Tin nhắn/câu hỏi muốn gửi cho LLM
-        device_index: Index thiết bị (0, 1, 2). None = thiết bị đang active
+        device_index: Index thiết bị (0..N-1 theo xiaozhi_endpoints.json). None = thiết bị đang active
         wait_response: KHÔNG SỬ DỤNG - để tương thích API cũ
         timeout: KHÔNG SỬ DỤNG - để tương thích API cũ
         
@@ -11605,10 +13930,10 @@ async def send_message_to_llm(message: str, device_index: int = None, wait_respo
             device_index = active_endpoint_index
         
         # Validate device_index
-        if device_index not in [0, 1, 2]:
+        if not isinstance(device_index, int) or not 0 <= device_index < len(endpoints_config):
             return {
                 "success": False,
-                "error": f"Invalid device_index: {device_index}. Must be 0, 1, or 2."
+                "error": f"Invalid device_index: {device_index}. Must be 0..{len(endpoints_config) - 1}."
             }
         
         # Kiểm tra kết nối WebSocket
@@ -11681,6 +14006,9 @@ async def send_message_to_llm(message: str, device_index: int = None, wait_respo
         }
 
 
+BROADCAST_DEVICE_TIMEOUT = 5  # seconds - timeout gửi cho mỗi thiết bị khi broadcast
+
+
 async def broadcast_to_all_llm(message: str, wait_response: bool = False) -> dict:
     """
     Gửi tin nhắn đến TẤT CẢ thiết bị LLM đang kết nối.
@@ -11692,27 +14020,33 @@ async def broadcast_to_all_llm(message: str, wait_response: bool = False) -> dic
     Returns:
         dict với kết quả gửi cho từng thiết bị
     """
-    global xiaozhi_connected
-    
     results = {
         "success": True,
         "message": message,
         "devices": []
     }
     
-    sent_count = 0
-    for device_index in [0, 1, 2]:
-        if xiaozhi_connected.get(device_index, False):
-            result = await send_message_to_llm(
-                message=message,
-                device_index=device_index
+    # Gửi song song, mỗi thiết bị có timeout riêng → 1 thiết bị chậm không kéo cả nhóm
+    async def _send_one(device_index: int) -> dict:
+        try:
+            return await asyncio.wait_for(
+                send_message_to_llm(message=message, device_index=device_index),
+                timeout=BROADCAST_DEVICE_TIMEOUT
             )
-            results["devices"].append({
-                "device_index": device_index,
-                "result": result
-            })
-            if result.get("success"):
-                sent_count += 1
+        except asyncio.TimeoutError:
+            return {"success": False, "error": f"Timeout sau {BROADCAST_DEVICE_TIMEOUT}s"}
+    
+    device_indices = connection_supervisor.connected_indices()
+    device_results = await asyncio.gather(*[_send_one(i) for i in device_indices])
+    
+    sent_count = 0
+    for device_index, result in zip(device_indices, device_results):
+        results["devices"].append({
+            "device_index": device_index,
+            "result": result
+        })
+        if result.get("success"):
+            sent_count += 1
     
     results["sent_count"] = sent_count
     results["total_connected"] = sum(1 for v in xiaozhi_connected.values() if v)
@@ -11724,29 +14058,82 @@ async def broadcast_to_all_llm(message: str, wait_response: bool = False) -> dic
     return results
 
 
+# ============================================================
+# 🌉 SYNC → ASYNC BRIDGE - Gọi coroutine từ code đồng bộ / thread khác
+# ============================================================
+# Coroutine luôn chạy trên event loop của server (nơi sở hữu các WebSocket),
+# thay vì tạo ThreadPoolExecutor + asyncio.run (loop mới) cho mỗi lần gọi.
+
+
+class LoopBridge:
+    """Đẩy coroutine lên loop chính bằng run_coroutine_threadsafe, có timeout + Future kết quả"""
+
+    def __init__(self):
+        self._loop = None
+        self._fallback = None  # Loop nền dùng khi server loop chưa chạy (VD: script/CLI)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.timeouts = 0
+
+    def bind(self, loop: asyncio.AbstractEventLoop = None):
+        """Gắn bridge vào loop của server (gọi trong startup)"""
+        self._loop = loop or asyncio.get_running_loop()
+
+    def _target_loop(self) -> asyncio.AbstractEventLoop:
+        loop = self._loop
+        if loop is not None and loop.is_running():
+            return loop
+        with self._lock:
+            if self._fallback is None:
+                self._fallback = asyncio.new_event_loop()
+                threading.Thread(target=self._fallback.run_forever, name="miniz-loop-bridge", daemon=True).start()
+            return self._fallback
+
+    def submit(self, coro) -> concurrent.futures.Future:
+        """Lên lịch coroutine, trả về concurrent.futures.Future (không block)"""
+        self.calls += 1
+        return asyncio.run_coroutine_threadsafe(coro, self._target_loop())
+
+    def run(self, coro, timeout: float = None):
+        """Chạy coroutine và chờ kết quả. Timeout → hủy coroutine + raise TimeoutError"""
+        loop = self._target_loop()
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            coro.close()
+            raise RuntimeError("LoopBridge.run() called on the event loop thread - use await instead")
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            self.timeouts += 1
+            future.cancel()
+            raise
+
+    def call_soon(self, callback, *args):
+        """Gọi hàm đồng bộ trên loop chính (VD: web_hub.publish từ thread VLC)"""
+        self._target_loop().call_soon_threadsafe(callback, *args)
+
+    def snapshot(self) -> dict:
+        return {"bound": self._loop is not None, "calls": self.calls, "timeouts": self.timeouts}
+
+
+loop_bridge = LoopBridge()
+
+
 def send_message_to_llm_sync(message: str, device_index: int = None, wait_response: bool = False, timeout: int = 30) -> dict:
     """
-    Wrapper đồng bộ cho send_message_to_llm (dùng trong TOOLS handler)
+    Wrapper đồng bộ cho send_message_to_llm (gọi từ thread, KHÔNG gọi trên event loop)
     """
     try:
-        loop = asyncio.get_event_loop()
-        if loop.is_running():
-            # Nếu đang trong async context, tạo task
-            import concurrent.futures
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                future = executor.submit(
-                    asyncio.run,
-                    send_message_to_llm(message, device_index)
-                )
-                return future.result(timeout=timeout + 5)
-        else:
-            return loop.run_until_complete(
-                send_message_to_llm(message, device_index)
-            )
+        return loop_bridge.run(send_message_to_llm(message, device_index), timeout=timeout + 5)
+    except concurrent.futures.TimeoutError:
+        return {"success": False, "error": f"Timeout sau {timeout + 5}s"}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-
 TOOLS = {
     # ============================================================
     # 📨 SEND MESSAGE TO LLM - Gửi tin nhắn cho robot/LLM tự trả lời
@@ -11762,7 +14149,7 @@ TOOLS = {
             },
             "device_index": {
                 "type": "integer",
-                "description": "Index thiết bị (0, 1, hoặc 2). Mặc định: thiết bị đang active. 0=Thiết bị 1, 1=Thiết bị 2, 2=Thiết bị 3",
+                "description": "Index thiết bị (0, 1, 2, ...). Mặc định: thiết bị đang active. 0=Thiết bị 1, 1=Thiết bị 2, 2=Thiết bị 3",
                 "required": False
             },
             "wait_response": {
@@ -11796,6 +14183,7 @@ TOOLS = {
     
     "get_hardware_specs": {
         "handler": get_system_info,
+        "timeout": 20,
         "description": "💻🔥 SPECS CẤU HÌNH HARDWARE - DUY NHẤT tool cho câu hỏi: 'cấu hình máy tính gì', 'máy tính này như thế nào', 'card đồ họa gì', 'CPU gì', 'GPU gì', 'mainboard gì', 'thế hệ CPU', 'RTX RTX mấy', 'Intel thế hệ mấy', 'AMD Ryzen mấy'. Trả về: CPU generation (Intel 13th gen), GPU series (RTX 4080), motherboard, BIOS, RAM specs. KHÔNG dùng cho performance monitoring!",
         "parameters": {
             "category": {
@@ -11919,6 +14307,7 @@ TOOLS = {
     },
     "play_music_from_user_folder": {
         "handler": play_music_from_user_folder,
+        "timeout": 15,
         "description": "🎵 [PYTHON-VLC] ⭐ ƯU TIÊN #1: Phát nhạc từ THƯ MỤC NGƯỜI DÙNG ĐÃ CẤU HÌNH (link riêng). Khi user nói 'phát nhạc từ thư mục của tôi', 'play từ folder F:', 'nhạc trong ổ D' → DÙNG TOOL NÀY! Tìm theo tên bài: filename='tên bài'. NHANH vì dùng Python-VLC nội bộ. Nếu chưa config thì báo lỗi → user cần vào Music Settings.",
         "parameters": {
             "filename": {
@@ -11983,7 +14372,8 @@ TOOLS = {
     # ============================================================
     "list_music": {
         "handler": list_music, 
-        "description": "📂 [LOCAL MUSIC] Liệt kê tất cả nhạc trong thư viện music_library. Triggers: 'xem danh sách nhạc', 'có bài gì', 'list music'. Auto-play mặc định = True (phát bài đầu tiên). Dùng subfolder='Pop' để lọc theo thể loại.", 
+        "timeout": 15,
+        "description": "📂 [LOCAL MUSIC] Liệt kê tất cả nhạc trong thư viện music_library. Triggers: 'xem danh sách nhạc', 'có bài gì', 'list music'. Auto-play mặc định = True (phát bài đầu tiên). Dùng subfolder='Pop' để lọc theo thể loại. Kết quả phân trang: page/page_size, has_more=True → gọi tiếp page+1.", 
         "parameters": {
             "subfolder": {
                 "type": "string", 
@@ -11994,11 +14384,22 @@ TOOLS = {
                 "type": "boolean",
                 "description": "Tự động phát bài đầu tiên? Default=True. Set False nếu chỉ muốn xem danh sách.",
                 "required": False
+            },
+            "page": {
+                "type": "integer",
+                "description": "Trang kết quả (bắt đầu từ 1). Default=1.",
+                "required": False
+            },
+            "page_size": {
+                "type": "integer",
+                "description": "Số bài mỗi trang (tối đa 500). Default=50.",
+                "required": False
             }
         }
     },
     "play_music": {
         "handler": play_music, 
+        "timeout": 15,
         "description": "🎵 PHÁT NHẠC LOCAL (Python-VLC) - Triggers: 'phát nhạc', 'bật nhạc', 'mở nhạc', 'nghe nhạc', 'play nhạc', 'phát bài [tên]', 'phat nhac', 'bat nhac'. VD: 'phát bài đa nghi' → play_music(filename='đa nghi'). ⚠️ Nếu user nói 'youtube/video' → dùng open_youtube!", 
         "parameters": {
             "filename": {
@@ -12032,6 +14433,7 @@ TOOLS = {
     # 🌟 SMART MUSIC CONTROL - Tool thông minh nhất
     "smart_music_control": {
         "handler": smart_music_control,
+        "timeout": 15,
         "description": "🎵🔥 ĐIỀU KHIỂN NHẠC THÔNG MINH - ⭐ GỌI KHI nghe: 'bài tiếp/next/chuyển bài', 'bài trước/quay lại', 'dừng/pause/tạm dừng', 'tắt nhạc/stop', 'phát bài [tên]', 'tăng/giảm âm lượng'. Voice: 'bai tiep', 'bai truoc', 'dung nhac', 'tam dung', 'pao'. VD: smart_music_control('bài tiếp'), smart_music_control('dừng'). Tool tự xử lý tất cả!",
         "parameters": {
             "command": {
@@ -12104,7 +14506,8 @@ TOOLS = {
     },
     "search_music": {
         "handler": search_music, 
-        "description": "🔍 TÌM NHẠC THEO TỪ KHÓA - Triggers: 'tìm bài [keyword]', 'search nhạc', 'có bài nào tên', 'tim bai', 'search bai'. Tìm trong thư viện local, hỗ trợ tiếng Việt, auto-play mặc định.", 
+        "timeout": 15,
+        "description": "🔍 TÌM NHẠC THEO TỪ KHÓA - Triggers: 'tìm bài [keyword]', 'search nhạc', 'có bài nào tên', 'tim bai', 'search bai', 'nhạc của [ca sĩ]'. Tìm trong thư viện local theo tên file + tag (ca sĩ/album/tiêu đề), hỗ trợ tiếng Việt, auto-play mặc định.", 
         "parameters": {
             "keyword": {
                 "type": "string", 
@@ -12115,6 +14518,21 @@ TOOLS = {
                 "type": "boolean",
                 "description": "Tự động phát bài đầu tiên? Default=True.",
                 "required": False
+            },
+            "page": {
+                "type": "integer",
+                "description": "Trang kết quả (bắt đầu từ 1). Default=1.",
+                "required": False
+            },
+            "page_size": {
+                "type": "integer",
+                "description": "Số bài mỗi trang (tối đa 500). Default=50.",
+                "required": False
+            },
+            "search_by": {
+                "type": "string",
+                "description": "Tìm theo: 'all' (mặc định, tên file + tag), 'name', 'artist' (ca sĩ), 'album', 'title'.",
+                "required": False
             }
         }
     },
@@ -12122,6 +14540,7 @@ TOOLS = {
     # QUICK WEBSITE ACCESS TOOLS
     "open_youtube": {
         "handler": open_youtube, 
+        "timeout": 20,
         "description": "📺 MỞ YOUTUBE - Triggers: 'mở youtube', 'vào youtube', 'xem youtube', 'youtube [tên video]'. ✨ NEW: TỰ ĐỘNG phát video trực tiếp nếu query CỤ THỂ (>= 2 từ)! VD: 'mở youtube Lạc Trôi' → Mở video trực tiếp (không phải search page). Query 1 từ → mở search page.", 
         "parameters": {
             "search_query": {
@@ -12133,6 +14552,7 @@ TOOLS = {
     },
     "search_youtube_video": {
         "handler": search_youtube_video,
+        "timeout": 20,
         "description": "🔍 TÌM VIDEO YOUTUBE (Explicit) - ⚠️ CHỈ dùng khi user YÊU CẦU 'tìm video', 'search video', hoặc muốn xem top 5 results. Còn lại DÙNG open_youtube (đã có auto-detect direct video). VD: 'tìm video Sơn Tùng' → search_youtube_video. 'mở youtube Sơn Tùng Chúng Ta' → open_youtube (preferred).",
         "parameters": {
             "video_title": {
@@ -12567,11 +14987,13 @@ TOOLS = {
     },
     "get_gold_price": {
         "handler": get_gold_price,
+        "timeout": 20,
         "description": "Lấy giá vàng hôm nay từ BNews RSS feed. Hiển thị giá mua vào và bán ra của các loại vàng phổ biến (SJC, 9999, nhẫn tròn, v.v.). Tự động cập nhật giá mới nhất.",
         "parameters": {}
     },
     "analyze_gold_price_with_ai": {
         "handler": analyze_gold_price_with_ai,
+        "timeout": 60,
         "description": "Phân tích thông minh giá vàng với AI (Gemini 3 Flash Preview + Google Search). So sánh giá hiện tại vs lịch sử, phân tích xu hướng, nguyên nhân biến động, dự báo, và khuyến nghị đầu tư chuyên sâu. Dùng khi cần phân tích chuyên môn về thị trường vàng.",
         "parameters": {
             "analysis_type": {
@@ -12585,6 +15007,7 @@ TOOLS = {
     # AI ASSISTANT TOOLS
     "ask_gemini": {
         "handler": ask_gemini,
+        "timeout": 60,
         "description": "✅ ƯU TIÊN DÙNG TOOL NÀY cho MỌI CÂU HỎI (MIỄN PHÍ 1500 requests/day). Gemini trả lời TRỰC TIẾP, NHANH, CHÍNH XÁC. Hữu ích cho: câu hỏi thông thường ('thủ tướng VN 2023 là ai', 'what is...', 'how to...'), phân tích, viết nội dung, dịch thuật, lịch sử, kiến thức tổng quát. Knowledge cutoff: ~10/2024 (đủ cho hầu hết câu hỏi). CHỈ dùng search_google_text nếu CẦN thông tin SAU 10/2024.",
         "parameters": {
             "prompt": {
@@ -12602,6 +15025,7 @@ TOOLS = {
     
     "ask_gpt4": {
         "handler": ask_gpt4,
+        "timeout": 60,
         "description": "TRẢ LỜI CÂU HỎI bằng OpenAI GPT-4 (TRẢ PHÍ, cần API key). DÙNG KHI CẦN: 1) Thông tin MỚI HƠN (knowledge đến 04/2024), 2) Phân tích PHỨC TẠP, 3) Reasoning SÂU, 4) Code generation chuyên nghiệp. GPT-4 MẠN HƠN Gemini cho code và phân tích, nhưng TRẢ PHÍ (~$0.01-0.03/1K tokens). Chọn GPT-4 khi cần chất lượng tối đa.",
         "parameters": {
             "prompt": {
@@ -12662,6 +15086,7 @@ TOOLS = {
     },
     "gemini_text_to_speech": {
         "handler": gemini_text_to_speech,
+        "timeout": 60,
         "description": "🎙️ ĐỌC TO TRÊN MÁY TÍNH - Gemini TTS chất lượng cao. ƯU TIÊN DÙNG TOOL NÀY khi user nói: 'đọc to', 'đọc trên máy tính', 'đọc văn bản', 'text to speech', 'tts', 'đọc cho tôi nghe', 'phát âm', 'nói ra', 'đọc bằng AI', 'đọc bằng gemini'. Giọng Việt tự nhiên, 5 voice: Aoede/Kore (nữ), Puck/Charon/Fenrir (nam). Examples: 'đọc to: xin chào', 'đọc trên máy tính văn bản này'.",
         "parameters": {
             "text": {
@@ -12688,6 +15113,7 @@ TOOLS = {
     },
     "text_to_speech": {
         "handler": text_to_speech,
+        "timeout": 60,
         "description": "TEXT-TO-SPEECH BACKUP: Dùng gTTS/Windows SAPI khi Gemini TTS không khả dụng. KHÔNG ƯU TIÊN - chỉ dùng khi gemini_text_to_speech fail. Chất lượng thấp hơn Gemini TTS.",
         "parameters": {
             "text": {
@@ -12709,6 +15135,7 @@ TOOLS = {
     },
     "speech_to_text": {
         "handler": speech_to_text,
+        "timeout": 45,
         "description": "SPEECH-TO-TEXT (STT): Chuyển GIỌNG NÓI thành VĂN BẢN. Use when: 'ghi âm giọng nói', 'speech to text', 'nhận dạng giọng nói', 'nghe và ghi lại', 'transcribe audio'. Dùng Google Speech Recognition (cần Internet). Hỗ trợ tiếng Việt + English. Examples: 'ghi âm 10 giây', 'nhận dạng giọng nói của tôi', 'speech to text'.",
         "parameters": {
             "duration": {
@@ -12904,6 +15331,7 @@ TOOLS = {
     },
     "get_knowledge_context": {
         "handler": get_knowledge_context,
+        "timeout": 60,
                 "description": "📚 LẤY CONTEXT TỪ CƠ SỞ DỮ LIỆU TÀI LIỆU (Knowledge Base) - ⚡ GỌI ĐẦU TIÊN khi user hỏi về: dữ liệu cá nhân, tài liệu đã lưu, thông tin trong files, cơ sở dữ liệu nội bộ, knowledge base. Tool này tìm kiếm trong TẤT CẢ documents đã được index và trả về context đầy đủ nhất. ⛔ TRIGGERS BẮT BUỘC: 'cơ sở dữ liệu', 'database', 'knowledge base', 'tài liệu của tôi', 'thông tin trong file', 'theo dữ liệu', 'dữ liệu đã lưu', 'based on my docs', 'what's in my documents', 'tìm trong tài liệu', 'search my files', hỏi về TÊN NGƯỜI/DỰ ÁN cụ thể (có thể trong docs). ⚠️ QUAN TRỌNG: SAU KHI NHẬN CONTEXT, BẠN PHẢI ĐỌC VÀ TRẢ LỜI USER DỰA TRÊN CONTEXT ĐÓ! KHÔNG CHỈ DUMP CONTEXT RA! QUY TRÌNH: 1) Gọi get_knowledge_context(query='keywords') 2) Nhận context từ docs 3) ⚡ ĐỌC CONTEXT VÀ TRẢ LỜI CÂU HỎI USER THEO CONTEXT ĐÓ ⚡. VD: 'Nguyễn Văn A làm gì?' → get_knowledge_context(query='Nguyễn Văn A') → Đọc context → Trả lời 'Nguyễn Văn A là...' | 'Thông tin trong cơ sở dữ liệu về dự án X?' → get_knowledge_context(query='dự án X') → Đọc context → Trả lời thông tin dự án X | 'Tài liệu nói gì về ABC?' → get_knowledge_context(query='ABC') → Đọc context → Tóm tắt nội dung về ABC.",
         "parameters": {
             "query": {
@@ -12926,6 +15354,7 @@ TOOLS = {
     
     "doc_reader_gemini_rag": {
         "handler": doc_reader_gemini_rag,
+        "timeout": 90,
         "description": "📖 RAG NÂNG CAO - Đọc, tìm kiếm VÀ TRẢ LỜI TỰ ĐỘNG từ Knowledge Base bằng Gemini AI. Tool này TỰ ĐỘNG xử lý toàn bộ quy trình: chunk documents → semantic search → generate response. ⚡ DÙNG KHI: User muốn câu trả lời TRỰC TIẾP thay vì chỉ context. Khác với get_knowledge_context (chỉ trả context), tool này TRẢ LỜI LUÔN. VD: 'Hỏi tài liệu về X', 'Tóm tắt thông tin Y từ KB', 'Giải thích Z dựa trên docs'. Hỗ trợ semantic search (vector-like) cho độ chính xác cao.",
         "parameters": {
             "user_query": {
@@ -12952,6 +15381,7 @@ TOOLS = {
     
     "gemini_smart_kb_filter": {
         "handler": gemini_smart_kb_filter,
+        "timeout": 60,
         "description": "🔥⚡ GEMINI FLASH LỌC THÔNG TIN THÔNG MINH - Sử dụng sức mạnh AI Gemini Flash để LỌC, TÌM KIẾM và TRÍCH XUẤT thông tin CHÍNH XÁC từ Knowledge Base. Tool này LOẠI BỎ NOISE, chỉ trả về content THỰC SỰ LIÊN QUAN. 🎯 DÙNG KHI: 1) KB có nhiều documents dài, 2) Cần lọc chính xác thông tin cụ thể, 3) Muốn tóm tắt/trích xuất facts, 4) get_knowledge_context trả về quá nhiều noise. ⚡ ƯU ĐIỂM: Gemini AI đọc và hiểu ngữ cảnh, lọc thông minh hơn TF-IDF. Triggers: 'lọc thông tin', 'tìm chính xác', 'trích xuất từ database', 'dùng AI lọc', 'smart search KB'. VD: 'Dùng AI lọc thông tin về dự án X', 'Trích xuất facts về nhân viên A từ KB'.",
         "parameters": {
             "user_query": {
@@ -12983,6 +15413,7 @@ TOOLS = {
     
     "gemini_smart_analyze": {
         "handler": gemini_smart_analyze,
+        "timeout": 90,
         "description": "🔥🌐⚡⚡ PHÂN TÍCH THÔNG MINH (Gemini + Web) - ⛔⛔ BẮT BUỘC DÙNG NGAY khi user nói: 'phân tích', 'analyze', 'tìm hiểu', 'nghiên cứu', 'đánh giá', 'so sánh', 'review', 'xu hướng', 'trend'. ❌ KHÔNG DÙNG web_search khi có các từ này! Tool này TỰ ĐỘNG: 1) Tìm Google, 2) Gemini phân tích, 3) Trả kết quả hoàn chỉnh. VD: 'phân tích thị trường', 'tìm hiểu về AI', 'đánh giá iPhone', 'xu hướng 2025'.",
         "parameters": {
             "user_query": {
@@ -13078,9 +15509,590 @@ TOOLS = {
                 "required": True
             }
         }
-    }
+    }
+}
+
+# 🧪 Tool giả lập cho benchmark offline (chỉ bật khi chạy với mcp_loadtest.py)
+if os.environ.get("XIAOZHI_LOADTEST"):
+    async def loadtest_sleep(delay_ms: int = 0, block_ms: int = 0) -> dict:
+        """Tool benchmark: chờ async delay_ms, rồi block event loop block_ms (mô phỏng tool blocking)"""
+        if delay_ms:
+            await asyncio.sleep(delay_ms / 1000)
+        if block_ms:
+            time.sleep(block_ms / 1000)
+        return {"success": True, "delay_ms": delay_ms, "block_ms": block_ms}
+
+    TOOLS["loadtest_sleep"] = {
+        "handler": loadtest_sleep,
+        "description": "🧪 LOADTEST - Tool giả lập độ trễ cho mcp_loadtest.py",
+        "parameters": {
+            "delay_ms": {"type": "integer", "description": "Thời gian chờ async (ms)", "required": False},
+            "block_ms": {"type": "integer", "description": "Thời gian block event loop (ms)", "required": False}
+        }
+    }
+    print("🧪 [LoadTest] XIAOZHI_LOADTEST enabled - registered loadtest_sleep tool")
+
+# ============================================================
+# 📋 TOOLS/LIST CATALOG - Schema biên dịch sẵn, cache JSON và phân trang
+# ============================================================
+
+TOOLS_LIST_PAGE_SIZE = 40  # Số tool mỗi trang tools/list (dùng nextCursor cho trang sau)
+
+# Profile tool cho từng endpoint - khai báo trong xiaozhi_endpoints.json:
+#   {"name": "Robot phòng khách", "token": "...", "tool_profile": "music"}
+# hoặc danh sách cụ thể: {"tools": ["play_music", "pause_music", ...]}
+# None = toàn bộ TOOLS
+TOOL_PROFILES = {
+    "full": None,
+    "music": [
+        'smart_music_control', 'detect_and_execute_music', 'play_music', 'pause_music',
+        'resume_music', 'stop_music', 'music_next', 'music_previous', 'music_volume',
+        'seek_music', 'get_music_status', 'list_music', 'search_music',
+        'play_music_from_user_folder', 'save_music_folder_config', 'smart_media_control',
+        'open_youtube', 'search_youtube_video', 'open_youtube_playlist',
+        'set_volume', 'get_volume', 'volume_up', 'volume_down', 'mute_volume', 'unmute_volume',
+        'get_current_time',
+    ],
+    "assistant": [
+        'ask_gemini', 'ask_gpt4', 'web_search', 'get_realtime_info', 'smart_answer', 'rag_search',
+        'get_knowledge_context', 'search_knowledge_base', 'doc_reader_gemini_rag',
+        'gemini_smart_analyze', 'get_current_time', 'get_lunar_date', 'get_weather_vietnam',
+        'get_gold_price', 'get_exchange_rate_vietnam', 'get_fuel_price_vietnam', 'get_news_vietnam',
+        'get_vnexpress_news', 'get_news_summary', 'search_news', 'get_daily_quote', 'get_joke',
+        'get_horoscope', 'get_today_in_history', 'what_to_eat', 'calculator',
+        'remember_task', 'recall_tasks', 'get_user_context',
+    ],
+}
+
+
+def _compile_tool_schema(name: str, info: dict) -> dict:
+    """Chuyển 1 entry TOOLS thành MCP tool schema (description rút gọn để giảm message size)"""
+    description = info["description"]
+    if len(description) > 100:
+        description = description[:97] + "..."
+    tool = {
+        "name": name,  # Giữ nguyên tên gốc để handler hoạt động
+        "description": description,
+        "inputSchema": {"type": "object", "properties": {}, "required": []}
+    }
+    for pname, pinfo in info["parameters"].items():
+        param_desc = pinfo["description"]
+        if len(param_desc) > 80:
+            param_desc = param_desc[:77] + "..."
+        tool["inputSchema"]["properties"][pname] = {"type": pinfo["type"], "description": param_desc}
+        if pinfo.get("required"):
+            tool["inputSchema"]["required"].append(pname)
+    return tool
+
+
+class ToolSchemaCatalog:
+    """
+    Cache tools/list:
+    - Schema biên dịch 1 lần khi khởi động (hoặc khi TOOLS thay đổi)
+    - Mỗi trang lưu sẵn dạng dict + JSON đã serialize → tools/list chỉ ghép chuỗi
+    - Cursor dạng "<version>:<offset>", version đổi hoặc offset không phải đầu trang
+      (cursor do client tự chế) thì quay về trang đầu → cache tối đa số trang thật của mỗi profile
+    """
+
+    def __init__(self, page_size: int = TOOLS_LIST_PAGE_SIZE):
+        self.page_size = page_size
+        self.version = 0
+        self._fingerprint = None
+        self._schemas = {}
+        self._pages = {}  # (profile_key, offset đầu trang) → (result_dict, result_json)
+
+    def invalidate(self):
+        """Gọi khi sửa nội dung TOOLS tại chỗ (thêm/xóa tool được tự phát hiện)"""
+        self._fingerprint = None
+
+    def compile(self):
+        started = time.perf_counter()
+        self._schemas = {name: _compile_tool_schema(name, info) for name, info in TOOLS.items()}
+        self._pages = {}
+        self._fingerprint = tuple(TOOLS)
+        self.version += 1
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        print(f"📋 [ToolCatalog] Compiled {len(self._schemas)} tool schemas (v{self.version}, {elapsed_ms:.1f}ms)")
+
+    def _ensure_compiled(self):
+        if self._fingerprint != tuple(TOOLS):
+            self.compile()
+
+    @staticmethod
+    def resolve_profile(endpoint: dict = None):
+        """Trả về tuple tên tool của endpoint, hoặc None = toàn bộ"""
+        if not endpoint:
+            return None
+        names = endpoint.get("tools")
+        if names is None:
+            names = TOOL_PROFILES.get(endpoint.get("tool_profile") or "full")
+        if names is None:
+            return None
+        return tuple(n for n in names if n in TOOLS)
+
+    def _parse_cursor(self, cursor) -> int:
+        if not cursor:
+            return 0
+        try:
+            version, offset = str(cursor).split(":", 1)
+            if int(version) != self.version:
+                return 0
+            return max(0, int(offset))
+        except (ValueError, TypeError):
+            return 0
+
+    def get_page(self, cursor: str = "", endpoint: dict = None):
+        """Returns: (result_dict, result_json) của trang tương ứng cursor"""
+        self._ensure_compiled()
+        names = self.resolve_profile(endpoint)
+        offset = self._parse_cursor(cursor)
+        if offset and (not self.page_size or offset % self.page_size):
+            offset = 0
+        key = (names, offset)
+        page = self._pages.get(key)
+        if page is None:
+            all_names = names if names is not None else tuple(self._schemas)
+            if offset and offset >= len(all_names):
+                return self.get_page("", endpoint)
+            chunk = all_names[offset:offset + self.page_size] if self.page_size else all_names[offset:]
+            result = {"tools": [self._schemas[n] for n in chunk]}
+            next_offset = offset + len(chunk)
+            if chunk and next_offset < len(all_names):
+                result["nextCursor"] = f"{self.version}:{next_offset}"
+            page = (result, json.dumps(result, ensure_ascii=False))
+            self._pages[key] = page
+        return page
+
+    def build_response_frame(self, request_id, cursor: str = "", endpoint: dict = None) -> str:
+        """JSON-RPC response hoàn chỉnh cho tools/list, không serialize lại schema"""
+        result, result_json = self.get_page(cursor, endpoint)
+        print(f"📋 [tools/list] Returning {len(result['tools'])} tools to robot"
+              f"{' (more pages)' if 'nextCursor' in result else ''}")
+        return '{"jsonrpc": "2.0", "id": ' + json.dumps(request_id) + ', "result": ' + result_json + '}'
+
+
+tool_catalog = ToolSchemaCatalog()
+tool_catalog.compile()
+
+# ============================================================
+# ⏱️ TOOL EXECUTION POLICY - Deadline, phân loại lỗi, retry có jitter
+# ============================================================
+
+# Tên exception (theo MRO) được coi là lỗi mạng/tạm thời → đáng retry.
+# Dùng tên thay vì import để không phụ thuộc aiohttp/requests/openai/google.
+_RETRYABLE_ERROR_NAMES = {
+    "ClientConnectionError", "ClientConnectorError", "ServerDisconnectedError",
+    "ServerTimeoutError", "ClientPayloadError", "ConnectTimeout", "ReadTimeout",
+    "Timeout", "ChunkedEncodingError", "APIConnectionError", "APITimeoutError",
+    "RateLimitError", "InternalServerError", "ResourceExhausted", "ServiceUnavailable",
+    "DeadlineExceeded", "TooManyRequests", "InvalidStatus", "ConnectionClosedError",
+}
+
+
+class ToolTimeoutError(Exception):
+    """Tool vượt quá deadline cho phép"""
+
+
+def classify_tool_error(error: BaseException) -> str:
+    """
+    Phân loại lỗi của tool:
+    - "retryable": lỗi mạng, timeout, quá tải API → thử lại có thể thành công
+    - "fatal": sai tham số, lỗi validate, lỗi logic → retry chỉ tốn thời gian
+    """
+    if isinstance(error, (TypeError, ValueError, KeyError, AttributeError,
+                          NotImplementedError, PermissionError, FileNotFoundError)):
+        return "fatal"
+    if isinstance(error, (ConnectionError, TimeoutError, asyncio.TimeoutError)):
+        return "retryable"
+    names = {cls.__name__ for cls in type(error).__mro__}
+    if names & _RETRYABLE_ERROR_NAMES:
+        return "retryable"
+    if isinstance(error, OSError):
+        return "retryable"  # socket/DNS errors
+    return "fatal"
+
+
+def retry_backoff_delay(attempt: int) -> float:
+    """Exponential backoff với full jitter (attempt bắt đầu từ 0)"""
+    cap = min(TOOL_RETRY_MAX_DELAY, TOOL_RETRY_BASE_DELAY * (2 ** attempt))
+    return random.uniform(TOOL_RETRY_BASE_DELAY / 2, cap)
+
+
+class ToolLatencyTracker:
+    """Lưu lịch sử latency từng tool để tính timeout tự thích nghi"""
+
+    MIN_SAMPLES = 10   # Cần đủ mẫu mới tin vào thống kê
+    P95_MULTIPLIER = 4  # Timeout >= p95 x 4 (rộng cho dao động mạng)
+    MAX_MULTIPLIER = 1.5  # Timeout >= lần chậm nhất đã thấy x 1.5
+    HIGH_VARIANCE_RATIO = 5  # p95 > 5 x p50 → latency dao động mạnh, giữ trần mặc định
+
+    def __init__(self, history: int = TOOL_LATENCY_HISTORY):
+        self._samples = {}
+        self._lane_waits = {}  # Thời gian chờ lane serial_device - tách riêng, không tính vào timeout
+        self._history = history
+
+    def record(self, tool_name: str, seconds: float):
+        samples = self._samples.get(tool_name)
+        if samples is None:
+            samples = self._samples[tool_name] = deque(maxlen=self._history)
+        samples.append(seconds)
+
+    def record_lane_wait(self, tool_name: str, seconds: float):
+        waits = self._lane_waits.get(tool_name)
+        if waits is None:
+            waits = self._lane_waits[tool_name] = deque(maxlen=self._history)
+        waits.append(seconds)
+
+    def percentile(self, tool_name: str, pct: float, samples=None):
+        samples = self._samples.get(tool_name) if samples is None else samples
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        idx = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+        return ordered[idx]
+
+    def adaptive_timeout(self, tool_name: str) -> float:
+        samples = self._samples.get(tool_name)
+        if not samples or len(samples) < self.MIN_SAMPLES:
+            return TOOL_DEFAULT_TIMEOUT
+        p50 = self.percentile(tool_name, 50)
+        p95 = self.percentile(tool_name, 95)
+        if p95 > p50 * self.HIGH_VARIANCE_RATIO:
+            return TOOL_DEFAULT_TIMEOUT  # Đuôi dài (search, AI...) - p95 của 50 mẫu không đoán được lần chậm kế tiếp
+        adaptive = max(p95 * self.P95_MULTIPLIER, max(samples) * self.MAX_MULTIPLIER)
+        return max(TOOL_MIN_TIMEOUT, min(TOOL_DEFAULT_TIMEOUT, adaptive))
+
+    def snapshot(self) -> dict:
+        stats = {
+            name: {
+                "count": len(samples),
+                "p50_ms": round(self.percentile(name, 50) * 1000, 1),
+                "p95_ms": round(self.percentile(name, 95) * 1000, 1),
+                "timeout_s": round(get_tool_timeout(name), 2),
+            }
+            for name, samples in self._samples.items() if samples
+        }
+        for name, waits in self._lane_waits.items():
+            if waits and name in stats:
+                stats[name]["lane_wait_p95_ms"] = round(self.percentile(name, 95, waits) * 1000, 1)
+        return stats
+
+
+tool_latency_tracker = ToolLatencyTracker()
+
+
+def get_tool_timeout(tool_name: str) -> float:
+    """Deadline của tool: khai báo trong TOOLS, nếu không thì tự thích nghi theo lịch sử"""
+    declared = (TOOLS.get(tool_name) or {}).get("timeout")
+    if declared:
+        return float(declared)
+    return tool_latency_tracker.adaptive_timeout(tool_name)
+
+
+# ============================================================
+# 🧵 TOOL EXECUTION CLASSES - Mỗi tool khai báo nơi chạy handler
+# ============================================================
+# "execution" trong TOOLS:
+#   loop          - chạy thẳng trên event loop (mặc định; tool async thuần, dùng WebSocket/progress/http_client)
+#   io_thread     - thread pool cho I/O blocking (requests, subprocess, file, selenium)
+#   serial_device - 1 thread riêng cho mỗi thiết bị vật lý (VLC, phím media, bàn phím...)
+#                   → lệnh tới cùng thiết bị chạy tuần tự, thiết bị khác không phải chờ
+# Pool chỉ nhận hàm sync (def / @blocking_handler); handler async luôn chạy trên loop chính,
+# lane serial_device giữ thứ tự bằng asyncio.Lock. Hàm sync trong pool không dùng được
+# report_progress/web_hub/WebSocket của loop chính.
+# Không dùng process pool: process con (spawn trên Windows) import lại cả module này cùng
+# mọi side effect lúc import (VLC player, music catalog, cache...) → parse tài liệu chạy io_thread.
+
+TOOL_EXECUTION_POOLS = {
+    "io_thread": 16,
+    "serial_device": 1,  # worker / lane
 }
 
+TOOL_EXECUTION_GROUPS = {
+    "io_thread": [
+        'get_hardware_specs', 'show_notification', 'get_system_resources', 'open_application',
+        'list_running_processes', 'find_process', 'kill_process', 'force_kill_app',
+        'create_file', 'read_file', 'list_files', 'get_battery_status', 'get_network_info',
+        'search_web', 'save_music_folder_config', 'get_active_media_players', 'set_brightness',
+        'get_clipboard', 'play_sound', 'get_disk_usage',
+        'open_youtube_playlist', 'open_facebook', 'open_google', 'open_tiktok', 'open_website',
+        'check_network_permission',
+        'request_firewall_permission', 'check_internet_connection', 'lock_computer',
+        'shutdown_schedule', 'set_theme', 'change_wallpaper', 'get_desktop_path',
+        'save_text_to_file', 'export_conversation', 'list_conversation_files', 'take_screenshot',
+        'browser_open_url', 'browser_get_info', 'browser_click', 'browser_fill_input',
+        'browser_scroll', 'browser_back', 'browser_forward', 'browser_refresh',
+        'browser_screenshot', 'browser_new_tab', 'browser_close_tab', 'browser_execute_js',
+        'browser_close',
+    ],
+    "serial_device": [
+        'smart_music_control', 'detect_and_execute_music', 'play_music', 'pause_music',
+        'resume_music', 'stop_music', 'music_next', 'music_previous', 'music_volume',
+        'seek_music', 'get_music_status', 'list_music', 'search_music',
+        'play_music_from_user_folder', 'smart_media_control',
+        'media_play_pause', 'media_next_track', 'media_previous_track', 'media_stop',
+        'media_control', 'control_vlc', 'vlc_play_pause', 'vlc_stop', 'vlc_next',
+        'vlc_previous', 'vlc_volume_up', 'vlc_volume_down', 'vlc_mute', 'vlc_forward',
+        'vlc_backward', 'control_wmp', 'wmp_play_pause', 'wmp_stop', 'wmp_next',
+        'wmp_previous', 'wmp_volume_up', 'wmp_volume_down', 'wmp_mute',
+        'control_youtube', 'youtube_play_pause', 'youtube_rewind', 'youtube_forward',
+        'youtube_volume_up', 'youtube_volume_down', 'youtube_mute', 'youtube_fullscreen',
+        'youtube_captions', 'youtube_speed',
+        'set_volume', 'get_volume', 'mute_volume', 'unmute_volume', 'volume_up', 'volume_down',
+        'paste_content', 'press_enter', 'undo_operation', 'show_desktop', 'set_clipboard',
+        'find_in_document', 'text_to_speech', 'speech_to_text',
+    ],
+}
+
+for _execution, _names in TOOL_EXECUTION_GROUPS.items():
+    for _name in _names:
+        if _name in TOOLS:
+            TOOLS[_name].setdefault("execution", _execution)
+
+
+class ToolExecutionPool:
+    """Executor theo execution class + số liệu queue depth / latency riêng"""
+
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max_workers
+        self._executors = {}  # lane → executor (serial_device: 1 lane / thiết bị)
+        self._lock = threading.Lock()
+        self._wait = deque(maxlen=TOOL_LATENCY_HISTORY)
+        self._run = deque(maxlen=TOOL_LATENCY_HISTORY)
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+
+    def _executor(self, lane: str):
+        executor = self._executors.get(lane)
+        if executor is None:
+            executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix=f"tool-{self.name}-{lane}"
+            )
+            self._executors[lane] = executor
+        return executor
+
+    def _start(self, state: dict, submitted: float):
+        with self._lock:
+            if state["done"]:
+                return  # Bên gọi đã thôi chờ trước khi job kịp chạy
+            state["started"] = True
+            self.queued -= 1
+            self.running += 1
+            self._wait.append(time.perf_counter() - submitted)
+
+    def _timed(self, state: dict, submitted: float, fn, args):
+        self._start(state, submitted)
+        return fn(*args)
+
+    async def run(self, fn, *args, lane: str = "default"):
+        """Chạy fn(*args) trong pool. Hủy/timeout chỉ bỏ chờ - job đã chạy sẽ chạy nốt"""
+        loop = asyncio.get_running_loop()
+        submitted = time.perf_counter()
+        state = {"started": False, "done": False}
+        with self._lock:
+            self.queued += 1
+        ok = False
+        try:
+            result = await loop.run_in_executor(self._executor(lane), self._timed, state, submitted, fn, args)
+            ok = True
+            return result
+        finally:
+            with self._lock:
+                state["done"] = True
+                if state["started"]:
+                    self.running -= 1
+                else:
+                    self.queued -= 1
+                if ok:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+                self._run.append(time.perf_counter() - submitted)
+
+    def shutdown(self):
+        for executor in self._executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+        self._executors.clear()
+
+    def snapshot(self) -> dict:
+        def pct(samples, p):
+            if not samples:
+                return None
+            ordered = sorted(samples)
+            return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1000, 1)
+
+        return {
+            "workers": self.max_workers,
+            "lanes": len(self._executors),
+            "queued": self.queued,
+            "running": self.running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "wait_p50_ms": pct(self._wait, 50),
+            "wait_p95_ms": pct(self._wait, 95),
+            "total_p50_ms": pct(self._run, 50),
+            "total_p95_ms": pct(self._run, 95),
+        }
+
+
+tool_pools = {name: ToolExecutionPool(name, workers) for name, workers in TOOL_EXECUTION_POOLS.items()}
+_tool_lane_locks = {}  # lane serial_device → asyncio.Lock (handler async giữ lane trên loop chính)
+
+
+def get_blocking_callable(handler):
+    """Hàm sync thật của handler (def thường hoặc @blocking_handler); None nếu là coroutine thuần"""
+    blocking = getattr(handler, "blocking", None)
+    if blocking is not None:
+        return blocking
+    return None if inspect.iscoroutinefunction(handler) else handler
+
+
+def get_tool_execution(tool_name: str) -> str:
+    execution = (TOOLS.get(tool_name) or {}).get("execution", "loop")
+    return execution if execution in tool_pools else "loop"
+
+
+def get_tool_lane_lock(tool_name: str):
+    """asyncio.Lock của lane serial_device mà tool chạy trên đó (None nếu tool không thuộc serial_device)"""
+    if get_tool_execution(tool_name) != "serial_device":
+        return None
+    lane = get_tool_ordering_key(tool_name) or tool_name
+    lock = _tool_lane_locks.get(lane)
+    if lock is None:
+        lock = _tool_lane_locks[lane] = asyncio.Lock()
+    return lock
+
+
+async def run_tool_handler(tool_name: str, args: dict, lane_held: bool = False):
+    """Gọi handler của tool theo execution class khai báo trong TOOLS
+
+    Pool/lane chỉ nhận hàm sync; handler async luôn chạy trên loop chính
+    (phần blocking bên trong tự bọc asyncio.to_thread).
+    lane_held=True: caller đã giữ lock lane serial_device (execute_tool_with_policy).
+    """
+    handler = TOOLS[tool_name]["handler"]
+    execution = get_tool_execution(tool_name)
+    blocking = get_blocking_callable(handler)
+    if execution == "loop" or (blocking is None and execution != "serial_device"):
+        result = handler(**args)
+        return await result if inspect.isawaitable(result) else result
+    pool = tool_pools[execution]
+    if execution == "io_thread":
+        return await pool.run(functools.partial(blocking, **args))
+    # serial_device: lệnh tới cùng thiết bị nối đuôi nhau, dù handler sync hay async
+    lane = get_tool_ordering_key(tool_name) or tool_name
+    lock = None if lane_held else get_tool_lane_lock(tool_name)
+    if lock is not None:
+        await lock.acquire()
+    try:
+        if blocking is None:
+            return await handler(**args)
+        return await pool.run(functools.partial(blocking, **args), lane=lane)
+    finally:
+        if lock is not None:
+            lock.release()
+
+
+async def execute_tool_with_policy(tool_name: str, args: dict):
+    """
+    Chạy handler của tool với:
+    - Deadline tổng cho cả các lần retry (không treo vô hạn)
+    - Chỉ retry lỗi tạm thời, backoff có jitter; lỗi tham số trả về ngay
+    - Hủy được qua asyncio cancellation (notifications/cancelled)
+
+    Tool serial_device: chờ tới lượt trên lane trước, deadline + mẫu latency chỉ tính từ lúc giữ được lane
+    (thời gian xếp hàng ghi riêng vào lane wait), retry giữ nguyên lane để lệnh sau không chen vào giữa.
+
+    Returns: (result, attempts). Raises exception cuối cùng nếu thất bại.
+    """
+    timeout = get_tool_timeout(tool_name)
+    loop = asyncio.get_running_loop()
+    lane_lock = get_tool_lane_lock(tool_name)
+    if lane_lock is None:
+        return await _execute_tool_attempts(tool_name, args, timeout, loop, lane_held=False)
+    queued = loop.time()
+    async with lane_lock:
+        tool_latency_tracker.record_lane_wait(tool_name, loop.time() - queued)
+        return await _execute_tool_attempts(tool_name, args, timeout, loop, lane_held=True)
+
+
+async def _execute_tool_attempts(tool_name: str, args: dict, timeout: float, loop, lane_held: bool):
+    deadline = loop.time() + timeout
+    attempt = 0
+    while True:
+        remaining = deadline - loop.time()
+        started = loop.time()
+        if remaining <= 0:
+            raise ToolTimeoutError(f"timed out after {timeout:g}s")
+        # asyncio.wait (không phải wait_for): hết deadline ↔ task chưa xong. TimeoutError do chính handler
+        # raise (aiohttp ServerTimeoutError, wait_for bên trong...) đi qua phân loại lỗi + retry như lỗi khác
+        task = asyncio.ensure_future(run_tool_handler(tool_name, args, lane_held=lane_held))
+        try:
+            done, _ = await asyncio.wait({task}, timeout=remaining)
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        if not done:
+            task.cancel()
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())  # Không log "exception never retrieved"
+            tool_latency_tracker.record(tool_name, loop.time() - started)
+            raise ToolTimeoutError(f"timed out after {timeout:g}s")
+        try:
+            result = task.result()
+            tool_latency_tracker.record(tool_name, loop.time() - started)
+            return result, attempt + 1
+        except Exception as e:
+            kind = classify_tool_error(e)
+            delay = retry_backoff_delay(attempt)
+            if kind != "retryable" or attempt + 1 >= MAX_TOOL_RETRIES or loop.time() + delay >= deadline:
+                raise
+            attempt += 1
+            print(f"⚠️ [Tool Retry] {tool_name} failed (attempt {attempt}/{MAX_TOOL_RETRIES}): {e} - retry in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+# ============================================================
+# 📈 EVENT LOOP LAG MONITOR - Đo độ trễ event loop (tool blocking, quá tải)
+# ============================================================
+
+class LoopLagMonitor:
+    """Ngủ INTERVAL giây rồi đo thời gian thức dậy trễ bao nhiêu so với dự kiến"""
+
+    INTERVAL = 0.1  # seconds
+
+    def __init__(self, history: int = 600):
+        self._samples = deque(maxlen=history)
+        self._task = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.INTERVAL
+            await asyncio.sleep(self.INTERVAL)
+            self._samples.append(max(0.0, loop.time() - expected))
+
+    def snapshot(self) -> dict:
+        if not self._samples:
+            return {"samples": 0}
+        ordered = sorted(self._samples)
+        pick = lambda pct: round(ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))] * 1000, 2)
+        return {
+            "samples": len(ordered),
+            "p50_ms": pick(50),
+            "p95_ms": pick(95),
+            "p99_ms": pick(99),
+            "max_ms": round(ordered[-1] * 1000, 2),
+        }
+
+
+loop_lag_monitor = LoopLagMonitor()
+
 # ============================================================
 # MINIZ MCP CLIENT
 # ============================================================
@@ -13114,7 +16126,7 @@ def get_vlc_context_for_llm() -> str:
     except:
         return ""
 
-async def handle_xiaozhi_message(message: dict) -> dict:
+async def handle_xiaozhi_message(message: dict, endpoint: dict = None) -> dict:
     method = message.get("method")
     params = message.get("params", {})
     
@@ -13130,38 +16142,9 @@ async def handle_xiaozhi_message(message: dict) -> dict:
             "instructions": full_instructions
         }
     elif method == "tools/list":
-        # Support cursor pagination (từ xiaozhi-esp32-server)
-        cursor = params.get("cursor", "")
-        tools = []
-        for name, info in TOOLS.items():
-            # Sanitize tool name để tương thích với server chính thức
-            sanitized_name = sanitize_tool_name(name) if 'sanitize_tool_name' in dir() else name
-            # Rút gọn description MẠNH để giảm message size (fix "message too big" error)
-            description = info["description"]
-            if len(description) > 100:
-                description = description[:97] + "..."
-            
-            tool = {
-                "name": name,  # Giữ nguyên tên gốc để handler hoạt động
-                "description": description, 
-                "inputSchema": {"type": "object", "properties": {}, "required": []}
-            }
-            for pname, pinfo in info["parameters"].items():
-                # Rút gọn parameter description MẠNH
-                param_desc = pinfo["description"]
-                if len(param_desc) > 80:
-                    param_desc = param_desc[:77] + "..."
-                
-                tool["inputSchema"]["properties"][pname] = {"type": pinfo["type"], "description": param_desc}
-                if pinfo.get("required"):
-                    tool["inputSchema"]["required"].append(pname)
-            tools.append(tool)
-        
-        # Log số lượng tools
-        print(f"📋 [tools/list] Returning {len(tools)} tools to robot")
-        
-        # Response theo format chuẩn với optional nextCursor
-        return {"tools": tools}  # nextCursor sẽ được thêm nếu cần pagination
+        # Schema đã biên dịch sẵn + cursor pagination (từ xiaozhi-esp32-server)
+        result, _ = tool_catalog.get_page(params.get("cursor", ""), endpoint)
+        return result
     elif method == "tools/call":
         tool_name = params.get("name")
         args = params.get("arguments", {})
@@ -13184,80 +16167,534 @@ async def handle_xiaozhi_message(message: dict) -> dict:
             add_to_conversation(role="tool", content=error_msg, metadata={"error": True})
             return {"content": [{"type": "text", "text": error_msg}], "isError": True}
         
-        # Retry mechanism (từ xiaozhi-esp32-server)
-        max_retries = MAX_TOOL_RETRIES
-        retry_interval = TOOL_RETRY_INTERVAL
-        last_error = None
+        # Deadline + retry policy: chỉ retry lỗi tạm thời (mạng/timeout), lỗi tham số trả về ngay
+        try:
+            result, attempts = await execute_tool_with_policy(tool_name, args)
+        except asyncio.CancelledError:
+            print(f"🛑 [Tool Cancelled] {tool_name}")
+            add_to_conversation(role="tool", content=f"Cancelled: {tool_name}", metadata={"error": True, "cancelled": True})
+            raise
+        except Exception as e:
+            error_msg = f"Error calling {tool_name} ({classify_tool_error(e)}): {str(e) or type(e).__name__}"
+            print(f"❌ {error_msg}")
+            add_to_conversation(role="tool", content=error_msg, metadata={"error": True})
+            return {"content": [{"type": "text", "text": error_msg}], "isError": True}
         
-        for attempt in range(max_retries):
-            try:
-                result = await TOOLS[tool_name]["handler"](**args)
-                print(f"✅ [Tool Result] {tool_name}: {result}")
-                
-                # Thêm VLC context vào music-related tools
-                music_tools = ['smart_music_control', 'play_music', 'pause_music', 'resume_music', 
-                              'stop_music', 'music_next', 'music_previous', 'music_volume', 
-                              'get_music_status', 'list_music', 'search_music', 'detect_and_execute_music']
-                if tool_name in music_tools:
-                    result["_vlc_hint"] = "🎵 Đang dùng Python-VLC Player nội bộ. Tiếp tục dùng smart_music_control() cho các lệnh nhạc tiếp theo."
-                
-                # Lưu tool result vào history
-                add_to_conversation(
-                    role="tool",
-                    content=json.dumps(result, ensure_ascii=False),
-                    metadata={
-                        "tool_name": tool_name,
-                        "success": result.get("success", True),
-                        "event_type": "tool_result",
-                        "attempt": attempt + 1
+        try:
+            print(f"✅ [Tool Result] {tool_name}: {result}")
+            
+            # Thêm VLC context vào music-related tools
+            music_tools = ['smart_music_control', 'play_music', 'pause_music', 'resume_music', 
+                          'stop_music', 'music_next', 'music_previous', 'music_volume', 
+                          'get_music_status', 'list_music', 'search_music', 'detect_and_execute_music']
+            if tool_name in music_tools:
+                result["_vlc_hint"] = "🎵 Đang dùng Python-VLC Player nội bộ. Tiếp tục dùng smart_music_control() cho các lệnh nhạc tiếp theo."
+            
+            # Lưu tool result vào history
+            add_to_conversation(
+                role="tool",
+                content=json.dumps(result, ensure_ascii=False),
+                metadata={
+                    "tool_name": tool_name,
+                    "success": result.get("success", True),
+                    "event_type": "tool_result",
+                    "attempt": attempts
+                }
+            )
+            
+            # ⚡ ĐẶC BIỆT: Với get_knowledge_context, trả về context trực tiếp để LLM dễ đọc
+            if tool_name == "get_knowledge_context" and isinstance(result, dict):
+                if result.get("success") and result.get("context"):
+                    # Trả về context trực tiếp - LLM đọc và trả lời ngay (giới hạn 2000 ký tự)
+                    truncated_context = smart_truncate_for_llm(result["context"], MAX_LLM_RESPONSE_CHARS)
+                    return {"content": [{"type": "text", "text": truncated_context}]}
+                elif not result.get("success"):
+                    # Không tìm thấy → trả về message lỗi
+                    error_msg = result.get("error", "Không tìm thấy thông tin trong cơ sở dữ liệu")
+                    return {"content": [{"type": "text", "text": f"❌ {error_msg}"}]}
+            
+            # ⚡ ĐẶC BIỆT: Với ask_gemini, ask_gpt4, gemini_smart_analyze - trả về response text cho LLM cloud tổng hợp
+            # Giống cách web_search hoạt động: trả data đầy đủ → LLM cloud TỰ TÓM TẮT → robot nói
+            if tool_name in ["ask_gemini", "ask_gpt4", "gemini_smart_analyze"] and isinstance(result, dict):
+                if result.get("success") and result.get("response_text"):
+                    response_text = result["response_text"]
+                    # Clean markdown để LLM dễ đọc (nhưng KHÔNG truncate - để LLM cloud tự tóm tắt)
+                    response_text = clean_markdown_for_tts(response_text)
+                    print(f"[{tool_name}] Cleaned response: {len(response_text)} chars (LLM cloud sẽ tóm tắt)")
+                    # Trả về TEXT trực tiếp, LLM cloud sẽ tự tóm tắt trước khi robot nói
+                    return {
+                        "content": [{"type": "text", "text": response_text}]
                     }
-                )
-                
-                # ⚡ ĐẶC BIỆT: Với get_knowledge_context, trả về context trực tiếp để LLM dễ đọc
-                if tool_name == "get_knowledge_context" and isinstance(result, dict):
-                    if result.get("success") and result.get("context"):
-                        # Trả về context trực tiếp - LLM đọc và trả lời ngay (giới hạn 2000 ký tự)
-                        truncated_context = smart_truncate_for_llm(result["context"], MAX_LLM_RESPONSE_CHARS)
-                        return {"content": [{"type": "text", "text": truncated_context}]}
-                    elif not result.get("success"):
-                        # Không tìm thấy → trả về message lỗi
-                        error_msg = result.get("error", "Không tìm thấy thông tin trong cơ sở dữ liệu")
-                        return {"content": [{"type": "text", "text": f"❌ {error_msg}"}]}
-                
-                # ⚡ ĐẶC BIỆT: Với ask_gemini, ask_gpt4, gemini_smart_analyze - trả về response text cho LLM cloud tổng hợp
-                # Giống cách web_search hoạt động: trả data đầy đủ → LLM cloud TỰ TÓM TẮT → robot nói
-                if tool_name in ["ask_gemini", "ask_gpt4", "gemini_smart_analyze"] and isinstance(result, dict):
-                    if result.get("success") and result.get("response_text"):
-                        response_text = result["response_text"]
-                        # Clean markdown để LLM dễ đọc (nhưng KHÔNG truncate - để LLM cloud tự tóm tắt)
-                        response_text = clean_markdown_for_tts(response_text)
-                        print(f"[{tool_name}] Cleaned response: {len(response_text)} chars (LLM cloud sẽ tóm tắt)")
-                        # Trả về TEXT trực tiếp, LLM cloud sẽ tự tóm tắt trước khi robot nói
-                        return {
-                            "content": [{"type": "text", "text": response_text}]
-                        }
-                
-                # 🔄 TRUNCATE: Giới hạn response dưới 2000 ký tự cho LLM
-                formatted_response = format_result_for_llm(result, MAX_LLM_RESPONSE_CHARS)
-                return {"content": [{"type": "text", "text": formatted_response}]}
-            except Exception as e:
-                last_error = e
-                if attempt < max_retries - 1:
-                    print(f"⚠️ [Tool Retry] {tool_name} failed (attempt {attempt + 1}/{max_retries}): {e}")
-                    await asyncio.sleep(retry_interval)
-                else:
-                    error_msg = f"Error calling {tool_name} after {max_retries} attempts: {str(e)}"
-                    print(f"❌ {error_msg}")
+            
+            # 🔄 TRUNCATE: Giới hạn response dưới 2000 ký tự cho LLM
+            formatted_response = format_result_for_llm(result, MAX_LLM_RESPONSE_CHARS)
+            return {"content": [{"type": "text", "text": formatted_response}]}
+        except Exception as e:
+            error_msg = f"Error formatting {tool_name} result: {str(e)}"
+            print(f"❌ {error_msg}")
+            import traceback
+            traceback.print_exc()
+            add_to_conversation(role="tool", content=error_msg, metadata={"error": True})
+            return {"content": [{"type": "text", "text": error_msg}], "isError": True}
+    return {"error": f"Unknown method: {method}"}
+
+# ============================================================
+# ⚡ MCP CALL DISPATCHER - Chạy tools/call song song cho mỗi kết nối
+# ============================================================
+
+MCP_MAX_CONCURRENT_CALLS = 8  # Số tools/call chạy đồng thời tối đa trên 1 thiết bị
+
+# Các tool chạm cùng một tài nguyên dùng chung 1 ordering key → chạy tuần tự
+# theo đúng thứ tự robot gửi. Tool không có key chạy song song tự do.
+# Có thể override từng tool bằng field "ordering_key" trong TOOLS.
+TOOL_ORDERING_GROUPS = {
+    "vlc_music": [
+        'smart_music_control', 'detect_and_execute_music', 'play_music', 'pause_music',
+        'resume_music', 'stop_music', 'music_next', 'music_previous', 'music_volume',
+        'seek_music', 'get_music_status', 'list_music', 'search_music',
+        'play_music_from_user_folder', 'smart_media_control',
+    ],
+    "media_keys": [
+        'media_play_pause', 'media_next_track', 'media_previous_track', 'media_stop',
+        'media_control', 'control_vlc', 'vlc_play_pause', 'vlc_stop', 'vlc_next',
+        'vlc_previous', 'vlc_volume_up', 'vlc_volume_down', 'vlc_mute', 'vlc_forward',
+        'vlc_backward', 'control_wmp', 'wmp_play_pause', 'wmp_stop', 'wmp_next',
+        'wmp_previous', 'wmp_volume_up', 'wmp_volume_down', 'wmp_mute',
+        'control_youtube', 'youtube_play_pause', 'youtube_rewind', 'youtube_forward',
+        'youtube_volume_up', 'youtube_volume_down', 'youtube_mute', 'youtube_fullscreen',
+        'youtube_captions', 'youtube_speed',
+    ],
+    "system_volume": ['set_volume', 'get_volume', 'mute_volume', 'unmute_volume', 'volume_up', 'volume_down'],
+    "browser": [
+        'browser_open_url', 'browser_get_info', 'browser_click', 'browser_fill_input',
+        'browser_scroll', 'browser_back', 'browser_forward', 'browser_refresh',
+        'browser_screenshot', 'browser_new_tab', 'browser_close_tab', 'browser_execute_js',
+        'browser_close',
+    ],
+    "keyboard": ['paste_content', 'press_enter', 'undo_operation', 'show_desktop', 'set_clipboard'],
+    "audio_io": ['text_to_speech', 'gemini_text_to_speech', 'speech_to_text'],
+}
+
+_TOOL_ORDERING_KEYS = {
+    tool: key for key, tools in TOOL_ORDERING_GROUPS.items() for tool in tools
+}
+
+
+def get_tool_ordering_key(tool_name: str):
+    """Trả về ordering key của tool (None = không cần tuần tự)"""
+    info = TOOLS.get(tool_name) or {}
+    return info.get("ordering_key") or _TOOL_ORDERING_KEYS.get(tool_name)
+
+
+async def _run_next_action(response: dict):
+    """
+    Nếu tool trả về next_action (VD: list_music → {'next_action': {'tool': 'play_music', ...}})
+    thì tự thực thi trên server để nhạc thực sự phát kể cả khi AI không gọi tiếp.
+    """
+    try:
+        if isinstance(response, dict) and response.get("next_action"):
+            na = response.get("next_action")
+            next_tool = na.get("tool")
+            next_params = na.get("parameters", {}) or {}
+            # Only execute if the tool exists locally
+            if next_tool and next_tool in TOOLS:
+                print(f"⏯️ [Auto Action] Executing suggested next_action {next_tool} with params: {next_params}")
+                try:
+                    # Chạy theo execution class của tool (loop / thread / device lane)
+                    res2 = await run_tool_handler(next_tool, next_params)
+                    print(f"⏯️ [Auto Action Result] {next_tool}: {res2}")
+                except Exception as e:
+                    print(f"❌ [Auto Action] Error executing {next_tool}: {e}")
                     import traceback
                     traceback.print_exc()
-                    add_to_conversation(role="tool", content=error_msg, metadata={"error": True})
-                    return {"content": [{"type": "text", "text": error_msg}], "isError": True}
-    return {"error": f"Unknown method: {method}"}
+    except Exception:
+        # defensive: do not let auto-action failures disrupt websocket loop
+        import traceback
+        traceback.print_exc()
+
+
+class MCPCallDispatcher:
+    """
+    Dispatcher cho 1 kết nối MCP:
+    - Mỗi tools/call chạy thành 1 task riêng, giới hạn bởi semaphore
+    - Response gửi ngay khi tool xong, ghép với request qua JSON-RPC id
+    - Tool cùng ordering key (VD: nhạc VLC) chạy tuần tự theo thứ tự nhận
+    """
+
+    def __init__(self, ws, endpoint_name: str, max_concurrent: int = MCP_MAX_CONCURRENT_CALLS):
+        self.ws = ws
+        self.endpoint_name = endpoint_name
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self._key_locks = {}
+        self._tasks = set()
+        self._by_request_id = {}  # JSON-RPC id → task (cho notifications/cancelled)
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._tasks)
+
+    def submit(self, data: dict) -> asyncio.Task:
+        """Đưa 1 tools/call vào hàng đợi, không chờ tool chạy xong"""
+        params = data.get("params", {}) or {}
+        key = get_tool_ordering_key(params.get("name"))
+        # Lấy lock theo key ngay lúc nhận để giữ đúng thứ tự (asyncio.Lock là FIFO)
+        lock = self._key_locks.setdefault(key, asyncio.Lock()) if key else None
+        task = asyncio.create_task(self._run(data, lock))
+        self._tasks.add(task)
+        request_id = data.get("id")
+        if request_id is not None:
+            self._by_request_id[request_id] = task
+        task.add_done_callback(lambda t: self._forget(t, request_id))
+        return task
+
+    def _forget(self, task: asyncio.Task, request_id):
+        self._tasks.discard(task)
+        if self._by_request_id.get(request_id) is task:
+            del self._by_request_id[request_id]
+
+    def cancel(self, request_id, reason: str = "") -> bool:
+        """Hủy tools/call đang chạy theo JSON-RPC id (MCP notifications/cancelled)"""
+        task = self._by_request_id.get(request_id)
+        if task is None or task.done():
+            return False
+        print(f"🛑 [Dispatcher] Cancelling request {request_id} on {self.endpoint_name}: {reason or 'no reason'}")
+        task.cancel()
+        return True
+
+    async def _run(self, data: dict, lock):
+        if lock is None:
+            async with self._slots:
+                await self._execute(data)
+            return
+        async with lock:
+            async with self._slots:
+                await self._execute(data)
+
+    async def _execute(self, data: dict):
+        params = data.get("params", {}) or {}
+        tool_name = params.get("name", "unknown")
+        tool_args = params.get("arguments", {})
+        # Request có progressToken → tool được phép gửi notifications/progress
+        progress_token = (params.get("_meta") or {}).get("progressToken")
+        if progress_token is not None:
+            _current_progress.set(ProgressReporter(self.ws.send, progress_token))
+        # Tool call từ robot = người đang chờ → được ưu tiên gọi AI trước việc nền (index KB...)
+        set_ai_priority(AI_PRIORITY_INTERACTIVE)
+        try:
+            response = await handle_xiaozhi_message(data)
+
+            # Log tool call request + response (chỉ tools/call, không log protocol messages)
+            add_to_conversation(
+                role="user",
+                content=format_tool_request(tool_name, tool_args),
+                metadata={
+                    "source": "mcp",
+                    "method": "tools/call",
+                    "tool_name": tool_name,
+                    "tool_arguments": tool_args,
+                    "endpoint": self.endpoint_name
+                }
+            )
+            add_to_conversation(
+                role="assistant",
+                content=format_tool_response(tool_name, response),
+                metadata={
+                    "source": "mcp",
+                    "method": "tools/call",
+                    "tool_name": tool_name,
+                    "response_data": response,
+                    "success": not isinstance(response, dict) or not response.get("isError")
+                }
+            )
+
+            await self.ws.send(json.dumps({"jsonrpc": "2.0", "id": data.get("id"), "result": response}))
+
+            # next_action chạy trong cùng slot/ordering key để giữ thứ tự nhạc
+            await _run_next_action(response)
+
+            web_hub.publish("activity", {"type": "xiaozhi_activity", "method": "tools/call", "timestamp": datetime.now().isoformat()})
+        except asyncio.CancelledError:
+            # Theo MCP: request đã bị hủy thì không gửi response
+            raise
+        except Exception as e:
+            print(f"⚠️ [Dispatcher] {tool_name} failed on {self.endpoint_name}: {e}")
+
+    async def shutdown(self):
+        """Hủy các tool đang chạy khi kết nối đóng (response không còn nơi gửi)"""
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        self._key_locks.clear()
+
+# ============================================================
+# 🛰️ CONNECTION SUPERVISOR - Quản lý N endpoint MCP (1 task / endpoint)
+# ============================================================
+
+class ConnectionSupervisor:
+    """
+    Giám sát tất cả endpoint trong xiaozhi_endpoints.json:
+    - Mỗi endpoint 1 task xiaozhi_websocket_client, tự thêm/bớt khi config thay đổi
+    - Thống kê theo endpoint: connect latency, số lần reconnect, tool đang chạy, lỗi cuối
+    """
+
+    def __init__(self):
+        self._tasks = {}
+        self._dispatchers = {}
+        self.stats = {}
+
+    def _ensure_slot(self, index: int):
+        xiaozhi_connections.setdefault(index, None)
+        xiaozhi_connected.setdefault(index, False)
+        should_reconnect.setdefault(index, False)
+        self.stats.setdefault(index, {
+            "connect_attempts": 0,
+            "connects": 0,
+            "reconnects": 0,
+            "last_connect_latency_ms": None,
+            "connected_since": None,
+            "last_disconnected": None,
+            "last_error": None,
+            "last_error_at": None,
+            "tool_calls": 0,
+        })
+
+    def sync(self):
+        """Khớp số task với endpoints_config hiện tại (gọi lúc startup và sau khi lưu config)"""
+        for index in range(len(endpoints_config)):
+            self._ensure_slot(index)
+            task = self._tasks.get(index)
+            if task is None or task.done():
+                self._tasks[index] = asyncio.create_task(xiaozhi_websocket_client(device_index=index))
+        for index in [i for i in self._tasks if i >= len(endpoints_config)]:
+            task = self._tasks.pop(index)
+            # Dọn slot sau khi task thoát hẳn (handler CancelledError còn ghi vào các dict)
+            task.add_done_callback(lambda _t, i=index: self._drop_slot(i))
+            task.cancel()
+        print(f"🛰️ [Supervisor] Managing {len(self._tasks)} endpoint tasks")
+
+    def _drop_slot(self, index: int):
+        if index in self._tasks:
+            return  # Endpoint đã được thêm lại
+        for table in (xiaozhi_connections, xiaozhi_connected, should_reconnect, self.stats):
+            table.pop(index, None)
+
+    def request_reconnect(self, index: int = None):
+        """Đóng kết nối hiện tại để client tự kết nối lại (None = tất cả)"""
+        targets = [index] if index is not None else list(self._tasks)
+        for i in targets:
+            if i in should_reconnect:
+                should_reconnect[i] = True
+            # Đóng ngay thay vì chờ message tiếp theo mới kiểm tra flag
+            ws = xiaozhi_connections.get(i)
+            if ws is not None:
+                asyncio.create_task(ws.close())
+
+    def on_connect_attempt(self, index: int):
+        self._ensure_slot(index)
+        self.stats[index]["connect_attempts"] += 1
+
+    def on_connected(self, index: int, latency_ms: float, dispatcher):
+        stats = self.stats[index]
+        if stats["connects"] > 0:
+            stats["reconnects"] += 1
+        stats["connects"] += 1
+        stats["last_connect_latency_ms"] = round(latency_ms, 1)
+        stats["connected_since"] = datetime.now().isoformat()
+        self._dispatchers[index] = dispatcher
+        telemetry.notify("endpoints")
+
+    def on_disconnected(self, index: int, error: BaseException = None):
+        if index not in self.stats:
+            return
+        stats = self.stats[index]
+        if stats["connected_since"]:
+            stats["last_disconnected"] = datetime.now().isoformat()
+        stats["connected_since"] = None
+        if error is not None:
+            stats["last_error"] = f"{type(error).__name__}: {error}"
+            stats["last_error_at"] = datetime.now().isoformat()
+        self._dispatchers.pop(index, None)
+        telemetry.notify("endpoints")
+
+    def on_tool_call(self, index: int):
+        if index in self.stats:
+            self.stats[index]["tool_calls"] += 1
+
+    def connected_indices(self) -> list:
+        return [i for i, ok in xiaozhi_connected.items() if ok]
+
+    def snapshot(self, index: int) -> dict:
+        dispatcher = self._dispatchers.get(index)
+        return {
+            **self.stats.get(index, {}),
+            "in_flight_calls": dispatcher.in_flight if dispatcher else 0,
+        }
+
+
+connection_supervisor = ConnectionSupervisor()
+
+# ============================================================
+# 📡 TELEMETRY - Server push trạng thái dashboard qua /ws (thay cho polling từng tab)
+# ============================================================
+# 1 sampler dùng chung cho mọi tab: VLC (event player + tick khi đang phát), tài nguyên, quota, endpoint.
+# Chỉ gửi key thay đổi (diff) kèm seq; tab thấy hụt seq (bản tin bị coalesce) → gửi "telemetry_sync".
+# REST cũ (/api/vlc_status, /api/resources, /api/quotas, /api/llm_connection_status) đọc cùng snapshot.
+
+TELEMETRY_TICK = 1.0  # Giây
+TELEMETRY_INTERVALS = {"vlc": 1.0, "endpoints": 1.0, "resources": 5.0, "quotas": 60.0}
+
+
+def _endpoint_status() -> dict:
+    status = {
+        "success": True,
+        "devices": []
+    }
+    for i, ep in enumerate(endpoints_config):
+        status["devices"].append({
+            "index": i,
+            "name": ep.get("name", f"Thiết bị {i + 1}"),
+            "connected": xiaozhi_connected.get(i, False),
+            "enabled": ep.get("enabled", False),
+            "has_token": bool(ep.get("token", ""))
+        })
+    status["active_index"] = active_endpoint_index
+    status["total_connected"] = sum(1 for v in xiaozhi_connected.values() if v)
+    return status
+
+
+def _vlc_status() -> dict:
+    if not vlc_player or not vlc_player._player:
+        return {"state": "not_initialized"}
+    return vlc_player.get_full_status()
+
+
+class TelemetryPublisher:
+    """Snapshot mới nhất + seq của từng loại telemetry; publish diff lên topic telemetry.<kind>"""
+
+    def __init__(self):
+        self.snapshots = {}  # kind → dict
+        self.seq = {}  # kind → số lần snapshot thay đổi
+        self._updated = {}  # kind → time.monotonic() lần lấy mẫu cuối
+        self._pending = set()  # kind đang chờ refresh do notify()
+        self._task = None
+        self.samples = 0
+        self.published = 0
+
+    async def _collect(self, kind: str) -> dict:
+        if kind == "vlc":
+            return _vlc_status()
+        if kind == "endpoints":
+            return _endpoint_status()
+        if kind == "resources":
+            return await get_system_resources()
+        if kind == "quotas":
+            return await get_api_quotas()
+        raise KeyError(kind)
+
+    def update(self, kind: str, data: dict):
+        """Lưu snapshot mới; có key thay đổi → publish diff"""
+        old = self.snapshots.get(kind)
+        self.snapshots[kind] = data
+        self._updated[kind] = time.monotonic()
+        if old is None:
+            diff, removed = data, []
+        else:
+            diff = {k: v for k, v in data.items() if old.get(k) != v}
+            removed = [k for k in old if k not in data]
+        if old is not None and not diff and not removed:
+            return
+        self.seq[kind] = self.seq.get(kind, 0) + 1
+        message = {"type": f"telemetry_{kind}", "seq": self.seq[kind], "diff": diff}
+        if removed:
+            message["removed"] = removed
+        self.published += 1
+        web_hub.publish(f"telemetry.{kind}", message)
+
+    async def refresh(self, kind: str) -> dict:
+        data = await self._collect(kind)
+        self.samples += 1
+        self.update(kind, data)
+        return data
+
+    async def get(self, kind: str, max_age: float = None) -> dict:
+        """Snapshot cho REST: còn mới thì dùng lại, không thì lấy mẫu ngay (và push diff cho các tab)"""
+        if max_age is None:
+            max_age = TELEMETRY_INTERVALS[kind]
+        if kind in self.snapshots and time.monotonic() - self._updated[kind] < max_age:
+            return self.snapshots[kind]
+        return await self.refresh(kind)
+
+    async def sync_message(self, kinds: list) -> dict:
+        """Snapshot đầy đủ + seq cho tab mới mở / tab bị hụt diff"""
+        snapshots = {}
+        for kind in kinds:
+            if kind not in TELEMETRY_INTERVALS:
+                continue
+            if kind not in self.snapshots:
+                await self.refresh(kind)
+            snapshots[kind] = {"seq": self.seq.get(kind, 0), "data": self.snapshots[kind]}
+        return {"type": "telemetry_sync", "snapshots": snapshots}
+
+    def notify(self, kind: str):
+        """Báo trạng thái đổi (gọi được từ mọi thread) → refresh + push trên loop chính"""
+        loop_bridge.call_soon(self._schedule, kind)
+
+    def _schedule(self, kind: str):
+        if kind in self._pending:
+            return  # Gộp các event dồn dập thành 1 lần lấy mẫu
+        self._pending.add(kind)
+        asyncio.get_running_loop().create_task(self._refresh_pending(kind))
+
+    async def _refresh_pending(self, kind: str):
+        try:
+            await self.refresh(kind)
+        except Exception as e:
+            print(f"⚠️ [Telemetry] {kind} refresh error: {e}")
+        finally:
+            self._pending.discard(kind)
+
+    def _wanted(self, kind: str) -> bool:
+        topic = f"telemetry.{kind}"
+        return any(client.wants(topic) for client in web_hub.clients.values())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(TELEMETRY_TICK)
+            now = time.monotonic()
+            for kind, interval in TELEMETRY_INTERVALS.items():
+                if not self._wanted(kind) or now - self._updated.get(kind, 0) < interval:
+                    continue
+                if kind == "vlc" and self.snapshots.get("vlc", {}).get("is_playing") is False:
+                    continue  # Đang dừng → chỉ event VLC mới làm đổi trạng thái
+                try:
+                    await self.refresh(kind)
+                except Exception as e:
+                    print(f"⚠️ [Telemetry] {kind} sample error: {e}")
+
+    def start(self):
+        if vlc_player is not None:
+            vlc_player.on_change = lambda: self.notify("vlc")
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if vlc_player is not None:
+            vlc_player.on_change = None
+        if self._task:
+            self._task.cancel()
+
+    def snapshot(self) -> dict:
+        return {"samples": self.samples, "published": self.published, "seq": dict(self.seq)}
+
+
+telemetry = TelemetryPublisher()
 
 async def xiaozhi_websocket_client(device_index: int = 0):
-    """WebSocket client for a specific device (0, 1, or 2)"""
+    """WebSocket client for a specific device (index trong endpoints_config, do ConnectionSupervisor quản lý)"""
     global xiaozhi_connections, xiaozhi_connected, should_reconnect
     retry = 0
+    ep = {"name": f"Thiết bị {device_index + 1}"}
     
     # ===== OPTIMIZED CONNECTION SETTINGS =====
     INITIAL_DELAY = 1        # Delay ban đầu 1s (giảm từ 2s)
@@ -13269,13 +16706,17 @@ async def xiaozhi_websocket_client(device_index: int = 0):
     
     while True:
         try:
+            if device_index >= len(endpoints_config):
+                # Endpoint đã bị xóa khỏi config → dừng task
+                print(f"🛰️ [Xiaozhi] Device {device_index + 1} removed from config, stopping client")
+                break
             ep = endpoints_config[device_index]
             if not ep.get("enabled") or not ep.get("token"):
                 # Thiết bị này chưa có token, chờ và thử lại
                 await asyncio.sleep(10)
                 continue
             
-            ws_url = f"wss://api.xiaozhi.me/mcp/?token={ep['token']}"
+            ws_url = build_mcp_ws_url(ep)
             retry += 1
             
             # Fast retry cho 3 lần đầu, sau đó dùng exponential backoff
@@ -13284,6 +16725,9 @@ async def xiaozhi_websocket_client(device_index: int = 0):
             else:
                 print(f"📡 [Xiaozhi] Connecting {ep['name']}... (retry {retry})")
             
+            connection_supervisor.on_connect_attempt(device_index)
+            connect_started = time.perf_counter()
+            
             # Sử dụng asyncio.wait_for để có timeout
             async with websockets.connect(
                 ws_url, 
@@ -13293,19 +16737,14 @@ async def xiaozhi_websocket_client(device_index: int = 0):
                 open_timeout=CONNECT_TIMEOUT,  # Timeout mở kết nối
                 max_size=10 * 1024 * 1024  # 10MB limit (default is 1MB) - fix "message too big"
             ) as ws:
+                connect_latency_ms = (time.perf_counter() - connect_started) * 1000
                 xiaozhi_connections[device_index] = ws
                 xiaozhi_connected[device_index] = True
                 should_reconnect[device_index] = False  # Reset flag khi kết nối thành công
                 retry = 0  # Reset retry counter khi kết nối thành công
                 print(f"✅ [Xiaozhi] Connected! ({ep['name']}) [Device {device_index + 1}]")
                 
-                # Batch broadcast kết nối - tạo tasks và chạy parallel
-                broadcast_msg = {"type": "endpoint_connected", "endpoint": ep['name'], "index": device_index}
-                tasks = []
-                for conn in active_connections:
-                    tasks.append(asyncio.create_task(conn.send_json(broadcast_msg)))
-                # Chạn tất cả broadcasts cùng lúc
-                await asyncio.gather(*tasks, return_exceptions=True)
+                web_hub.publish("status", {"type": "endpoint_connected", "endpoint": ep['name'], "index": device_index})
                 
                 init_msg = {"jsonrpc": "2.0", "method": "initialize", "params": {"protocolVersion": "2024-11-05", "capabilities": {}, "clientInfo": {"name": "xiaozhi-final", "version": "4.3.0"}}, "id": 1}
                 
@@ -13313,111 +16752,54 @@ async def xiaozhi_websocket_client(device_index: int = 0):
                 
                 await ws.send(json.dumps(init_msg))
                 
-                async for msg in ws:
-                    # Kiểm tra nếu cần reconnect (user đã chuyển thiết bị)
-                    if should_reconnect[device_index]:
-                        print(f"🔄 [Xiaozhi] Reconnecting {ep['name']}...")
-                        await ws.close()
-                        break
-                    
-                    try:
-                        data = json.loads(msg)
-                        method = data.get("method", "unknown")
-                        if method != "ping":
-                            print(f"📨 [{method}]")
-                        
-                        response = await handle_xiaozhi_message(data)
+                dispatcher = MCPCallDispatcher(ws, ep['name'])
+                connection_supervisor.on_connected(device_index, connect_latency_ms, dispatcher)
+                try:
+                    async for msg in ws:
+                        # Kiểm tra nếu cần reconnect (user đã chuyển thiết bị)
+                        if should_reconnect[device_index]:
+                            print(f"🔄 [Xiaozhi] Reconnecting {ep['name']}...")
+                            await ws.close()
+                            break
                         
-                        # CHỈ log conversation thực sự (tools/call), KHÔNG log MCP protocol messages
-                        # Bỏ qua: initialize, notifications/initialized, tools/list
-                        if method == "tools/call" and method != "ping":
-                            # Lấy thông tin tool
-                            params = data.get("params", {})
-                            tool_name = params.get("name", "unknown")
-                            tool_args = params.get("arguments", {})
+                        try:
+                            data = json.loads(msg)
+                            method = data.get("method", "unknown")
+                            if method != "ping":
+                                print(f"📨 [{method}]")
                             
-                            # Tạo nội dung dễ đọc từ tool arguments
-                            user_message = format_tool_request(tool_name, tool_args)
+                            # tools/call chạy nền qua dispatcher → đọc frame tiếp theo ngay
+                            if method == "tools/call":
+                                connection_supervisor.on_tool_call(device_index)
+                                dispatcher.submit(data)
+                                continue
                             
-                            # Log tool call request
-                            add_to_conversation(
-                                role="user",
-                                content=user_message,
-                                metadata={
-                                    "source": "mcp",
-                                    "method": method,
-                                    "tool_name": tool_name,
-                                    "tool_arguments": tool_args,
-                                    "endpoint": ep['name']
-                                }
-                            )
+                            # tools/list: gửi thẳng JSON đã cache (theo profile của endpoint)
+                            if method == "tools/list":
+                                cursor = (data.get("params") or {}).get("cursor", "")
+                                await ws.send(tool_catalog.build_response_frame(data.get("id"), cursor, ep))
+                                continue
                             
-                            # Tạo nội dung response dễ đọc
-                            assistant_message = format_tool_response(tool_name, response)
+                            # Server hủy request đang chạy (notification → không response)
+                            if method == "notifications/cancelled":
+                                cancel_params = data.get("params", {}) or {}
+                                dispatcher.cancel(cancel_params.get("requestId"), cancel_params.get("reason", ""))
+                                continue
                             
-                            # Log tool call response
-                            add_to_conversation(
-                                role="assistant",
-                                content=assistant_message,
-                                metadata={
-                                    "source": "mcp",
-                                    "method": method,
-                                    "tool_name": tool_name,
-                                    "response_data": response,
-                                    "success": not isinstance(response, dict) or not response.get("isError")
-                                }
-                            )
-                        
-                        await ws.send(json.dumps({"jsonrpc": "2.0", "id": data.get("id"), "result": response}))
-
-                        # If the tool response suggests a next_action (for example list_music
-                        # returning {'next_action': {'tool': 'play_music', 'parameters': {...}}}),
-                        # execute it locally on the server as a fallback so music actually plays
-                        # even if the remote AI/client doesn't invoke the follow-up.
-                        try:
-                            if isinstance(response, dict) and response.get("next_action"):
-                                na = response.get("next_action")
-                                next_tool = na.get("tool")
-                                next_params = na.get("parameters", {}) or {}
-                                # Only execute if the tool exists locally
-                                if next_tool and next_tool in TOOLS:
-                                    print(f"⏯️ [Auto Action] Executing suggested next_action {next_tool} with params: {next_params}")
-                                    try:
-                                        # call the handler (handlers may be async)
-                                        handler = TOOLS[next_tool]["handler"]
-                                        if asyncio.iscoroutinefunction(handler):
-                                            res2 = await handler(**next_params)
-                                        else:
-                                            # run sync handlers in executor
-                                            loop = asyncio.get_event_loop()
-                                            res2 = await loop.run_in_executor(None, lambda: handler(**next_params))
-                                        print(f"⏯️ [Auto Action Result] {next_tool}: {res2}")
-                                    except Exception as e:
-                                        print(f"❌ [Auto Action] Error executing {next_tool}: {e}")
-                                        import traceback
-                                        traceback.print_exc()
-                        except Exception:
-                            # defensive: do not let auto-action failures disrupt websocket loop
-                            import traceback
-                            traceback.print_exc()
-                        
-                        # Batch broadcast - chỉ broadcast cho methods quan trọng
-                        if method in ["tools/call", "initialize"]:
-                            broadcast_msg = {"type": "xiaozhi_activity", "method": method, "timestamp": datetime.now().isoformat()}
-                            # Cleanup dead connections trước khi broadcast
-                            dead_connections = []
-                            for conn in active_connections:
-                                try:
-                                    await conn.send_json(broadcast_msg)
-                                except Exception:
-                                    dead_connections.append(conn)
-                            # Remove dead connections
-                            for conn in dead_connections:
-                                active_connections.remove(conn)
-                    except json.JSONDecodeError as e:
-                        print(f"⚠️ [Xiaozhi] JSON decode error: {e}")
-                    except Exception as e:
-                        print(f"⚠️ [Xiaozhi] Message handling error: {e}")
+                            # Protocol messages (initialize, tools/list, ping...) xử lý inline
+                            response = await handle_xiaozhi_message(data)
+                            await ws.send(json.dumps({"jsonrpc": "2.0", "id": data.get("id"), "result": response}))
+                            
+                            # Chỉ broadcast cho methods quan trọng
+                            if method == "initialize":
+                                web_hub.publish("activity", {"type": "xiaozhi_activity", "method": method, "timestamp": datetime.now().isoformat()})
+                        except json.JSONDecodeError as e:
+                            print(f"⚠️ [Xiaozhi] JSON decode error: {e}")
+                        except Exception as e:
+                            print(f"⚠️ [Xiaozhi] Message handling error: {e}")
+                finally:
+                    await dispatcher.shutdown()
+                    connection_supervisor.on_disconnected(device_index)
         except asyncio.CancelledError:
             print(f"⚠️ [Xiaozhi] Task cancelled ({ep['name']})")
             xiaozhi_connected[device_index] = False
@@ -13426,6 +16808,7 @@ async def xiaozhi_websocket_client(device_index: int = 0):
         except websockets.exceptions.WebSocketException as e:
             xiaozhi_connected[device_index] = False
             xiaozhi_connections[device_index] = None
+            connection_supervisor.on_disconnected(device_index, e)
             # Fast retry cho 3 lần đầu
             if retry <= FAST_RETRY_COUNT:
                 wait = FAST_RETRY_DELAY
@@ -13437,6 +16820,7 @@ async def xiaozhi_websocket_client(device_index: int = 0):
         except Exception as e:
             xiaozhi_connected[device_index] = False
             xiaozhi_connections[device_index] = None
+            connection_supervisor.on_disconnected(device_index, e)
             # Fast retry cho 3 lần đầu
             if retry <= FAST_RETRY_COUNT:
                 wait = FAST_RETRY_DELAY
@@ -15453,55 +18837,63 @@ async def index():
                 
                 const response = await fetch('/api/resources');
                 const data = await response.json();
+                applyResources(data);
                 if (data.success) {
-                    const cpuPercent = data.data.cpu_percent;
-                    document.getElementById('cpu').textContent = cpuPercent + '%';
-                    document.getElementById('ram').textContent = data.data.memory_percent + '%';
-                    document.getElementById('disk').textContent = data.data.disk_percent + '%';
-                    
-                    // Update RunCat animation speed based on CPU usage
-                    updateRunCatSpeed(cpuPercent);
-                    
                     // Cập nhật cache
                     resourceCache = data;
                     lastResourceFetch = now;
-                } else {
-                    addLog(`❌ Lỗi lấy tài nguyên: ${data.error}`, 'error');
                 }
             } catch (error) {
                 addLog(`❌ ${error.message}`, 'error');
             }
         }
         
+        function applyResources(data) {
+            if (data.success) {
+                const cpuPercent = data.data.cpu_percent;
+                document.getElementById('cpu').textContent = cpuPercent + '%';
+                document.getElementById('ram').textContent = data.data.memory_percent + '%';
+                document.getElementById('disk').textContent = data.data.disk_percent + '%';
+                
+                // Update RunCat animation speed based on CPU usage
+                updateRunCatSpeed(cpuPercent);
+            } else {
+                addLog(`❌ Lỗi lấy tài nguyên: ${data.error}`, 'error');
+            }
+        }
+        
         async function getQuotas() {
             try {
                 const response = await fetch('/api/quotas');
-                const data = await response.json();
-                if (data.success) {
-                    // Gemini quota
-                    const geminiEl = document.getElementById('gemini-quota');
-                    if (data.gemini && geminiEl) {
-                        if (data.gemini.has_key) {
-                            geminiEl.innerHTML = `✅ ${data.gemini.free_tier}<br><small style="color:#6b7280;">${data.gemini.daily_limit}</small>`;
-                        } else {
-                            geminiEl.innerHTML = `❌ <small style="color:#ef4444;">Chưa có API key</small>`;
-                        }
+                applyQuotas(await response.json());
+            } catch (error) {
+                console.error('Failed to fetch quotas:', error);
+            }
+        }
+        
+        function applyQuotas(data) {
+            if (data.success) {
+                // Gemini quota
+                const geminiEl = document.getElementById('gemini-quota');
+                if (data.gemini && geminiEl) {
+                    if (data.gemini.has_key) {
+                        geminiEl.innerHTML = `✅ ${data.gemini.free_tier}<br><small style="color:#6b7280;">${data.gemini.daily_limit}</small>`;
+                    } else {
+                        geminiEl.innerHTML = `❌ <small style="color:#ef4444;">Chưa có API key</small>`;
                     }
+                }
                     
-                    // Serper quota
-                    const serperEl = document.getElementById('serper-quota');
-                    if (data.serper && serperEl) {
-                        if (data.serper.has_key) {
-                            serperEl.innerHTML = `✅ ${data.serper.free_tier}`;
-                        } else {
-                            serperEl.innerHTML = `❌ <small style="color:#ef4444;">Chưa có API key</small>`;
-                        }
+                // Serper quota
+                const serperEl = document.getElementById('serper-quota');
+                if (data.serper && serperEl) {
+                    if (data.serper.has_key) {
+                        serperEl.innerHTML = `✅ ${data.serper.free_tier}`;
+                    } else {
+                        serperEl.innerHTML = `❌ <small style="color:#ef4444;">Chưa có API key</small>`;
                     }
-                } else {
-                    console.log('Error fetching quotas:', data.error);
                 }
-            } catch (error) {
-                console.error('Failed to fetch quotas:', error);
+            } else {
+                console.log('Error fetching quotas:', data.error);
             }
         }
         
@@ -16008,6 +19400,8 @@ async def index():
             ws.onopen = () => {
                 addLog('✅ WebSocket connected', 'success');
                 wsReconnectAttempts = 0; // Reset counter khi connect thành công
+                telemetrySeq = {};
+                subscribeTelemetry();
             };
             ws.onmessage = (event) => {
                 const data = JSON.parse(event.data);
@@ -16025,6 +19419,10 @@ async def index():
                     if (data.method !== 'ping') {
                         addLog(`📡 Xiaozhi: ${data.method}`, 'info');
                     }
+                } else if (data.type && data.type.startsWith('chat_')) {
+                    handleLLMStreamEvent(data);
+                } else if (data.type && data.type.startsWith('telemetry_')) {
+                    handleTelemetry(data);
                 }
             };
             ws.onclose = () => {
@@ -16036,6 +19434,59 @@ async def index():
             };
         }
         
+        // ===== TELEMETRY PUSH (/ws) - server gửi diff, tab không cần polling =====
+        const TELEMETRY_KINDS = ['vlc', 'resources', 'quotas', 'endpoints'];
+        let telemetrySeq = {};   // kind → seq đã áp dụng
+        let telemetryState = {}; // kind → snapshot đã ghép từ các diff
+        
+        function telemetryLive(kind) {
+            return ws && ws.readyState === WebSocket.OPEN && telemetrySeq[kind] !== undefined;
+        }
+        
+        function subscribeTelemetry() {
+            // Tab ẩn chỉ cần trạng thái kết nối; hiện lại → đăng ký đủ + xin snapshot
+            const kinds = document.hidden ? ['endpoints'] : TELEMETRY_KINDS;
+            const hidden = TELEMETRY_KINDS.filter(kind => !kinds.includes(kind));
+            if (!ws || ws.readyState !== WebSocket.OPEN) return;
+            ws.send(JSON.stringify({type: 'subscribe', topics: ['status', 'activity', 'knowledge', ...kinds.map(k => 'telemetry.' + k)]}));
+            if (hidden.length) {
+                ws.send(JSON.stringify({type: 'unsubscribe', topics: hidden.map(k => 'telemetry.' + k)}));
+                hidden.forEach(kind => delete telemetrySeq[kind]);
+            }
+            ws.send(JSON.stringify({type: 'telemetry_sync', kinds: kinds}));
+        }
+        document.addEventListener('visibilitychange', subscribeTelemetry);
+        
+        const telemetryRenderers = {
+            vlc: status => applyVlcStatus(status),
+            resources: data => applyResources(data),
+            quotas: data => applyQuotas(data),
+            endpoints: data => applyConnectionStatus(data)
+        };
+        
+        function handleTelemetry(data) {
+            if (data.type === 'telemetry_sync') {
+                for (const [kind, snap] of Object.entries(data.snapshots || {})) {
+                    telemetryState[kind] = snap.data;
+                    telemetrySeq[kind] = snap.seq;
+                    telemetryRenderers[kind](snap.data);
+                }
+                return;
+            }
+            const kind = data.type.slice('telemetry_'.length);
+            if (!telemetryRenderers[kind] || telemetrySeq[kind] === undefined) return; // Chờ snapshot sync
+            if (data.seq <= telemetrySeq[kind]) return; // Diff cũ hơn snapshot đang có
+            const state = Object.assign({}, telemetryState[kind], data.diff);
+            (data.removed || []).forEach(key => delete state[key]);
+            if (data.seq !== telemetrySeq[kind] + 1) {
+                // Hụt diff (bị gộp khi tab chậm) → xin lại snapshot đầy đủ
+                ws.send(JSON.stringify({type: 'telemetry_sync', kinds: [kind]}));
+            }
+            telemetryState[kind] = state;
+            telemetrySeq[kind] = data.seq;
+            telemetryRenderers[kind](state);
+        }
+        
         // Caching và optimization
         let resourceCache = null;
         let lastResourceFetch = 0;
@@ -16667,74 +20118,79 @@ async def index():
         async function pollVlcStatus() {
             try {
                 const response = await fetch('/api/vlc_status');
-                const status = await response.json();
-                
-                if (status.state && status.state !== 'not_initialized') {
-                    // Update play state
-                    isPlaying = status.is_playing;
-                    document.getElementById('play-btn').textContent = isPlaying ? '⏸️' : '▶️';
+                applyVlcStatus(await response.json());
+            } catch (e) {
+                // Silent fail - VLC may not be playing
+            }
+        }
+        
+        function applyVlcStatus(status) {
+            if (status.state && status.state !== 'not_initialized') {
+                // Update play state
+                isPlaying = status.is_playing;
+                document.getElementById('play-btn').textContent = isPlaying ? '⏸️' : '▶️';
                     
-                    // Update progress slider (only if not dragging)
-                    if (status.position !== undefined && !isDraggingProgress) {
-                        const percent = (status.position * 100).toFixed(1);
-                        const slider = document.getElementById('progress-slider');
-                        if (slider) {
-                            slider.value = percent;
-                            slider.style.background = `linear-gradient(to right, #667eea 0%, #667eea ${percent}%, #374151 ${percent}%, #374151 100%)`;
-                        }
+                // Update progress slider (only if not dragging)
+                if (status.position !== undefined && !isDraggingProgress) {
+                    const percent = (status.position * 100).toFixed(1);
+                    const slider = document.getElementById('progress-slider');
+                    if (slider) {
+                        slider.value = percent;
+                        slider.style.background = `linear-gradient(to right, #667eea 0%, #667eea ${percent}%, #374151 ${percent}%, #374151 100%)`;
                     }
+                }
                     
-                    // Update time display
-                    if (status.current_time_formatted) {
-                        document.getElementById('current-time').textContent = status.current_time_formatted;
-                    }
-                    if (status.duration_formatted) {
-                        document.getElementById('total-time').textContent = status.duration_formatted;
-                    }
+                // Update time display
+                if (status.current_time_formatted) {
+                    document.getElementById('current-time').textContent = status.current_time_formatted;
+                }
+                if (status.duration_formatted) {
+                    document.getElementById('total-time').textContent = status.duration_formatted;
+                }
                     
-                    // Update volume (sync from VLC)
-                    if (status.volume !== undefined) {
-                        const slider = document.getElementById('volume-slider');
-                        if (document.activeElement !== slider) { // Don't update while user is dragging
-                            slider.value = status.volume;
-                            document.getElementById('volume-value').textContent = status.volume + '%';
-                            slider.style.background = `linear-gradient(to right, #667eea 0%, #667eea ${status.volume}%, #374151 ${status.volume}%, #374151 100%)`;
-                        }
+                // Update volume (sync from VLC)
+                if (status.volume !== undefined) {
+                    const slider = document.getElementById('volume-slider');
+                    if (document.activeElement !== slider) { // Don't update while user is dragging
+                        slider.value = status.volume;
+                        document.getElementById('volume-value').textContent = status.volume + '%';
+                        slider.style.background = `linear-gradient(to right, #667eea 0%, #667eea ${status.volume}%, #374151 ${status.volume}%, #374151 100%)`;
                     }
+                }
                     
-                    // Update current track name
-                    if (status.current_track) {
-                        document.getElementById('current-track').textContent = '🎵 ' + status.current_track;
-                        document.getElementById('track-info').textContent = 
-                            `${status.playlist_index + 1}/${status.playlist_count} bài • VLC Player`;
-                    }
+                // Update current track name
+                if (status.current_track) {
+                    document.getElementById('current-track').textContent = '🎵 ' + status.current_track;
+                    document.getElementById('track-info').textContent = 
+                        `${status.playlist_index + 1}/${status.playlist_count} bài • VLC Player`;
+                }
                     
-                    // Sync shuffle/repeat state from VLC
-                    if (status.shuffle !== undefined) {
-                        isShuffleOn = status.shuffle;
-                        const shuffleBtn = document.getElementById('shuffle-btn');
-                        if (shuffleBtn) {
-                            shuffleBtn.style.opacity = isShuffleOn ? '1' : '0.6';
-                            shuffleBtn.style.transform = isShuffleOn ? 'scale(1.1)' : 'scale(1)';
-                        }
+                // Sync shuffle/repeat state from VLC
+                if (status.shuffle !== undefined) {
+                    isShuffleOn = status.shuffle;
+                    const shuffleBtn = document.getElementById('shuffle-btn');
+                    if (shuffleBtn) {
+                        shuffleBtn.style.opacity = isShuffleOn ? '1' : '0.6';
+                        shuffleBtn.style.transform = isShuffleOn ? 'scale(1.1)' : 'scale(1)';
                     }
-                    if (status.repeat_mode !== undefined) {
-                        repeatMode = status.repeat_mode;
-                        const repeatBtn = document.getElementById('repeat-btn');
-                        if (repeatBtn) {
-                            repeatBtn.textContent = repeatMode === 2 ? '🔂' : '🔁';
-                            repeatBtn.style.opacity = repeatMode > 0 ? '1' : '0.6';
-                        }
+                }
+                if (status.repeat_mode !== undefined) {
+                    repeatMode = status.repeat_mode;
+                    const repeatBtn = document.getElementById('repeat-btn');
+                    if (repeatBtn) {
+                        repeatBtn.textContent = repeatMode === 2 ? '🔂' : '🔁';
+                        repeatBtn.style.opacity = repeatMode > 0 ? '1' : '0.6';
                     }
                 }
-            } catch (e) {
-                // Silent fail - VLC may not be playing
             }
         }
         
         function startVlcPolling() {
             if (vlcStatusInterval) clearInterval(vlcStatusInterval);
-            vlcStatusInterval = setInterval(pollVlcStatus, 1000); // Poll every 1 second
+            // Fallback khi /ws chưa kết nối - bình thường trạng thái được server push
+            vlcStatusInterval = setInterval(() => {
+                if (!telemetryLive('vlc')) pollVlcStatus();
+            }, 1000);
         }
         
         function stopVlcPolling() {
@@ -16818,17 +20274,25 @@ async def index():
                     ? { folder: localStorage.getItem('musicFolderPath') || '', auto_play: false }
                     : { auto_play: false };
                 
-                const response = await fetch('/api/call_tool', {
-                    method: 'POST',
-                    headers: {'Content-Type': 'application/json'},
-                    body: JSON.stringify({tool: 'list_music', args: args})
-                });
-                const data = await response.json();
+                // Catalog trả về theo trang → tải lần lượt tới khi hết
+                let files = [];
+                let data = null;
+                for (let page = 1; ; page++) {
+                    const response = await fetch('/api/call_tool', {
+                        method: 'POST',
+                        headers: {'Content-Type': 'application/json'},
+                        body: JSON.stringify({tool: 'list_music', args: {...args, page: page, page_size: 500}})
+                    });
+                    data = await response.json();
+                    if (!data.success || !data.files) break;
+                    files = files.concat(data.files);
+                    if (!data.has_more) break;
+                }
                 
-                if (data.success && data.files) {
-                    allMusicFiles = data.files;
-                    currentPlaylist = data.files;
-                    renderMusicLibrary(data.files);
+                if (files.length > 0) {
+                    allMusicFiles = files;
+                    currentPlaylist = files;
+                    renderMusicLibrary(files);
                 } else {
                     document.getElementById('music-library').innerHTML = '<p style="text-align:center; color:#999; padding:40px;">❌ Không tìm thấy nhạc trong thư viện</p>';
                 }
@@ -17267,13 +20731,13 @@ async def index():
         }
         
         connectWS();
-        // Giảm polling từ 5s xuống 10s để giảm tải
-        setInterval(getResources, 10000);
+        // Fallback polling khi /ws chưa kết nối (bình thường server push qua telemetry)
+        setInterval(() => { if (!telemetryLive('resources')) getResources(); }, 10000);
         getResources();
         
         // Load quotas on startup and refresh every 60 seconds
         getQuotas();
-        setInterval(getQuotas, 60000);
+        setInterval(() => { if (!telemetryLive('quotas')) getQuotas(); }, 60000);
         
         // Start VLC status polling for real-time sync
         startVlcPolling();
@@ -17307,7 +20771,7 @@ async def index():
         // Auto-update music status every 1 second when music section is active
         setInterval(() => {
             const musicSection = document.getElementById('music-section');
-            if (musicSection && musicSection.style.display !== 'none') {
+            if (musicSection && musicSection.style.display !== 'none' && !telemetryLive('vlc')) {
                 updateMusicStatus();
             }
         }, 1000);
@@ -17377,54 +20841,56 @@ async def index():
         async function refreshLLMConnectionStatus() {
             try {
                 const response = await fetch('/api/llm_connection_status');
-                const data = await response.json();
-                
-                if (data.success) {
-                    data.devices.forEach((device, index) => {
-                        // Update old status display (if exists)
-                        const statusEl = document.getElementById(`device${index + 1}-status`);
-                        if (statusEl) {
-                            const icon = device.connected ? '✅' : (device.enabled ? '⏳' : '❌');
-                            const text = device.connected ? 'Đã kết nối' : (device.enabled ? 'Đang kết nối...' : 'Chưa cấu hình');
-                            statusEl.innerHTML = `📱 ${device.name}: <span class="status-indicator">${icon} ${text}</span>`;
-                        }
+                applyConnectionStatus(await response.json());
+            } catch (e) {
+                console.error('Error refreshing LLM connection status:', e);
+            }
+        }
+        
+        function applyConnectionStatus(data) {
+            if (data.success) {
+                data.devices.forEach((device, index) => {
+                    // Update old status display (if exists)
+                    const statusEl = document.getElementById(`device${index + 1}-status`);
+                    if (statusEl) {
+                        const icon = device.connected ? '✅' : (device.enabled ? '⏳' : '❌');
+                        const text = device.connected ? 'Đã kết nối' : (device.enabled ? 'Đang kết nối...' : 'Chưa cấu hình');
+                        statusEl.innerHTML = `📱 ${device.name}: <span class="status-indicator">${icon} ${text}</span>`;
+                    }
                         
-                        // Update new device card indicator
-                        const indicator = document.getElementById(`device-${index + 1}-indicator`);
-                        const card = document.getElementById(`device-${index + 1}-card`);
-                        if (indicator) {
-                            if (device.connected) {
-                                indicator.innerHTML = '<span class="status-dot" style="width:8px;height:8px;border-radius:50%;background:#10b981;animation:pulse 2s infinite;"></span> ✅ Đã kết nối';
-                                indicator.style.background = '#d1fae5';
-                                indicator.style.color = '#047857';
-                                if (card) card.style.boxShadow = '0 0 20px rgba(16, 185, 129, 0.4)';
-                            } else if (device.enabled) {
-                                indicator.innerHTML = '<span class="status-dot" style="width:8px;height:8px;border-radius:50%;background:#f59e0b;animation:blink 1s infinite;"></span> ⏳ Đang kết nối...';
-                                indicator.style.background = '#fef3c7';
-                                indicator.style.color = '#b45309';
-                                if (card) card.style.boxShadow = '0 0 15px rgba(245, 158, 11, 0.3)';
-                            } else {
-                                indicator.innerHTML = '<span class="status-dot" style="width:8px;height:8px;border-radius:50%;background:#6b7280;"></span> ❌ Chưa kết nối';
-                                indicator.style.background = '#f3f4f6';
-                                indicator.style.color = '#6b7280';
-                                if (card) card.style.boxShadow = 'none';
-                            }
+                    // Update new device card indicator
+                    const indicator = document.getElementById(`device-${index + 1}-indicator`);
+                    const card = document.getElementById(`device-${index + 1}-card`);
+                    if (indicator) {
+                        if (device.connected) {
+                            indicator.innerHTML = '<span class="status-dot" style="width:8px;height:8px;border-radius:50%;background:#10b981;animation:pulse 2s infinite;"></span> ✅ Đã kết nối';
+                            indicator.style.background = '#d1fae5';
+                            indicator.style.color = '#047857';
+                            if (card) card.style.boxShadow = '0 0 20px rgba(16, 185, 129, 0.4)';
+                        } else if (device.enabled) {
+                            indicator.innerHTML = '<span class="status-dot" style="width:8px;height:8px;border-radius:50%;background:#f59e0b;animation:blink 1s infinite;"></span> ⏳ Đang kết nối...';
+                            indicator.style.background = '#fef3c7';
+                            indicator.style.color = '#b45309';
+                            if (card) card.style.boxShadow = '0 0 15px rgba(245, 158, 11, 0.3)';
+                        } else {
+                            indicator.innerHTML = '<span class="status-dot" style="width:8px;height:8px;border-radius:50%;background:#6b7280;"></span> ❌ Chưa kết nối';
+                            indicator.style.background = '#f3f4f6';
+                            indicator.style.color = '#6b7280';
+                            if (card) card.style.boxShadow = 'none';
                         }
-                    });
-                    
-                    // Update device selector
-                    const select = document.getElementById('llm-device-select');
-                    if (select) {
-                        data.devices.forEach((device, index) => {
-                            const option = select.options[index];
-                            if (option) {
-                                option.text = `${device.connected ? '🟢' : '⚪'} ${device.name}`;
-                            }
-                        });
                     }
+                });
+                    
+                // Update device selector
+                const select = document.getElementById('llm-device-select');
+                if (select) {
+                    data.devices.forEach((device, index) => {
+                        const option = select.options[index];
+                        if (option) {
+                            option.text = `${device.connected ? '🟢' : '⚪'} ${device.name}`;
+                        }
+                    });
                 }
-            } catch (e) {
-                console.error('Error refreshing LLM connection status:', e);
             }
         }
         
@@ -17447,6 +20913,23 @@ async def index():
             input.value = '';
             input.style.height = '50px';
             
+            // 💬 Stream qua WebSocket nếu đang kết nối - tin nhắn mới tự hủy lượt trước
+            if (ws && ws.readyState === WebSocket.OPEN) {
+                if (llmStream && llmStream.textNode) {
+                    llmStream.textNode.nodeValue = llmStream.text + ' ⏹';
+                }
+                hideLLMTyping();
+                showLLMTyping();
+                llmStream = { id: `chat-${Date.now()}`, model: selectedModel, text: '', textNode: null };
+                ws.send(JSON.stringify({
+                    type: 'chat_stream',
+                    request_id: llmStream.id,
+                    prompt: message,
+                    model: selectedModel
+                }));
+                return;
+            }
+            
             // Show typing indicator
             showLLMTyping();
             
@@ -17499,6 +20982,57 @@ async def index():
             }
         }
         
+        // Lượt chat stream hiện tại: {id, model, text, textNode}
+        let llmStream = null;
+        
+        function handleLLMStreamEvent(data) {
+            if (!llmStream || data.request_id !== llmStream.id) return;
+            const stream = llmStream;
+            
+            if (data.type === 'chat_status') {
+                addLog(`⏳ ${data.message}`, 'info');
+            } else if (data.type === 'chat_delta') {
+                if (!stream.textNode) {
+                    hideLLMTyping();
+                    addLLMChatMessage('assistant', '', `Gemini ${getModelDisplayName(stream.model)}`);
+                    const container = document.getElementById('llm-chat-messages');
+                    const contentEl = container.lastElementChild.querySelector('.content');
+                    stream.textNode = document.createTextNode('');
+                    contentEl.insertBefore(stream.textNode, contentEl.firstChild);
+                }
+                stream.text += data.delta;
+                stream.textNode.nodeValue = stream.text;
+                const container = document.getElementById('llm-chat-messages');
+                container.scrollTop = container.scrollHeight;
+            } else if (data.type === 'chat_done') {
+                hideLLMTyping();
+                const responseText = data.text || stream.text || 'Không có nội dung trả về';
+                if (stream.textNode) {
+                    stream.textNode.nodeValue = responseText;
+                    llmChatMessages[llmChatMessages.length - 1].content = responseText;
+                } else {
+                    addLLMChatMessage('assistant', responseText, `Gemini ${getModelDisplayName(stream.model)}`);
+                }
+                const ttft = data.ttft_ms != null ? ` - chữ đầu ${Math.round(data.ttft_ms)}ms` : '';
+                const source = data.knowledge_base_used ? ' (sử dụng Knowledge Base)' : (data.cached ? ' (cache)' : '');
+                addLog(`✅ Gemini trả lời${source}${ttft}`, 'success');
+                llmStream = null;
+                
+                // 🔊 Text-to-Speech nếu được bật
+                if (document.getElementById('llm-tts-toggle')?.checked && responseText) {
+                    speakText(responseText);
+                }
+            } else if (data.type === 'chat_error') {
+                hideLLMTyping();
+                addLLMChatMessage('assistant', `❌ Lỗi: ${data.error}`, 'System');
+                addLog(`❌ Lỗi Gemini: ${data.error}`, 'error');
+                llmStream = null;
+            } else if (data.type === 'chat_cancelled') {
+                hideLLMTyping();
+                llmStream = null;
+            }
+        }
+        
         function getModelDisplayName(model) {
             if (model.includes('gemini-3')) return '3 Flash ⚡';
             if (model.includes('2.5-pro')) return '2.5 Pro 💎';
@@ -18096,8 +21630,8 @@ async def index():
             loadCurrentEndpoint();
             // 🔥 FIX: Auto-refresh connection status
             refreshLLMConnectionStatus();
-            // ⏰ Refresh connection status every 3 seconds
-            setInterval(refreshLLMConnectionStatus, 3000);
+            // ⏰ Fallback khi /ws chưa kết nối - bình thường trạng thái được server push
+            setInterval(() => { if (!telemetryLive('endpoints')) refreshLLMConnectionStatus(); }, 3000);
         });
         
     // Initialize playlists on page load
@@ -18165,25 +21699,7 @@ async def api_llm_connection_status():
     """
     Kiểm tra trạng thái kết nối của các thiết bị LLM.
     """
-    status = {
-        "success": True,
-        "devices": []
-    }
-    
-    for i in range(3):
-        device_status = {
-            "index": i,
-            "name": endpoints_config[i].get("name", f"Thiết bị {i + 1}"),
-            "connected": xiaozhi_connected.get(i, False),
-            "enabled": endpoints_config[i].get("enabled", False),
-            "has_token": bool(endpoints_config[i].get("token", ""))
-        }
-        status["devices"].append(device_status)
-    
-    status["active_index"] = active_endpoint_index
-    status["total_connected"] = sum(1 for v in xiaozhi_connected.values() if v)
-    
-    return status
+    return await telemetry.refresh("endpoints")  # Rẻ (chỉ đọc dict) → luôn mới, đồng thời push diff
 
 # API Endpoints
 @app.post("/api/volume")
@@ -18209,7 +21725,7 @@ async def api_notification(request: NotificationRequest):
 
 @app.get("/api/resources")
 async def api_resources():
-    result = await get_system_resources()
+    result = await telemetry.get("resources", max_age=RESOURCE_CACHE_DURATION)
     if not result["success"]:
         raise HTTPException(500, result["error"])
     return result
@@ -18217,7 +21733,7 @@ async def api_resources():
 @app.get("/api/quotas")
 async def api_quotas():
     """Lấy thông tin quota của Gemini và Serper APIs"""
-    result = await get_api_quotas()
+    result = await telemetry.get("quotas", max_age=5)
     if not result["success"]:
         raise HTTPException(500, result["error"])
     return result
@@ -18226,17 +21742,14 @@ async def api_quotas():
 async def api_vlc_status():
     """VLC status - MCP-style response với session tracking"""
     try:
-        # Cache status để tránh query liên tục (200ms)
-        import time
-        now = time.time()
-        if not hasattr(vlc_player, '_status_cache') or (now - vlc_player._status_cache_time) > 0.2:
-            status = vlc_player.get_full_status()
-            # MCP-style: thêm metadata
-            status['timestamp'] = int(now * 1000)  # milliseconds
-            status['session_id'] = getattr(vlc_player, '_session_id', 'default')
-            vlc_player._status_cache = status
-            vlc_player._status_cache_time = now
-        return vlc_player._status_cache
+        # Cùng snapshot với telemetry push (/ws) - lấy mẫu lại nếu cũ hơn 200ms
+        status = await telemetry.get("vlc", max_age=0.2)
+        # MCP-style: thêm metadata
+        return {
+            **status,
+            "timestamp": int(time.time() * 1000),  # milliseconds
+            "session_id": getattr(vlc_player, '_session_id', 'default')
+        }
     except Exception as e:
         return {
             "success": False, 
@@ -18265,7 +21778,7 @@ async def api_vlc_seek(data: dict):
         current_time = vlc_player.get_time()
         
         # Execute seek
-        vlc_player.set_position(position)
+        await vlc_player.send("seek", position)
         
         # Calculate time delta
         new_time = vlc_player.get_time()
@@ -18291,8 +21804,7 @@ async def api_vlc_seek(data: dict):
 async def api_vlc_volume(data: dict):
     """Set VLC player volume (0-100)"""
     try:
-        level = int(data.get("level", 80))
-        vlc_player.set_volume(level)
+        level = await vlc_player.send("volume", int(data.get("level", 80)))
         return {"success": True, "volume": level}
     except Exception as e:
         return {"success": False, "error": str(e)}
@@ -18305,7 +21817,7 @@ async def api_vlc_shuffle(data: dict):
         if enabled is None:
             # Toggle
             enabled = not vlc_player.get_shuffle()
-        vlc_player.set_shuffle(enabled)
+        await vlc_player.send("shuffle", enabled)
         return {"success": True, "shuffle": enabled}
     except Exception as e:
         return {"success": False, "error": str(e)}
@@ -18319,7 +21831,7 @@ async def api_vlc_repeat(data: dict):
             # Cycle through modes
             current = vlc_player.get_repeat_mode()
             mode = (current + 1) % 3
-        vlc_player.set_repeat_mode(mode)
+        await vlc_player.send("repeat", mode)
         return {"success": True, "repeat_mode": mode}
     except Exception as e:
         return {"success": False, "error": str(e)}
@@ -18350,8 +21862,8 @@ async def api_vlc_play_pause():
             # Track state before action (xiaozhi pattern)
             was_playing = vlc_player.is_playing()
             
-            # Execute command
-            vlc_player.pause()
+            # Execute command (actor chờ event Paused/Playing nên is_playing bên dưới đã đúng)
+            await vlc_player.send("pause")
             
             # Get new state
             is_playing = vlc_player.is_playing()
@@ -18389,7 +21901,7 @@ async def api_vlc_stop():
             stopped_track = current_media.get_meta(0) if current_media else "Unknown"
             
             # Execute stop
-            vlc_player.stop()
+            await vlc_player.send("stop")
             
             return {
                 "success": True,
@@ -18417,9 +21929,8 @@ async def api_vlc_next():
             current_title = current_media.get_meta(0) if current_media else "Unknown"
             current_index = vlc_player._list_player.get_media_player().get_position()
             
-            # Execute command
-            vlc_player._list_player.next()
-            vlc_player._list_player.play()  # Đảm bảo phát
+            # Execute command qua actor - không chờ; click liên tục được gộp thành skip N
+            vlc_player.submit("skip", 1)
             
             # MCP-style: trả về immediate response + track info
             return {
@@ -18447,8 +21958,7 @@ async def api_vlc_previous():
     """Previous track - TỐI ƯU: Không block UI với sleep"""
     try:
         if vlc_player and vlc_player._list_player:
-            vlc_player._list_player.previous()
-            vlc_player._list_player.play()  # Đảm bảo phát
+            vlc_player.submit("skip", -1)
             # Trả về ngay - Web UI sẽ poll status để update
             return {
                 "success": True, 
@@ -18489,9 +21999,7 @@ async def call_any_tool(data: dict):
         raise HTTPException(404, f"Tool '{tool_name}' not found")
     
     try:
-        handler = TOOLS[tool_name]["handler"]
-        result = await handler(**args)
-        return result
+        return await run_tool_handler(tool_name, args)
     except Exception as e:
         return {"success": False, "error": str(e)}
 
@@ -18816,7 +22324,6 @@ async def api_auto_execute(data: dict):
                 print(f"🚀 [Execute] Calling tool: {detected_tool}")
                 
                 try:
-                    handler = TOOLS[detected_tool]["handler"]
                     tool_args = {}
                     
                     # Extract arguments cho play_music
@@ -18835,7 +22342,7 @@ async def api_auto_execute(data: dict):
                                     break
                     
                     # Gọi tool
-                    tool_result = await handler(**tool_args)
+                    tool_result = await run_tool_handler(detected_tool, tool_args)
                     tool_executed = True
                     
                     print(f"✅ [Execute] Success!")
@@ -19010,9 +22517,8 @@ TRẢ VỀ JSON:"""
                 try:
                     api_key = os.getenv("GEMINI_API_KEY", "")
                     if api_key:
-                        genai.configure(api_key=api_key)
-                        model = genai.GenerativeModel('models/gemini-3-flash-preview')
-                        response = model.generate_content(analysis_prompt)
+                        response = await ai_clients.generate('models/gemini-3-flash-preview', analysis_prompt,
+                                                             api_key=api_key)
                         ai_result = response.text.strip()
                         print(f"🤖 [AI Analysis] Gemini response: {ai_result[:200]}...")
                         return self._parse_ai_response(ai_result)
@@ -19024,13 +22530,16 @@ TRẢ VỀ JSON:"""
                 try:
                     api_key = os.getenv("OPENAI_API_KEY", "")
                     if api_key:
-                        client = OpenAI(api_key=api_key)
-                        response = client.chat.completions.create(
-                            model="gpt-4o-mini",
-                            messages=[{"role": "user", "content": analysis_prompt}],
-                            temperature=0.1,
-                            max_tokens=500
-                        )
+                        client = ai_clients.openai_client(api_key)
+                        async with ai_clients.slot("openai", "gpt-4o-mini", api_key=api_key) as slot:
+                            response = await asyncio.to_thread(
+                                client.chat.completions.create,
+                                model="gpt-4o-mini",
+                                messages=[{"role": "user", "content": analysis_prompt}],
+                                temperature=0.1,
+                                max_tokens=500
+                            )
+                            slot.record(response)
                         ai_result = response.choices[0].message.content.strip()
                         print(f"🤖 [AI Analysis] GPT-4 response: {ai_result[:200]}...")
                         return self._parse_ai_response(ai_result)
@@ -19338,7 +22847,7 @@ TRẢ VỀ JSON:"""
                 return {"success": False, "error": f"Tool '{tool_name}' has no handler"}
             
             # Gọi tool
-            result = await handler(**arguments)
+            result = await run_tool_handler(tool_name, arguments)
             
             # Lưu lại
             self.last_executed_tool = tool_name
@@ -19506,20 +23015,7 @@ async def api_smart_chat(data: dict):
     
     try:
         # 🆕 STEP -1: Kiểm tra có cần Google Search không (câu hỏi thời sự, giá cả, tin tức)
-        realtime_keywords = [
-            'giá vàng', 'giá usd', 'tỷ giá', 'giá bitcoin', 'crypto', 'chứng khoán',
-            'thời tiết', 'weather', 'tin tức', 'news', 'mới nhất', 'latest',
-            'hôm nay', 'bây giờ', 'hiện nay', 'hiện tại', 'today', 'now', 'current',
-            'năm 2024', 'năm 2025', 'năm 2026', '2024', '2025', '2026',
-            'vô địch', 'champion', 'winner', 'kết quả', 'score', 'result',
-            'tổng thống', 'president', 'thủ tướng', 'chủ tịch', 'ceo',
-            'iphone', 'samsung', 'tesla', 'apple', 'google', 'microsoft', 'ra mắt',
-            'là ai', 'là gì', 'ở đâu', 'what is', 'where is', 'how much', 'bao nhiêu',
-            'sự kiện', 'event', 'lịch', 'schedule', 'khi nào', 'when', 'giá xăng', 'giá dầu',
-            'covid', 'bão', 'động đất', 'tai nạn', 'cháy', 'chiến tranh', 'xung đột'
-        ]
-        query_lower = query.lower()
-        needs_google_search = use_google_search and any(kw in query_lower for kw in realtime_keywords)
+        needs_google_search = use_google_search and keyword_classifier.has(query, "realtime")
         
         # 🔍 Nếu cần Google Search, ưu tiên dùng Gemini + Google Search Grounding
         if needs_google_search:
@@ -19650,8 +23146,7 @@ async def api_smart_chat(data: dict):
                     tool_args = {"query": query}
                     
                     # Gọi tool
-                    handler = TOOLS[tool_name]["handler"]
-                    tool_result = await handler(**tool_args)
+                    tool_result = await run_tool_handler(tool_name, tool_args)
                     tool_used = tool_name
                     
                     print(f"✅ [Auto Tool] {tool_name} result: {str(tool_result)[:200]}...")
@@ -19841,40 +23336,7 @@ async def api_ask_gemini(data: dict):
     )
     
     # 🆕 STEP 0: Kiểm tra có cần Google Search không
-    realtime_keywords = [
-        # Giá cả, tài chính
-        'giá vàng', 'giá usd', 'tỷ giá', 'giá bitcoin', 'crypto', 'chứng khoán',
-        'gold price', 'exchange rate', 'giá xăng', 'giá dầu', 'giá cao nhất', 'giá mới nhất',
-        'stock', 'bitcoin', 'ethereum', 'btc', 'eth',
-        
-        # Thời tiết
-        'thời tiết', 'weather', 'nhiệt độ', 'temperature', 'mưa', 'bão',
-        
-        # Tin tức, sự kiện
-        'tin tức', 'news', 'mới nhất', 'latest', 'breaking', 'sự kiện',
-        
-        # Thời gian thực
-        'hôm nay', 'bây giờ', 'hiện nay', 'hiện tại', 'today', 'now', 'current',
-        'năm 2024', 'năm 2025', 'năm 2026', '2024', '2025', '2026',
-        
-        # Thể thao, cuộc thi
-        'vô địch', 'champion', 'winner', 'kết quả', 'score', 'result',
-        'world cup', 'euro', 'sea games', 'olympic', 'bóng đá', 'football',
-        
-        # Người nổi tiếng, chính trị
-        'tổng thống', 'president', 'thủ tướng', 'chủ tịch', 'ceo',
-        'ai là', 'who is', 'who won',
-        
-        # Sản phẩm, công nghệ
-        'iphone', 'samsung', 'tesla', 'apple', 'google', 'microsoft',
-        'ra mắt', 'launch', 'release', 'announced',
-        
-        # Tra cứu chung cần thông tin mới
-        'là ai', 'là gì', 'ở đâu', 'what is', 'where is', 'how much', 'bao nhiêu',
-        'khi nào', 'when', 'how many'
-    ]
-    prompt_lower = prompt.lower()
-    needs_google_search = use_google_search and any(kw in prompt_lower for kw in realtime_keywords)
+    needs_google_search = use_google_search and keyword_classifier.has(prompt, "realtime")
     
     # 🔍 Nếu cần Google Search, ưu tiên dùng Gemini + Google Search Grounding
     if needs_google_search:
@@ -19959,6 +23421,8 @@ async def api_ask_gemini(data: dict):
     
     # Gọi Gemini với enhanced prompt
     result = await ask_gemini(prompt=enhanced_prompt, model=model)
+    if result.get("success"):
+        result["response"] = result.get("response") or result.get("response_text", "")
     
     # Thêm metadata về KB usage
     if kb_context_used and result.get("success"):
@@ -20396,7 +23860,9 @@ async def get_endpoints_status():
             "enabled": ep.get("enabled", False),
             "has_token": bool(ep.get("token")),
             "connected": xiaozhi_connected.get(i, False),
-            "is_active": i == active_endpoint_index
+            "is_active": i == active_endpoint_index,
+            # Live stats từ ConnectionSupervisor: connect latency, reconnects, in-flight calls, lỗi cuối
+            "live": connection_supervisor.snapshot(i)
         }
         
         # Thêm stats từ EndpointManager nếu có
@@ -20420,11 +23886,31 @@ async def get_endpoints_status():
     
     return status
 
+@app.get("/api/perf")
+async def api_perf():
+    """Số liệu hiệu năng: event loop lag + latency từng tool (dùng bởi mcp_loadtest.py)"""
+    return {
+        "success": True,
+        "loop_lag": loop_lag_monitor.snapshot(),
+        "tools": tool_latency_tracker.snapshot(),
+        "endpoints": {i: connection_supervisor.snapshot(i) for i in range(len(endpoints_config))},
+        "webui": web_hub.snapshot(),
+        "loop_bridge": loop_bridge.snapshot(),
+        "tool_pools": {name: pool.snapshot() for name, pool in tool_pools.items()},
+        "http": http_client.snapshot(),
+        "ai": ai_clients.snapshot(),
+        "response_cache": response_cache.snapshot(),
+        "intent_cache": intent_llm_cache.snapshot(),
+        "chat_stream": chat_stream_stats.snapshot(),
+        "music_catalog": music_catalog.snapshot(),
+        "knowledge": knowledge_store.snapshot(),
+        "vlc": vlc_player.snapshot() if vlc_player and vlc_player._player else None,
+        "telemetry": telemetry.snapshot()
+    }
+
 @app.post("/api/endpoints/reconnect/{index}")
 async def reconnect_endpoint(index: int):
     """🔥 NEW: Force reconnect an endpoint"""
-    global should_reconnect
-    
     if index < 0 or index >= len(endpoints_config):
         return {"success": False, "error": f"Invalid index: {index}"}
     
@@ -20433,7 +23919,7 @@ async def reconnect_endpoint(index: int):
         return {"success": False, "error": "Endpoint has no token"}
     
     # Trigger reconnect
-    should_reconnect[index] = True
+    connection_supervisor.request_reconnect(index)
     
     # Cập nhật EndpointManager nếu có
     if ENDPOINT_MANAGER_AVAILABLE:
@@ -20518,16 +24004,397 @@ def save_knowledge_config(config: dict):
         print(f"❌ [Knowledge] Error saving config: {e}")
         return False
 
-def load_knowledge_index():
-    """Load index đã lưu"""
-    if KNOWLEDGE_INDEX_FILE.exists():
+# ============================================================
+# KB SEARCH INDEX - BM25 inverted index (dựng khi index/commit, truy vấn chỉ duyệt posting list)
+# ============================================================
+
+KB_STOP_WORDS = {
+    # Vietnamese
+    'là', 'của', 'và', 'có', 'các', 'được', 'trong', 'để', 'này', 'đó', 'cho', 'với',
+    'từ', 'về', 'như', 'theo', 'không', 'khi', 'đã', 'sẽ', 'những', 'một', 'hay', 'hoặc',
+    'thì', 'mà', 'nếu', 'vì', 'bởi', 'nên', 'cũng', 'lại', 'còn', 'đây', 'kia', 'ấy',
+    'ra', 'vào', 'lên', 'xuống', 'đi', 'đến', 'bằng', 'qua', 'sau', 'trước', 'trên', 'dưới',
+    'nào', 'gì', 'sao', 'thế', 'rằng', 'tại', 'vậy', 'nhưng', 'tuy', 'mặc', 'dù', 'ai', 'đâu',
+    # English
+    'a', 'an', 'the', 'is', 'are', 'was', 'were', 'be', 'been', 'being',
+    'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would', 'should', 'could',
+    'may', 'might', 'can', 'what', 'which', 'who', 'how', 'when', 'where', 'why',
+    'this', 'that', 'these', 'those', 'it', 'its', 'they', 'them', 'their',
+    'he', 'she', 'him', 'her', 'his', 'we', 'us', 'our', 'you', 'your',
+    'of', 'to', 'in', 'on', 'at', 'by', 'for', 'with', 'about', 'as', 'from'
+}
+KB_FIELD_WEIGHTS = {"file_name": 3.0, "summary": 2.0, "keywords": 2.0, "content": 1.0}  # content giữ 1.0 (xem _document_terms)
+KB_BM25_K1 = 1.2
+KB_BM25_B = 0.75
+KB_FOLD_PREFIX = "~"  # Term bỏ dấu: "~tiep" (term có dấu giữ nguyên: "tiếp")
+KB_FOLD_CACHE_MAX = 100000  # Âm tiết → dạng bỏ dấu
+
+_KB_TOKEN_RE = re.compile(r'\w+')
+
+
+def kb_tokens(text: str) -> list:
+    """Âm tiết (lowercase, NFC) - bỏ stop word và token 1 ký tự; None giữ chỗ để bigram không nối qua từ bị bỏ"""
+    return [t if len(t) > 1 and t not in KB_STOP_WORDS else None
+            for t in _KB_TOKEN_RE.findall(unicodedata.normalize("NFC", text).lower())]
+
+
+def kb_terms(tokens: list, fold) -> Counter:
+    """
+    Term của 1 đoạn: âm tiết + bigram âm tiết liền nhau, mỗi loại có 2 dạng (có dấu / bỏ dấu).
+    Query không dấu khớp dạng bỏ dấu, query có dấu khớp đúng dấu (xem KnowledgeSearchIndex.query_terms).
+    """
+    folded = [None if t is None else KB_FOLD_PREFIX + fold(t) for t in tokens]
+    terms = Counter(t for t in tokens if t is not None)
+    terms.update(f for f in folded if f is not None)
+    terms.update(f"{a} {b}" for a, b in zip(tokens, tokens[1:]) if a is not None and b is not None)
+    terms.update(f"{a} {b[1:]}" for a, b in zip(folded, folded[1:]) if a is not None and b is not None)
+    return terms
+
+
+class KnowledgeSearchIndex:
+    """
+    BM25 trên documents của 1 KnowledgeSnapshot (file_name/summary/keywords/content có trọng số riêng).
+    Postings: term → (doc ids, tf có trọng số) - truy vấn tỉ lệ với độ dài posting list, không với corpus.
+    Commit cập nhật tăng dần so với index cũ: doc bị thay/xóa → tombstone + rút id khỏi posting list của term
+    của nó, doc mới → id mới nối cuối; chỉ term của doc thay đổi được chép lại (array của snapshot cũ giữ nguyên).
+    """
+
+    def __init__(self, documents: tuple, previous: "KnowledgeSearchIndex" = None):
+        started = time.perf_counter()
+        self.documents = documents
+        self._fold_cache = previous._fold_cache if previous else {}
+        current = {id(doc): doc for doc in documents}
+        removed = added = ()
+        if previous is not None:
+            removed = [entry for key, entry in previous._doc_terms.items() if key not in current]
+            added = [doc for key, doc in current.items() if key not in previous._doc_terms]
+        # Tombstone nhiều hơn doc còn sống (hoặc thay gần hết KB) → dựng lại id liền mạch, vẫn dùng lại term đã đếm
+        incremental = previous is not None and len(previous._tombstones) + len(removed) <= len(documents)
+        if not incremental:
+            self._build(documents, previous)
+        else:
+            self._update(previous, removed, added)
+        self._avg_length = (self._total_length / len(documents)) if documents and self._total_length > 0 else 1.0
+        self.stats = {"documents": len(documents), "terms": len(self._postings), "reused": len(documents) - len(added),
+                      "added": len(added), "removed": len(removed), "tombstones": len(self._tombstones),
+                      "incremental": incremental,
+                      "build_ms": round((time.perf_counter() - started) * 1000, 1)}
+
+    def _build(self, documents: tuple, previous: "KnowledgeSearchIndex" = None):
+        reuse = previous._doc_terms if previous else {}
+        self._doc_terms = {}  # id(doc) → (doc, doc id, Counter term → tf có trọng số, độ dài có trọng số)
+        self._slots = list(documents)  # doc id → doc (None = tombstone)
+        self._tombstones = set()
+        self._lengths = array('f')
+        self._total_length = 0.0
+        postings = {}
+        for doc_id, doc in enumerate(documents):
+            cached = reuse.get(id(doc))
+            terms, length = (cached[2], cached[3]) if cached is not None else self._document_terms(doc)
+            self._doc_terms[id(doc)] = (doc, doc_id, terms, length)
+            self._lengths.append(length)
+            self._total_length += length
+            for term, tf in terms.items():
+                entry = postings.get(term)
+                if entry is None:
+                    postings[term] = entry = ([], [])
+                entry[0].append(doc_id)
+                entry[1].append(tf)
+        self._postings = {term: (array('I', ids), array('f', tfs)) for term, (ids, tfs) in postings.items()}
+
+    def _update(self, previous: "KnowledgeSearchIndex", removed: list, added: list):
+        self._doc_terms = dict(previous._doc_terms)
+        self._slots = list(previous._slots)
+        self._tombstones = set(previous._tombstones)
+        self._lengths = array('f', previous._lengths)
+        self._total_length = previous._total_length
+        touched = {}  # term → (doc id bị rút, doc id mới, tf mới)
+        for doc, doc_id, terms, length in removed:
+            del self._doc_terms[id(doc)]
+            self._slots[doc_id] = None
+            self._tombstones.add(doc_id)
+            self._lengths[doc_id] = 0.0
+            self._total_length -= length
+            for term in terms:
+                touched.setdefault(term, (set(), [], []))[0].add(doc_id)
+        for doc in added:
+            terms, length = self._document_terms(doc)
+            doc_id = len(self._slots)
+            self._slots.append(doc)
+            self._doc_terms[id(doc)] = (doc, doc_id, terms, length)
+            self._lengths.append(length)
+            self._total_length += length
+            for term, tf in terms.items():
+                entry = touched.setdefault(term, (set(), [], []))
+                entry[1].append(doc_id)
+                entry[2].append(tf)
+        self._postings = postings = dict(previous._postings)
+        for term, (dropped, new_ids, new_tfs) in touched.items():
+            old_ids, old_tfs = postings.get(term, (array('I'), array('f')))
+            ids, tfs = array('I', old_ids), array('f', old_tfs)  # Chép (memcpy) - snapshot cũ vẫn đọc array gốc
+            for doc_id in dropped:  # Doc id trong posting list luôn tăng dần → tìm nhị phân
+                pos = bisect_left(ids, doc_id)
+                if pos < len(ids) and ids[pos] == doc_id:
+                    del ids[pos]
+                    del tfs[pos]
+            ids.extend(new_ids)
+            tfs.extend(new_tfs)
+            if ids:
+                postings[term] = (ids, tfs)
+            else:
+                postings.pop(term, None)
+
+    def fold(self, token: str) -> str:
+        folded = self._fold_cache.get(token)
+        if folded is None:
+            if len(self._fold_cache) >= KB_FOLD_CACHE_MAX:
+                self._fold_cache.clear()  # Dùng chung giữa các snapshot - không để phình theo mọi âm tiết từng gặp
+            folded = self._fold_cache[token] = fold_voice_token(token)
+        return folded
+
+    def _document_terms(self, doc: dict) -> tuple:
+        counts = {}
+        length = 0.0
+        for field, weight in KB_FIELD_WEIGHTS.items():
+            value = doc.get(field) or ""
+            if isinstance(value, list):
+                value = " ".join(str(v) for v in value)
+            tokens = kb_tokens(str(value))
+            length += weight * len(tokens)
+            counts[field] = kb_terms(tokens, self.fold)
+        # Content (dài nhất, trọng số 1.0) dùng luôn Counter - chỉ nhân trọng số cho các field ngắn
+        weighted = counts.pop("content")
+        for field, terms in counts.items():
+            weight = KB_FIELD_WEIGHTS[field]
+            for term, tf in terms.items():
+                weighted[term] += weight * tf
+        return weighted, length
+
+    def query_terms(self, query: str) -> list:
+        """[(term, âm tiết gốc hoặc None nếu là bigram)] - có dấu → khớp đúng dấu, không dấu → khớp dạng bỏ dấu"""
+        terms = []
+        seen = set()
+        prev = None
+        for token in kb_tokens(query or ""):
+            if token is None:
+                prev = None
+                continue
+            folded = self.fold(token)
+            unigram = token if token != folded else KB_FOLD_PREFIX + folded
+            if unigram not in seen:
+                seen.add(unigram)
+                terms.append((unigram, token))
+            if prev is not None:
+                prev_folded = self.fold(prev)
+                if prev == prev_folded and token == folded:
+                    bigram = f"{KB_FOLD_PREFIX}{prev_folded} {folded}"
+                else:
+                    bigram = f"{prev} {token}"
+                if bigram not in seen:
+                    seen.add(bigram)
+                    terms.append((bigram, None))
+            prev = token
+        return terms
+
+    def idf(self, term: str) -> float:
+        postings = self._postings.get(term)
+        df = len(postings[0]) if postings else 0
+        n = len(self.documents)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, top_k: int = 10, min_match: int = 1) -> list:
+        """
+        Top-k document theo BM25.
+
+        Args:
+            min_match: Số âm tiết (khác nhau) của query tối thiểu phải khớp
+
+        Returns:
+            [(score, doc, [âm tiết query đã khớp])] - score giảm dần
+        """
+        scores = defaultdict(float)
+        matched = defaultdict(list)
+        lengths = self._lengths
+        # k1 × (1 - b + b × L / avgL) = base + scale × L - avgL lấy từ tổng độ dài cộng dồn, không duyệt lại doc
+        base = KB_BM25_K1 * (1 - KB_BM25_B)
+        scale = KB_BM25_K1 * KB_BM25_B / self._avg_length
+        for term, surface in self.query_terms(query):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf(term)
+            for doc_id, tf in zip(*postings):
+                scores[doc_id] += idf * tf * (KB_BM25_K1 + 1) / (tf + base + scale * lengths[doc_id])
+                if surface is not None:
+                    matched[doc_id].append(surface)
+        top = heapq.nlargest(top_k, ((score, doc_id) for doc_id, score in scores.items()
+                                     if len(matched[doc_id]) >= min_match))
+        return [(score, self._slots[doc_id], matched[doc_id]) for score, doc_id in top]
+
+    def rank_passages(self, query: str, passages: list, top_k: int = 5) -> list:
+        """BM25 cho các đoạn (chunk) của vài doc ứng viên, dùng IDF của cả KB. Returns: [(score, index)]"""
+        terms = self.query_terms(query)
+        if not terms or not passages:
+            return []
+        counted = [kb_terms(kb_tokens(text), self.fold) for text in passages]
+        lengths = [sum(c.values()) for c in counted]
+        avg_length = (sum(lengths) / len(lengths)) or 1.0
+        idfs = [(term, self.idf(term)) for term, _ in terms]
+        scored = []
+        for i, counts in enumerate(counted):
+            norm = KB_BM25_K1 * (1 - KB_BM25_B + KB_BM25_B * lengths[i] / avg_length)
+            score = sum(idf * counts[term] * (KB_BM25_K1 + 1) / (counts[term] + norm)
+                        for term, idf in idfs if counts.get(term))
+            if score > 0:
+                scored.append((score, i))
+        return heapq.nlargest(top_k, scored)
+
+    def locate(self, content: str, surfaces: list) -> int:
+        """Vị trí đầu tiên của 1 âm tiết query trong content (so khớp cả bản bỏ dấu), -1 nếu không có - dùng cắt snippet"""
+        lower = content.lower()
+        positions = [lower.find(s) for s in surfaces]
+        positions = [p for p in positions if p >= 0]
+        if not positions:
+            folded = ''.join(c for c in unicodedata.normalize('NFD', lower) if not unicodedata.combining(c))
+            if len(folded) == len(lower):  # NFD bỏ dấu giữ nguyên độ dài → vị trí dùng được cho content gốc
+                folded = folded.replace('đ', 'd')
+                positions = [p for p in (folded.find(self.fold(s)) for s in surfaces) if p >= 0]
+        return min(positions) if positions else -1
+
+    def snapshot(self) -> dict:
+        return dict(self.stats)
+
+
+class KnowledgeSnapshot:
+    """
+    1 phiên bản Knowledge Base - KHÔNG sửa sau khi publish (reader dùng chung, không khóa).
+    Writer luôn tạo tuple/dict mới (copy-on-write), nên reader giữ snapshot cũ vẫn thấy dữ liệu nhất quán.
+    """
+
+    __slots__ = ("version", "documents", "total_chunks", "last_update", "by_path", "search_index")
+
+    def __init__(self, version: int, documents: tuple, last_update: str = "", previous: "KnowledgeSnapshot" = None):
+        self.version = version
+        self.documents = documents
+        self.total_chunks = len(documents)
+        self.last_update = last_update
+        self.by_path = {doc.get("file_path", ""): doc for doc in documents}
+        self.search_index = KnowledgeSearchIndex(documents, previous.search_index if previous else None)
+
+    def to_dict(self) -> dict:
+        """Định dạng knowledge_index.json (documents là list mới - caller sửa list không ảnh hưởng snapshot)"""
+        return {"documents": list(self.documents), "total_chunks": self.total_chunks,
+                "last_update": self.last_update, "version": self.version}
+
+
+class KnowledgeStore:
+    """
+    Knowledge Base trong RAM: load knowledge_index.json 1 lần, truy vấn chỉ đọc snapshot (không chạm đĩa).
+    Ghi qua commit(): 1 writer tại 1 thời điểm → version + 1 → publish snapshot mới → lưu file
+    (ghi file tạm rồi os.replace - crash giữa chừng không làm hỏng index cũ).
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._snapshot = None
+        self._load_lock = threading.Lock()
+        self._write_lock = threading.Lock()  # 1 writer: index_all / index_file / clear không ghi đè lẫn nhau
+        self.stats = {"loads": 0, "load_ms": 0.0, "commits": 0, "persist_ms": 0.0, "persist_errors": 0}
+
+    def _load(self) -> KnowledgeSnapshot:
+        started = time.perf_counter()
+        data = {}
+        if self.path.exists():
+            try:
+                # Sử dụng utf-8-sig để tự động xử lý BOM
+                with open(self.path, 'r', encoding='utf-8-sig') as f:
+                    data = json.load(f)
+            except Exception as e:
+                print(f"⚠️ [Knowledge] Error loading index: {e}")
+        documents = tuple(doc for doc in data.get("documents", []) if isinstance(doc, dict))
+        self.stats["loads"] += 1
+        self.stats["load_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        snapshot = KnowledgeSnapshot(data.get("version", 0), documents, data.get("last_update", ""))
+        print(f"📚 [Knowledge] Loaded {len(documents)} documents ({self.stats['load_ms']}ms, "
+              f"BM25 {snapshot.search_index.stats['terms']} terms in {snapshot.search_index.stats['build_ms']}ms)")
+        return snapshot
+
+    def current(self) -> KnowledgeSnapshot:
+        """Snapshot hiện tại - chỉ lần đầu đọc đĩa"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._load_lock:
+                if self._snapshot is None:
+                    self._snapshot = self._load()
+                snapshot = self._snapshot
+        return snapshot
+
+    async def current_async(self) -> KnowledgeSnapshot:
+        """current() cho async caller: đang load/dựng BM25 lúc startup thì chờ ở thread, không chặn loop"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            snapshot = await asyncio.to_thread(self.current)
+        return snapshot
+
+    def commit(self, mutate) -> KnowledgeSnapshot:
+        """
+        Áp 1 thay đổi lên snapshot MỚI NHẤT (không phải bản caller đọc lúc bắt đầu) và lưu xuống đĩa.
+
+        Args:
+            mutate: fn(documents: list) -> list - nhận list copy, trả list documents mới
+                    (chạy trong lock - không await/IO; async caller gọi qua asyncio.to_thread)
+
+        Returns:
+            Snapshot sau khi ghi
+        """
+        with self._write_lock:
+            current = self.current()
+            documents = tuple(mutate(list(current.documents)))
+            snapshot = KnowledgeSnapshot(current.version + 1, documents, datetime.now().strftime("%Y-%m-%d %H:%M"),
+                                         previous=current)
+            self._snapshot = snapshot
+            self.stats["commits"] += 1
+            self._persist(snapshot)
+        return snapshot
+
+    def _persist(self, snapshot: KnowledgeSnapshot):
+        started = time.perf_counter()
+        tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
         try:
-            # Sử dụng utf-8-sig để tự động xử lý BOM
-            with open(KNOWLEDGE_INDEX_FILE, 'r', encoding='utf-8-sig') as f:
-                return json.load(f)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(snapshot.to_dict(), f, ensure_ascii=False, separators=(",", ":"))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
         except Exception as e:
-            print(f"⚠️ [Knowledge] Error loading index: {e}")
-    return {"documents": [], "total_chunks": 0, "last_update": ""}
+            self.stats["persist_errors"] += 1
+            print(f"❌ [Knowledge] Error saving index v{snapshot.version}: {e}")
+            try:
+                tmp_path.unlink()
+            except OSError:
+                pass
+        self.stats["persist_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+    def upsert(self, document: dict) -> KnowledgeSnapshot:
+        """Thêm/thay document theo file_path"""
+        path = document.get("file_path", "")
+        return self.commit(lambda docs: [d for d in docs if d.get("file_path") != path] + [document])
+
+    def replace_all(self, documents: list) -> KnowledgeSnapshot:
+        return self.commit(lambda _: list(documents))
+
+    def snapshot(self) -> dict:
+        snapshot = self._snapshot
+        return {
+            "loaded": snapshot is not None,
+            "version": snapshot.version if snapshot else None,
+            "documents": snapshot.total_chunks if snapshot else 0,
+            "search_index": snapshot.search_index.snapshot() if snapshot else None,
+            **self.stats,
+        }
+
+
+knowledge_store = KnowledgeStore(KNOWLEDGE_INDEX_FILE)
 
 # ============================================================
 # VECTOR SEARCH ENGINE - Global Instance
@@ -20565,25 +24432,9 @@ def get_vector_engine():
             
     return _vector_engine
 
-def save_knowledge_index(index_data: dict):
-    """Lưu index"""
-    try:
-        with open(KNOWLEDGE_INDEX_FILE, 'w', encoding='utf-8') as f:
-            json.dump(index_data, f, ensure_ascii=False, indent=2)
-        return True
-    except Exception as e:
-        print(f"❌ [Knowledge] Error saving index: {e}")
-        return False
-
 async def summarize_with_gemini(text: str, filename: str) -> dict:
     """Tóm tắt document bằng Gemini Flash (optimized)"""
     try:
-        import google.generativeai as genai
-        
-        # Configure Gemini
-        genai.configure(api_key=GEMINI_API_KEY)
-        model = genai.GenerativeModel('models/gemini-3-flash-preview')
-        
         # ⚡ PROMPT NGẮN GỌN - phản hồi nhanh hơn
         prompt = f"""Tóm tắt tài liệu:
 
@@ -20600,12 +24451,8 @@ Trả về JSON:
         
         print(f"⚡ [Gemini] Tóm tắt: {filename[:30]}...")
         
-        # ⏱️ Timeout 12 giây
-        loop = asyncio.get_event_loop()
-        response = await asyncio.wait_for(
-            loop.run_in_executor(None, lambda: model.generate_content(prompt)),
-            timeout=12.0
-        )
+        # ⏱️ Timeout 12 giây (tính từ lúc tới lượt, không tính thời gian chờ rate limit)
+        response = await ai_clients.generate('models/gemini-3-flash-preview', prompt, timeout=12.0)
         
         # Parse JSON response
         import json
@@ -20638,7 +24485,7 @@ Trả về JSON:
         }
 
 def extract_text_from_file(file_path: str) -> str:
-    """Trích xuất text từ file"""
+    """Trích xuất text từ file (blocking, PDF/XLSX khá nặng → gọi qua tool_pools["io_thread"])"""
     ext = Path(file_path).suffix.lower()
     text = ""
     
@@ -20783,7 +24630,6 @@ def scan_folder_for_files(folder_path: str) -> list:
 async def api_knowledge_status():
     """Lấy trạng thái Knowledge Base"""
     config = load_knowledge_config()
-    index = load_knowledge_index()
     
     folder_path = config.get("folder_path", "")
     files = []
@@ -20868,6 +24714,7 @@ async def api_knowledge_scan(data: dict):
 @app.post("/api/knowledge/index_all")
 async def api_knowledge_index_all():
     """Index tất cả files trong thư mục (parallel processing)"""
+    set_ai_priority(AI_PRIORITY_BACKGROUND)
     config = load_knowledge_config()
     folder_path = config.get("folder_path", "")
     
@@ -20880,7 +24727,7 @@ async def api_knowledge_index_all():
     # ⚡ PARALLEL PROCESSING: Index nhiều files cùng lúc
     async def index_single_file(file_info):
         try:
-            text = extract_text_from_file(file_info["path"])
+            text = await tool_pools["io_thread"].run(extract_text_from_file, file_info["path"])
             
             # Check if extraction failed
             if not text or len(text.strip()) < 10:
@@ -20929,18 +24776,28 @@ async def api_knowledge_index_all():
     for i in range(0, len(files), batch_size):
         batch = files[i:i+batch_size]
         results = await asyncio.gather(*[index_single_file(f) for f in batch], return_exceptions=True)
-        documents.extend([r for r in results if r and not isinstance(r, Exception)])
-        print(f"⚡ [Index] Processed {min(i+batch_size, len(files))}/{len(files)} files...")
+        batch_docs = [r for r in results if r and not isinstance(r, Exception)]
+        documents.extend(batch_docs)
+        processed = min(i+batch_size, len(files))
+        print(f"⚡ [Index] Processed {processed}/{len(files)} files...")
+        
+        # 📶 Báo tiến độ từng batch (MCP progress + Web UI) thay vì chờ index xong toàn bộ
+        progress_msg = f"Đã index {processed}/{len(files)} files"
+        await report_progress(progress_msg, progress=processed, total=len(files), force=True)
+        progress_event = {
+            "type": "knowledge_index_progress",
+            "processed": processed,
+            "total": len(files),
+            "indexed": len(documents),
+            "files": [d["file_name"] for d in batch_docs],
+            "message": progress_msg
+        }
+        web_hub.publish("knowledge", progress_event)
     
     indexed_count = len(documents)
     
-    # Lưu index
-    index_data = {
-        "documents": documents,
-        "total_chunks": indexed_count,
-        "last_update": datetime.now().strftime("%Y-%m-%d %H:%M")
-    }
-    save_knowledge_index(index_data)
+    # Lưu index - thay toàn bộ qua writer duy nhất (không đè lên index_file đang ghi dở)
+    kb = await asyncio.to_thread(knowledge_store.replace_all, documents)
     
     # 🆕 BUILD VECTOR INDEX with FAISS
     if VECTOR_SEARCH_AVAILABLE and documents:
@@ -20980,12 +24837,14 @@ async def api_knowledge_index_all():
         "success": True,
         "message": f"Đã index {indexed_count}/{len(files)} files",
         "indexed_count": indexed_count,
-        "last_update": index_data["last_update"]
+        "last_update": kb.last_update,
+        "version": kb.version
     }
 
 @app.post("/api/knowledge/index_file")
 async def api_knowledge_index_file(data: dict):
     """Index một file cụ thể"""
+    set_ai_priority(AI_PRIORITY_BACKGROUND)
     file_path = data.get("file_path", "").strip()
     
     if not file_path or not Path(file_path).exists():
@@ -20995,19 +24854,13 @@ async def api_knowledge_index_file(data: dict):
         file_name = Path(file_path).name
         print(f"📄 [Index] Starting index: {file_name}")
         
-        text = extract_text_from_file(file_path)
+        text = await tool_pools["io_thread"].run(extract_text_from_file, file_path)
         if not text or text.startswith("["):
             print(f"❌ [Index] Failed to extract: {file_name} - {text[:100] if text else 'Empty'}")
             return {"success": False, "error": f"Không thể đọc file: {text}"}
         
         print(f"📝 [Index] Extracted {len(text)} chars from {file_name}")
         
-        # Load existing index
-        index_data = load_knowledge_index()
-        
-        # Remove existing entry for this file
-        index_data["documents"] = [d for d in index_data["documents"] if d["file_path"] != file_path]
-        
         # 🆕 TRY summarize, nhưng fallback nếu fail
         ai_summary = {"summary": "", "keywords": [], "key_quotes": [], "category": "general"}
         try:
@@ -21023,8 +24876,8 @@ async def api_knowledge_index_file(data: dict):
             print(f"⚠️ [Index] AI Summary error for {file_name}: {e}, using basic index")
             ai_summary["summary"] = text[:500] + "..."
         
-        # Add new entry
-        index_data["documents"].append({
+        # Thêm/thay entry của file - áp lên index MỚI NHẤT lúc ghi (không phải bản đọc lúc bắt đầu)
+        kb = await asyncio.to_thread(knowledge_store.upsert, {
             "file_path": file_path,
             "file_name": file_name,
             "content": text[:50000],
@@ -21034,11 +24887,7 @@ async def api_knowledge_index_file(data: dict):
             "category": ai_summary.get("category", "general"),
             "indexed_at": datetime.now().isoformat()
         })
-        index_data["total_chunks"] = len(index_data["documents"])
-        index_data["last_update"] = datetime.now().strftime("%Y-%m-%d %H:%M")
-        
-        save_knowledge_index(index_data)
-        print(f"✅ [Index] Saved: {file_name} (total: {index_data['total_chunks']} docs)")
+        print(f"✅ [Index] Saved: {file_name} (total: {kb.total_chunks} docs, v{kb.version})")
         
         # Update config
         config = load_knowledge_config()
@@ -21057,8 +24906,8 @@ async def api_knowledge_index_file(data: dict):
 async def api_knowledge_clear():
     """Xóa toàn bộ index"""
     try:
-        # Clear index file
-        save_knowledge_index({"documents": [], "total_chunks": 0, "last_update": ""})
+        # Clear index
+        await asyncio.to_thread(knowledge_store.replace_all, [])
         
         # Update config
         config = load_knowledge_config()
@@ -21076,64 +24925,38 @@ async def api_knowledge_search(query: str = ""):
     if not query:
         return {"success": False, "error": "Vui lòng nhập từ khóa tìm kiếm"}
     
-    index_data = load_knowledge_index()
-    documents = index_data.get("documents", [])
-    
-    if not documents:
+    kb = await knowledge_store.current_async()
+    if not kb.documents:
         return {"success": False, "error": "Knowledge base chưa có dữ liệu. Vui lòng index files trước."}
     
-    # AI-powered search - tìm trong summary, keywords và content
-    query_lower = query.lower()
+    # BM25 trên inverted index - tìm trong tên file, summary, keywords và content (có/không dấu)
     results = []
-    
-    for doc in documents:
-        score = 0
-        matched_in = []
-        
-        # Tìm trong summary (điểm cao nhất)
+    for score, doc, matched in kb.search_index.search(query, top_k=20):
         summary = doc.get("summary", "")
-        if query_lower in summary.lower():
-            score += 10
-            matched_in.append("summary")
-        
-        # Tìm trong keywords (điểm trung bình)
         keywords = doc.get("keywords", [])
-        for keyword in keywords:
-            if query_lower in keyword.lower():
-                score += 5
-                matched_in.append("keywords")
-                break
-        
-        # Tìm trong content (điểm thấp nhất)
         content = doc.get("content", "")
-        if query_lower in content.lower():
-            score += 1
+        matched_in = [field for field, text in (("summary", summary), ("keywords", " ".join(keywords)))
+                      if kb.search_index.locate(text, matched) >= 0]
+        
+        # Tìm đoạn text chứa từ khóa
+        idx = kb.search_index.locate(content, matched)
+        if idx >= 0:
             matched_in.append("content")
-            
-            # Tìm đoạn text chứa query
-            idx = content.lower().find(query_lower)
-            start = max(0, idx - 200)
-            end = min(len(content), idx + 200)
-            snippet = content[start:end]
+            snippet = content[max(0, idx - 200):idx + 200]
         else:
             snippet = summary[:400] if summary else content[:400]
         
-        # Chỉ thêm vào results nếu có match
-        if score > 0:
-            results.append({
-                "file_name": doc.get("file_name", ""),
-                "file_path": doc.get("file_path", ""),
-                "summary": summary,
-                "keywords": keywords,
-                "category": doc.get("category", "general"),
-                "snippet": "..." + snippet + "...",
-                "score": score,
-                "matched_in": matched_in,
-                "indexed_at": doc.get("indexed_at", "")
-            })
-    
-    # Sắp xếp theo score
-    results.sort(key=lambda x: x["score"], reverse=True)
+        results.append({
+            "file_name": doc.get("file_name", ""),
+            "file_path": doc.get("file_path", ""),
+            "summary": summary,
+            "keywords": keywords,
+            "category": doc.get("category", "general"),
+            "snippet": "..." + snippet + "...",
+            "score": round(score, 3),
+            "matched_in": matched_in,
+            "indexed_at": doc.get("indexed_at", "")
+        })
     
     return {
         "success": True,
@@ -21151,8 +24974,7 @@ async def api_knowledge_get_context(query: str = "", max_chars: int = 10000, use
 @app.get("/api/knowledge/context_legacy")
 async def api_knowledge_get_context_legacy(query: str = "", max_chars: int = 10000):
     """Legacy endpoint - không dùng Gemini summarization"""
-    index_data = load_knowledge_index()
-    documents = index_data.get("documents", [])
+    documents = list((await knowledge_store.current_async()).documents)
     
     if not documents:
         return {"success": False, "context": "", "message": "Knowledge base trống"}
@@ -21409,7 +25231,7 @@ async def api_list_conversation_files():
 
 @app.post("/api/endpoints/switch/{index}")
 async def switch_endpoint(index: int):
-    global active_endpoint_index, should_reconnect
+    global active_endpoint_index
     if index < 0 or index >= len(endpoints_config):
         return {"success": False, "error": "Thiết bị không tồn tại"}
     
@@ -21420,7 +25242,7 @@ async def switch_endpoint(index: int):
     # Thay đổi endpoint và trigger reconnect
     old_index = active_endpoint_index
     active_endpoint_index = index
-    should_reconnect = True  # Trigger reconnect trong xiaozhi_websocket_client
+    connection_supervisor.request_reconnect(index)  # Trigger reconnect trong xiaozhi_websocket_client
     
     # Lưu vào file
     save_endpoints_to_file(endpoints_config, active_endpoint_index)
@@ -21431,20 +25253,22 @@ async def switch_endpoint(index: int):
 
 @app.post("/api/endpoints/save")
 async def save_endpoints(data: dict):
-    global endpoints_config, should_reconnect
+    global endpoints_config
     try:
         devices = data.get('devices', [])
         if not devices:
             return {"success": False, "error": "Không có dữ liệu"}
         
-        # Lưu token cũ của thiết bị đang active để so sánh
-        old_active_token = endpoints_config[active_endpoint_index].get('token', '') if active_endpoint_index < len(endpoints_config) else ''
+        # Lưu config cũ để so sánh token và giữ các field mở rộng (tool_profile, tools...)
+        old_config = endpoints_config
         
         # Cập nhật endpoints_config
         endpoints_config = []
-        for dev in devices:
+        for i, dev in enumerate(devices):
             token = dev.get('token', '').strip()  # Strip whitespace
+            old_ep = old_config[i] if i < len(old_config) else {}
             endpoints_config.append({
+                **old_ep,
                 'name': dev.get('name', 'Thiết bị'),
                 'token': token,
                 'enabled': bool(token)  # Only enabled if token not empty
@@ -21456,12 +25280,17 @@ async def save_endpoints(data: dict):
         else:
             print(f"⚠️ [Endpoint] Failed to save to file, but config updated in memory")
         
-        # CHỈ reconnect nếu token thay đổi VÀ có giá trị mới khác rỗng
-        new_active_token = endpoints_config[active_endpoint_index].get('token', '') if active_endpoint_index < len(endpoints_config) else ''
-        if old_active_token != new_active_token and new_active_token and old_active_token:
-            # Token đã thay đổi (không phải lần đầu nhập)
-            should_reconnect = True
-            print(f"🔄 [Endpoint] Token changed for active device {active_endpoint_index}. Triggering reconnect...")
+        # CHỈ reconnect thiết bị có token thay đổi VÀ có giá trị mới khác rỗng
+        for i, ep in enumerate(endpoints_config):
+            old_token = old_config[i].get('token', '') if i < len(old_config) else ''
+            new_token = ep.get('token', '')
+            if old_token != new_token and new_token and old_token:
+                # Token đã thay đổi (không phải lần đầu nhập)
+                connection_supervisor.request_reconnect(i)
+                print(f"🔄 [Endpoint] Token changed for device {i}. Triggering reconnect...")
+        
+        # Thêm/bớt task kết nối theo số endpoint mới
+        connection_supervisor.sync()
         
         return {"success": True, "message": "Đã lưu cấu hình"}
     except Exception as e:
@@ -21594,12 +25423,154 @@ async def get_serper_key():
     return {"success": True, "has_key": False}
 
 
+# ============================================================
+# 💬 WEB UI CHAT STREAM - Gemini trả lời từng đoạn qua /ws
+# ============================================================
+# Client gửi {"type": "chat_stream", "request_id", "prompt", "model"}, server đẩy về:
+#   chat_status (đang tra cứu...), chat_delta (từng đoạn text), chat_done (text đầy đủ + TTFT)
+# Tin nhắn mới hoặc {"type": "chat_cancel"} hủy stream đang chạy → chat_cancelled
+
+CHAT_STREAM_SAMPLES = 200
+
+
+class ChatStreamReporter(ProgressReporter):
+    """
+    Thay cho MCP progress khi chat từ Web UI: cùng đường report_progress/gemini_generate_with_progress,
+    nhưng chunk partial → chat_delta gửi thẳng tới tab đang chat (không throttle, không gộp).
+    """
+
+    def __init__(self, client: "WebUIClient", request_id: str):
+        super().__init__(send=None, progress_token=request_id)
+        self.client = client
+        self.request_id = request_id
+        self.started = time.monotonic()
+        self.first_token_at = None
+        self.parts = []
+
+    async def report(self, message: str = "", progress: float = None, total: float = None,
+                     partial: bool = False, force: bool = False) -> bool:
+        if not message:
+            return False
+        if partial:
+            if self.first_token_at is None:
+                self.first_token_at = time.monotonic()
+            self.parts.append(message)
+            self.client.send({"type": "chat_delta", "request_id": self.request_id,
+                              "index": len(self.parts) - 1, "delta": message})
+        else:
+            event = {"type": "chat_status", "request_id": self.request_id, "message": message}
+            if progress is not None:
+                event["progress"] = progress
+            if total is not None:
+                event["total"] = total
+            self.client.send(event)
+        self.sent += 1
+        return True
+
+    async def flush(self) -> bool:
+        return False  # Không giữ lại chunk nào
+
+    @property
+    def text(self) -> str:
+        return "".join(self.parts)
+
+    @property
+    def ttft_ms(self):
+        if self.first_token_at is None:
+            return None
+        return round((self.first_token_at - self.started) * 1000, 1)
+
+
+class ChatStreamStats:
+    """Time-to-first-token + tổng thời gian các lượt chat stream (xem /api/perf)"""
+
+    def __init__(self):
+        self.counts = {"started": 0, "completed": 0, "cancelled": 0, "errors": 0}
+        self._ttft = deque(maxlen=CHAT_STREAM_SAMPLES)
+        self._total = deque(maxlen=CHAT_STREAM_SAMPLES)
+
+    def record(self, reporter: ChatStreamReporter, outcome: str):
+        self.counts[outcome] += 1
+        if reporter.first_token_at is not None:
+            self._ttft.append(reporter.first_token_at - reporter.started)
+        if outcome == "completed":
+            self._total.append(time.monotonic() - reporter.started)
+
+    def snapshot(self) -> dict:
+        def pct(samples, p):
+            if not samples:
+                return None
+            ordered = sorted(samples)
+            return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1000, 1)
+
+        return {
+            **self.counts,
+            "ttft_p50_ms": pct(self._ttft, 50),
+            "ttft_p95_ms": pct(self._ttft, 95),
+            "total_p50_ms": pct(self._total, 50),
+            "total_p95_ms": pct(self._total, 95),
+        }
+
+
+chat_stream_stats = ChatStreamStats()
+
+
+async def run_chat_stream(client: "WebUIClient", request_id: str, prompt: str, model: str):
+    """
+    1 lượt chat stream (chạy trong task riêng của client): đi đúng luồng /api/tool/ask_gemini
+    (Google Search / Knowledge Base / cache) - chỉ khác là reporter đẩy chunk ra /ws.
+    """
+    reporter = ChatStreamReporter(client, request_id)
+    _current_progress.set(reporter)  # Task riêng → không lẫn với request khác
+    set_ai_priority(AI_PRIORITY_INTERACTIVE)
+    chat_stream_stats.counts["started"] += 1
+    try:
+        result = await api_ask_gemini({"prompt": prompt, "model": model})
+    except asyncio.CancelledError:
+        chat_stream_stats.record(reporter, "cancelled")
+        client.send({"type": "chat_cancelled", "request_id": request_id, "text": reporter.text})
+        if reporter.parts:
+            add_to_conversation(
+                role="assistant",
+                content=reporter.text,
+                metadata={"source": "web_ui_stream", "model": model, "cancelled": True}
+            )
+        raise
+    except Exception as e:
+        chat_stream_stats.record(reporter, "errors")
+        client.send({"type": "chat_error", "request_id": request_id, "error": str(e)})
+        return
+
+    if not result.get("success"):
+        chat_stream_stats.record(reporter, "errors")
+        client.send({"type": "chat_error", "request_id": request_id,
+                     "error": result.get("error", "Unknown error")})
+        return
+
+    text = result.get("response") or result.get("response_text") or ""
+    if not reporter.parts and text:
+        # Cache hit / Google Search grounding trả nguyên khối → gửi 1 delta để client xử lý thống nhất
+        await reporter.report(text, partial=True)
+    chat_stream_stats.record(reporter, "completed")
+    client.send({
+        "type": "chat_done",
+        "request_id": request_id,
+        "text": text,
+        "model": result.get("model", model),
+        "ttft_ms": reporter.ttft_ms,
+        "total_ms": round((time.monotonic() - reporter.started) * 1000, 1),
+        "cached": result.get("cached", False),
+        "knowledge_base_used": result.get("knowledge_base_used", False),
+        "google_search_used": result.get("google_search_used", False),
+    })
+
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
-    active_connections.append(websocket)
+    client = web_hub.register(websocket)
     try:
-        await websocket.send_json({"type": "xiaozhi_status", "connected": xiaozhi_connected})
+        client.send({"type": "xiaozhi_status", "connected": xiaozhi_connected})
         while True:
             data = await websocket.receive_text()
             
@@ -21608,8 +25579,34 @@ async def websocket_endpoint(websocket: WebSocket):
                 msg_data = json.loads(data)
                 msg_type = msg_data.get("type", "")
                 
+                # Đăng ký / hủy topic: {"type": "subscribe", "topics": ["status", "activity"]}
+                if msg_type == "subscribe":
+                    topics = set(msg_data.get("topics") or [])
+                    client.topics = None if "*" in topics else (client.topics or set()) | topics
+                
+                elif msg_type == "unsubscribe":
+                    topics = set(msg_data.get("topics") or [])
+                    current = client.topics if client.topics is not None else set(WEBUI_TOPIC_POLICIES)
+                    client.topics = current - topics
+                
+                # 📡 Snapshot telemetry đầy đủ: {"type": "telemetry_sync", "kinds": ["vlc", "resources"]}
+                elif msg_type == "telemetry_sync":
+                    client.send(await telemetry.sync_message(msg_data.get("kinds") or list(TELEMETRY_INTERVALS)))
+                
+                # 💬 Chat stream: hủy lượt đang chạy (nếu có) rồi bắt đầu lượt mới
+                elif msg_type == "chat_stream":
+                    client.cancel_chat()
+                    prompt = (msg_data.get("prompt") or msg_data.get("message") or "").strip()
+                    if prompt:
+                        request_id = msg_data.get("request_id") or f"chat-{int(time.time() * 1000)}"
+                        model = msg_data.get("model") or "gemini-2.0-flash"
+                        client.chat_task = asyncio.create_task(run_chat_stream(client, request_id, prompt, model))
+                
+                elif msg_type == "chat_cancel":
+                    client.cancel_chat()
+                
                 # Lưu user messages từ Web UI
-                if msg_type == "chat_message":
+                elif msg_type == "chat_message":
                     user_msg = msg_data.get("message", "")
                     if user_msg:
                         add_to_conversation(
@@ -21655,7 +25652,7 @@ async def websocket_endpoint(websocket: WebSocket):
                     })
                     
                     # Gửi kết quả về client
-                    await websocket.send_json({
+                    client.send({
                         "type": "smart_analyze_result",
                         **analyze_result
                     })
@@ -21691,19 +25688,16 @@ async def websocket_endpoint(websocket: WebSocket):
                             result["type"] = "auto_execute_result"
                         
                         # Gửi kết quả về client
-                        await websocket.send_json(result)
+                        client.send(result)
                         
                         print(f"✅ [WebSocket] Result sent to client")
                 
             except json.JSONDecodeError:
                 pass  # Not JSON, skip logging
-            
-            await websocket.send_text(f"Echo: {data}")
     except Exception as e:
         print(f"⚠️ WebSocket client error: {e}")
     finally:
-        if websocket in active_connections:
-            active_connections.remove(websocket)
+        web_hub.unregister(websocket)
 
 @app.on_event("startup")
 async def startup():
@@ -21715,6 +25709,8 @@ async def startup():
     if config_info.get("has_config"):
         folder_path = config_info.get("folder_path", "")
         print(f"🎵 [Music Config] User music folder configured: {folder_path}")
+        if folder_path and os.path.isdir(folder_path):
+            asyncio.create_task(music_catalog.ensure_async(folder_path))  # Catalog + tag thư mục người dùng
         print(f"⭐ [Music Priority] Will use play_music_from_user_folder for music requests")
     else:
         print(f"⚠️ [Music Config] No user music folder configured. Will use VLC music_library as fallback.")
@@ -21758,9 +25754,18 @@ async def startup():
     
     # Enable WebSocket client with error handling
     try:
-        # Khởi tạo 3 Xiaozhi clients đồng thời
-        for i in range(3):
-            asyncio.create_task(xiaozhi_websocket_client(device_index=i))
+        # Khởi tạo 1 Xiaozhi client cho mỗi endpoint (N thiết bị đồng thời)
+        loop_bridge.bind()
+        http_client.bind()
+        connection_supervisor.sync()
+        loop_lag_monitor.start()
+        asyncio.create_task(asyncio.to_thread(response_cache.load))  # Nạp cache AI nền, không chặn startup
+        asyncio.create_task(asyncio.to_thread(intent_llm_cache.load))
+        asyncio.create_task(asyncio.to_thread(knowledge_store.current))  # Nạp Knowledge Base 1 lần, truy vấn sau không đọc đĩa
+        if MUSIC_LIBRARY.exists():
+            asyncio.create_task(music_catalog.ensure_async(MUSIC_LIBRARY))
+        music_catalog.start_watcher()  # Quét lại thư viện nhạc định kỳ ở thread nền
+        telemetry.start()  # Push trạng thái dashboard qua /ws
         print(f"✅ [Startup] WebSocket clients started for {len(endpoints_config)} devices")
     except Exception as e:
         print(f"⚠️ Failed to start WebSocket clients: {e}")
@@ -21793,6 +25798,14 @@ async def shutdown():
         print(f"⚠️ [Shutdown] Error saving: {e}")
         import traceback
         traceback.print_exc()
+    
+    for pool in tool_pools.values():
+        pool.shutdown()
+    await http_client.close()
+    response_cache.flush()
+    intent_llm_cache.flush()
+    music_catalog.stop_watcher()
+    telemetry.stop()
 
 if __name__ == "__main__":
     import uvicorn